@@ -68,8 +68,12 @@ setup(name='qilib',
           'Programming Language :: Python :: 3.10',
           'Programming Language :: Python :: 3.11'],
       license='MIT',
-      install_requires=['spirack>=0.1.8', 'numpy>=1.20', 'serialize', 'pymongo',
+      install_requires=['spirack>=0.1.8', 'numpy>=1.20', 'serialize', 'pymongo>=4.2',
                         'requests', 'qcodes>=0.33.0', 'qcodes_contrib_drivers>=0.13.1', 'dataclasses-json'],
       extras_require={
-          'dev': ['pytest>=3.3.1', 'coverage>=4.5.1', 'mongomock==3.20.0', 'mypy', 'pylint', 'types-requests'],
+          'dev': ['pytest>=3.3.1', 'coverage>=4.5.1', 'mongomock==3.20.0', 'mypy', 'pylint', 'types-requests',
+                  'motor'],
+          'compression': ['zstandard', 'lz4'],
+          'msgpack': ['msgpack'],
+          'async': ['motor'],
       })
@@ -0,0 +1,293 @@
+"""Quantum Inspire library
+
+Copyright 2022 QuTech Delft
+
+qilib is available under the [MIT open-source license](https://opensource.org/licenses/MIT):
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import timeit
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Sequence, Tuple
+from unittest.mock import patch
+
+import numpy as np
+
+from qilib.version import __version__
+from qilib.utils.storage.file import StorageFile
+from qilib.utils.storage.interface import StorageInterface
+from qilib.utils.storage.memory import StorageMemory
+from qilib.utils.storage.mongo import StorageMongoDb
+from qilib.utils.storage.sqlite import StorageSQLite
+
+BackendFactory = Callable[[], ContextManager[StorageInterface]]
+Result = Dict[str, Any]
+
+
+@contextmanager
+def _memory_storage() -> Iterator[StorageInterface]:
+    yield StorageMemory('benchmark')
+
+
+@contextmanager
+def _file_storage() -> Iterator[StorageInterface]:
+    directory = tempfile.mkdtemp(prefix='qilib_benchmark_')
+    try:
+        yield StorageFile('benchmark', directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+@contextmanager
+def _sqlite_storage() -> Iterator[StorageInterface]:
+    directory = tempfile.mkdtemp(prefix='qilib_benchmark_')
+    storage = StorageSQLite('benchmark', f'{directory}/benchmark.db')
+    try:
+        yield storage
+    finally:
+        storage.close()
+        shutil.rmtree(directory)
+
+
+def _mongo_factory(host: Optional[str], materialized_path: bool) -> BackendFactory:
+    """ Create the factory of a StorageMongoDb in a temporary database
+
+    Args:
+        host: Host of the mongod to benchmark against, if None mongomock is used as a stand-in
+        materialized_path: Use the materialized path layout
+
+    Returns:
+        The factory
+    """
+    @contextmanager
+    def factory() -> Iterator[StorageInterface]:
+        database = f'qilib_benchmark_{datetime.now():%Y%m%d%H%M%S%f}'
+        if host is None:
+            import mongomock
+            with patch('qilib.utils.storage.mongo.MongoClient', return_value=mongomock.MongoClient()):
+                storage = StorageMongoDb('benchmark', database=database, materialized_path=materialized_path)
+        else:
+            storage = StorageMongoDb('benchmark', host=host, database=database, materialized_path=materialized_path)
+        try:
+            yield storage
+        finally:
+            storage._client.drop_database(database)
+            storage.close()
+
+    return factory
+
+
+def backend_factories(mongo_host: Optional[str] = None) -> Dict[str, BackendFactory]:
+    """ The storage backends that can be benchmarked
+
+    Args:
+        mongo_host: Host of the mongod for the StorageMongoDb backends, if None mongomock is used as a stand-in
+
+    Returns:
+        For every backend a factory of a context manager that provides an empty storage
+    """
+    return {
+        'memory': _memory_storage,
+        'file': _file_storage,
+        'sqlite': _sqlite_storage,
+        'mongo': _mongo_factory(mongo_host, materialized_path=False),
+        'mongo_path': _mongo_factory(mongo_host, materialized_path=True),
+    }
+
+
+def _time(function: Callable[[], Any], number: int, repeat: int) -> Dict[str, float]:
+    """ Measure the run time of a function
+
+    Args:
+        function: The function to measure
+        number: The number of runs of a single timing
+        repeat: The number of timings
+
+    Returns:
+        The median and minimum run time over the timings in microseconds
+    """
+    timings = [1e6 * seconds / number for seconds in timeit.repeat(function, number=number, repeat=repeat)]
+    return {'median_us': statistics.median(timings), 'min_us': min(timings)}
+
+
+def _datetags(count: int) -> List[str]:
+    start = datetime(2022, 1, 1)
+    return [StorageInterface.datetag_part(start + timedelta(seconds=index)) for index in range(count)]
+
+
+def benchmark_tag_depth(storage: StorageInterface, depths: Sequence[int], number: int, repeat: int) -> List[Result]:
+    """ Save and load a small leaf at increasing tag depths """
+    results = []
+    for depth in depths:
+        tag = [f'depth_{depth}'] + [f'node_{index}' for index in range(depth - 1)]
+        data = {'frequency': 1e9, 'amplitude': 0.5}
+        storage.save_data(data, tag)
+        results.append({'operation': 'save_data', 'parameter': depth,
+                        **_time(lambda: storage.save_data(data, tag), number, repeat)})
+        results.append({'operation': 'load_data', 'parameter': depth,
+                        **_time(lambda: storage.load_data(tag), number, repeat)})
+    return results
+
+
+def benchmark_siblings(storage: StorageInterface, counts: Sequence[int], number: int, repeat: int) -> List[Result]:
+    """ List the subtags of nodes with an increasing number of children """
+    results = []
+    for count in counts:
+        tag = ['siblings', str(count)]
+        storage.save_many([(tag + [subtag], index) for index, subtag in enumerate(_datetags(count))])
+        results.append({'operation': 'list_data_subtags', 'parameter': count,
+                        **_time(lambda: storage.list_data_subtags(tag), number, repeat)})
+        results.append({'operation': 'list_data_subtags_limit_10', 'parameter': count,
+                        **_time(lambda: storage.list_data_subtags(tag, limit=10), number, repeat)})
+    return results
+
+
+def benchmark_numpy_leaf(storage: StorageInterface, sizes: Sequence[int], number: int, repeat: int) -> List[Result]:
+    """ Save and load leaves with numpy arrays of an increasing number of float64 elements """
+    results = []
+    for size in sizes:
+        tag = ['numpy', str(size)]
+        array = np.random.default_rng(size).random(size)
+        storage.save_data(array, tag)
+        for operation, function in (('save_data', lambda: storage.save_data(array, tag)),
+                                    ('load_data', lambda: storage.load_data(tag))):
+            timing = _time(function, number, repeat)
+            results.append({'operation': operation, 'parameter': size, **timing,
+                            'throughput_mb_s': array.nbytes / timing['median_us']})
+    return results
+
+
+def benchmark_latest_subtag(storage: StorageInterface, counts: Sequence[int], number: int,
+                            repeat: int) -> List[Result]:
+    """ Get the latest subtag of nodes with an increasing number of datetagged children """
+    results = []
+    for count in counts:
+        tag = ['latest', str(count)]
+        storage.save_many([(tag + [subtag], index) for index, subtag in enumerate(_datetags(count))])
+        results.append({'operation': 'get_latest_subtag', 'parameter': count,
+                        **_time(lambda: storage.get_latest_subtag(tag), number, repeat)})
+    return results
+
+
+Benchmark = Callable[[StorageInterface, Sequence[int], int, int], List[Result]]
+
+# the benchmarks with the parameters they are run for: the tag depth, the number of children or the array size
+BENCHMARKS: Dict[str, Tuple[Benchmark, Sequence[int]]] = {
+    'tag_depth': (benchmark_tag_depth, (1, 2, 4, 8, 16)),
+    'siblings': (benchmark_siblings, (10, 100, 1000)),
+    'numpy_leaf': (benchmark_numpy_leaf, (1000, 100000, 1000000)),
+    'latest_subtag': (benchmark_latest_subtag, (100, 1000, 10000)),
+}
+
+
+def run(backends: Dict[str, BackendFactory], benchmarks: Sequence[str], number: int = 10, repeat: int = 5,
+        quick: bool = False) -> Dict[str, Any]:
+    """ Run the benchmarks on every backend, each benchmark on an empty storage
+
+    Args:
+        backends: The factories of the storages to benchmark
+        benchmarks: The names of the benchmarks in BENCHMARKS to run
+        number: The number of runs of a single timing
+        repeat: The number of timings of which the median and minimum are reported
+        quick: Skip the largest parameter of every benchmark
+
+    Returns:
+        The environment of the run and a list with a result for every backend, benchmark, operation and parameter
+    """
+    results = []
+    for backend, factory in backends.items():
+        for benchmark in benchmarks:
+            function, parameters = BENCHMARKS[benchmark]
+            with factory() as storage:
+                for result in function(storage, parameters[:-1] if quick else parameters, number, repeat):
+                    results.append({'backend': backend, 'benchmark': benchmark, **result})
+    return {
+        'environment': {'qilib': __version__, 'python': platform.python_version(), 'numpy': np.__version__,
+                        'platform': platform.platform(), 'date': datetime.now().isoformat(timespec='seconds'),
+                        'number': number, 'repeat': repeat, 'quick': quick},
+        'results': results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.2) -> List[Result]:
+    """ Find the results that are slower than in a baseline run
+
+    Args:
+        baseline: The output of a previous run
+        current: The output of the current run
+        threshold: The relative increase of the median run time above which a result is a regression
+
+    Returns:
+        The regressions with the median run time of the baseline and the ratio to it
+    """
+    def key(result: Result) -> Tuple[Any, ...]:
+        return result['backend'], result['benchmark'], result['operation'], result['parameter']
+
+    reference = {key(result): result['median_us'] for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        baseline_us = reference.get(key(result))
+        if baseline_us and result['median_us'] > (1 + threshold) * baseline_us:
+            regressions.append({**result, 'baseline_us': baseline_us, 'ratio': result['median_us'] / baseline_us})
+    return regressions
+
+
+def main(arguments: Optional[Sequence[str]] = None) -> int:
+    factories = backend_factories()
+    parser = argparse.ArgumentParser(description='Benchmark the storage backends and write the results as JSON')
+    parser.add_argument('--backends', nargs='+', choices=list(factories), default=list(factories),
+                        help='backends to benchmark')
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help='benchmarks to run')
+    parser.add_argument('--mongo-host', help='host of a mongod to benchmark against, without it the mongo backends '
+                        'run on mongomock, whose timings are not representative of a server')
+    parser.add_argument('--number', type=int, default=10, help='number of runs of a single timing')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timings')
+    parser.add_argument('--quick', action='store_true', help='skip the largest parameter of every benchmark')
+    parser.add_argument('--output', help='file to write the JSON results to, by default they are printed')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown that is reported as a regression')
+    args = parser.parse_args(arguments)
+
+    factories = backend_factories(args.mongo_host)
+    output = run({name: factories[name] for name in args.backends}, args.benchmarks, args.number, args.repeat,
+                 args.quick)
+    if args.output is None:
+        json.dump(output, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as file:
+            json.dump(output, file, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), output, args.threshold)
+        for regression in regressions:
+            print(f'{regression["backend"]} {regression["benchmark"]} {regression["operation"]} '
+                  f'{regression["parameter"]}: {regression["median_us"]:.1f} us, {regression["ratio"]:.2f} times '
+                  f'the baseline', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
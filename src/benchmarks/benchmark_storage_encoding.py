@@ -0,0 +1,73 @@
+"""Quantum Inspire library
+
+Copyright 2022 QuTech Delft
+
+qilib is available under the [MIT open-source license](https://opensource.org/licenses/MIT):
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import argparse
+import timeit
+import tracemalloc
+from typing import Any, Callable, Dict
+
+from qilib.utils.serialization import serializer
+from qilib.utils.storage.mongo import StorageMongoDb
+from tests.test_data.m4i_snapshot import snapshot
+
+
+def _measure(function: Callable[[], Any], number: int) -> Dict[str, float]:
+    """ Measure the run time and the peak memory allocation of a function
+
+    Args:
+        function: The function to measure
+        number: The number of runs for the timing
+
+    Returns:
+        The mean run time in microseconds and the peak allocation of a single run in kilobytes
+    """
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    seconds = timeit.timeit(function, number=number)
+    return {'time_us': 1e6 * seconds / number, 'peak_kb': peak / 1024}
+
+
+def run(number: int = 200) -> Dict[str, Dict[str, float]]:
+    """ Compare encoding a snapshot for storage in two passes with the single pass of `Serializer.encode_data`
+
+    Args:
+        number: The number of runs for the timing
+
+    Returns:
+        The measurements of every method
+    """
+    encoded = serializer.encode_data(snapshot, encode_key=StorageMongoDb._encode_key)
+    return {
+        'encode two passes': _measure(lambda: StorageMongoDb._encode_data(serializer.encode_data(snapshot)), number),
+        'encode single pass': _measure(
+            lambda: serializer.encode_data(snapshot, encode_key=StorageMongoDb._encode_key), number),
+        'decode two passes': _measure(lambda: serializer.decode_data(StorageMongoDb._decode_data(encoded)), number),
+        'decode single pass': _measure(
+            lambda: serializer.decode_data(encoded, decode_key=StorageMongoDb._decode_key), number),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the key encoding of StorageMongoDb on the M4i snapshot')
+    parser.add_argument('--number', type=int, default=200, help='number of runs for the timing')
+    args = parser.parse_args()
+    for name, result in run(args.number).items():
+        print(f'{name:20s} {result["time_us"]:10.1f} us {result["peak_kb"]:10.1f} kB peak')
@@ -89,7 +89,22 @@ class InstrumentConfiguration:
             A new InstrumentConfiguration loaded from database.
 
         """
-        document = storage.load_data(tag)
+        return InstrumentConfiguration.from_document(tag, storage.load_data(tag), storage)
+
+    @staticmethod
+    def from_document(tag: List[str], document: PythonJsonStructure,
+                      storage: StorageInterface) -> 'InstrumentConfiguration':
+        """ A factory that creates a new InstrumentConfiguration from a document loaded from storage.
+
+        Args:
+            tag: A unique identifier for a instrument configuration.
+            document: The document stored at the tag.
+            storage: Any storage that implements the StorageInterface.
+
+        Returns:
+            A new InstrumentConfiguration.
+
+        """
         adapter_class_name = document['adapter_class_name']
         address = document['address']
         instrument_name = document.get('instrument_name', None)
@@ -106,11 +121,19 @@ class InstrumentConfiguration:
         if self._storage.tag_in_storage(self._tag):
             raise DuplicateTagError(
                 f"InstrumentConfiguration for {self._adapter_class_name} with tag '{self._tag}' already in storage")
-        document = PythonJsonStructure(adapter_class_name=self._adapter_class_name,
-                                       address=self._address,
-                                       instrument_name=self._instrument_name,
-                                       configuration=self._configuration)
-        self._storage.save_data(document, self._tag)
+        self._storage.save_data(self.to_document(), self._tag)
+
+    def to_document(self) -> PythonJsonStructure:
+        """ The document that is saved to storage for this configuration.
+
+        Returns:
+            The adapter class name, address, instrument name and configuration.
+
+        """
+        return PythonJsonStructure(adapter_class_name=self._adapter_class_name,
+                                   address=self._address,
+                                   instrument_name=self._instrument_name,
+                                   configuration=self._configuration)
 
     def apply(self) -> None:
         """ Uploads the configuration to the instrument."""
@@ -17,7 +17,7 @@ WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEM
 COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
 OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
-from typing import Union, List, Optional
+from typing import Any, Union, List, Optional, Tuple
 
 from qilib.configuration_helper.instrument_configuration import InstrumentConfiguration
 from qilib.configuration_helper.visitor import Visitor
@@ -83,7 +83,9 @@ class InstrumentConfigurationSet:
 
         # load the document as a list of instruments tags
         tags = storage.load_data(tag)
-        instrument_configurations = [InstrumentConfiguration.load(instrument_tag, storage) for instrument_tag in tags]
+        documents = storage.load_many(tags)
+        instrument_configurations = [InstrumentConfiguration.from_document(instrument_tag, document, storage)
+                                     for instrument_tag, document in zip(tags, documents)]
 
         return InstrumentConfigurationSet(storage, tag, instrument_configurations)
 
@@ -97,17 +99,13 @@ class InstrumentConfigurationSet:
         if self._storage.tag_in_storage(self._tag):
             raise DuplicateTagError(f'InstrumentConfiguration with tag \'{self._tag}\' already in storage')
 
-        instrument_configuration_tags = []
-        for instrument_configuration in self.instrument_configurations:
-            try:
-                instrument_configuration.store()
-            except DuplicateTagError:
-                pass
-            finally:
-                instrument_configuration_tags.append(instrument_configuration.tag)
-
+        # instrument configurations that are already in storage are not stored again
+        items: List[Tuple[List[str], Any]] = [(instrument_configuration.tag, instrument_configuration.to_document())
+                                               for instrument_configuration in self.instrument_configurations]
         # save the document as a list of instruments tags
-        self._storage.save_data(instrument_configuration_tags, self._tag)
+        items.append((self._tag, [instrument_configuration.tag
+                                  for instrument_configuration in self.instrument_configurations]))
+        self._storage.save_many(items, overwrite=False)
 
     def snapshot(self, tag: Union[None, List[str]] = None) -> None:
         """ Updates the configuration set by overwriting the tag and refreshing all underlying instruments """
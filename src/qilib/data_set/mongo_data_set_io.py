@@ -21,9 +21,11 @@ from typing import Optional, Dict, Any, Union, MutableMapping
 
 from bson.objectid import ObjectId
 from pymongo.change_stream import CollectionChangeStream
+from pymongo.collection import Collection
 from pymongo.errors import DuplicateKeyError
 from pymongo.mongo_client import MongoClient
 from qilib.data_set.data_array import DataArray
+from qilib.utils.mongo_client_registry import mongo_client_registry
 from qilib.utils.serialization import NumpyArrayEncDec
 from qilib.utils.type_aliases import EncodedNumpyArray, NumpyNdarrayType
 
@@ -44,7 +46,7 @@ class MongoDataSetIO:
 
     def __init__(self, name: Optional[str] = None, document_id: Optional[str] = None,
                  create_if_not_found: Optional[bool] = True, database: str = DEFAULT_DATABASE_NAME,
-                 collection: str = DEFAULT_COLLECTION_NAME) -> None:
+                 collection: str = DEFAULT_COLLECTION_NAME, max_pool_size: Optional[int] = None) -> None:
         """
 
         Args:
@@ -53,6 +55,9 @@ class MongoDataSetIO:
             create_if_not_found: Create a new document if no match is found.
             database: Name of the database.
             collection: Name of the collections.
+            max_pool_size: Maximum number of connections in the pool of the client. The client is shared with the
+                storages and other data sets that use the same pool size, see `MongoClientRegistry`. If None the
+                default of the registry is used.
 
         Raises:
             DocumentNotFoundError: If document not found in database.
@@ -61,10 +66,29 @@ class MongoDataSetIO:
         if name is None and document_id is None:
             raise DocumentNotFoundError("Neither 'name' nor 'document_id' were provided.")
 
-        self._client = MongoClient()  # type: MongoClient[Any]
-        self._db = self._client[database][collection]
-        self._assert_name_field_is_unique()
+        self._client: MongoClient[Any] = mongo_client_registry.acquire(client_class=MongoClient,
+                                                                      max_pool_size=max_pool_size)
+        self._released = False
+        self._db: Collection[Any] = self._client[database][collection]
+        try:
+            self._assert_name_field_is_unique()
+            self._find_or_create_document(name, document_id, create_if_not_found)
+        except Exception:
+            mongo_client_registry.release(self._client)
+            raise
+
+    def _find_or_create_document(self, name: Optional[str], document_id: Optional[str],
+                                 create_if_not_found: Optional[bool]) -> None:
+        """ Find the document by name and/or id, or create it if allowed.
+
+        Args:
+            name: Name of the document.
+            document_id: The document _id.
+            create_if_not_found: Create a new document if no match is found.
 
+        Raises:
+            DocumentNotFoundError: If document not found in database.
+        """
         query_dict: MutableMapping[str, Any] = {}
         if name is not None:
             query_dict['name'] = name
@@ -111,8 +135,14 @@ class MongoDataSetIO:
         return document
 
     def finalize(self) -> None:
-        """ Close the connection to the database."""
-        self._client.close()
+        """ Release the connection to the database, the shared client is closed when it is no longer used.
+
+        Only the first call releases the client, so the client of other users is not closed by repeated calls.
+        """
+        if self._released:
+            return
+        self._released = True
+        mongo_client_registry.release(self._client)
 
     def append_to_document(self, data: Dict[str, Any]) -> None:
         """ Append data to an array in the underlying document.
@@ -153,16 +183,17 @@ class MongoDataSetIO:
         return NumpyArrayEncDec.encode(array)
 
     @staticmethod
-    def decode_numpy_array(encoded_array: Dict[str, Any]) -> NumpyNdarrayType:
+    def decode_numpy_array(encoded_array: Dict[str, Any], read_only: bool = False) -> NumpyNdarrayType:
         """ Decode a numpy array from database.
 
         Args:
             encoded_array: The encoded array to decode.
+            read_only: Return a read-only view on the decoded data instead of a writable copy.
 
         Returns:
             The decoded array.
         """
-        return NumpyArrayEncDec.decode(encoded_array)
+        return NumpyArrayEncDec.decode(encoded_array, read_only)
 
     def _assert_name_field_is_unique(self) -> None:
         """ The field 'name' should be unique in the database.
@@ -43,7 +43,7 @@ class MongoDataSetIOReader(DataSetIOReader):
         """ DataSetIOReader implementation for a mongodb.
 
         Note:
-            The finalize method has to be called to close database connection and join the watcher thread.
+            The database connection is released and the watcher thread is joined when the reader is deleted.
 
         Args:
             name: Name of data set in the underlying mongodb.
@@ -73,6 +73,7 @@ class MongoDataSetIOReader(DataSetIOReader):
         self._watcher.close()
         watchers.remove(self._watcher)
         self._update_thread.join(1)
+        self._mongo_data_set_io.finalize()
 
     def sync_from_storage(self, timeout: float) -> None:
         """ Poll the Mongo database for changes and apply any to the bound data_set.
@@ -198,7 +199,8 @@ class MongoDataSetIOReader(DataSetIOReader):
         return data_array
 
     def _update_data_array(self, array: Dict[str, Any]) -> None:
-        np_array = MongoDataSetIO.decode_numpy_array(array['preset_data'])
+        # the values are copied into the data array, so the decoded array does not have to be writable
+        np_array = MongoDataSetIO.decode_numpy_array(array['preset_data'], read_only=True)
         self._data_set.data_arrays[array['name']].label = array['label']
         self._data_set.data_arrays[array['name']].unit = array['unit']
 
@@ -0,0 +1,123 @@
+"""Quantum Inspire library
+
+Copyright 2022 QuTech Delft
+
+qilib is available under the [MIT open-source license](https://opensource.org/licenses/MIT):
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import importlib
+import threading
+import zlib
+from typing import Any, Callable, Dict, Tuple, cast
+
+_CompressionFunctions = Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]
+
+
+def _zlib() -> _CompressionFunctions:
+    return zlib.compress, zlib.decompress
+
+
+def _zstd() -> _CompressionFunctions:
+    zstandard: Any = _import_module('zstandard', 'zstd')
+    # the compressor and decompressor objects are not thread-safe, so every thread gets its own
+    contexts = threading.local()
+
+    def compress_zstd(data: bytes) -> bytes:
+        if not hasattr(contexts, 'compressor'):
+            contexts.compressor = zstandard.ZstdCompressor()
+        return cast(bytes, contexts.compressor.compress(data))
+
+    def decompress_zstd(data: bytes) -> bytes:
+        if not hasattr(contexts, 'decompressor'):
+            contexts.decompressor = zstandard.ZstdDecompressor()
+        return cast(bytes, contexts.decompressor.decompress(data))
+
+    return compress_zstd, decompress_zstd
+
+
+def _lz4() -> _CompressionFunctions:
+    lz4_frame: Any = _import_module('lz4.frame', 'lz4')
+    return lz4_frame.compress, lz4_frame.decompress
+
+
+def _import_module(module: str, method: str) -> Any:
+    try:
+        return importlib.import_module(module)
+    except ImportError as e:
+        raise ImportError(f'The {method} compression requires the {module.split(".")[0]} package, install it with '
+                          f'pip install qilib[compression]') from e
+
+
+_METHODS: Dict[str, Callable[[], _CompressionFunctions]] = {'zlib': _zlib, 'zstd': _zstd, 'lz4': _lz4}
+_loaded_methods: Dict[str, _CompressionFunctions] = {}
+
+
+def _functions(method: str) -> _CompressionFunctions:
+    """ The compress and decompress functions of a compression method, the module is imported on first use
+
+    Raises:
+        ValueError: If the compression method is unknown
+        ImportError: If the package of the compression method is not installed
+    """
+    functions = _loaded_methods.get(method)
+    if functions is None:
+        if method not in _METHODS:
+            raise ValueError(f'Unknown compression method {method!r}, expected one of {sorted(_METHODS)}')
+        functions = _loaded_methods[method] = _METHODS[method]()
+    return functions
+
+
+def compression_methods() -> Tuple[str, ...]:
+    """ The names of the supported compression methods
+
+    zlib is always available, zstd requires the zstandard package and lz4 the lz4 package.
+    """
+    return tuple(_METHODS)
+
+
+def check_compression_method(method: str) -> None:
+    """ Check that a compression method is supported and that its package is installed
+
+    Raises:
+        ValueError: If the compression method is unknown
+        ImportError: If the package of the compression method is not installed
+    """
+    _functions(method)
+
+
+def compress(data: bytes, method: str) -> bytes:
+    """ Compress data
+
+    Args:
+        data: The data to compress
+        method: The compression method, one of `compression_methods`
+
+    Returns:
+        The compressed data
+    """
+    return _functions(method)[0](data)
+
+
+def decompress(data: bytes, method: str) -> bytes:
+    """ Decompress data that was compressed with `compress`
+
+    Args:
+        data: The compressed data
+        method: The compression method that was used
+
+    Returns:
+        The decompressed data
+    """
+    return _functions(method)[1](data)
@@ -0,0 +1,266 @@
+"""Quantum Inspire library
+
+Copyright 2022 QuTech Delft
+
+qilib is available under the [MIT open-source license](https://opensource.org/licenses/MIT):
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+from bisect import bisect_left
+from functools import wraps
+from threading import Lock, local
+from time import perf_counter
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, cast
+
+
+# the scope of the instrumented operation that runs in a thread, see MetricsScope.active
+_active = local()
+
+
+class MetricsEvent(NamedTuple):
+    """ A single observation that is passed to the callback of `StorageMetrics`
+
+    The kind is 'operation' for a call of a public storage method, the duration and bytes then cover the whole
+    operation, or 'round_trip' for a single request of a backend to its database. The call is the name of the
+    request, e.g. 'find', and empty for operations.
+    """
+    kind: str
+    storage: str
+    operation: str
+    call: str
+    duration: float
+    nbytes: int
+
+
+class _OperationStatistics:
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.nbytes = 0
+        self.bucket_counts = [0] * (len(buckets) + 1)
+
+
+class MetricsScope:
+    """ The instrumentation of a single storage, created with `StorageMetrics.scope`
+
+    Round trips that a backend reports during an operation are attributed to that operation. Operations that are
+    called from within another operation of the same storage, e.g. `load_data` from `load_many`, are part of the
+    outer operation and are not recorded separately. Backends that observe their round trips outside the storage,
+    e.g. with a command listener of the database client, report them to the `active` scope.
+    """
+
+    def __init__(self, metrics: 'StorageMetrics', storage: str) -> None:
+        self._metrics = metrics
+        self._storage = storage
+        self._state = local()
+
+    @staticmethod
+    def active() -> Optional['MetricsScope']:
+        """ The scope of the instrumented operation that runs in the current thread
+
+        Returns:
+            The scope of the innermost storage of which an operation runs, None if no operation runs
+        """
+        return cast(Optional[MetricsScope], getattr(_active, 'scope', None))
+
+    @property
+    def metrics(self) -> 'StorageMetrics':
+        """ The metrics the observations are recorded in """
+        return self._metrics
+
+    def instrument(self, operation: str, method: Callable[..., Any]) -> Callable[..., Any]:
+        """ Wrap a bound method so that its calls are recorded as an operation
+
+        Args:
+            operation: Name of the operation
+            method: The method to wrap
+
+        Returns:
+            The wrapped method
+        """
+        state = self._state
+
+        @wraps(method)
+        def instrumented(*args: Any, **kwargs: Any) -> Any:
+            if getattr(state, 'operation', None) is not None:
+                return method(*args, **kwargs)
+            state.operation = operation
+            state.nbytes = 0
+            outer_scope = getattr(_active, 'scope', None)
+            _active.scope = self
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                duration = perf_counter() - start
+                state.operation = None
+                _active.scope = outer_scope
+                self._metrics.observe(self._storage, operation, duration, state.nbytes)
+
+        return instrumented
+
+    def round_trip(self, call: str, duration: float = 0.0, nbytes: int = 0) -> None:
+        """ Record a request of the backend to its database
+
+        Args:
+            call: Name of the request, e.g. 'find'
+            duration: Duration of the request in seconds
+            nbytes: Number of bytes sent and received
+        """
+        operation = getattr(self._state, 'operation', None)
+        if operation is not None:
+            self._state.nbytes += nbytes
+        self._metrics.count_round_trip(self._storage, operation or '', call, duration, nbytes)
+
+
+class StorageMetrics:
+    """ Collects the number, latency and size of storage operations and the round trips of the backends
+
+    Metrics are enabled on a storage with `StorageInterface.set_metrics`, a single instance can be shared by
+    several storages. The collected metrics are exported in the Prometheus text format with `export_prometheus`,
+    or every observation is passed to a callback. Storages without metrics are not instrumented at all.
+    """
+
+    DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, callback: Optional[Callable[[MetricsEvent], None]] = None,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, prefix: str = 'qilib_storage') -> None:
+        """ Creates a metrics collector
+
+        Args:
+            callback: Called with a `MetricsEvent` for every operation and round trip
+            buckets: Upper bounds in seconds of the buckets of the latency histograms
+            prefix: Prefix of the names of the exported metrics
+        """
+        self._callback = callback
+        self._buckets = tuple(sorted(buckets))
+        self._prefix = prefix
+        self._lock = Lock()
+        self._operations: Dict[Tuple[str, str], _OperationStatistics] = {}
+        self._round_trips: Dict[Tuple[str, str, str], int] = {}
+
+    def scope(self, storage: str) -> MetricsScope:
+        """ Create the instrumentation of a storage
+
+        Args:
+            storage: Name of the storage the observations are labelled with
+
+        Returns:
+            The scope that records the operations and round trips of the storage
+        """
+        return MetricsScope(self, storage)
+
+    def observe(self, storage: str, operation: str, duration: float, nbytes: int = 0) -> None:
+        """ Record a storage operation
+
+        Args:
+            storage: Name of the storage
+            operation: Name of the operation, e.g. 'load_data'
+            duration: Duration of the operation in seconds
+            nbytes: Number of bytes sent to and received from the database during the operation
+        """
+        with self._lock:
+            statistics = self._operations.get((storage, operation))
+            if statistics is None:
+                statistics = self._operations[(storage, operation)] = _OperationStatistics(self._buckets)
+            statistics.count += 1
+            statistics.total += duration
+            statistics.nbytes += nbytes
+            statistics.bucket_counts[bisect_left(self._buckets, duration)] += 1
+        if self._callback is not None:
+            self._callback(MetricsEvent('operation', storage, operation, '', duration, nbytes))
+
+    def count_round_trip(self, storage: str, operation: str, call: str, duration: float = 0.0,
+                         nbytes: int = 0) -> None:
+        """ Record a request of a backend to its database
+
+        Args:
+            storage: Name of the storage
+            operation: Name of the operation the request is part of, empty if it is not part of an operation
+            call: Name of the request, e.g. 'find'
+            duration: Duration of the request in seconds
+            nbytes: Number of bytes sent and received
+        """
+        key = (storage, operation, call)
+        with self._lock:
+            self._round_trips[key] = self._round_trips.get(key, 0) + 1
+        if self._callback is not None:
+            self._callback(MetricsEvent('round_trip', storage, operation, call, duration, nbytes))
+
+    def clear(self) -> None:
+        """ Remove all collected metrics """
+        with self._lock:
+            self._operations.clear()
+            self._round_trips.clear()
+
+    def statistics(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """ The collected metrics per storage
+
+        Returns:
+            For every storage a dictionary with the count, total duration and bytes of each operation, and with
+            the round trips of each operation per request, e.g.
+            {'my_storage': {'load_data': {'count': 2, 'seconds': 0.01, 'bytes': 420, 'round_trips': {'find': 4}}}}
+        """
+        result: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        with self._lock:
+            for (storage, operation), statistics in self._operations.items():
+                result.setdefault(storage, {})[operation] = {
+                    'count': statistics.count, 'seconds': statistics.total, 'bytes': statistics.nbytes,
+                    'round_trips': {}}
+            for (storage, operation, call), count in self._round_trips.items():
+                entry = result.setdefault(storage, {}).setdefault(
+                    operation, {'count': 0, 'seconds': 0.0, 'bytes': 0, 'round_trips': {}})
+                entry['round_trips'][call] = count
+        return result
+
+    @staticmethod
+    def _labels(**labels: str) -> str:
+        escaped = ('{}="{}"'.format(key, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                   for key, value in labels.items())
+        return '{' + ','.join(escaped) + '}'
+
+    def export_prometheus(self) -> str:
+        """ Export the collected metrics in the Prometheus text exposition format
+
+        Returns:
+            The latency histogram and the number of bytes of every operation and the number of round trips of
+            every request
+        """
+        seconds = f'{self._prefix}_operation_seconds'
+        nbytes = f'{self._prefix}_operation_bytes_total'
+        round_trips = f'{self._prefix}_round_trips_total'
+        lines: List[str] = [f'# HELP {seconds} Duration of storage operations in seconds',
+                            f'# TYPE {seconds} histogram']
+        with self._lock:
+            operations = sorted(self._operations.items())
+            for (storage, operation), statistics in operations:
+                cumulative = 0
+                bounds = [repr(bound) for bound in self._buckets] + ['+Inf']
+                for bound, count in zip(bounds, statistics.bucket_counts):
+                    cumulative += count
+                    labels = self._labels(storage=storage, operation=operation, le=bound)
+                    lines.append(f'{seconds}_bucket{labels} {cumulative}')
+                labels = self._labels(storage=storage, operation=operation)
+                lines.append(f'{seconds}_sum{labels} {statistics.total!r}')
+                lines.append(f'{seconds}_count{labels} {statistics.count}')
+            lines += [f'# HELP {nbytes} Bytes sent to and received from the database by storage operations',
+                      f'# TYPE {nbytes} counter']
+            for (storage, operation), statistics in operations:
+                lines.append(f'{nbytes}{self._labels(storage=storage, operation=operation)} {statistics.nbytes}')
+            lines += [f'# HELP {round_trips} Requests of the storage backends to their database',
+                      f'# TYPE {round_trips} counter']
+            for (storage, operation, call), count in sorted(self._round_trips.items()):
+                labels = self._labels(storage=storage, operation=operation, call=call)
+                lines.append(f'{round_trips}{labels} {count}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,163 @@
+"""Quantum Inspire library
+
+Copyright 2022 QuTech Delft
+
+qilib is available under the [MIT open-source license](https://opensource.org/licenses/MIT):
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import bson
+import numpy as np
+from bson.codec_options import CodecOptions, TypeEncoder, TypeRegistry
+from pymongo.mongo_client import MongoClient
+from pymongo.monitoring import CommandFailedEvent, CommandListener, CommandStartedEvent, CommandSucceededEvent
+
+from qilib.utils.metrics import MetricsScope
+from qilib.utils.serialization import NumpyArrayEncDec
+
+
+class _NumpyArrayEncoder(TypeEncoder):
+    @property
+    def python_type(self) -> Any:
+        return np.ndarray
+
+    def transform_python(self, value: Any) -> Any:
+        return NumpyArrayEncDec.encode(value)
+
+
+class _CommandMetricsListener(CommandListener):
+    """ Reports the commands that a client sends during an instrumented storage operation as round trips
+
+    Every command is a round trip of the active metrics scope, including the getMore commands that fetch the next
+    batches of a cursor. The bytes of a round trip are the BSON size of the command and of its reply. The events do
+    not carry the sizes of the messages, so the documents are only encoded while an instrumented operation runs.
+    """
+
+    _CODEC_OPTIONS: 'CodecOptions[Any]' = CodecOptions(type_registry=TypeRegistry([_NumpyArrayEncoder()]))
+
+    def __init__(self) -> None:
+        self._command_sizes: Dict[int, int] = {}
+
+    @classmethod
+    def _size(cls, document: Any) -> int:
+        try:
+            return len(bson.encode(document, codec_options=cls._CODEC_OPTIONS))
+        except (bson.errors.InvalidDocument, TypeError):
+            return 0
+
+    def started(self, event: CommandStartedEvent) -> None:
+        if MetricsScope.active() is not None:
+            self._command_sizes[event.request_id] = self._size(event.command)
+
+    def succeeded(self, event: CommandSucceededEvent) -> None:
+        scope = MetricsScope.active()
+        command_size = self._command_sizes.pop(event.request_id, 0)
+        if scope is not None:
+            scope.round_trip(event.command_name, event.duration_micros / 1e6, command_size + self._size(event.reply))
+
+    def failed(self, event: CommandFailedEvent) -> None:
+        scope = MetricsScope.active()
+        command_size = self._command_sizes.pop(event.request_id, 0)
+        if scope is not None:
+            scope.round_trip(event.command_name, event.duration_micros / 1e6, command_size)
+
+
+# installed on every client of the registry, so the storages that share a client report their own commands
+command_metrics_listener = _CommandMetricsListener()
+
+
+class MongoClientRegistry:
+    """ Process-wide registry of shared MongoDB clients
+
+    A MongoClient holds a connection pool and is safe to use from multiple threads, so one client per server and
+    pool configuration suffices. The registry hands out the same client to every user that acquires it with the same
+    host, port and pool sizes and counts the references. The client is closed when the last reference is released.
+    Every client reports its commands as round trips to the active `MetricsScope` with `command_metrics_listener`.
+    Other client options are only used when the client is created, so settings that differ between users, such as
+    timeouts, should be applied per operation, e.g. with `pymongo.timeout`.
+    """
+
+    def __init__(self, max_pool_size: int = 100, min_pool_size: int = 0) -> None:
+        """
+        Args:
+            max_pool_size: Default maximum number of connections in the pool of a client
+            min_pool_size: Default minimum number of connections in the pool of a client
+        """
+        self.max_pool_size = max_pool_size
+        self.min_pool_size = min_pool_size
+        self._lock = threading.Lock()
+        self._clients: Dict[Hashable, Tuple[Any, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def acquire(self, host: str = 'localhost', port: int = 27017, client_class: Callable[..., Any] = MongoClient,
+                max_pool_size: Optional[int] = None, min_pool_size: Optional[int] = None, **options: Any) -> Any:
+        """ Get the shared client for the connection parameters, the client is created on first use
+
+        Args:
+            host: MongoDB host
+            port: MongoDB port
+            client_class: The class of the client to create
+            max_pool_size: Maximum number of connections in the pool, if None the default of the registry is used
+            min_pool_size: Minimum number of connections in the pool, if None the default of the registry is used
+            options: Other keyword arguments of the client, which are only used if the client is created
+
+        Returns:
+            The client, which should be returned with `release` when it is no longer used
+        """
+        options['maxPoolSize'] = self.max_pool_size if max_pool_size is None else max_pool_size
+        options['minPoolSize'] = self.min_pool_size if min_pool_size is None else min_pool_size
+        options['event_listeners'] = [command_metrics_listener, *options.get('event_listeners', [])]
+        key = (client_class, host, port, options['maxPoolSize'], options['minPoolSize'])
+        with self._lock:
+            client, references = self._clients.get(key, (None, 0))
+            if client is None:
+                client = client_class(host, port, **options)
+            self._clients[key] = (client, references + 1)
+        return client
+
+    def release(self, client: Any) -> None:
+        """ Release a reference to a client that was acquired from the registry
+
+        The client is closed when no references are left. Clients that are not in the registry are ignored.
+
+        Args:
+            client: The client to release
+        """
+        with self._lock:
+            for key, (registered_client, references) in self._clients.items():
+                if registered_client is client:
+                    break
+            else:
+                return
+            if references > 1:
+                self._clients[key] = (client, references - 1)
+                return
+            del self._clients[key]
+        client.close()
+
+    def clear(self) -> None:
+        """ Close all clients and empty the registry """
+        with self._lock:
+            clients: List[Any] = [client for client, _ in self._clients.values()]
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+
+mongo_client_registry = MongoClientRegistry()
@@ -18,12 +18,15 @@ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER I
 OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 import base64
+import importlib
+import struct
 from functools import partial
 from json import JSONDecoder, JSONEncoder
-from typing import Any, Callable, Dict, Tuple, Optional, Union
+from typing import Any, Callable, Dict, List, Tuple, Optional, Union, cast
 from dataclasses_json.api import DataClassJsonMixin
 import numpy as np
 
+from qilib.utils.compression import compress, decompress
 from qilib.utils.type_aliases import EncodedNumpyArray, NumpyNdarrayType
 
 
@@ -39,54 +42,113 @@ class NumpyKeys:
     DATA_TYPE: str = '__data_type__'
     SHAPE: str = '__shape__'
     ARRAY: str = '__ndarray__'
+    COMPRESSION: str = '__compression__'
+
+
+class BinaryExtType:
+    """The MessagePack extension type codes of the binary serialization format."""
+    NDARRAY: int = 1
+    NUMPY_NUMBER: int = 2
 
 
 class NumpyArrayEncDec:
     """ Class to decode and encode numpy arrays """
     @staticmethod
-    def _return_data_as_numpy_keys(data: Union[str, bytes], array: NumpyNdarrayType) -> EncodedNumpyArray:
+    def _return_data_as_numpy_keys(data: Union[str, bytes], array: NumpyNdarrayType,
+                                   compression: Optional[str] = None) -> EncodedNumpyArray:
         """ Return the encoded numpy array. """
+        content: Dict[str, Union[str, List[Any], bytes]] = {
+            NumpyKeys.ARRAY: data,
+            NumpyKeys.DATA_TYPE: array.dtype.str,
+            NumpyKeys.SHAPE: list(array.shape),
+        }
+        if compression is not None:
+            content[NumpyKeys.COMPRESSION] = compression
         return {
             NumpyKeys.OBJECT: np.array.__name__,
-            NumpyKeys.CONTENT: {
-                NumpyKeys.ARRAY: data,
-                NumpyKeys.DATA_TYPE: array.dtype.str,
-                NumpyKeys.SHAPE: list(array.shape),
-            }
+            NumpyKeys.CONTENT: content
         }
 
     @staticmethod
-    def encode_to_bytes(array: NumpyNdarrayType) -> EncodedNumpyArray:
+    def encode_to_bytes(array: NumpyNdarrayType, compression: Optional[str] = None,
+                        compression_threshold: int = 0) -> EncodedNumpyArray:
         """ Encode numpy array to bytes.
         Args:
             array: Numpy array to encode.
+            compression: The compression method of the bytes, see `compression_methods`. If None the bytes are not
+                compressed.
+            compression_threshold: Arrays smaller than this number of bytes are not compressed.
 
         Returns:
             The encoded array.
 
         """
-        data: Union[str, bytes] = array.tobytes()
-        return NumpyArrayEncDec._return_data_as_numpy_keys(data, array)
+        data = array.tobytes()
+        if compression is None or array.nbytes < compression_threshold:
+            return NumpyArrayEncDec._return_data_as_numpy_keys(data, array)
+        return NumpyArrayEncDec._return_data_as_numpy_keys(compress(data, compression), array, compression)
 
     @staticmethod
-    def encode(array: NumpyNdarrayType) -> EncodedNumpyArray:
+    def encode(array: NumpyNdarrayType, compression: Optional[str] = None,
+               compression_threshold: int = 0) -> EncodedNumpyArray:
         """ Encode numpy array to str.
         Args:
             array: Numpy array to encode.
+            compression: The compression method of the bytes before they are encoded, see `compression_methods`.
+                If None the bytes are not compressed.
+            compression_threshold: Arrays smaller than this number of bytes are not compressed.
 
         Returns:
             The encoded array.
 
         """
-        data = base64.b64encode(array.tobytes()).decode('ascii')
-        return NumpyArrayEncDec._return_data_as_numpy_keys(data, array)
+        encoded_array = NumpyArrayEncDec.encode_to_bytes(array, compression, compression_threshold)
+        content = cast(Dict[str, Any], encoded_array[NumpyKeys.CONTENT])
+        content[NumpyKeys.ARRAY] = base64.b64encode(content[NumpyKeys.ARRAY]).decode('ascii')
+        return encoded_array
 
     @staticmethod
-    def decode(encoded_array: Dict[str, Any]) -> NumpyNdarrayType:
+    def encode_to_buffer(array: NumpyNdarrayType) -> bytes:
+        """ Encode numpy array to a buffer with a header with the data type and shape followed by the raw data.
+
+        The data starts at a multiple of 16 bytes, so it can be decoded without a copy and stays aligned.
+
+        Args:
+            array: Numpy array to encode, the data type should not contain objects.
+
+        Returns:
+            The buffer.
+
+        """
+        data_type = array.dtype.str.encode('ascii')
+        header = struct.pack(f'<BB{len(data_type)}s{array.ndim}q', len(data_type), array.ndim, data_type,
+                             *array.shape)
+        return header + bytes(-len(header) % 16) + array.tobytes()
+
+    @staticmethod
+    def decode_from_buffer(buffer: bytes) -> NumpyNdarrayType:
+        """ Decode a numpy array from a buffer created with `encode_to_buffer`.
+
+        Args:
+            buffer: The buffer to decode.
+
+        Returns:
+            The decoded array, a read-only view on the buffer.
+        """
+        data_type_length, ndim = struct.unpack_from('<BB', buffer)
+        data_type, *shape = struct.unpack_from(f'<{data_type_length}s{ndim}q', buffer, 2)
+        offset = 2 + data_type_length + 8 * ndim
+        offset += -offset % 16
+        return np.frombuffer(buffer, dtype=np.dtype(data_type.decode('ascii')), offset=offset).reshape(shape)
+
+    @staticmethod
+    def decode(encoded_array: Dict[str, Any], read_only: bool = False) -> NumpyNdarrayType:
         """ Decode a numpy array from database.
 
         Args:
             encoded_array: The encoded array to decode.
+            read_only: Return a read-only view on the decoded data instead of a writable copy, which saves a copy
+                of the array. Use `np.array` to get a writable copy of the view.
 
         Returns:
             The decoded array.
@@ -97,10 +159,15 @@ class NumpyArrayEncDec:
         if isinstance(data, str):
             # decode the b64encoded data
             data = base64.b64decode(data)
+        if NumpyKeys.COMPRESSION in content:
+            data = decompress(data, content[NumpyKeys.COMPRESSION])
         array = np.frombuffer(data,
                               dtype=np.dtype(content[NumpyKeys.DATA_TYPE])).reshape(content[NumpyKeys.SHAPE])
-        # recreate the array to make it writable
-        array = np.array(array)
+        if read_only:
+            array.flags.writeable = False
+        else:
+            # recreate the array to make it writable
+            array = np.array(array)
 
         return array
 
@@ -152,12 +219,13 @@ class Serializer:
      extending the types with a custom encoder and decoder."""
 
     def __init__(self, encoders: Optional[Dict[type, TransformFunction]] = None,
-                 decoders: Optional[Dict[str, TransformFunction]] = None):
+                 decoders: Optional[Dict[str, TransformFunction]] = None, read_only_arrays: bool = False):
         """ Creates a serializer
 
         Args:
             encoders: The default encoders if any
             decoders: The default decoders if any
+            read_only_arrays: Decode numpy arrays as read-only views on the decoded data instead of writable copies
         """
 
         self.encoder = Encoder()
@@ -172,7 +240,7 @@ class Serializer:
 
         self.register(bytes, self._encode_bytes_base64, 'bytes_base64', self._decode_bytes_base64)
         self.register(np.ndarray, NumpyArrayEncDec.encode, np.array.__name__,
-                      NumpyArrayEncDec.decode)
+                      partial(NumpyArrayEncDec.decode, read_only=read_only_arrays))
         self.register(tuple, self._encode_tuple, tuple.__name__, self._decode_tuple)
         for numpy_integer_type in [np.int16, np.int32, np.int64, np.float16, np.float32, np.float64, np.bool_]:
             self.register(numpy_integer_type, self._encode_numpy_number, '__npnumber__', self._decode_numpy_number)
@@ -292,16 +360,80 @@ class Serializer:
 
         return self.decoder.decode(data)
 
-    def encode_data(self, data: Any) -> Any:
+    def serialize_binary(self, data: Any) -> bytes:
+        """ Serializes a Python object to MessagePack
+
+        Numpy arrays and numbers are packed as extension types with their raw data and bytes are packed as binary,
+        other types are encoded with the registered encode functions. Requires the msgpack package.
+
+        Args:
+            data: Any Python object
+
+        Returns:
+            MessagePack encoded bytes
+        """
+
+        return cast(bytes, _import_msgpack().packb(data, default=self._encode_binary, strict_types=True))
+
+    def unserialize_binary(self, data: bytes) -> Any:
+        """ Unserializes MessagePack bytes to a Python object
+
+        Numpy arrays are decoded without a copy, they are read-only views on the data. Requires the msgpack package.
+
+        Args:
+            data: The MessagePack encoded bytes
+
+        Returns:
+            A Python object decoded from the bytes
+        """
+
+        return _import_msgpack().unpackb(data, object_hook=self._decode, ext_hook=self._decode_binary_ext,
+                                         strict_map_key=False)
+
+    def _encode_binary(self, data: Any) -> Any:
+        msgpack = _import_msgpack()
+        type_ = type(data)
+        if type_ is np.ndarray and not data.dtype.hasobject:
+            return msgpack.ExtType(BinaryExtType.NDARRAY, NumpyArrayEncDec.encode_to_buffer(data))
+        if isinstance(data, np.generic) and type_ in self.encoder.encoders:
+            return msgpack.ExtType(BinaryExtType.NUMPY_NUMBER, NumpyArrayEncDec.encode_to_buffer(np.asarray(data)))
+        if type_ is tuple:
+            # the items are packed by msgpack, not encoded for JSON as by the registered encode function
+            return {JsonSerializeKey.OBJECT: tuple.__name__, JsonSerializeKey.CONTENT: list(data)}
+        if type_ in self.encoder.encoders:
+            return self.encoder.encoders[type_](data)
+        if isinstance(data, dict):
+            return dict(data)
+        if isinstance(data, (list, tuple)):
+            return list(data)
+        for base_type in (str, int, float):
+            if isinstance(data, base_type):
+                return base_type(data)
+        raise TypeError(f'Object of type {type_.__name__} is not MessagePack serializable')
+
+    @staticmethod
+    def _decode_binary_ext(code: int, data: bytes) -> Any:
+        if code == BinaryExtType.NDARRAY:
+            return NumpyArrayEncDec.decode_from_buffer(data)
+        if code == BinaryExtType.NUMPY_NUMBER:
+            return NumpyArrayEncDec.decode_from_buffer(data)[()]
+        raise ValueError(f'extension type {code} not in decoders')
+
+    def encode_data(self, data: Any, encode_key: Optional[TransformFunction] = None) -> Any:
         """ Recursively transform a Python object and apply transform functions to it
 
         Args:
             data: Any Python object that can be handled by an encode/transform function for that type
+            encode_key: Optional transform function for the dictionary keys. The keys are transformed in the same
+                pass, which saves a second traversal and copy of the data, e.g. for escaping keys for a database
 
         Returns:
             The transformed data
         """
 
+        if encode_key is not None:
+            return self._encode_data_and_keys(data, encode_key)
+
         if isinstance(data, dict):
             new_dict = {}
 
@@ -319,6 +451,30 @@ class Serializer:
 
         return self._encode(data)
 
+    def _encode_data_and_keys(self, data: Any, encode_key: TransformFunction) -> Any:
+        if isinstance(data, dict):
+            return {encode_key(key): self._encode_data_and_keys(value, encode_key) for key, value in data.items()}
+
+        elif isinstance(data, list):
+            return [self._encode_data_and_keys(self._encode(item), encode_key) for item in data]
+
+        encoded_data = self._encode(data)
+        if encoded_data is data:
+            return data
+        # the output of an encode function is already encoded, only its keys are left
+        return self._transform_keys(encoded_data, encode_key)
+
+    @staticmethod
+    def _transform_keys(data: Any, transform_key: TransformFunction) -> Any:
+        if isinstance(data, dict):
+            return {transform_key(key): Serializer._transform_keys(value, transform_key)
+                    for key, value in data.items()}
+
+        elif isinstance(data, list):
+            return [Serializer._transform_keys(item, transform_key) for item in data]
+
+        return data
+
     def _encode(self, data: Any) -> Any:
         type_ = type(data)
         if type_ in self.encoder.encoders:
@@ -326,11 +482,13 @@ class Serializer:
 
         return data
 
-    def decode_data(self, data: Any) -> Any:
+    def decode_data(self, data: Any, decode_key: Optional[TransformFunction] = None) -> Any:
         """ Recursively transform an object and apply transform functions to it
 
         Args:
             data: Any Python object that can be handled by a decode/transform function for that type
+            decode_key: Optional transform function for the dictionary keys, which is applied in the same pass
+                before the transform functions for the values
 
         Returns:
             The transformed data
@@ -338,15 +496,19 @@ class Serializer:
 
         if isinstance(data, dict):
             new_dict = {}
-            for key, value in data.items():
-                new_dict[key] = self.decode_data(value)
+            if decode_key is None:
+                for key, value in data.items():
+                    new_dict[key] = self.decode_data(value)
+            else:
+                for key, value in data.items():
+                    new_dict[decode_key(key)] = self.decode_data(value, decode_key)
 
             return self._decode(new_dict)
 
         if isinstance(data, list):
             new_list = []
             for item in data:
-                new_list.append(self.decode_data(item))
+                new_list.append(self.decode_data(item, decode_key))
             return new_list
 
         return data
@@ -386,5 +548,37 @@ def unserialize(data: bytes) -> Any:
     return serializer.unserialize(data.decode('utf8'))
 
 
+def serialize_binary(data: Any) -> bytes:
+    """ Serializes a Python object to MessagePack using the default serializer. Requires the msgpack package.
+
+    Args:
+        data: Any Python object
+    Returns:
+        MessagePack encoded bytes
+    """
+
+    return serializer.serialize_binary(data)
+
+
+def unserialize_binary(data: bytes) -> Any:
+    """ Unserializes MessagePack bytes to a Python object using the default serializer
+
+    Args:
+        data: The MessagePack encoded bytes
+    Returns:
+        A Python object decoded from the bytes
+    """
+
+    return serializer.unserialize_binary(data)
+
+
+def _import_msgpack() -> Any:
+    try:
+        return importlib.import_module('msgpack')
+    except ImportError as e:
+        raise ImportError('The binary serialization requires the msgpack package, install it with '
+                          'pip install qilib[msgpack]') from e
+
+
 # The default Serializer to use
 serializer = Serializer()
@@ -1,2 +1,19 @@
+import importlib
+from typing import Any
+
 from qilib.utils.storage.memory import StorageMemory
 from qilib.utils.storage.mongo import StorageMongoDb
+from qilib.utils.storage.file import StorageFile
+from qilib.utils.storage.sqlite import StorageSQLite
+from qilib.utils.storage.buffered import BufferedStorage
+from qilib.utils.storage.cached import CachedStorage
+from qilib.utils.storage.records import dump_records, load_records
+from qilib.utils.storage.retention import RetentionPolicy
+from qilib.utils.metrics import MetricsEvent, StorageMetrics
+
+
+def __getattr__(name: str) -> Any:
+    # the asynchronous storage requires the optional motor package, so it is imported on first use
+    if name == 'AsyncStorageMongoDb':
+        return importlib.import_module('qilib.utils.storage.async_mongo').AsyncStorageMongoDb
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,156 @@
+"""Quantum Inspire library
+
+Copyright 2022 QuTech Delft
+
+qilib is available under the [MIT open-source license](https://opensource.org/licenses/MIT):
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Callable, List, Optional, Union
+
+from qilib.utils.storage.interface import StorageInterface
+from qilib.utils.type_aliases import FieldType, TagType
+
+
+class AsyncStorageInterface(ABC):
+    """ Base class for asynchronous storage of measurement and calibration results.
+
+    The asynchronous storage mirrors `StorageInterface`: data is stored at the leaves of a tree that is addressed
+    with tags, and the same rules apply. Every method that does I/O is a coroutine, so the storage can be used from
+    an event loop without blocking it.
+    """
+
+    datetag_part = staticmethod(StorageInterface.datetag_part)
+    _validate_tag = staticmethod(StorageInterface._validate_tag)
+    _validate_field = staticmethod(StorageInterface._validate_field)
+    _subtag_bounds = staticmethod(StorageInterface._subtag_bounds)
+
+    def __init__(self, name: str) -> None:
+        """
+        Base constructor.
+
+        Args:
+            name: Symbolic name for the storage instance.
+        """
+
+        self.name: str = name
+        self._serialize: Callable[[Any], Any] = lambda x: x
+        self._unserialize: Callable[[Any], Any] = lambda x: x
+        self.logger: Any = logging.getLogger(self.name)
+        self.logger.info('created AsyncStorageInterface %s', self.name)
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.name!r})'
+
+    @abstractmethod
+    async def load_data(self, tag: TagType) -> Any:
+        """ Load result from storage.
+
+        Args:
+            tag: tag for result to load
+
+        Returns:
+            Data found at the node identified by the tag.
+
+        Raises:
+            NoDataAtKeyError: if there is no data for the specified tag.
+        """
+
+    @abstractmethod
+    async def load_individual_data(self, tag: TagType, field: FieldType) -> Any:
+        """ Load an individual field at a given tag from storage.
+
+        Args:
+            tag: tag for field to load
+            field: Name of the field to be loaded, or the list of keys of a nested field
+
+        Returns:
+            Data found of the field of the node identified by the tag.
+
+        Raises:
+            NoDataAtKeyError: if there is no data for the specified tag/field.
+        """
+
+    @abstractmethod
+    async def save_data(self, data: Any, tag: TagType) -> None:
+        """ Save data to storage.
+
+        Args:
+            data: data to store
+            tag: reference tag to store the data
+        """
+
+    @abstractmethod
+    async def update_individual_data(self, data: Any, tag: TagType, field: FieldType) -> None:
+        """ Update an individual field at a given tag with data.
+        If the field does not exist, it will be created.
+
+        Args:
+            data: data to store
+            tag: reference tag to store the data
+            field: Name of field, or the list of keys of a nested field
+        """
+
+    @abstractmethod
+    async def get_latest_subtag(self, tag: TagType) -> Optional[TagType]:
+        """ Return tag of latest result for a given tag.
+
+        Args:
+            tag: reference tag to retrieve latest result
+
+        Returns:
+            The tag of the first result for the nodes found at the tag sorted in descending order, or None if
+            the tag has no children.
+        """
+
+    @abstractmethod
+    async def list_data_subtags(self, tag: TagType, limit: int = 0, start: Optional[str] = None,
+                                end: Optional[str] = None, after: Optional[str] = None) -> TagType:
+        """ List available result tags of at tag.
+
+        Args:
+            tag: hdf5 tag
+            limit: Maximum number of results to generate. If 0 then return all results
+            start: If set only the subtags that are greater than or equal to start are listed
+            end: If set only the subtags that are less than end are listed
+            after: If set only the subtags that are less than after are listed, see `StorageInterface.list_data_subtags`
+        Returns:
+            results: List of child tags for tag, an empty list if the tag does not address a node
+        """
+
+    @abstractmethod
+    async def search(self, query: str) -> List[TagType]:
+        """ Find the leaves that satisfy a query, see `StorageInterface.search` for the query language
+
+        Args:
+            query: The query
+
+        Returns:
+            The tags of the matching leaves, sorted in descending order
+
+        Raises:
+            InvalidQueryError: If the query can not be parsed
+        """
+
+    @abstractmethod
+    async def tag_in_storage(self, tag: TagType) -> bool:
+        """ Check if tag is already in storage
+        Args:
+            tag: hdf5 tag
+        Returns:
+            True of tag found in storage, else False.
+        """
@@ -0,0 +1,280 @@
+"""Quantum Inspire library
+
+Copyright 2022 QuTech Delft
+
+qilib is available under the [MIT open-source license](https://opensource.org/licenses/MIT):
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from bson.codec_options import CodecOptions, TypeRegistry
+from pymongo.errors import BulkWriteError, ServerSelectionTimeoutError
+
+from qilib.utils.serialization import Serializer, serializer as _serializer
+from qilib.utils.storage.async_interface import AsyncStorageInterface
+from qilib.utils.storage.interface import ConnectionTimeoutError, NoDataAtKeyError
+from qilib.utils.storage.mongo import NumpyArrayCodec, StorageMongoDb
+from qilib.utils.storage.query import parse_query, sort_search_results
+from qilib.utils.type_aliases import FieldType, TagType
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError as e:
+    raise ImportError('The AsyncStorageMongoDb requires the motor package, install it with '
+                      'pip install qilib[async]') from e
+
+
+class AsyncStorageMongoDb(AsyncStorageInterface):
+    """Implementation of AsyncStorageInterface with an asynchronous mongodb backend
+
+    Only the materialized path layout of `StorageMongoDb` is supported, so every operation is a single round trip
+    to the database and a collection can be shared with a `StorageMongoDb` that uses the materialized path layout.
+    The tree layout is not supported, collections in the tree layout must first be converted with
+    `StorageMongoDb.migrate_to_materialized_path`. Requires the motor package.
+
+    The connection is checked and the indexes are created when the storage is used for the first time.
+    """
+
+    def __init__(self, name: str, host: str = 'localhost', port: int = 27017, database: str = '',
+                 serializer: Union[Serializer, None] = None, connection_timeout: float = 30000,
+                 create_indexes: bool = True) -> None:
+        """Asynchronous MongoDB implementation of storage class
+
+        See also: `AsyncStorageInterface`
+
+        Args:
+            name: Symbolic name for the storage instance.
+            host: MongoDB host
+            port: MongoDB port
+            database: The database to use, if empty the name of the storage is used
+            connection_timeout: How long to try to connect to database before raising an error in milliseconds
+            create_indexes: Ensure the indexes of the materialized path layout exist. If False the indexes should be
+                provisioned by the database administrator, the storage relies on the unique path index
+        """
+        super().__init__(name)
+
+        type_registry = TypeRegistry([NumpyArrayCodec()])
+        codec_options = CodecOptions(type_registry=type_registry)  # type: CodecOptions[Any]
+        self._client = AsyncIOMotorClient(host, port, serverSelectionTimeoutMS=connection_timeout)
+        self._connection_timeout = connection_timeout
+        self._db = self._client.get_database(database or name, codec_options=codec_options)
+        self._collection = self._db.get_collection('storage')
+        self._create_indexes = create_indexes
+        self._initialized = False
+
+        if serializer is None:
+            serializer = _serializer
+        self._serialize = serializer.encode_data
+        self._unserialize = serializer.decode_data
+        self._serialize_value: Callable[[Any], Any] = partial(serializer.encode_data,
+                                                              encode_key=StorageMongoDb._encode_key)
+        self._unserialize_value: Callable[[Any], Any] = partial(serializer.decode_data,
+                                                                decode_key=StorageMongoDb._decode_key)
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} at 0x{id(self):x}: name {self._db.name}>'
+
+    def __str__(self) -> str:
+        return f'<{type(self).__name__}: name {self._db.name}>'
+
+    async def _initialize(self) -> None:
+        """ Check the connection to the database server and create the indexes on first use
+
+        Raises:
+            ConnectionTimeoutError: If connection to database has not been established before the connection timeout
+                is reached
+        """
+        if self._initialized:
+            return
+        try:
+            await self._client.server_info()
+        except ServerSelectionTimeoutError as e:
+            raise ConnectionTimeoutError(
+                f'Failed to connect to Mongo database within {self._connection_timeout} milliseconds') from e
+        if self._create_indexes:
+            await self._collection.create_index('path', unique=True, sparse=True)
+            await self._collection.create_index([('parent_path', 1), ('tag', 1)])
+        self._initialized = True
+
+    async def _retrieve_value(self, tag: TagType, field: Optional[str] = None) -> Any:
+        """ Retrieve the value / field value of a given leaf tag
+
+        Args:
+            tag: The leaf tag
+            field: The encoded field to be retrieved, the keys of a nested field are separated by dots.
+                Default value is none.
+
+        Returns:
+            Data held by the leaf. If field is provided, returns the value of the field stored in the leaf
+
+        Raises:
+            NoDataAtKeyError: If the tag does not exist or if the field does not exist
+        """
+        await self._initialize()
+        projection = None if field is None else {f'value.{field}': 1}
+        doc = await self._collection.find_one({'path': StorageMongoDb._tag_to_path(tag)}, projection)
+
+        if doc is None:
+            raise NoDataAtKeyError(f'Tag "{tag[-1]}" cannot be found')
+        elif 'value' not in doc:
+            raise NoDataAtKeyError(f'Tag "{tag[-1]}" is not a leaf')
+        elif field is None:
+            return doc['value']
+        return StorageMongoDb._get_field(doc['value'], field.split('.'))
+
+    async def _raise_path_error(self, tag: TagType) -> None:
+        """ Find out why a tag is not an existing leaf and raise the matching error
+
+        Args:
+            tag: The tag
+
+        Raises:
+              NodeAlreadyExistsError: If a tag in Tag List is an unexpected node/leaf
+              NoDataAtKeyError:  If a tag in Tag List does not exist
+        """
+        paths = [StorageMongoDb._tag_to_path(tag[:index + 1]) for index in range(len(tag))]
+        documents = await self._collection.find({'path': {'$in': paths}}, {'path': 1, 'value': 1}).to_list(None)
+        existing = {doc['path'] for doc in documents}
+        leaves = {doc['path'] for doc in documents if 'value' in doc}
+        raise StorageMongoDb._path_error(tag, existing, leaves)
+
+    async def load_data(self, tag: TagType) -> Any:
+        if not isinstance(tag, list):
+            raise TypeError('Tag should be a list of strings')
+
+        if len(tag) == 0:
+            raise NoDataAtKeyError('Tag cannot be empty')
+
+        return self._unserialize_value(await self._retrieve_value(tag))
+
+    async def save_data(self, data: Any, tag: TagType) -> None:
+        """ Save data to storage with a single ordered bulk write of upserts
+
+        Args:
+            data: data to store
+            tag: reference tag to store the data
+
+        Raises:
+              NodeAlreadyExistsError: If a tag in Tag List is an unexpected node/leaf
+        """
+        self._validate_tag(tag)
+        await self._initialize()
+        requests, request_tags = StorageMongoDb._path_write_requests(
+            [(tag, self._serialize_value(data))])
+        try:
+            await self._collection.bulk_write(requests, ordered=True)
+        except BulkWriteError as e:
+            raise StorageMongoDb._path_write_error(e, request_tags) from e
+
+    async def load_individual_data(self, tag: TagType, field: FieldType) -> Any:
+        """ Retrieve an individual field value at a given tag
+
+            Args:
+                tag: The tag
+                field: Name of the individual field to be retrieved, or the list of keys of a nested field
+
+            Raises:
+                NoDataAtKeyError if the tag is empty
+
+            Returns:
+                Value of the field
+        """
+        self._validate_tag(tag)
+        self._validate_field(field)
+
+        if len(tag) == 0:
+            raise NoDataAtKeyError('Tag cannot be empty')
+
+        encoded_field = StorageMongoDb._encode_field(self._serialize(field))
+        return self._unserialize_value(await self._retrieve_value(tag, encoded_field))
+
+    async def update_individual_data(self, data: Any, tag: TagType, field: FieldType) -> None:
+        """ Update an individual field at a given tag with the given data.
+        If the field does not exist, it will be created.
+
+            Args:
+                data: Data to update
+                tag: The tag
+                field: Name of the individual field to updated, or the list of keys of a nested field
+
+        """
+        self._validate_tag(tag)
+        self._validate_field(field)
+        await self._initialize()
+        encoded_field = StorageMongoDb._encode_field(self._serialize(field))
+        result = await self._collection.update_one(
+            {'path': StorageMongoDb._tag_to_path(tag), 'value': {'$exists': True}},
+            {'$set': {f'value.{encoded_field}': self._serialize_value(data)}, '$inc': {'version': 1}})
+        if result.matched_count == 0:
+            await self._raise_path_error(tag)
+
+    async def get_latest_subtag(self, tag: TagType) -> Optional[TagType]:
+        """ Get the latest subtag
+
+        Args:
+            tag: Tag to search from
+        Returns:
+            Latest subtag found among subtags or None if there are no subtags
+        """
+        child_tags = await self.list_data_subtags(tag, limit=1)
+        if len(child_tags) == 0:
+            return None
+
+        return tag + [child_tags[0]]
+
+    async def list_data_subtags(self, tag: TagType, limit: int = 0, start: Optional[str] = None,
+                                end: Optional[str] = None, after: Optional[str] = None) -> TagType:
+        """ List subtags for the given tag. The number of subtags listed is based on the limit parameter (0 for
+        listing all subtags). The range of subtags is selected with an indexed range query on the tag
+
+        Args:
+            tag: Tag to search from
+            limit: Maximum number of subtags to return. If set to zero there is no limit
+            start: If set only the subtags that are greater than or equal to start are listed
+            end: If set only the subtags that are less than end are listed
+            after: If set only the subtags that are less than after are listed, see `StorageInterface.list_data_subtags`
+        Returns:
+            List of subtags found, sorted in descending order
+        """
+        await self._initialize()
+        query: Dict[str, Any] = {'parent_path': StorageMongoDb._tag_to_path(tag)}
+        lower, upper = self._subtag_bounds(start, end, after)
+        if lower is not None or upper is not None:
+            query['tag'] = StorageMongoDb._tag_range(lower, upper)
+        cursor = self._collection.find(query, {'tag': 1}, limit=limit, sort=[('tag', -1)])
+        return [doc['tag'] for doc in await cursor.to_list(None)]
+
+    async def search(self, query: str) -> List[TagType]:
+        """ Find the leaves that satisfy a query with a single find
+
+        Args:
+            query: The query
+
+        Returns:
+            The tags of the matching leaves, sorted in descending order
+        """
+        leaf_filter: Dict[str, Any] = StorageMongoDb._compile_conditions(parse_query(query),
+                                                                         lambda index: f'tags.{index}')
+        leaf_filter['value'] = {'$exists': True}
+        await self._initialize()
+        documents = await self._collection.find(leaf_filter, {'tags': 1}).to_list(None)
+        return sort_search_results([doc['tags'] for doc in documents])
+
+    async def tag_in_storage(self, tag: TagType) -> bool:
+        if len(tag) == 0:
+            return True
+        await self._initialize()
+        return await self._collection.find_one({'path': StorageMongoDb._tag_to_path(tag)}, {'_id': 1}) is not None
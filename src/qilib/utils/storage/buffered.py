@@ -0,0 +1,476 @@
+"""Quantum Inspire library
+
+Copyright 2022 QuTech Delft
+
+qilib is available under the [MIT open-source license](https://opensource.org/licenses/MIT):
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from qilib.utils.storage.interface import NoDataAtKeyError, StorageInterface
+from qilib.utils.type_aliases import FieldType, TagType
+
+
+class FlushError(Exception):
+    """ Raised when writes of a `BufferedStorage` could not be written to the storage
+
+    The failed writes are kept in the queue. The errors of the failed writes are available per tag.
+    """
+
+    def __init__(self, errors: Dict[Tuple[str, ...], Exception]) -> None:
+        tags = ', '.join(str(list(key)) for key in errors)
+        super().__init__(f'Failed to write {len(errors)} buffered tags, the writes are kept in the queue: {tags}')
+        self.errors = errors
+
+
+class _PendingWrite:
+    """ The coalesced writes to a single tag that have not been flushed yet """
+
+    def __init__(self) -> None:
+        self.has_data = False
+        self.data: Any = None
+        self.fields: Dict[Tuple[Union[str, int], ...], Any] = {}
+
+    def update(self, path: Tuple[Union[str, int], ...], value: Any) -> None:
+        """ Add a field update, replacing the pending updates of the field and of the fields nested in it """
+        for pending in [pending for pending in self.fields if pending[:len(path)] == path]:
+            del self.fields[pending]
+        self.fields[path] = value
+
+    def snapshot(self) -> '_PendingWrite':
+        """ A copy of the writes that is not changed by later writes to the tag """
+        write = _PendingWrite()
+        write.has_data = self.has_data
+        write.data = self.data
+        write.fields = dict(self.fields)
+        return write
+
+    def apply(self, data: Any) -> Any:
+        """ Apply the writes to the data of the leaf without modifying it
+
+        Args:
+            data: The data of the leaf before the writes
+
+        Returns:
+            The data of the leaf after the writes
+        """
+        if self.has_data:
+            data = self.data
+        for path, value in self.fields.items():
+            data = StorageInterface._set_field(data, list(path), value, copy_containers=True)
+        return data
+
+
+class BufferedStorage(StorageInterface):
+    """ Write-behind buffer in front of another storage
+
+    Writes are queued in memory and return immediately. A background thread writes them to the storage in batches
+    when the queue holds `max_pending` tags, when the oldest write is `flush_interval` seconds old, or when `flush`
+    is called. Repeated writes to the same tag are coalesced: a save replaces the pending writes of the tag and
+    field updates of the same field replace each other. The saves of a flush are written with a single `save_many`.
+
+    Reads see the buffered writes. `search` flushes the queue first. A recursive delete drops the pending writes in
+    the deleted subtrees before the queue is flushed.
+
+    If writes fail, the other writes of the flush are still written and a `FlushError` with the failed tags is
+    raised. Errors of a background flush are logged and raised by the next write, `flush` or `close`. The failed
+    writes are kept in the queue and retried by the next flush, a failed write that should not be retried is
+    discarded by deleting its tag. Writes to a closed buffered storage raise a ValueError.
+    """
+
+    def __init__(self, storage: StorageInterface, max_pending: int = 1000,
+                 flush_interval: Optional[float] = 1.0) -> None:
+        """ Buffered storage wrapper
+
+        See also: `StorageInterface`
+
+        Args:
+            storage: The storage to write to
+            max_pending: Number of tags with pending writes at which a flush is started
+            flush_interval: Maximum age in seconds of a pending write before it is flushed. If None writes are only
+                flushed when the queue is full or on `flush`
+        """
+        super().__init__(storage.name)
+        self._storage = storage
+        self._max_pending = max_pending
+        self._flush_interval = flush_interval
+
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._pending: 'OrderedDict[Tuple[str, ...], _PendingWrite]' = OrderedDict()
+        self._flushing: Dict[Tuple[str, ...], _PendingWrite] = {}
+        self._oldest_pending: Optional[float] = None
+        self._error: Optional[BaseException] = None
+        self._retrying = False
+        self._closed = False
+
+        self.writes = 0
+        self.coalesced_writes = 0
+        self.flushes = 0
+        self.flushed_writes = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self._total_flush_latency = 0.0
+
+        self._thread = threading.Thread(target=self._run, name=f'BufferedStorage {self.name}', daemon=True)
+        self._thread.start()
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self._storage!r})'
+
+    @property
+    def storage(self) -> StorageInterface:
+        """ The storage the writes are flushed to """
+        return self._storage
+
+    @property
+    def queue_depth(self) -> int:
+        """ Number of tags with pending writes """
+        with self._condition:
+            return len(self._pending)
+
+    def statistics(self) -> Dict[str, float]:
+        """ The buffer statistics
+
+        Returns:
+            The queue depth, the number of writes, coalesced writes, flushes and flushed tags, and the last, maximum
+            and mean flush latency in seconds
+        """
+        with self._condition:
+            return {'queue_depth': len(self._pending), 'writes': self.writes,
+                    'coalesced_writes': self.coalesced_writes, 'flushes': self.flushes,
+                    'flushed_writes': self.flushed_writes, 'last_flush_latency': self.last_flush_latency,
+                    'max_flush_latency': self.max_flush_latency,
+                    'mean_flush_latency': self._total_flush_latency / self.flushes if self.flushes else 0.0}
+
+    def _run(self) -> None:
+        """ Flush the pending writes when the queue is full or the oldest write is too old, until closed """
+        while True:
+            with self._condition:
+                while not self._closed and not self._flush_due():
+                    timeout = None
+                    if self._flush_interval is not None and self._oldest_pending is not None:
+                        timeout = self._oldest_pending + self._flush_interval - time.monotonic()
+                    self._condition.wait(timeout)
+                if self._closed:
+                    return
+            try:
+                self._flush_pending()
+            except Exception as e:  # pylint: disable=broad-except
+                self.logger.exception('Failed to flush the buffered writes of %s', self.name)
+                with self._condition:
+                    self._error = e
+
+    def _flush_due(self) -> bool:
+        # after a failed flush a full queue is only flushed again when a new write arrives
+        if len(self._pending) >= self._max_pending and not self._retrying:
+            return True
+        return self._flush_interval is not None and self._oldest_pending is not None \
+            and time.monotonic() - self._oldest_pending >= self._flush_interval
+
+    def _flush_pending(self) -> None:
+        """ Write the pending writes to the storage """
+        with self._flush_lock:
+            with self._condition:
+                if not self._pending:
+                    return
+                self._flushing = dict(self._pending)
+                self._pending = OrderedDict()
+                self._oldest_pending = None
+
+            start = time.monotonic()
+            errors: Dict[Tuple[str, ...], Exception] = {}
+            failed: Dict[Tuple[str, ...], _PendingWrite] = {}
+            try:
+                saves = [(key, write) for key, write in self._flushing.items() if write.has_data]
+                try:
+                    self._storage.save_many([(list(key), write.apply(None)) for key, write in saves])
+                except Exception:  # pylint: disable=broad-except
+                    # find the failing saves, the other saves are written
+                    for key, write in saves:
+                        try:
+                            self._storage.save_data(write.apply(None), list(key))
+                        except Exception as e:  # pylint: disable=broad-except
+                            errors[key] = e
+                            failed[key] = write
+                for key, write in self._flushing.items():
+                    if not write.has_data:
+                        remaining = self._write_fields(key, write, errors)
+                        if remaining is not None:
+                            failed[key] = remaining
+            except BaseException:
+                failed = self._flushing
+                raise
+            finally:
+                latency = time.monotonic() - start
+                with self._condition:
+                    self.flushes += 1
+                    self.flushed_writes += len(self._flushing) - len(failed)
+                    self.last_flush_latency = latency
+                    self.max_flush_latency = max(self.max_flush_latency, latency)
+                    self._total_flush_latency += latency
+                    self._flushing = {}
+                    self._requeue(failed)
+            if errors:
+                raise FlushError(errors) from next(iter(errors.values()))
+
+    def _write_fields(self, key: Tuple[str, ...], write: _PendingWrite,
+                      errors: Dict[Tuple[str, ...], Exception]) -> Optional[_PendingWrite]:
+        """ Write the field updates of a tag in order, until an update fails
+
+        Args:
+            key: The tag
+            write: The pending field updates of the tag
+            errors: The errors of the failed writes, the error of the tag is added if an update fails
+
+        Returns:
+            The failed update and the updates after it, None if all updates were written
+        """
+        fields = list(write.fields.items())
+        for index, (path, value) in enumerate(fields):
+            field = path[0] if len(path) == 1 else list(path)
+            try:
+                self._storage.update_individual_data(value, list(key), field)
+            except Exception as e:  # pylint: disable=broad-except
+                errors[key] = e
+                remaining = _PendingWrite()
+                remaining.fields = dict(fields[index:])
+                return remaining
+        return None
+
+    def _requeue(self, writes: Dict[Tuple[str, ...], _PendingWrite]) -> None:
+        """ Put writes that were not written back in front of the queue, should be called with the condition held
+
+        A pending save of the same tag replaces the write, pending field updates of the tag are applied after it.
+
+        Args:
+            writes: The writes that were not written
+        """
+        if not writes:
+            return
+        for key, write in reversed(list(writes.items())):
+            newer = self._pending.get(key)
+            if newer is not None and newer.has_data:
+                continue
+            if newer is not None:
+                for path, value in newer.fields.items():
+                    write.update(path, value)
+            self._pending[key] = write
+            self._pending.move_to_end(key, last=False)
+        self._oldest_pending = time.monotonic()
+        self._retrying = True
+
+    def _raise_error(self) -> None:
+        """ Raise the error of a failed background flush, if any """
+        with self._condition:
+            error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def flush(self) -> None:
+        """ Write all pending writes to the storage
+
+        Raises:
+            FlushError: If writes of this flush failed
+            Exception: The error of a failed background flush
+        """
+        self._raise_error()
+        self._flush_pending()
+
+    def close(self) -> None:
+        """ Stop the background thread and flush the pending writes
+
+        Raises:
+            FlushError: If pending writes failed, the failed writes can be retried with `flush`
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self.flush()
+
+    def _check_open(self) -> None:
+        """ Raise a ValueError if the buffered storage is closed """
+        if self._closed:
+            raise ValueError('Operation on closed BufferedStorage.')
+
+    def _enqueue(self, tag: TagType) -> _PendingWrite:
+        """ Get the pending write of a tag, creating it if needed. Should be called with the condition held """
+        key = tuple(tag)
+        self.writes += 1
+        self._retrying = False
+        write = self._pending.get(key)
+        if write is None:
+            write = self._pending[key] = _PendingWrite()
+            if self._oldest_pending is None:
+                # the background thread waits without timeout while the queue is empty
+                self._oldest_pending = time.monotonic()
+                self._condition.notify_all()
+        else:
+            self.coalesced_writes += 1
+        if len(self._pending) >= self._max_pending:
+            self._condition.notify_all()
+        return write
+
+    def _writes(self, tag: TagType) -> List[_PendingWrite]:
+        """ Snapshots of the writes to a tag that are being flushed or pending, oldest first
+
+        The snapshots are taken under the lock, so they can be applied while other threads write to the tag.
+        """
+        key = tuple(tag)
+        with self._condition:
+            return [write.snapshot() for write in (self._flushing.get(key), self._pending.get(key))
+                    if write is not None]
+
+    def save_data(self, data: Any, tag: TagType) -> None:
+        self._validate_tag(tag)
+        self._check_open()
+        self._raise_error()
+        with self._condition:
+            write = self._enqueue(tag)
+            write.has_data = True
+            write.data = data
+            write.fields = {}
+
+    def save_many(self, items: Sequence[Tuple[TagType, Any]], overwrite: bool = True) -> None:
+        self._check_open()
+        for tag, data in items:
+            if overwrite or not self.tag_in_storage(tag):
+                self.save_data(data, tag)
+
+    def update_individual_data(self, data: Any, tag: TagType, field: FieldType) -> None:
+        self._validate_tag(tag)
+        self._validate_field(field)
+        self._check_open()
+        self._raise_error()
+        with self._condition:
+            self._enqueue(tag).update(tuple(self._field_path(field)), data)
+
+    def _drop_pending(self, tags: Sequence[TagType]) -> bool:
+        """ Drop the pending writes in the subtrees of the given tags
+
+        Returns:
+            True if any pending write was dropped
+        """
+        prefixes = {tuple(tag) for tag in tags}
+        with self._condition:
+            keys = [key for key in self._pending if any(key[:len(prefix)] == prefix for prefix in prefixes)]
+            for key in keys:
+                del self._pending[key]
+            if not self._pending:
+                self._oldest_pending = None
+        return len(keys) > 0
+
+    def delete(self, tag: TagType, recursive: bool = True) -> None:
+        self._validate_tag(tag)
+        if len(tag) == 0:
+            raise NoDataAtKeyError('Tag cannot be empty')
+        dropped = recursive and self._drop_pending([tag])
+        self.flush()
+        if dropped and not self._storage.tag_in_storage(tag):
+            return
+        self._storage.delete(tag, recursive)
+
+    def delete_many(self, tags: Sequence[TagType], recursive: bool = True) -> None:
+        for tag in tags:
+            self._validate_tag(tag)
+        if recursive:
+            self._drop_pending(tags)
+        self.flush()
+        self._storage.delete_many(tags, recursive)
+
+    def load_data(self, tag: TagType) -> Any:
+        writes = self._writes(tag) if isinstance(tag, list) else []
+        if any(write.has_data for write in writes):
+            data = None
+        else:
+            data = self._storage.load_data(tag)
+        for write in writes:
+            data = write.apply(data)
+        return data
+
+    def load_many(self, tags: Sequence[TagType]) -> List[Any]:
+        writes = [self._writes(tag) for tag in tags]
+        unbuffered = [index for index, tag_writes in enumerate(writes)
+                      if not any(write.has_data for write in tag_writes)]
+        results: List[Any] = [None] * len(tags)
+        for index, data in zip(unbuffered, self._storage.load_many([tags[index] for index in unbuffered])):
+            results[index] = data
+        for index, tag_writes in enumerate(writes):
+            for write in tag_writes:
+                results[index] = write.apply(results[index])
+        return results
+
+    def load_individual_data(self, tag: TagType, field: FieldType) -> Any:
+        self._validate_field(field)
+        path = tuple(self._field_path(field))
+        for write in reversed(self._writes(tag)):
+            for pending, value in reversed(list(write.fields.items())):
+                if path[:len(pending)] == pending:
+                    return self._get_field(value, path[len(pending):])
+                if pending[:len(path)] == path:
+                    # a field nested in the requested field is pending
+                    return self._get_field(self.load_data(tag), path)
+            if write.has_data:
+                return self._get_field(write.data, path)
+        return self._storage.load_individual_data(tag, field)
+
+    def list_data_subtags(self, tag: TagType, limit: int = 0, start: Optional[str] = None,
+                          end: Optional[str] = None, after: Optional[str] = None) -> TagType:
+        """ List the subtags of the storage and of the buffered writes
+
+        Args:
+            tag: Tag to search from
+            limit: Maximum number of subtags to return. If set to zero there is no limit
+            start: If set only the subtags that are greater than or equal to start are listed
+            end: If set only the subtags that are less than end are listed
+            after: If set only the subtags that are less than after are listed, see `StorageInterface.list_data_subtags`
+        Returns:
+            List of subtags found, sorted in descending order
+        """
+        children = set(self._storage.list_data_subtags(tag, limit, start, end, after))
+        prefix = tuple(tag)
+        with self._condition:
+            for key in list(self._flushing) + list(self._pending):
+                if len(key) > len(prefix) and key[:len(prefix)] == prefix:
+                    children.add(key[len(prefix)])
+        return self._filter_subtags(sorted(children, reverse=True), limit, start, end, after)
+
+    def get_latest_subtag(self, tag: TagType) -> Optional[TagType]:
+        child_tags = self.list_data_subtags(tag, limit=1)
+        if len(child_tags) == 0:
+            return None
+        return tag + [child_tags[0]]
+
+    def search(self, query: str) -> List[TagType]:
+        """ Flush the pending writes and search the storage, see `StorageInterface.search` """
+        self.flush()
+        return self._storage.search(query)
+
+    def export_subtree(self, tag: TagType, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """ Flush the pending writes and export a subtree of the storage, see `StorageInterface.export_subtree` """
+        self.flush()
+        return self._storage.export_subtree(tag, batch_size)
+
+    def tag_in_storage(self, tag: TagType) -> bool:
+        prefix = tuple(tag)
+        with self._condition:
+            for key in list(self._flushing) + list(self._pending):
+                if key[:len(prefix)] == prefix:
+                    return True
+        return self._storage.tag_in_storage(tag)
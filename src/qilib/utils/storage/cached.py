@@ -0,0 +1,283 @@
+"""Quantum Inspire library
+
+Copyright 2022 QuTech Delft
+
+qilib is available under the [MIT open-source license](https://opensource.org/licenses/MIT):
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+from qilib.utils.storage.interface import StorageInterface
+from qilib.utils.storage.views import read_only_view
+from qilib.utils.type_aliases import FieldType, TagType
+
+_FieldPath = Tuple[Union[str, int], ...]
+_CacheKey = Tuple[Tuple[str, ...], Optional[_FieldPath]]
+
+
+class CachedStorage(StorageInterface):
+    """ Read-through cache in front of another storage
+
+    The data loaded with `load_data`, `load_many` and `load_individual_data` is kept in a bounded LRU cache. Fields
+    loaded with `load_individual_data` are cached separately from the data of the whole leaf. Writes through the cache
+    invalidate the cached data of the written tag and deletes invalidate the cached data of the deleted subtrees.
+    Writes by other clients of the storage are only seen when the cached data expires, or when `watch_changes` is
+    enabled for a storage that can watch its changes, e.g. a `StorageMongoDb`.
+
+    The cached data is shared between the callers, so it is returned as a read-only view, see `read_only_view`.
+    Dictionaries and lists are copied when the caller modifies them and numpy arrays are not writeable. The views
+    are dict and list instances, so the loaded data can be stored again or passed to a PythonJsonStructure.
+    """
+
+    def __init__(self, storage: StorageInterface, max_size: int = 1024, ttl: Optional[float] = None,
+                 watch_changes: bool = False) -> None:
+        """ Caching storage wrapper
+
+        See also: `StorageInterface`
+
+        Args:
+            storage: The storage to cache
+            max_size: Maximum number of cached leaves and fields. If zero the cache is disabled
+            ttl: Time in seconds after which cached data expires. If None the data does not expire
+            watch_changes: Invalidate the cache on the changes of all clients of the storage, see
+                `StorageMongoDb.watch_changes`. Only supported for storages with a `watch_changes` method
+
+        Raises:
+            TypeError: If `watch_changes` is set and the storage has no `watch_changes` method
+        """
+        super().__init__(storage.name)
+        self._storage = storage
+        self._max_size = max_size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[_CacheKey, Tuple[Any, float]]' = OrderedDict()
+        self._fields: Dict[Tuple[str, ...], Set[Optional[_FieldPath]]] = {}
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        if watch_changes:
+            if not hasattr(storage, 'watch_changes'):
+                raise TypeError(f'Watching changes is not supported for {type(storage).__name__}')
+            self._watcher = threading.Thread(target=self._watch, args=(storage,),
+                                             name=f'CachedStorage {self.name}', daemon=True)
+            self._watcher.start()
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self._storage!r})'
+
+    @property
+    def storage(self) -> StorageInterface:
+        """ The cached storage """
+        return self._storage
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _watch(self, storage: Any) -> None:
+        """ Invalidate the cached data of the changes in the storage until closed """
+        try:
+            for tag in storage.watch_changes(self._stop):
+                if tag is None:
+                    self.invalidate()
+                else:
+                    self.invalidate(tag)
+        except Exception:  # pylint: disable=broad-except
+            self.logger.exception('Stopped watching the changes of %s, the cache is disabled', self.name)
+            self._max_size = 0
+            self.invalidate()
+
+    def close(self) -> None:
+        """ Stop watching the changes of the storage """
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+
+    def statistics(self) -> Dict[str, int]:
+        """ The cache statistics
+
+        Returns:
+            The number of hits, misses, evictions, invalidated entries and cached entries
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'invalidations': self.invalidations, 'size': len(self._entries)}
+
+    def _get(self, key: _CacheKey) -> Tuple[bool, Any]:
+        """ Look up cached data and count the hit or miss
+
+        Returns:
+            True and the data if the data is cached and not expired, else False and the current generation of the
+            cache, which should be passed to `_put`
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return True, entry[0]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return False, self._generation
+
+    def _put(self, key: _CacheKey, data: Any, generation: int) -> None:
+        """ Cache data, evicting the least recently used entries if the cache is full
+
+        Args:
+            key: The tag and field of the data
+            data: The data
+            generation: The generation of the cache before the data was loaded. If the cache was invalidated since,
+                the data may be outdated and is not cached
+        """
+        if self._max_size <= 0:
+            return
+        expires = time.monotonic() + self._ttl if self._ttl is not None else float('inf')
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (data, expires)
+            self._entries.move_to_end(key)
+            self._fields.setdefault(key[0], set()).add(key[1])
+            while len(self._entries) > self._max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: _CacheKey) -> None:
+        """ Remove an entry, should be called with the lock held """
+        del self._entries[key]
+        fields = self._fields[key[0]]
+        fields.discard(key[1])
+        if not fields:
+            del self._fields[key[0]]
+
+    def invalidate(self, tag: Optional[TagType] = None, field: Optional[FieldType] = None) -> None:
+        """ Remove cached data
+
+        Args:
+            tag: The tag of the leaf to remove. If None the whole cache is cleared
+            field: If set only this field, the fields nested in it or containing it and the data of the whole leaf
+                are removed, else also all other fields of the leaf
+        """
+        with self._lock:
+            self._generation += 1
+            if tag is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self._fields.clear()
+                return
+            key = tuple(tag)
+            path = None if field is None else tuple(self._field_path(field))
+            for cached_field in list(self._fields.get(key, ())):
+                if path is None or cached_field is None or cached_field[:len(path)] == path \
+                        or path[:len(cached_field)] == cached_field:
+                    self._remove((key, cached_field))
+                    self.invalidations += 1
+
+    def _invalidate_subtrees(self, tags: Sequence[TagType]) -> None:
+        """ Remove the cached data of all leaves in the subtrees of the given tags """
+        prefixes = {tuple(tag) for tag in tags}
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._fields if any(key[:len(prefix)] == prefix for prefix in prefixes)]:
+                for cached_field in list(self._fields[key]):
+                    self._remove((key, cached_field))
+                    self.invalidations += 1
+
+    def load_data(self, tag: TagType) -> Any:
+        key = (tuple(tag), None)
+        found, data = self._get(key)
+        if not found:
+            generation, data = data, self._storage.load_data(tag)
+            self._put(key, data, generation)
+        return read_only_view(data)
+
+    def load_many(self, tags: Sequence[TagType]) -> List[Any]:
+        results: List[Any] = [None] * len(tags)
+        missing: List[int] = []
+        generation = 0
+        for index, tag in enumerate(tags):
+            found, data = self._get((tuple(tag), None))
+            if found:
+                results[index] = data
+            else:
+                if not missing:
+                    generation = data
+                missing.append(index)
+        if missing:
+            for index, data in zip(missing, self._storage.load_many([tags[index] for index in missing])):
+                results[index] = data
+                self._put((tuple(tags[index]), None), data, generation)
+        return [read_only_view(data) for data in results]
+
+    def load_individual_data(self, tag: TagType, field: FieldType) -> Any:
+        self._validate_field(field)
+        key = (tuple(tag), tuple(self._field_path(field)))
+        found, data = self._get(key)
+        if not found:
+            generation, data = data, self._storage.load_individual_data(tag, field)
+            self._put(key, data, generation)
+        return read_only_view(data)
+
+    def save_data(self, data: Any, tag: TagType) -> None:
+        self._storage.save_data(data, tag)
+        self.invalidate(tag)
+
+    def save_many(self, items: Sequence[Tuple[TagType, Any]], overwrite: bool = True) -> None:
+        try:
+            self._storage.save_many(items, overwrite)
+        finally:
+            for tag, _ in items:
+                self.invalidate(tag)
+
+    def update_individual_data(self, data: Any, tag: TagType, field: FieldType) -> None:
+        self._storage.update_individual_data(data, tag, field)
+        self.invalidate(tag, field)
+
+    def delete(self, tag: TagType, recursive: bool = True) -> None:
+        try:
+            self._storage.delete(tag, recursive)
+        finally:
+            self._invalidate_subtrees([tag])
+
+    def delete_many(self, tags: Sequence[TagType], recursive: bool = True) -> None:
+        try:
+            self._storage.delete_many(tags, recursive)
+        finally:
+            self._invalidate_subtrees(tags)
+
+    def get_latest_subtag(self, tag: TagType) -> Optional[TagType]:
+        return self._storage.get_latest_subtag(tag)
+
+    def list_data_subtags(self, tag: TagType, limit: int = 0, start: Optional[str] = None,
+                          end: Optional[str] = None, after: Optional[str] = None) -> TagType:
+        return self._storage.list_data_subtags(tag, limit, start, end, after)
+
+    def search(self, query: str) -> List[TagType]:
+        return self._storage.search(query)
+
+    def export_subtree(self, tag: TagType, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        return self._storage.export_subtree(tag, batch_size)
+
+    def tag_in_storage(self, tag: TagType) -> bool:
+        return self._storage.tag_in_storage(tag)
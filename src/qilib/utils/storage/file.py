@@ -0,0 +1,451 @@
+"""Quantum Inspire library
+
+Copyright 2022 QuTech Delft
+
+qilib is available under the [MIT open-source license](https://opensource.org/licenses/MIT):
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import json
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from qilib.utils.serialization import Serializer, serializer as _serializer
+from qilib.utils.storage.interface import (NoDataAtKeyError, NodeAlreadyExistsError, NodeDoesNotExistsError,
+                                           NodeNotEmptyError, StorageInterface)
+from qilib.utils.storage.query import SearchIndex, parse_query
+from qilib.utils.type_aliases import FieldType, NumpyNdarrayType, TagType
+
+
+class StorageFile(StorageInterface):
+    """ Implementation of StorageInterface with a directory tree on the local file system
+
+    Every node is a directory and every leaf is a JSON file that is encoded with the `Serializer`. Numpy arrays in
+    a leaf that are larger than the memmap threshold are stored next to the JSON file as raw .npy files. When the
+    leaf is loaded these arrays are opened as read-only memory maps, so a large array is read lazily without copying
+    it into memory.
+
+    Files are written to a temporary file first and then moved into place. Every write of a leaf stores its arrays
+    under new file names that are referenced from the JSON file, which is moved into place last. The arrays of the
+    previous version are removed afterwards, so readers see either the old or the new leaf, never a partially
+    written one. `search` reads all leaves; it is meant for small trees.
+    """
+
+    LEAF_SUFFIX = '.json'
+    ARRAY_SUFFIX = '.npy'
+    ARRAY_KEY = '__npy_file__'
+    _ENCODED_INT_PATTERN = re.compile(r'_integer\[(-?\d+)\]')
+
+    def __init__(self, name: str, directory: str, serializer: Optional[Serializer] = None,
+                 memmap_threshold: int = 65536) -> None:
+        """ File system implementation of storage class
+
+        See also: `StorageInterface`
+
+        Args:
+            name: Symbolic name for the storage instance.
+            directory: Root directory of the storage tree, it is created if it does not exist
+            serializer: The serializer for the leaves, if None the default serializer is used
+            memmap_threshold: Numpy arrays of at least this number of bytes are stored in .npy files and loaded as
+                memory maps. Smaller arrays are stored in the JSON file
+        """
+        super().__init__(name)
+        self._directory = os.path.abspath(directory)
+        os.makedirs(self._directory, exist_ok=True)
+        self._serializer = _serializer if serializer is None else serializer
+        self._memmap_threshold = memmap_threshold
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} at 0x{id(self):x}: name {self.name}, directory {self._directory}>'
+
+    @property
+    def directory(self) -> str:
+        """ Root directory of the storage tree """
+        return self._directory
+
+    @staticmethod
+    def _encode_name(part: str) -> str:
+        """ Convert a tag component to a file name
+
+        Characters that are not safe in file names are percent-encoded. Dots are encoded as well, so a name never
+        has a suffix, and the empty component is encoded as a single percent sign.
+
+        Args:
+            part: The tag component
+
+        Returns:
+            The file name
+        """
+        if part == '':
+            return '%'
+        return quote(part, safe='').replace('.', '%2E')
+
+    @staticmethod
+    def _decode_name(name: str) -> str:
+        """ Convert a file name created by `_encode_name` back to the tag component """
+        return '' if name == '%' else unquote(name)
+
+    def _node_path(self, tag: TagType) -> str:
+        return os.path.join(self._directory, *[self._encode_name(part) for part in tag])
+
+    def _leaf_path(self, tag: TagType) -> str:
+        return self._node_path(tag) + self.LEAF_SUFFIX
+
+    def _array_path(self, tag: TagType, reference: Union[int, str]) -> str:
+        # leaves written before the arrays had unique names reference their arrays by index
+        if isinstance(reference, int):
+            return f'{self._node_path(tag)}.{reference}{self.ARRAY_SUFFIX}'
+        return os.path.join(os.path.dirname(self._node_path(tag)), reference)
+
+    def _array_files(self, tag: TagType) -> List[str]:
+        """ The names of the .npy files of all versions of a leaf """
+        prefix = self._encode_name(tag[-1]) + '.'
+        try:
+            names = os.listdir(os.path.dirname(self._node_path(tag)))
+        except FileNotFoundError:
+            return []
+        return [name for name in names if name.startswith(prefix) and name.endswith(self.ARRAY_SUFFIX)]
+
+    def _remove_arrays(self, tag: TagType, keep: Sequence[str] = ()) -> None:
+        """ Remove the .npy files of a leaf that are not referenced by its current version
+
+        Args:
+            tag: The tag of the leaf
+            keep: The names of the files that are kept
+        """
+        for name in self._array_files(tag):
+            if name not in keep:
+                try:
+                    os.remove(self._array_path(tag, name))
+                except FileNotFoundError:
+                    pass
+
+    def _check_path(self, tag: TagType) -> None:
+        """ Check that none of the ancestors of a tag is a leaf
+
+        Raises:
+            NodeAlreadyExistsError: If one of the ancestors of the tag is a leaf
+        """
+        for index in range(1, len(tag)):
+            if os.path.isfile(self._leaf_path(tag[:index])):
+                raise NodeAlreadyExistsError(f'Tag "{tag[index - 1]}" is a leaf')
+
+    @staticmethod
+    def _write_file(path: str, write: Any) -> None:
+        """ Write a file atomically by writing to a temporary file in the same directory and moving it into place
+
+        Args:
+            path: The path of the file
+            write: Function that writes the content to the open binary file
+        """
+        handle, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                write(file)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+    def _extract_arrays(self, data: Any, arrays: List[Tuple[str, NumpyNdarrayType]], prefix: str) -> Any:
+        """ Replace the numpy arrays above the memmap threshold by references to .npy files
+
+        Args:
+            data: The data
+            arrays: The extracted arrays are appended to this list with the name of their file
+            prefix: The prefix of the names of the files
+
+        Returns:
+            The data with the references
+        """
+        if isinstance(data, dict):
+            return {key: self._extract_arrays(value, arrays, prefix) for key, value in data.items()}
+        if isinstance(data, list):
+            return [self._extract_arrays(item, arrays, prefix) for item in data]
+        if type(data) is tuple:
+            return tuple(self._extract_arrays(item, arrays, prefix) for item in data)
+        if isinstance(data, np.ndarray):
+            # loaded arrays are memory maps, which are written as plain arrays
+            data = np.asarray(data)
+            if data.nbytes >= self._memmap_threshold and not data.dtype.hasobject:
+                name = f'{prefix}.{len(arrays)}{self.ARRAY_SUFFIX}'
+                arrays.append((name, data))
+                return {self.ARRAY_KEY: name}
+        return data
+
+    def _insert_arrays(self, data: Any, tag: TagType) -> Any:
+        """ Replace the references to .npy files by read-only memory maps of the arrays
+
+        Args:
+            data: The data with the references
+            tag: The tag of the leaf
+
+        Returns:
+            The data with the arrays
+        """
+        if isinstance(data, dict):
+            if len(data) == 1 and self.ARRAY_KEY in data:
+                return np.load(self._array_path(tag, data[self.ARRAY_KEY]), mmap_mode='r')
+            return {key: self._insert_arrays(value, tag) for key, value in data.items()}
+        if isinstance(data, list):
+            return [self._insert_arrays(item, tag) for item in data]
+        if type(data) is tuple:
+            return tuple(self._insert_arrays(item, tag) for item in data)
+        return data
+
+    @staticmethod
+    def _encode_key(key: Union[int, str]) -> str:
+        """ Encode integer keys, which JSON does not support, as strings """
+        return f'_integer[{key}]' if isinstance(key, int) else key
+
+    @staticmethod
+    def _decode_key(key: str) -> Union[int, str]:
+        """ Decode the keys encoded by `_encode_key` """
+        match = StorageFile._ENCODED_INT_PATTERN.fullmatch(key)
+        return int(match.group(1)) if match else key
+
+    def _read_leaf(self, tag: TagType, insert_arrays: bool = True) -> Any:
+        """ Read the data of a leaf
+
+        Args:
+            tag: The tag of the leaf
+            insert_arrays: If False the references to the .npy files are kept
+
+        Returns:
+            The data of the leaf
+
+        Raises:
+            NoDataAtKeyError: If the tag is not a leaf
+        """
+        while True:
+            try:
+                with open(self._leaf_path(tag), 'rb') as file:
+                    encoded = json.load(file)
+            except FileNotFoundError:
+                if os.path.isdir(self._node_path(tag)):
+                    raise NoDataAtKeyError(f'Tag "{tag[-1]}" is not a leaf') from None
+                raise NoDataAtKeyError(f'Tag "{tag[-1]}" cannot be found') from None
+            data = self._serializer.decode_data(encoded, decode_key=self._decode_key)
+            if not insert_arrays:
+                return data
+            try:
+                return self._insert_arrays(data, tag)
+            except FileNotFoundError:
+                # the leaf was written again after it was read, so its arrays were replaced
+                continue
+
+    def _write_leaf(self, tag: TagType, data: Any) -> None:
+        """ Write the data of a leaf, the arrays above the memmap threshold are written to .npy files
+
+        Args:
+            tag: The tag of the leaf
+            data: The data to write
+
+        Raises:
+            NodeAlreadyExistsError: If the tag or one of its ancestors is an unexpected node/leaf
+        """
+        self._check_path(tag)
+        if os.path.isdir(self._node_path(tag)):
+            raise NodeAlreadyExistsError(f'Tag "{tag[-1]}" is not a leaf')
+        os.makedirs(os.path.dirname(self._node_path(tag)), exist_ok=True)
+
+        arrays: List[Tuple[str, NumpyNdarrayType]] = []
+        prefix = f'{self._encode_name(tag[-1])}.{uuid.uuid4().hex}'
+        encoded = self._serializer.encode_data(self._extract_arrays(data, arrays, prefix),
+                                               encode_key=self._encode_key)
+        for name, array in arrays:
+            self._write_file(self._array_path(tag, name), lambda file: np.save(file, array))
+        self._write_file(self._leaf_path(tag), lambda file: file.write(json.dumps(encoded).encode('utf-8')))
+        self._remove_arrays(tag, keep=[name for name, _ in arrays])
+
+    def load_data(self, tag: TagType) -> Any:
+        if not isinstance(tag, list):
+            raise TypeError('Tag should be a list of strings')
+        if len(tag) == 0:
+            raise NoDataAtKeyError('Tag cannot be empty')
+
+        return self._read_leaf(tag)
+
+    def save_data(self, data: Any, tag: TagType) -> None:
+        """ Save data to storage
+
+        Args:
+            data: data to store
+            tag: reference tag to store the data
+
+        Raises:
+            NodeAlreadyExistsError: If the tag or one of its ancestors is an unexpected node/leaf
+        """
+        self._validate_tag(tag)
+        if len(tag) == 0:
+            raise NodeAlreadyExistsError('Tag cannot be empty')
+        self._write_leaf(tag, data)
+
+    def load_individual_data(self, tag: TagType, field: FieldType) -> Any:
+        """ Retrieve an individual field value at a given tag
+
+        Args:
+            tag: The tag
+            field: Name of the individual field to be retrieved, or the list of keys of a nested field
+
+        Raises:
+            NoDataAtKeyError: If the tag is not a leaf or the field does not exist
+
+        Returns:
+            Value of the field
+        """
+        self._validate_tag(tag)
+        self._validate_field(field)
+        if len(tag) == 0:
+            raise NoDataAtKeyError('Tag cannot be empty')
+
+        data = self._read_leaf(tag)
+        if not isinstance(data, dict):
+            raise NoDataAtKeyError(f'The field "{field}" does not exists')
+        return self._get_field(data, self._field_path(field))
+
+    def update_individual_data(self, data: Any, tag: TagType, field: FieldType) -> None:
+        """ Update an individual field at a given tag with the given data.
+        If the field does not exist, it will be created.
+
+        Args:
+            data: Data to update
+            tag: The tag
+            field: Name of the individual field to updated, or the list of keys of a nested field
+
+        Raises:
+            NodeDoesNotExistsError: If the tag does not exist
+            NodeAlreadyExistsError: If the tag or one of its ancestors is an unexpected node/leaf
+        """
+        self._validate_tag(tag)
+        self._validate_field(field)
+        self._check_path(tag)
+        try:
+            leaf_data = self._read_leaf(tag)
+        except NoDataAtKeyError as e:
+            if os.path.isdir(self._node_path(tag)):
+                raise NodeAlreadyExistsError(f'Tag "{tag[-1]}" is not a leaf') from e
+            raise NodeDoesNotExistsError(f'Tag "{tag[-1]}" does not exist') from e
+        leaf_data = self._set_field(leaf_data, field, data)
+        self._write_leaf(tag, leaf_data)
+
+    def get_latest_subtag(self, tag: TagType) -> Optional[TagType]:
+        """ Get the latest subtag
+
+        Args:
+            tag: Tag to search from
+        Returns:
+            Latest subtag found among subtags or None if there are no subtags
+        """
+        child_tags = self.list_data_subtags(tag, limit=1)
+        if len(child_tags) == 0:
+            return None
+
+        return tag + [child_tags[0]]
+
+    def list_data_subtags(self, tag: TagType, limit: int = 0, start: Optional[str] = None,
+                          end: Optional[str] = None, after: Optional[str] = None) -> TagType:
+        """ List subtags for the given tag. The number of subtags listed is based on the limit parameter (0 for
+        listing all subtags)
+
+        Args:
+            tag: Tag to search from
+            limit: Maximum number of subtags to return. If set to zero there is no limit
+            start: If set only the subtags that are greater than or equal to start are listed
+            end: If set only the subtags that are less than end are listed
+            after: If set only the subtags that are less than after are listed, see `StorageInterface.list_data_subtags`
+        Returns:
+            List of subtags found, sorted in descending order
+        """
+        children = sorted((part for part, _ in self._children(tag)), reverse=True)
+        return self._filter_subtags(children, limit, start, end, after)
+
+    def _children(self, tag: TagType) -> Iterator[Tuple[str, bool]]:
+        """ Iterate over the children of a node
+
+        Args:
+            tag: The tag of the node
+
+        Returns:
+            Iterator over the tag components of the children and whether the child is a leaf. The iterator is empty
+            if the tag is not a node
+        """
+        try:
+            entries = list(os.scandir(self._node_path(tag)))
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir():
+                yield self._decode_name(entry.name), False
+            elif entry.name.endswith(self.LEAF_SUFFIX):
+                yield self._decode_name(entry.name[:-len(self.LEAF_SUFFIX)]), True
+
+    def _leaves(self, tag: TagType) -> Iterator[TagType]:
+        """ Iterate over the tags of all leaves below a node """
+        for part, is_leaf in self._children(tag):
+            if is_leaf:
+                yield tag + [part]
+            else:
+                yield from self._leaves(tag + [part])
+
+    def delete(self, tag: TagType, recursive: bool = True) -> None:
+        """ Delete a leaf with its .npy files, or the directory of a node
+
+        Args:
+            tag: The tag of the leaf or node
+            recursive: If True the children of a node are deleted with the node
+        """
+        self._validate_tag(tag)
+        if len(tag) == 0:
+            raise NoDataAtKeyError('Tag cannot be empty')
+        if os.path.isfile(self._leaf_path(tag)):
+            os.remove(self._leaf_path(tag))
+            self._remove_arrays(tag)
+        elif os.path.isdir(self._node_path(tag)):
+            if not recursive and next(self._children(tag), None) is not None:
+                raise NodeNotEmptyError(f'Tag "{tag[-1]}" has children')
+            shutil.rmtree(self._node_path(tag))
+        else:
+            raise NoDataAtKeyError(f'Tag "{tag[-1]}" cannot be found')
+
+    def search(self, query: str) -> List[TagType]:
+        """ Find the leaves that satisfy a query, see `StorageInterface.search` for the query language
+
+        All leaves are read to answer the query, the numpy arrays in .npy files are not opened.
+
+        Args:
+            query: The query
+
+        Returns:
+            The tags of the matching leaves, sorted in descending order
+        """
+        conditions = parse_query(query)
+        search_index = SearchIndex()
+        for tag in self._leaves([]):
+            search_index.add(tag, self._read_leaf(tag, insert_arrays=False))
+        return search_index.search(conditions)
+
+    def tag_in_storage(self, tag: TagType) -> bool:
+        if len(tag) == 0:
+            return True
+        return os.path.isfile(self._leaf_path(tag)) or os.path.isdir(self._node_path(tag))
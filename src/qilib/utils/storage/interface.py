@@ -20,24 +20,38 @@ OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
 
 import logging
 from abc import ABC, abstractmethod
+from copy import copy
 from datetime import datetime
 from collections.abc import Sequence as SequenceBaseClass
-from typing import Any, Callable, Optional, Union, Sequence
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union, Sequence
 
-from qilib.utils.type_aliases import TagType
+from qilib.utils.metrics import MetricsScope, StorageMetrics
+from qilib.utils.storage.retention import RetentionPolicy
+from qilib.utils.type_aliases import FieldType, TagType
 
 
 class _LazySequence(SequenceBaseClass):  # type: ignore
-    def __init__(self, length: int, item_getter: Callable[[int], Any]):
+    def __init__(self, length: int, item_getter: Callable[[int], Any],
+                 page_getter: Optional[Callable[[int, int], Sequence[Any]]] = None, page_size: int = 1):
         """ Convert a length and method to retrieve an indexed item into a sequence with lazy evaluation
 
+        Items are fetched in pages: accessing an item that has not been loaded yet also reads ahead the items that
+        follow it, up to the page size. Loaded items are cached.
+
         Args:
             length: Length of the sequence to be represented
             item_getter: Method to retrieve an item at the specified index
+            page_getter: Method to retrieve the items from a start index up to a stop index. If None the items
+                are retrieved one by one with the item_getter
+            page_size: Number of items to retrieve at once with the page_getter
         """
         super(SequenceBaseClass, self).__init__()
         self._length = length
         self._item_getter = item_getter
+        self._page_getter = page_getter
+        self._page_size = max(page_size, 1)
+        self._items: Dict[int, Any] = {}
 
     def __repr__(self) -> str:
         classname = ".".join([self.__module__, self.__class__.__qualname__])
@@ -50,10 +64,24 @@ class _LazySequence(SequenceBaseClass):  # type: ignore
     def __getitem__(self, index: Union[int, slice]) -> Any:
         if isinstance(index, slice):
             slice_range = range(*index.indices(len(self)))
-            return (self._item_getter(i) for i in slice_range)
+            return (self._get_item(i) for i in slice_range)
         else:
-            r = self._item_getter(index)
-            return r
+            if index < 0:
+                index += self._length
+            if not 0 <= index < self._length:
+                raise IndexError('sequence index out of range')
+            return self._get_item(index)
+
+    def _get_item(self, index: int) -> Any:
+        if index not in self._items:
+            if self._page_getter is None or self._page_size == 1:
+                self._items[index] = self._item_getter(index)
+            else:
+                stop = index + 1
+                while stop < min(index + self._page_size, self._length) and stop not in self._items:
+                    stop += 1
+                self._items.update(zip(range(index, stop), self._page_getter(index, stop)))
+        return self._items[index]
 
 
 class NoDataAtKeyError(Exception):
@@ -68,10 +96,22 @@ class NodeDoesNotExistsError(Exception):
     """ Raised when trying to update/create a field on a node which cannot be found."""
 
 
+class NodeNotEmptyError(Exception):
+    """ Raised when trying to delete a node that has children without deleting the children."""
+
+
+class VersionConflictError(Exception):
+    """ Raised when saving data that was changed by another writer since it was loaded."""
+
+
 class ConnectionTimeoutError(Exception):
     """ Raised when connection to storage can not be established."""
 
 
+class InvalidQueryError(Exception):
+    """ Raised when a search query can not be parsed."""
+
+
 class StorageInterface(ABC):
     """ Base class for storage of measurement and calibration results.
         The storage is based on tags (HDF5-like).
@@ -85,6 +125,11 @@ class StorageInterface(ABC):
         nodes cannot be overwritten by leaves
     """
 
+    INSTRUMENTED_OPERATIONS: Tuple[str, ...] = (
+        'load_data', 'load_individual_data', 'load_many', 'load_data_from_subtag', 'save_data', 'save_many',
+        'update_individual_data', 'get_latest_subtag', 'list_data_subtags', 'import_subtree', 'delete',
+        'delete_many', 'prune', 'search', 'tag_in_storage')
+
     def __init__(self, name: str) -> None:
         """
         Base constructor.
@@ -98,10 +143,31 @@ class StorageInterface(ABC):
         self._unserialize: Callable[[Any], Any] = lambda x: x
         self.logger: Any = logging.getLogger(self.name)
         self.logger.info('created StorageInterface %s', self.name)
+        self._metrics_scope: Optional[MetricsScope] = None
 
     def __repr__(self) -> str:
         return f'{self.__class__.__name__}({self.name!r})'
 
+    @property
+    def metrics(self) -> Optional[StorageMetrics]:
+        """ The metrics the operations of the storage are recorded in, None if the storage is not instrumented """
+        return None if self._metrics_scope is None else self._metrics_scope.metrics
+
+    def set_metrics(self, metrics: Optional[StorageMetrics]) -> None:
+        """ Record the operations in INSTRUMENTED_OPERATIONS, and the round trips of the backend, in metrics
+
+        The methods of the operations are wrapped on the instance, so a storage without metrics has no overhead.
+
+        Args:
+            metrics: The metrics to record in, if None the instrumentation is removed
+        """
+        for operation in self.INSTRUMENTED_OPERATIONS:
+            self.__dict__.pop(operation, None)
+        self._metrics_scope = None if metrics is None else metrics.scope(self.name)
+        if self._metrics_scope is not None:
+            for operation in self.INSTRUMENTED_OPERATIONS:
+                setattr(self, operation, self._metrics_scope.instrument(operation, getattr(self, operation)))
+
     @staticmethod
     def datetag_part(date_with_time: Optional[datetime] = None) -> str:
         """
@@ -135,12 +201,13 @@ class StorageInterface(ABC):
         """
 
     @abstractmethod
-    def load_individual_data(self, tag: TagType, field: Union[str, int]) -> Any:
+    def load_individual_data(self, tag: TagType, field: FieldType) -> Any:
         """ Load an individual field at a given tag from storage.
 
         Args:
             tag: tag for field to load
-            field: Name of the field to be loaded
+            field: Name of the field to be loaded, or a list with the path of keys to a field of nested
+                dictionaries, e.g. ['dac1', 'value']. A string with dots is a single key
 
         Returns:
             Data found of the field of the node identified by the tag.
@@ -176,12 +243,67 @@ class StorageInterface(ABC):
             raise TypeError(f'Tag {tag} should be a list of strings')
 
     @staticmethod
-    def _validate_field(field: Union[str, int]) -> None:
-        """ Assert that field is an int or string. """
+    def _validate_field(field: FieldType) -> None:
+        """ Assert that field is an int or string, or a non-empty list of them. """
 
-        if not (isinstance(field, int) or isinstance(field, str)):
+        if isinstance(field, list):
+            if len(field) == 0 or not all(isinstance(key, (int, str)) for key in field):
+                raise TypeError(f'Field path {field} should be a non-empty list of integers and strings')
+        elif not (isinstance(field, int) or isinstance(field, str)):
             raise TypeError(f'Field {field} should be an integer or a string')
 
+    @staticmethod
+    def _field_path(field: FieldType) -> List[Union[str, int]]:
+        """ Convert a field to the list of keys of its path """
+        return list(field) if isinstance(field, list) else [field]
+
+    @staticmethod
+    def _get_field(data: Any, path: Sequence[Union[str, int]]) -> Any:
+        """ Get the value of a (nested) field of the data of a leaf
+
+        Args:
+            data: The data of the leaf
+            path: The keys of the field, see `_field_path`
+
+        Raises:
+            NoDataAtKeyError: If the field does not exist
+        """
+        for key in path:
+            try:
+                if key not in data:
+                    raise NoDataAtKeyError(f'The field "{key}" does not exists')
+                data = data[key]
+            except TypeError:
+                raise NoDataAtKeyError(f'The field "{key}" does not exists') from None
+        return data
+
+    @staticmethod
+    def _set_field(data: Any, field: FieldType, value: Any, copy_containers: bool = False) -> Any:
+        """ Set the value of a (nested) field of the data of a leaf
+
+        Missing dictionaries on the path of the field are created.
+
+        Args:
+            data: The data of the leaf
+            field: The field
+            value: The new value of the field
+            copy_containers: If True the data and the dictionaries on the path of the field are copied instead of
+                modified, so references to the old data keep the old values
+
+        Returns:
+            The data of the leaf with the field set
+        """
+        path = StorageInterface._field_path(field)
+        root = container = copy(data) if copy_containers else data
+        for key in path[:-1]:
+            if key not in container:
+                container[key] = {}
+            elif copy_containers:
+                container[key] = copy(container[key])
+            container = container[key]
+        container[path[-1]] = value
+        return root
+
     @abstractmethod
     def save_data(self, data: Any, tag: TagType) -> None:
         """ Save data to storage.
@@ -192,15 +314,45 @@ class StorageInterface(ABC):
         """
         pass
 
+    def save_many(self, items: Sequence[Tuple[TagType, Any]], overwrite: bool = True) -> None:
+        """ Save multiple results to storage.
+
+        Backends override this method to combine the saves in as few round trips as possible.
+
+        Args:
+            items: Pairs of reference tag and data to store
+            overwrite: If False, items of which the tag is already in storage are skipped
+        """
+        for tag, data in items:
+            if overwrite or not self.tag_in_storage(tag):
+                self.save_data(data, tag)
+
+    def load_many(self, tags: Sequence[TagType]) -> List[Any]:
+        """ Load multiple results from storage.
+
+        Backends override this method to combine the loads in as few round trips as possible.
+
+        Args:
+            tags: tags for results to load
+
+        Returns:
+            Data found at the nodes identified by the tags, in the order of the tags.
+
+        Raises:
+            NoDataAtKeyError: if there is no data for one of the tags.
+        """
+        return [self.load_data(tag) for tag in tags]
+
     @abstractmethod
-    def update_individual_data(self, data: Any, tag: TagType, field: Union[str, int]) -> None:
+    def update_individual_data(self, data: Any, tag: TagType, field: FieldType) -> None:
         """ Update an individual field at a given tag with data.
         If the field does not exist, it will be created.
 
         Args:
             data: data to store
             tag: reference tag to store the data
-            field: Name of field
+            field: Name of field, or a list with the path of keys to a field of nested dictionaries. Missing
+                dictionaries on the path are created
 
         """
         pass
@@ -223,12 +375,22 @@ class StorageInterface(ABC):
         pass
 
     @abstractmethod
-    def list_data_subtags(self, tag: TagType, limit: int = 0) -> TagType:
+    def list_data_subtags(self, tag: TagType, limit: int = 0, start: Optional[str] = None, end: Optional[str] = None,
+                          after: Optional[str] = None) -> TagType:
         """ List available result tags of at tag.
 
+        The subtags are listed in descending order, so the most recent results come first if the subtags are
+        created with `datetag_part`. A range of subtags is selected with `start` and `end`, e.g. the results of
+        a morning with start='2019-02-18T09:00' and end='2019-02-18T12:00'. Long listings are read in pages by
+        passing the last subtag of a page as `after` of the next page.
+
         Args:
             tag: hdf5 tag
             limit: Maximum number of results to generate. If 0 then return all results
+            start: If set only the subtags that are greater than or equal to start are listed
+            end: If set only the subtags that are less than end are listed
+            after: Cursor of the listing. If set only the subtags that come after it in descending order, i.e. that
+                are less than after, are listed
         Returns:
             results: List of child tags for tag
 
@@ -243,26 +405,235 @@ class StorageInterface(ABC):
         """
         pass
 
-    def load_data_from_subtag(self, tag: TagType, limit: int = 0) -> Sequence[Any]:
+    @staticmethod
+    def _subtag_bounds(start: Optional[str], end: Optional[str],
+                       after: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """ Combine the range and cursor arguments of `list_data_subtags`
+
+        Returns:
+            The inclusive lower bound and the exclusive upper bound of the subtags. None if there is no bound
+        """
+        upper = end if after is None or (end is not None and end < after) else after
+        return start, upper
+
+    @staticmethod
+    def _filter_subtags(subtags: Sequence[str], limit: int = 0, start: Optional[str] = None,
+                        end: Optional[str] = None, after: Optional[str] = None) -> TagType:
+        """ Select the subtags of a listing, for backends that can not select them in the query
+
+        Args:
+            subtags: All subtags, sorted in descending order
+            limit, start, end, after: See `list_data_subtags`
+
+        Returns:
+            The selected subtags, sorted in descending order
+        """
+        lower, upper = StorageInterface._subtag_bounds(start, end, after)
+        selected = [subtag for subtag in subtags
+                    if (lower is None or subtag >= lower) and (upper is None or subtag < upper)]
+        return selected[:limit] if limit > 0 else selected
+
+    def load_data_from_subtag(self, tag: TagType, limit: int = 0, page_size: int = 100) -> Sequence[Any]:
         """ Return all results under the specified tag
 
         Args:
             tag: Tag to search for results
             limit: Maximum number of results to generate. If 0 then return all results
+            page_size: Number of results that are loaded at once with `load_many`
         Returns:
-            Generator for all the results
+            Sequence that loads the results in pages when they are accessed
         """
         subtags = self.list_data_subtags(tag, limit=limit)
 
         def item_getter(index: int) -> Any:
             subtag = subtags[index]
             return self.load_data(tag+[subtag])
-        return _LazySequence(len(subtags), item_getter)
+
+        def page_getter(start: int, stop: int) -> Sequence[Any]:
+            return self.load_many([tag + [subtag] for subtag in subtags[start:stop]])
+        return _LazySequence(len(subtags), item_getter, page_getter, page_size)
+
+    def export_subtree(self, tag: TagType, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """ Export the leaves in a subtree as a stream of records
+
+        The leaves are loaded in batches with `load_many`, so only a batch of leaves is held in memory. Backends
+        override this method to read the subtree with batched cursors. The order of the records depends on the
+        backend. The records can be written to a file with `dump_records`.
+
+        Args:
+            tag: The tag of the subtree. If the tag is a leaf a single record is exported
+            batch_size: Number of leaves that are loaded at once
+
+        Yields:
+            A record with the tag of the leaf relative to the subtree and the data of the leaf,
+            e.g. {'tag': ['2019-02-18'], 'data': {...}}
+        """
+        if len(tag) > 0 and len(self.list_data_subtags(tag)) == 0:
+            try:
+                yield {'tag': [], 'data': self.load_data(tag)}
+            except NoDataAtKeyError:
+                pass
+            return
+        nodes: List[TagType] = [[]]
+        while nodes:
+            node = nodes.pop()
+            subtags = self.list_data_subtags(tag + node)
+            for start in range(0, len(subtags), batch_size):
+                children = [node + [subtag] for subtag in subtags[start:start + batch_size]]
+                yield from self._export_children(tag, children, nodes)
+
+    def _export_children(self, tag: TagType, children: List[TagType],
+                         nodes: List[TagType]) -> Iterator[Dict[str, Any]]:
+        """ Load a batch of children in a subtree as records
+
+        Args:
+            tag: The tag of the subtree
+            children: The tags of the children relative to the subtree
+            nodes: The children that are nodes instead of leaves are appended to this list
+        """
+        try:
+            data = self.load_many([tag + child for child in children])
+        except NoDataAtKeyError:
+            for child in children:
+                try:
+                    value = self.load_data(tag + child)
+                except NoDataAtKeyError:
+                    nodes.append(child)
+                else:
+                    yield {'tag': child, 'data': value}
+        else:
+            for child, value in zip(children, data):
+                yield {'tag': child, 'data': value}
+
+    def import_subtree(self, records: Iterable[Dict[str, Any]], tag: Optional[TagType] = None,
+                       overwrite: bool = True, batch_size: int = 1000) -> int:
+        """ Import a stream of records created by `export_subtree`
+
+        The records are saved in batches with `save_many`, so only a batch of records is held in memory.
+
+        Args:
+            records: The records, e.g. read from a file with `load_records`
+            tag: The tag of the subtree to import into. If None the records are imported at the root
+            overwrite: If False, records of which the tag is already in storage are skipped
+            batch_size: Number of records that are saved at once
+
+        Returns:
+            The number of imported records
+        """
+        prefix = [] if tag is None else tag
+        iterator = iter(records)
+        count = 0
+        while True:
+            batch = [(prefix + record['tag'], record['data']) for record in islice(iterator, batch_size)]
+            if len(batch) == 0:
+                return count
+            self.save_many(batch, overwrite)
+            count += len(batch)
+
+    def delete(self, tag: TagType, recursive: bool = True) -> None:
+        """ Delete a leaf or a node from storage
+
+        Backends should override this method, it is not abstract so that existing storage implementations without
+        deletes can still be instantiated.
+
+        Args:
+            tag: The tag of the leaf or node
+            recursive: If True the children of a node are deleted with the node
+
+        Raises:
+            NoDataAtKeyError: If the tag is empty or not in storage
+            NodeNotEmptyError: If the tag is a node that has children and recursive is False
+            NotImplementedError: If the storage does not support deletes
+        """
+        raise NotImplementedError(f'{type(self).__name__} does not support deletes')
+
+    def delete_many(self, tags: Sequence[TagType], recursive: bool = True) -> None:
+        """ Delete multiple leaves or nodes from storage
+
+        Backends override this method to combine the deletes in as few round trips as possible.
+
+        Args:
+            tags: The tags of the leaves and nodes. Tags that are not in storage are skipped
+            recursive: If True the children of the nodes are deleted with the nodes
+
+        Raises:
+            NodeNotEmptyError: If one of the tags is a node that has children and recursive is False
+        """
+        for tag in tags:
+            if self.tag_in_storage(tag):
+                self.delete(tag, recursive)
+
+    def prune(self, tag: TagType, policy: RetentionPolicy, depth: int = 0, dry_run: bool = False,
+              batch_size: int = 1000) -> List[TagType]:
+        """ Delete the results at a tag that are not kept by a retention policy
+
+        The results are the children of the nodes `depth` levels below the tag, e.g. the configurations of every
+        adapter are pruned with prune(['configuration'], RetentionPolicy(keep_last=10), depth=1). The expired
+        results are selected with range queries of `list_data_subtags` and deleted in batches with `delete_many`.
+
+        Args:
+            tag: The tag of the pruned subtree
+            policy: Selects the results that are kept
+            depth: Number of levels between the tag and the nodes of which the children are the results
+            dry_run: If True the expired results are returned without deleting them
+            batch_size: Number of results that are deleted at once
+
+        Returns:
+            The tags of the expired results
+        """
+        self._validate_tag(tag)
+        nodes = [tag]
+        for _ in range(depth):
+            nodes = [node + [subtag] for node in nodes for subtag in self.list_data_subtags(node)]
+
+        cutoff = policy.cutoff()
+        expired = [node + [subtag] for node in nodes for subtag in self._expired_subtags(node, policy, cutoff)]
+        if not dry_run:
+            for start in range(0, len(expired), batch_size):
+                self.delete_many(expired[start:start + batch_size])
+        return expired
+
+    def _expired_subtags(self, tag: TagType, policy: RetentionPolicy, cutoff: Optional[str]) -> TagType:
+        """ List the subtags of a node that are not kept by a retention policy
+
+        Args:
+            tag: The tag of the node
+            policy: The retention policy
+            cutoff: The datetag below which the subtags are not kept by date, see `RetentionPolicy.cutoff`
+
+        Returns:
+            The expired subtags, sorted in descending order
+        """
+        if policy.keep_last is None and cutoff is None:
+            return []
+        after = None
+        if policy.keep_last:
+            kept = self.list_data_subtags(tag, limit=policy.keep_last)
+            if len(kept) < policy.keep_last:
+                return []
+            after = kept[-1]
+        return self.list_data_subtags(tag, end=cutoff, after=after)
 
     @abstractmethod
-    def search(self, query: str) -> Any:
-        """ Future implementation of query interface """
-        raise NotImplementedError('search interface not yet specified')
+    def search(self, query: str) -> List[TagType]:
+        """ Find the leaves that satisfy a query
+
+        A query is a list of comparisons joined by `and`. The left hand side of a comparison is either a tag
+        component, written as `tag[index]`, or a (nested) field of the leaf value written as dotted keys. The
+        right hand side is a quoted string, a number, `true`, `false` or `null`. The operators are ==, !=, <, <=,
+        > and >=. A comparison on a tag component or field that does not exist does not match. For example:
+
+            adapter_class_name == 'M4iInstrumentAdapter' and tag[2] >= '2019-02-18' and tag[2] < '2019-02-19'
+
+        Args:
+            query: The query
+
+        Returns:
+            The tags of the matching leaves, sorted in descending order
+
+        Raises:
+            InvalidQueryError: If the query can not be parsed
+        """
 
     @abstractmethod
     def tag_in_storage(self, tag: TagType) -> bool:
@@ -17,18 +17,25 @@ WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEM
 COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
 OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
-from typing import Any, Dict, Optional, Union
+from bisect import bisect_left, insort
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union, cast
 
 from qilib.utils.storage.interface import (NoDataAtKeyError,
                                            NodeAlreadyExistsError,
-                                           StorageInterface, NodeDoesNotExistsError)
-from qilib.utils.type_aliases import TagType
+                                           StorageInterface, NodeDoesNotExistsError, NodeNotEmptyError)
+from qilib.utils.storage.query import SearchIndex, parse_query
+from qilib.utils.storage.views import read_only_view
+from qilib.utils.type_aliases import FieldType, TagType
 
 
 class StorageMemory(StorageInterface):
     """ Reference implementation of StorageInterface with in-memory backend.
 
-    Implements a storage tree as an in-memory dictionary.
+    Implements a storage tree as an in-memory dictionary. Every node keeps the names of its children in sorted
+    order, so the children are listed in descending order like `StorageMongoDb` without sorting them on every call.
+    The tag components and scalar fields of the leaves are kept in a secondary index that serves `search`. The index
+    is built by the first search and then kept up to date by the writes, so storages that are not searched do not
+    pay for it.
     """
 
     class __Leaf:
@@ -36,30 +43,48 @@ class StorageMemory(StorageInterface):
             self.data: Any = data
 
     class __Node(Dict[str, Any]):
-        pass
+        """ A node of the tree that keeps the names of its children in sorted order """
 
-    def __init__(self, name: str) -> None:
+        def __init__(self) -> None:
+            super().__init__()
+            self.sorted_keys: List[str] = []
+
+        def __setitem__(self, key: str, value: Any) -> None:
+            if key not in self:
+                insort(self.sorted_keys, key)
+            super().__setitem__(key, value)
+
+        def __delitem__(self, key: str) -> None:
+            super().__delitem__(key)
+            del self.sorted_keys[bisect_left(self.sorted_keys, key)]
+
+    def __init__(self, name: str, copy_on_write: bool = False) -> None:
         """ In memory implementation of storage class.
 
         See also: `StorageInterface`
 
+        Args:
+            name: Symbolic name for the storage instance.
+            copy_on_write: Return read-only views of the stored data instead of the stored objects, see
+                `read_only_view`. Dictionaries and lists are copied when the caller modifies them and numpy arrays
+                are not writeable, so loading data is zero-copy while the stored data cannot be changed by readers
         """
         super().__init__(name)
-        self._data: Dict[str, Any] = {}
+        self._copy_on_write = copy_on_write
+        if copy_on_write:
+            self._unserialize = read_only_view
+        self._data: Dict[str, Any] = StorageMemory.__Node()
+        self._search_index: Optional[SearchIndex] = None
 
     @staticmethod
     def _retrieve_value_from_dict_by_tag(dictionary: Dict[str, Any], tag: TagType,
-                                         field: Optional[Union[str, int]] = None) -> Any:
+                                         field: Optional[FieldType] = None) -> Any:
         if len(tag) == 0:
             if not isinstance(dictionary, StorageMemory.__Leaf):
                 raise NoDataAtKeyError()
             if field is None:
                 return dictionary.data
-            else:
-                if field in dictionary.data:
-                    return dictionary.data[field]
-                else:
-                    raise NoDataAtKeyError(f'The field {field} does not exist.')
+            return StorageMemory._get_field(dictionary.data, StorageMemory._field_path(field))
 
         tag_prefix: str = tag[0]
         if tag_prefix not in dictionary:
@@ -67,24 +92,26 @@ class StorageMemory(StorageInterface):
         return StorageMemory._retrieve_value_from_dict_by_tag(dictionary[tag_prefix], tag[1:], field)
 
     @staticmethod
-    def _retrieve_nodes_from_dict_by_tag(dictionary: Dict[str, Any],
-                                         tag: TagType, limit: int = 0) -> TagType:
+    def _retrieve_nodes_from_dict_by_tag(dictionary: Dict[str, Any], tag: TagType, limit: int = 0,
+                                         lower: Optional[str] = None, upper: Optional[str] = None) -> TagType:
         if len(tag) == 0:
-            results = list(dictionary.keys())
+            sorted_keys = cast(StorageMemory.__Node, dictionary).sorted_keys
+            first = 0 if lower is None else bisect_left(sorted_keys, lower)
+            stop = len(sorted_keys) if upper is None else bisect_left(sorted_keys, upper)
             if limit > 0:
-                results = results[:limit]
-            return results
+                first = max(first, stop - limit)
+            return sorted_keys[first:stop][::-1]
         tag_prefix = tag[0]
         if tag_prefix not in dictionary:
             raise NoDataAtKeyError(tag)
         if isinstance(dictionary[tag_prefix], StorageMemory.__Leaf):
             raise NoDataAtKeyError(tag)
 
-        return StorageMemory._retrieve_nodes_from_dict_by_tag(dictionary[tag_prefix], tag[1:], limit=limit)
+        return StorageMemory._retrieve_nodes_from_dict_by_tag(dictionary[tag_prefix], tag[1:], limit, lower, upper)
 
     @staticmethod
     def _store_value_to_dict_by_tag(dictionary: Dict[str, Any], tag: TagType, value: Any,
-                                    field: Optional[Union[str, int]] = None) -> None:
+                                    field: Optional[FieldType] = None, copy_on_write: bool = False) -> None:
         if len(tag) == 1:
             if tag[0] in dictionary:
                 if isinstance(dictionary[tag[0]], StorageMemory.__Node):
@@ -93,7 +120,9 @@ class StorageMemory(StorageInterface):
                 dictionary[tag[0]] = StorageMemory.__Leaf(value)
             else:
                 if tag[0] in dictionary:
-                    dictionary[tag[0]].data[field] = value
+                    # with copy on write the views of the data that were handed out keep the data as it was
+                    leaf = dictionary[tag[0]]
+                    leaf.data = StorageMemory._set_field(leaf.data, field, value, copy_on_write)
                 else:
                     raise NodeDoesNotExistsError(f'The Node {tag[0]} does not exist')
         else:
@@ -102,7 +131,7 @@ class StorageMemory(StorageInterface):
             elif isinstance(dictionary[tag[0]], StorageMemory.__Leaf):
                 raise NodeAlreadyExistsError(f'Cannot store or replace data, because \'{tag[0]}\' is already a node')
 
-            StorageMemory._store_value_to_dict_by_tag(dictionary[tag[0]], tag[1:], value, field)
+            StorageMemory._store_value_to_dict_by_tag(dictionary[tag[0]], tag[1:], value, field, copy_on_write)
 
     def load_data(self, tag: TagType) -> Any:
         if not isinstance(tag, list):
@@ -111,24 +140,100 @@ class StorageMemory(StorageInterface):
 
     def save_data(self, data: Any, tag: TagType) -> None:
         self._validate_tag(tag)
-        StorageMemory._store_value_to_dict_by_tag(self._data, tag, self._serialize(data))
+        serialized_data = self._serialize(data)
+        StorageMemory._store_value_to_dict_by_tag(self._data, tag, serialized_data)
+        if self._search_index is not None:
+            self._search_index.add(tag, serialized_data)
+
+    def save_many(self, items: Sequence[Tuple[TagType, Any]], overwrite: bool = True) -> None:
+        for tag, data in items:
+            self._validate_tag(tag)
+            if overwrite or not self.tag_in_storage(tag):
+                serialized_data = self._serialize(data)
+                StorageMemory._store_value_to_dict_by_tag(self._data, tag, serialized_data)
+                if self._search_index is not None:
+                    self._search_index.add(tag, serialized_data)
+
+    def load_many(self, tags: Sequence[TagType]) -> List[Any]:
+        for tag in tags:
+            self._validate_tag(tag)
+        return [self._unserialize(StorageMemory._retrieve_value_from_dict_by_tag(self._data, tag)) for tag in tags]
 
     def get_latest_subtag(self, tag: TagType) -> Optional[TagType]:
-        child_tags: TagType = self.list_data_subtags(tag)
+        child_tags: TagType = self.list_data_subtags(tag, limit=1)
         if len(child_tags) == 0:
             return None
-        child_tags = sorted(child_tags)
-        return tag + [child_tags[-1]]
+        return tag + [child_tags[0]]
+
+    def list_data_subtags(self, tag: TagType, limit: int = 0, start: Optional[str] = None, end: Optional[str] = None,
+                          after: Optional[str] = None) -> TagType:
+        """ List subtags for the given tag. The number of subtags listed is based on the limit parameter (0 for
+        listing all subtags). The range of subtags is found by bisection of the sorted children
 
-    def list_data_subtags(self, tag: TagType, limit: int = 0) -> TagType:
+        Args:
+            tag: Tag to search from
+            limit: Maximum number of subtags to return. If set to zero there is no limit
+            start: If set only the subtags that are greater than or equal to start are listed
+            end: If set only the subtags that are less than end are listed
+            after: If set only the subtags that are less than after are listed, see `StorageInterface.list_data_subtags`
+        Returns:
+            List of subtags found, sorted in descending order
+        """
+        lower, upper = self._subtag_bounds(start, end, after)
         try:
-            tags: TagType = self._retrieve_nodes_from_dict_by_tag(self._data, tag, limit=limit)
+            tags: TagType = self._retrieve_nodes_from_dict_by_tag(self._data, tag, limit, lower, upper)
         except NoDataAtKeyError:
             return []
-        return list(tags)
+        return tags
+
+    @staticmethod
+    def _leaf_tags(value: Any, tag: TagType) -> List[TagType]:
+        if isinstance(value, StorageMemory.__Leaf):
+            return [tag]
+        return [leaf for key, child in value.items() for leaf in StorageMemory._leaf_tags(child, tag + [key])]
+
+    def delete(self, tag: TagType, recursive: bool = True) -> None:
+        """ Delete a leaf or a node, the leaves in the subtree are removed from the search index
 
-    def search(self, query: str) -> Any:
-        raise NotImplementedError()
+        Args:
+            tag: The tag of the leaf or node
+            recursive: If True the children of a node are deleted with the node
+        """
+        self._validate_tag(tag)
+        if len(tag) == 0:
+            raise NoDataAtKeyError('Tag cannot be empty')
+        parent = self._data
+        for tag_prefix in tag[:-1]:
+            if not isinstance(parent.get(tag_prefix), StorageMemory.__Node):
+                raise NoDataAtKeyError(tag)
+            parent = parent[tag_prefix]
+        if tag[-1] not in parent:
+            raise NoDataAtKeyError(tag)
+        value = parent[tag[-1]]
+        if isinstance(value, StorageMemory.__Node) and len(value) > 0 and not recursive:
+            raise NodeNotEmptyError(f'Tag "{tag[-1]}" has children')
+
+        del parent[tag[-1]]
+        if self._search_index is not None:
+            for leaf in StorageMemory._leaf_tags(value, tag):
+                self._search_index.remove(leaf)
+
+    def search(self, query: str) -> List[TagType]:
+        """ Find the leaves that satisfy a query with the secondary index, which is built on the first search
+
+        Args:
+            query: The query, see `StorageInterface.search`
+
+        Returns:
+            The tags of the matching leaves, sorted in descending order
+        """
+        conditions = parse_query(query)
+        if self._search_index is None:
+            search_index = SearchIndex()
+            for leaf in StorageMemory._leaf_tags(self._data, []):
+                search_index.add(leaf, StorageMemory._retrieve_value_from_dict_by_tag(self._data, leaf))
+            self._search_index = search_index
+        return self._search_index.search(conditions)
 
     def tag_in_storage(self, tag: TagType) -> bool:
         tmp_data = self._data
@@ -139,12 +244,12 @@ class StorageMemory(StorageInterface):
                 return False
         return True
 
-    def load_individual_data(self, tag: TagType, field: Union[str, int]) -> Any:
-        """ Retrieve the value of an individual field at the given tag
+    def load_individual_data(self, tag: TagType, field: FieldType) -> Any:
+        """ Retrieve the value of an individual field at the given tag, walking the path of a nested field
 
         Args:
             tag: The tag
-            field: Name of the field to load
+            field: Name of the field to load, or the list of keys of a nested field
 
         Returns:
             Value of the field
@@ -154,16 +259,19 @@ class StorageMemory(StorageInterface):
         self._validate_field(field)
         return self._unserialize(StorageMemory._retrieve_value_from_dict_by_tag(self._data, tag, field))
 
-    def update_individual_data(self, data: Any, tag: TagType, field: Union[str, int]) -> None:
+    def update_individual_data(self, data: Any, tag: TagType, field: FieldType) -> None:
         """ Update the value of an individual field at the given tag.
         If the field does not already exist, then it will be created.
 
          Args:
              data: The data to be used for updating the field
              tag: The tag
-             field: Name of the field to update
+             field: Name of the field to update, or the list of keys of a nested field
 
          """
         self._validate_tag(tag)
         self._validate_field(field)
-        StorageMemory._store_value_to_dict_by_tag(self._data, tag, self._serialize(data), field)
+        StorageMemory._store_value_to_dict_by_tag(self._data, tag, self._serialize(data), field, self._copy_on_write)
+        if self._search_index is not None:
+            self._search_index.update_field(tag, self._field_path(field),
+                                            StorageMemory._retrieve_value_from_dict_by_tag(self._data, tag))
@@ -17,26 +17,45 @@ WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEM
 COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
 OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
+import re
+import threading
+from functools import partial
 from operator import itemgetter
-from typing import Any, Optional, Union, cast
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Type, Union, cast
 
 import numpy as np
+import pymongo
 from bson.codec_options import TypeCodec, CodecOptions, TypeRegistry
 from bson.objectid import ObjectId
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
 from pymongo.mongo_client import MongoClient
-from pymongo.errors import ServerSelectionTimeoutError
+from pymongo.errors import BulkWriteError, DuplicateKeyError, ServerSelectionTimeoutError
 
 from qilib.data_set.mongo_data_set_io import MongoDataSetIO
-from qilib.utils.serialization import NumpyKeys, Serializer, serializer as _serializer
+from qilib.utils.mongo_client_registry import mongo_client_registry
+from qilib.utils.compression import check_compression_method
+from qilib.utils.serialization import NumpyArrayEncDec, NumpyKeys, Serializer, serializer as _serializer
 from qilib.utils.storage.interface import (NoDataAtKeyError,
                                            NodeAlreadyExistsError,
+                                           NodeNotEmptyError,
                                            StorageInterface,
-                                           ConnectionTimeoutError)
-from qilib.utils.type_aliases import TagType
+                                           ConnectionTimeoutError,
+                                           VersionConflictError)
+from qilib.utils.storage.node_cache import NodeCache
+from qilib.utils.storage.query import QueryCondition, parse_query, sort_search_results
+from qilib.utils.type_aliases import FieldType, TagType
 
 
 class NumpyArrayCodec(TypeCodec):
 
+    def __init__(self, read_only: bool = False) -> None:
+        """ Codec for numpy arrays in BSON documents
+
+        Args:
+            read_only: Decode the arrays as read-only views on the decoded data instead of writable copies
+        """
+        self._read_only = read_only
+
     @property
     def python_type(self) -> Any:
         return np.ndarray
@@ -50,7 +69,7 @@ class NumpyArrayCodec(TypeCodec):
 
     def transform_bson(self, value: Any) -> Any:
         if NumpyKeys.OBJECT in value and value[NumpyKeys.OBJECT] == np.array.__name__:
-            return MongoDataSetIO.decode_numpy_array(value)
+            return MongoDataSetIO.decode_numpy_array(value, self._read_only)
 
         return value
 
@@ -59,12 +78,35 @@ class StorageMongoDb(StorageInterface):
     """Reference implementation of StorageInterface with an mongodb backend
 
     Implements a storage tree in a MongoDB collection
-    Performance Note: Creating index(es) in mongodb will help improve query performance
-    eg: An index on (parent, tag) will improve the performance of queries in _retrieve_nodes_by_tag
+    Performance Note: The indexes used by the queries of the storage are created by the constructor, e.g. a unique
+    index on (parent, tag) for the tree layout. Use `find_unindexed_queries` to verify the query plans.
+    The ObjectIDs of resolved nodes are kept in a bounded LRU cache, so repeated access to the same subtree does
+    not walk the tree from the root again.
+
+    In the materialized path layout every document also holds its full tag path and the paths of its ancestors.
+    A tag is then resolved with a single indexed query instead of one query per tag component.
+
+    Writes are atomic upserts. Every write of a leaf increments its version, which is used for optimistic concurrency
+    by `load_versioned_data` and `save_versioned_data`.
+
+    Numpy arrays are stored as base64 encoded strings by default. With `binary_arrays` their data is stored as BSON
+    binary and with `compression` large arrays are compressed. Documents with either encoding are loaded transparently.
+
+    With `set_metrics` every command that the client sends to the database is counted as a round trip of the storage
+    operation it is part of, e.g. the number of `find` commands of a `load_data` of a deep tag in the tree layout or
+    the `getMore` commands of a large listing.
     """
 
+    MIGRATION_BATCH_SIZE = 1000
+    DELETE_BATCH_SIZE = 1000
+    QUERY_OPERATORS = {'==': '$eq', '!=': '$ne', '<': '$lt', '<=': '$lte', '>': '$gt', '>=': '$gte'}
+    INSTRUMENTED_OPERATIONS = StorageInterface.INSTRUMENTED_OPERATIONS + ('load_versioned_data', 'save_versioned_data')
+
     def __init__(self, name: str, host: str = 'localhost', port: int = 27017, database: str = '',
-                 serializer: Union[Serializer, None] = None, connection_timeout: float = 30000) -> None:
+                 serializer: Union[Serializer, None] = None, connection_timeout: float = 30000,
+                 materialized_path: bool = False, node_cache_size: int = 1024, create_indexes: bool = True,
+                 max_pool_size: Optional[int] = None, binary_arrays: bool = False, compression: Optional[str] = None,
+                 compression_threshold: int = 65536, read_only_arrays: bool = False) -> None:
         """MongoDB implementation of storage class
 
         See also: `StorageInterface`
@@ -75,22 +117,90 @@ class StorageMongoDb(StorageInterface):
             port: MongoDB port
             database: The database to use, if empty the name of the storage is used
             connection_timeout: How long to try to connect to database before raising an error in milliseconds
+            materialized_path: Use the materialized path layout. Existing trees can be converted
+                with `migrate_to_materialized_path`
+            node_cache_size: Maximum number of node ObjectIDs kept in the LRU node cache of the tree layout.
+                If zero the cache is disabled. A cached node that was deleted by another storage instance is detected
+                when a write creates a new leaf below it or a read below it finds nothing
+            create_indexes: Ensure the indexes of the storage layout exist. If False the indexes should be provisioned
+                by the database administrator, the materialized path layout relies on its unique path index. Without
+                a unique (parent, tag) index the tree layout checks the siblings before every write
+            max_pool_size: Maximum number of connections in the pool of the client. The client is shared with the
+                other storages and data sets that use the same connection parameters, see `MongoClientRegistry`.
+                If None the default of the registry is used
+            binary_arrays: Store the data of numpy arrays as BSON binary instead of base64 encoded strings, which
+                are a third larger
+            compression: Compress the data of numpy arrays with this method, one of `compression_methods`. zstd
+                and lz4 require the optional compression packages. If None the arrays are not compressed
+            compression_threshold: Arrays smaller than this number of bytes are not compressed
+            read_only_arrays: Load numpy arrays as read-only views on the loaded data, which saves a copy of every
+                array. Use `np.array` to get a writable copy
         Raises:
             StorageTimeoutError: If connection to database has not been established before connection_timeout is reached
+            ValueError: If the compression method is unknown
+            ImportError: If the package of the compression method is not installed
         """
+        if compression is not None:
+            check_compression_method(compression)
         super().__init__(name)
 
-        type_registry = TypeRegistry([NumpyArrayCodec()])
+        type_registry = TypeRegistry([NumpyArrayCodec(read_only_arrays)])
         codec_options = CodecOptions(type_registry=type_registry)  # type: CodecOptions[Any]
-        self._client = MongoClient(host, port, serverSelectionTimeoutMS=connection_timeout)  # type: MongoClient[Any]
-        self._check_server_connection(connection_timeout)
+        self._client = mongo_client_registry.acquire(
+            host, port, client_class=MongoClient, max_pool_size=max_pool_size)  # type: MongoClient[Any]
+        try:
+            self._check_server_connection(connection_timeout)
+        except ConnectionTimeoutError:
+            mongo_client_registry.release(self._client)
+            raise
+        self._released = False
         self._db = self._client.get_database(database or name, codec_options=codec_options)
         self._collection = self._db.get_collection('storage')
+        self._materialized_path = materialized_path
+        self._node_cache = NodeCache(node_cache_size)
+        self._unique_siblings = True
+        if create_indexes:
+            self._create_indexes()
+        elif not self._materialized_path:
+            self._unique_siblings = self._has_unique_sibling_index()
 
         if serializer is None:
             serializer = _serializer
+        if binary_arrays or compression is not None or read_only_arrays:
+            serializer = self._array_serializer(serializer, binary_arrays, compression, compression_threshold,
+                                                read_only_arrays)
         self._serialize = serializer.encode_data
         self._unserialize = serializer.decode_data
+        self._serialize_value: Callable[[Any], Any] = partial(serializer.encode_data, encode_key=self._encode_key)
+        self._unserialize_value: Callable[[Any], Any] = partial(serializer.decode_data, decode_key=self._decode_key)
+
+    @staticmethod
+    def _array_serializer(serializer: Serializer, binary_arrays: bool, compression: Optional[str],
+                          compression_threshold: int, read_only_arrays: bool = False) -> Serializer:
+        """ Create a copy of a serializer with an encoder for numpy arrays that stores binary or compressed data
+
+        The arrays are decoded by `NumpyArrayEncDec.decode`, which also decodes the base64 encoded arrays of
+        existing documents.
+
+        Args:
+            serializer: The serializer to copy
+            binary_arrays: Store the data of the arrays as bytes, which are encoded as BSON binary
+            compression: The compression method of the data, or None
+            compression_threshold: Arrays smaller than this number of bytes are not compressed
+            read_only_arrays: Decode the arrays as read-only views instead of writable copies
+
+        Returns:
+            The serializer
+        """
+        encode = NumpyArrayEncDec.encode_to_bytes if binary_arrays else NumpyArrayEncDec.encode
+        array_serializer = Serializer()
+        array_serializer.encoder.encoders.update(serializer.encoder.encoders)
+        array_serializer.decoder.decoders.update(serializer.decoder.decoders)
+        array_serializer.encoder.encoders[np.ndarray] = partial(encode, compression=compression,
+                                                                compression_threshold=compression_threshold)
+        if read_only_arrays:
+            array_serializer.decoder.decoders[np.array.__name__] = partial(NumpyArrayEncDec.decode, read_only=True)
+        return array_serializer
 
     def __repr__(self) -> str:
         return f'<{self.__class__.__name__} at 0x{id(self):x}: name {self._db.name}>'
@@ -98,63 +208,391 @@ class StorageMongoDb(StorageInterface):
     def __str__(self) -> str:
         return f'<{type(self).__name__}: name {self._db.name}>'
 
+    def close(self) -> None:
+        """ Release the connection to the database, the shared client is closed when it is no longer used.
+
+        Only the first call releases the client, so the client of other users is not closed by repeated calls.
+        """
+        if self._released:
+            return
+        self._released = True
+        mongo_client_registry.release(self._client)
+
+    def watch_changes(self, stop: threading.Event, max_await_time: float = 1.0) -> Iterator[Optional[TagType]]:
+        """ Watch the storage for changes made by any client, e.g. to keep caches of several processes coherent
+
+        Change streams require a replica set or sharded cluster.
+
+        Args:
+            stop: The watch ends when the event is set
+            max_await_time: Maximum time in seconds to wait for a change before `stop` is checked again
+
+        Yields:
+            The tag of each changed document. None is yielded if the tag of a change is unknown, which is the case for
+            deleted documents and for all changes in the tree layout
+        """
+        with self._collection.watch(full_document='updateLookup',
+                                    max_await_time_ms=int(max_await_time * 1000)) as stream:
+            while not stop.is_set():
+                change = stream.try_next()
+                if change is None:
+                    continue
+                document = change.get('fullDocument')
+                if self._materialized_path and document is not None and 'tags' in document:
+                    yield list(document['tags'])
+                else:
+                    yield None
+
     def _check_server_connection(self, timeout: float) -> None:
-        """ Check if connection has been established to database server."""
+        """ Check if connection has been established to database server.
+
+        The client is shared, so the timeout is applied to this check instead of to the client.
+        """
         try:
-            self._client.server_info()
+            with pymongo.timeout(timeout / 1000):
+                self._client.server_info()
         except ServerSelectionTimeoutError as e:
             raise ConnectionTimeoutError(f'Failed to connect to Mongo database within {timeout} milliseconds') from e
 
+    @property
+    def materialized_path(self) -> bool:
+        """ True if the storage uses the materialized path layout """
+        return self._materialized_path
+
+    @property
+    def node_cache(self) -> NodeCache:
+        """ The cache with the ObjectIDs of the resolved nodes """
+        return self._node_cache
+
+    def _create_indexes(self) -> None:
+        """ Create the indexes used by the queries of the storage layout.
+
+        The unique index on (parent, tag) of the tree layout also prevents duplicate sibling nodes when several
+        writers create the same node, so nodes and leaves are created with atomic upserts. If the collection already
+        contains duplicate siblings, a warning is logged and a non-unique index is created instead. The storage then
+        checks the siblings before every upsert.
+        """
+        if self._materialized_path:
+            self._create_path_indexes()
+            return
+
+        keys = [('parent', ASCENDING), ('tag', ASCENDING)]
+        try:
+            self._collection.create_index(keys, unique=True)
+        except DuplicateKeyError:
+            self.logger.warning('Duplicate sibling nodes found in %s, creating a non-unique index on (parent, tag)',
+                                self._collection.name)
+            self._collection.create_index(keys)
+            self._unique_siblings = False
+        else:
+            self._unique_siblings = True
+
+    def _has_unique_sibling_index(self) -> bool:
+        """ Check whether the collection has the unique index on (parent, tag) that the atomic upserts rely on
+
+        Returns:
+            True if a unique index on (parent, tag) exists
+        """
+        return len(self._unique_sibling_indexes()) > 0
+
+    def _unique_sibling_indexes(self) -> List[str]:
+        """ Find the unique indexes on (parent, tag)
+
+        Returns:
+            The names of the indexes
+        """
+        keys = [('parent', ASCENDING), ('tag', ASCENDING)]
+        return [name for name, index in self._collection.index_information().items()
+                if index.get('unique', False) and [tuple(key) for key in index['key']] == keys]
+
+    def find_unindexed_queries(self) -> List[str]:
+        """ Explain the queries of the storage layout and report the ones that need a collection scan
+
+        Returns:
+            The names of the query shapes of which the winning plan contains a collection scan
+        """
+        queries: Dict[str, Tuple[Dict[str, Any], Optional[List[Tuple[str, int]]]]]
+        if self._materialized_path:
+            queries = {
+                'load by path': ({'path': ''}, None),
+                'list children by parent path': ({'parent_path': ''}, [('tag', -1)]),
+            }
+        else:
+            queries = {
+                'root': ({'tag': '', 'parent': {'$exists': False}}, None),
+                'load by parent and tag': ({'parent': ObjectId(), 'tag': ''}, None),
+                'list children by parent': ({'parent': ObjectId(), 'tag': {'$exists': True}}, [('tag', -1)]),
+            }
+
+        unindexed = []
+        for name, (query, sort) in queries.items():
+            cursor = self._collection.find(query, limit=1)
+            if sort is not None:
+                cursor = cursor.sort(sort)
+            plan = cursor.explain()['queryPlanner']['winningPlan']
+            if self._is_collection_scan(plan):
+                self.logger.warning('Query "%s" on %s is not indexed', name, self._collection.name)
+                unindexed.append(name)
+        return unindexed
+
+    @staticmethod
+    def _is_collection_scan(plan: Dict[str, Any]) -> bool:
+        """ Check whether a query plan, or one of its input stages, is a collection scan
+
+        Args:
+            plan: The query plan as returned by explain
+
+        Returns:
+            True if the plan contains a COLLSCAN stage
+        """
+        if plan.get('stage') == 'COLLSCAN':
+            return True
+        stages = plan.get('inputStages', []) + ([plan['inputStage']] if 'inputStage' in plan else [])
+        return any(StorageMongoDb._is_collection_scan(stage) for stage in stages)
+
+    def _create_path_indexes(self) -> None:
+        """ Create the indexes used by the materialized path layout.
+
+        The unique index on the path is sparse, so documents of the tree layout that have not been migrated yet
+        are not indexed. A unique index on (parent, tag) of the tree layout is dropped, documents of this layout have
+        no parent reference and would collide on (null, tag).
+        """
+        self._collection.create_index('path', unique=True, sparse=True)
+        self._collection.create_index([('parent_path', ASCENDING), ('tag', ASCENDING)])
+        for name in self._unique_sibling_indexes():
+            self._collection.drop_index(name)
+
+    @staticmethod
+    def _tag_to_path(tag: TagType) -> str:
+        """ Convert a tag to its materialized path
+
+        Every tag component is prefixed with a slash. Slashes and percent signs inside a component are escaped,
+        so that different tags never map to the same path. The root node has the empty path.
+
+        Args:
+            tag: The tag
+
+        Returns:
+            The path of the tag
+        """
+        return ''.join('/' + part.replace('%', '%25').replace('/', '%2F') for part in tag)
+
+    @staticmethod
+    def _path_document(tag: TagType, include_path: bool = True) -> Dict[str, Any]:
+        """ Create the tree fields of a document in the materialized path layout
+
+        Args:
+            tag: The tag of the document, should not be empty
+            include_path: If False the path is left out, e.g. when it is already part of an upsert filter
+
+        Returns:
+            The tag, tag components, path, parent path and ancestor paths of the document
+        """
+        ancestors = [StorageMongoDb._tag_to_path(tag[:index]) for index in range(len(tag))]
+        document = {'tag': tag[-1], 'tags': list(tag), 'parent_path': ancestors[-1], 'ancestors': ancestors}
+        if include_path:
+            document['path'] = StorageMongoDb._tag_to_path(tag)
+        return document
+
     def _get_root(self) -> ObjectId:
         """Get or create a root node if it doesn't exist yet
 
         Returns:
             An ObjectID of the root node
         """
+        root = self._node_cache.get([])
+        if root is not None:
+            return cast(ObjectId, root)
+
+        root_filter = {'tag': '', 'parent': {'$exists': False}}
+        node = self._collection.find_one(root_filter)
+        if node is None:
+            try:
+                node = self._collection.find_one_and_update(root_filter, {'$setOnInsert': {'tag': ''}},
+                                                            projection={'_id': 1}, upsert=True,
+                                                            return_document=ReturnDocument.AFTER)
+            except DuplicateKeyError:
+                # another writer created the root at the same time
+                node = self._collection.find_one(root_filter)
+        root = node['_id']
+        self._node_cache.put([], root)
+        return cast(ObjectId, root)
+
+    def _get_node(self, tag: TagType, create: bool = False,
+                  leaf_error: Type[Exception] = NoDataAtKeyError) -> ObjectId:
+        """Resolve the ObjectID of the node at a given tag, see `_walk_to_node`
 
-        node = self._collection.find_one({'tag': '', 'parent': {'$exists': False}})
+        Args:
+            tag: The node tag
+            create: If True missing nodes are created
+            leaf_error: The error to raise if a tag in the tag list is a leaf
 
-        if node is not None:
-            return cast(ObjectId, node['_id'])
+        Returns:
+            The ObjectID of the node
 
-        return cast(ObjectId, self._collection.insert_one({'tag': ''}).inserted_id)
+        Raises:
+            NoDataAtKeyError: If a tag in the tag list does not exist and create is False
+        """
+        return self._walk_to_node(tag, create, leaf_error)[0]
 
-    def _retrieve_nodes_by_tag(self, tag: TagType, parent: ObjectId, document_limit: int = 0) -> TagType:
-        """Traverse the tree and list the children of a given tag
+    def _walk_to_node(self, tag: TagType, create: bool = False,
+                      leaf_error: Type[Exception] = NoDataAtKeyError) -> Tuple[ObjectId, int, Optional[ObjectId]]:
+        """Resolve the ObjectID of the node at a given tag
+
+        The walk starts at the deepest node on the path that is in the node cache. Nodes that are found or created
+        on the way are added to the cache. The cached node may have been deleted by another storage instance, so
+        it is checked when a tag below it cannot be found, see `_evict_stale_node`.
+
+        Args:
+            tag: The node tag
+            create: If True missing nodes are created
+            leaf_error: The error to raise if a tag in the tag list is a leaf
+
+        Returns:
+            The ObjectID of the node, and the length of the tag and the ObjectID of the cached node the walk started
+            at. The ObjectID of the cached node is None if no node was cached
+
+        Raises:
+            NoDataAtKeyError: If a tag in the tag list does not exist and create is False
+        """
+        depth, cached = self._node_cache.longest_prefix(tag)
+        node = self._get_root() if cached is None else cached
+
+        for index in range(depth, len(tag)):
+            if create and self._unique_siblings:
+                node = self._upsert_node(node, tag[index], leaf_error)
+            else:
+                doc = self._collection.find_one({'parent': node, 'tag': tag[index]})
+                if doc is None:
+                    if not create:
+                        if self._evict_stale_node(tag[:depth], cached):
+                            return self._walk_to_node(tag, create, leaf_error)
+                        raise NoDataAtKeyError(f'Tag "{tag[index]}" cannot be found')
+                    node = self._collection.insert_one({'parent': node, 'tag': tag[index]}).inserted_id
+                elif 'value' in doc:
+                    raise leaf_error(f'Tag "{tag[index]}" is a leaf')
+                else:
+                    node = doc['_id']
+            self._node_cache.put(tag[:index + 1], node)
+
+        return cast(ObjectId, node), depth, cached
+
+    def _evict_stale_node(self, tag: TagType, node: Optional[ObjectId]) -> bool:
+        """ Check whether a cached node still exists
+
+        The node cache of a storage does not see the deletes of other storage instances. If the node has been
+        deleted, the node and its descendants are removed from the cache and the documents that were written below
+        the node since, e.g. by upserts that did not match, are deleted.
+
+        Args:
+            tag: The tag of the cached node
+            node: The ObjectID of the cached node, or None if no node was cached
+
+        Returns:
+            True if the node has been deleted and has been evicted from the cache
+        """
+        if node is None or self._collection.find_one({'_id': node}, {'_id': 1}) is not None:
+            return False
+        self._node_cache.invalidate(tag)
+        self._delete_subtrees([node])
+        return True
+
+    def _delete_subtrees(self, node_ids: List[ObjectId]) -> None:
+        """ Delete nodes and all their descendants in the tree layout
+
+        The ObjectIDs of the subtrees are collected level by level, reading the children of a batch of nodes with
+        one query, and the collected documents are deleted with a delete_many per batch.
+
+        Args:
+            node_ids: The ObjectIDs of the nodes
+        """
+        batch_size = self.DELETE_BATCH_SIZE
+        ids: List[ObjectId] = []
+        while node_ids:
+            ids.extend(node_ids)
+            children: List[ObjectId] = []
+            for start in range(0, len(node_ids), batch_size):
+                children.extend(doc['_id'] for doc in self._collection.find(
+                    {'parent': {'$in': node_ids[start:start + batch_size]}}, {'_id': 1}, batch_size=batch_size))
+            node_ids = children
+        for start in range(0, len(ids), batch_size):
+            self._collection.delete_many({'_id': {'$in': ids[start:start + batch_size]}})
+
+    def _upsert_node(self, parent: ObjectId, name: str, leaf_error: Type[Exception]) -> ObjectId:
+        """ Get or create a node with a single atomic upsert
+
+        A leaf with the same name collides with the upsert on the unique (parent, tag) index.
+
+        Args:
+            parent: The ObjectID of the parent node
+            name: The tag of the node
+            leaf_error: The error to raise if the tag is a leaf
+
+        Returns:
+            The ObjectID of the node
+        """
+        try:
+            doc = self._collection.find_one_and_update({'parent': parent, 'tag': name, 'value': {'$exists': False}},
+                                                       {'$setOnInsert': {'parent': parent, 'tag': name}},
+                                                       projection={'_id': 1}, upsert=True,
+                                                       return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError:
+            # the tag is a leaf, or another writer created the node at the same time
+            doc = self._collection.find_one({'parent': parent, 'tag': name})
+            if doc is None or 'value' in doc:
+                raise leaf_error(f'Tag "{name}" is a leaf') from None
+        return cast(ObjectId, doc['_id'])
+
+    @staticmethod
+    def _tag_range(lower: Optional[str], upper: Optional[str]) -> Dict[str, Any]:
+        """ Create the filter on the tag of the children in a range, served by the (parent, tag) index
+
+        Args:
+            lower: The inclusive lower bound of the tags. None if there is no lower bound
+            upper: The exclusive upper bound of the tags. None if there is no upper bound
+
+        Returns:
+            The filter on the tag field
+        """
+        tag_filter: Dict[str, Any] = {'$exists': True}
+        if lower is not None:
+            tag_filter['$gte'] = lower
+        if upper is not None:
+            tag_filter['$lt'] = upper
+        return tag_filter
+
+    def _retrieve_nodes_by_tag(self, tag: TagType, document_limit: int = 0, lower: Optional[str] = None,
+                               upper: Optional[str] = None) -> TagType:
+        """List the children of a given tag
 
         Args:
             tag: The node tag
-            parent: The ObjectID of the node's parent
             document_limit: Maximum number of documents to return. If set to zero there is no limit
+            lower: The inclusive lower bound of the names of the children
+            upper: The exclusive upper bound of the names of the children
 
         Returns:
             A list of names of the children
         """
-        if len(tag) == 0:
-            return list(map(itemgetter('tag'),
-                            self._collection.find({'parent': parent, 'tag': {'$exists': True}},
+        parent, depth, cached = self._walk_to_node(tag)
+        children = list(map(itemgetter('tag'),
+                            self._collection.find({'parent': parent, 'tag': self._tag_range(lower, upper)},
                                                   {'value': 0},
                                                   limit=document_limit,
                                                   sort=[('tag', -1)])))
+        if len(children) == 0 and self._evict_stale_node(tag[:depth], cached):
+            return self._retrieve_nodes_by_tag(tag, document_limit, lower, upper)
+        return children
 
-        else:
-            doc = self._collection.find_one({'parent': parent, 'tag': tag[0]})
-            if doc is None:
-                raise NoDataAtKeyError(f'Tag "{tag[0]}" cannot be found')
-            elif 'value' in doc:
-                raise NoDataAtKeyError(f'Tag "{tag[0]}" is not a node')
-            else:
-                return self._retrieve_nodes_by_tag(tag[1:], doc['_id'], document_limit)
-
-    def _retrieve_value_by_tag(self, tag: TagType, parent: ObjectId, field: Optional[Union[str, int]] = None) -> Any:
-        """Traverse the tree and retrieves the value / field value of a given leaf tag
+    def _retrieve_value_by_tag(self, tag: TagType, field: Optional[str] = None) -> Any:
+        """Retrieves the value / field value of a given leaf tag
         If the field is specified, it returns the value of the field instead of tag value
         If the specified field does not exist, it will raise a NoDataAtKeyError
 
         Args:
             tag: The leaf tag
-            parent: The ObjectID of the leaf's parent
-            field: The field to be retrieved. Default value is none.
+            field: The encoded field to be retrieved, the keys of a nested field are separated by dots.
+                Default value is none.
 
         Returns:
             Data held by the leaf. If field is provided, returns the value of the
@@ -164,79 +602,291 @@ class StorageMongoDb(StorageInterface):
             NoDataAtKeyError: If a tag in Tag list does not exist
             or if the field does not exist
         """
+        parent, depth, cached = self._walk_to_node(tag[:-1])
+        if field is None:
+            doc = self._collection.find_one({'parent': parent, 'tag': tag[-1]})
+        else:
+            doc = self._collection.find_one({'parent': parent, 'tag': tag[-1]}, {f'value.{field}': 1})
+
+        if doc is None:
+            if self._evict_stale_node(tag[:depth], cached):
+                return self._retrieve_value_by_tag(tag, field)
+            raise NoDataAtKeyError(f'Tag "{tag[-1]}" cannot be found')
+        elif 'value' not in doc:
+            raise NoDataAtKeyError(f'Tag "{tag[-1]}" is not a leaf')
+        elif field is None:
+            return doc['value']
+        return self._get_field(doc['value'], field.split('.'))
+
+    def _store_value_by_tag(self, tag: TagType, data: Any, field: Optional[str] = None) -> None:
+        """ Store a value at a given tag. In case a field is specified, function will update the value of the
+        field with data. If the field does not already exists, the field will be created
 
-        if len(tag) == 1:
-            if field is None:
-                doc = self._collection.find_one({'parent': parent, 'tag': tag[0]})
-            else:
-                doc = self._collection.find_one({'parent': parent, 'tag': tag[0]}, {f'value.{field}': 1})
+        The leaf is written with a single atomic upsert, which also increments the version of the leaf. If the
+        upsert creates a new leaf below a cached node, the cached node is checked and the write is repeated if the
+        node has been deleted by another storage instance.
 
-            if doc is None:
-                raise NoDataAtKeyError(f'Tag "{tag[0]}" cannot be found')
-            elif 'value' not in doc:
-                raise NoDataAtKeyError(f'Tag "{tag[0]}" is not a leaf')
-            else:
-                if field is None:
-                    return doc['value']
-                elif field in doc['value']:
-                    return doc['value'][field]
-                else:
-                    raise NoDataAtKeyError(f'The field "{field}" does not exists')
+        Args:
+            tag: The tag
+            data: Data to store
+            field: Field to be updated. Default value is None
 
-        else:
-            doc = self._collection.find_one({'parent': parent, 'tag': tag[0], 'value': {'$exists': False}})
-            if doc is None:
-                raise NoDataAtKeyError(f'Tag "{tag[0]}" cannot be found')
-            else:
-                return self._retrieve_value_by_tag(tag[1:], doc['_id'], field)
+        Raises:
+              NodeAlreadyExistsError: If a tag in Tag List is an unexpected node/leaf
+              NoDataAtKeyError:  If a tag in Tag List does not exist
+        """
+        parent, depth, cached = self._walk_to_node(tag[:-1], create=field is None, leaf_error=NodeAlreadyExistsError)
+        leaf_filter = {'parent': parent, 'tag': tag[-1], 'value': {'$exists': True}}
+        if field is not None:
+            result = self._collection.update_one(leaf_filter, {'$set': {f'value.{field}': data},
+                                                               '$inc': {'version': 1}})
+            if result.matched_count == 0:
+                if self._evict_stale_node(tag[:depth], cached):
+                    self._store_value_by_tag(tag, data, field)
+                    return
+                self._raise_tag_error(parent, tag)
+            return
+
+        if not self._unique_siblings and self._collection.find_one(
+                {'parent': parent, 'tag': tag[-1], 'value': {'$exists': False}}, {'_id': 1}) is not None:
+            raise NodeAlreadyExistsError(f'Tag "{tag[-1]}" is not a leaf')
+        try:
+            result = self._collection.update_one(leaf_filter, {'$set': {'value': data}, '$inc': {'version': 1}},
+                                                 upsert=True)
+        except DuplicateKeyError as e:
+            raise NodeAlreadyExistsError(f'Tag "{tag[-1]}" is not a leaf') from e
+        if result.upserted_id is not None and self._evict_stale_node(tag[:depth], cached):
+            self._store_value_by_tag(tag, data)
 
-    def _store_value_by_tag(self, tag: TagType, data: Any, parent: ObjectId,
-                            field: Optional[Union[str, int]] = None) -> None:
-        """ Store a value at a given tag. In case a field is specified, function will update the value of the
-        field with data. If the field does not already exists, the field will be created
+    def _raise_tag_error(self, parent: ObjectId, tag: TagType) -> None:
+        """ Find out why a tag in the tree layout is not an existing leaf and raise the matching error
+
+        Args:
+            parent: The ObjectID of the parent node of the tag
+            tag: The tag
+
+        Raises:
+              NodeAlreadyExistsError: If the tag is a node
+              NoDataAtKeyError:  If the tag does not exist
+        """
+        if self._collection.find_one({'parent': parent, 'tag': tag[-1]}, {'_id': 1}) is None:
+            raise NoDataAtKeyError(f'Tag "{tag[-1]}" does not exist')
+        raise NodeAlreadyExistsError(f'Tag "{tag[-1]}" is not a leaf')
+
+    def _retrieve_nodes_by_path(self, tag: TagType, document_limit: int = 0, lower: Optional[str] = None,
+                                upper: Optional[str] = None) -> TagType:
+        """ List the children of a given tag in the materialized path layout
+
+        Args:
+            tag: The node tag
+            document_limit: Maximum number of documents to return. If set to zero there is no limit
+            lower: The inclusive lower bound of the names of the children
+            upper: The exclusive upper bound of the names of the children
+
+        Returns:
+            A list of names of the children, sorted in descending order
+        """
+        query: Dict[str, Any] = {'parent_path': self._tag_to_path(tag)}
+        if lower is not None or upper is not None:
+            query['tag'] = self._tag_range(lower, upper)
+        return list(map(itemgetter('tag'),
+                        self._collection.find(query,
+                                              {'tag': 1},
+                                              limit=document_limit,
+                                              sort=[('tag', -1)])))
+
+    def _retrieve_value_by_path(self, tag: TagType, field: Optional[str] = None) -> Any:
+        """ Retrieve the value / field value of a given leaf tag in the materialized path layout
+
+        Args:
+            tag: The leaf tag
+            field: The encoded field to be retrieved, the keys of a nested field are separated by dots.
+                Default value is none.
+
+        Returns:
+            Data held by the leaf. If field is provided, returns the value of the
+            field stored in the leaf
+
+        Raises:
+            NoDataAtKeyError: If the tag does not exist or if the field does not exist
+        """
+        projection = None if field is None else {f'value.{field}': 1}
+        doc = self._collection.find_one({'path': self._tag_to_path(tag)}, projection)
+
+        if doc is None:
+            raise NoDataAtKeyError(f'Tag "{tag[-1]}" cannot be found')
+        elif 'value' not in doc:
+            raise NoDataAtKeyError(f'Tag "{tag[-1]}" is not a leaf')
+        elif field is None:
+            return doc['value']
+        return self._get_field(doc['value'], field.split('.'))
+
+    def _store_value_by_path(self, tag: TagType, data: Any, field: Optional[str] = None) -> None:
+        """ Store a value at a given tag in the materialized path layout. In case a field is specified, function will
+        update the value of the field with data. If the field does not already exists, the field will be created
+
+        A save is a single ordered bulk write of upserts. An upsert that matches neither a node (for the ancestors)
+        nor a leaf (for the tag itself) collides on the unique path index, which identifies the offending tag.
 
         Args:
             tag: The tag
             data: Data to store
-            parent: An ObjectID of the node's parent
             field: Field to be updated. Default value is None
 
         Raises:
               NodeAlreadyExistsError: If a tag in Tag List is an unexpected node/leaf
               NoDataAtKeyError:  If a tag in Tag List does not exist
         """
+        if field is not None:
+            result = self._collection.update_one({'path': self._tag_to_path(tag), 'value': {'$exists': True}},
+                                                 {'$set': {f'value.{field}': data}, '$inc': {'version': 1}})
+            if result.matched_count == 0:
+                self._raise_path_error(tag)
+            return
 
-        if len(tag) == 1:
-            doc = self._collection.find_one({'parent': parent, 'tag': tag[0]})
-            if doc:
-                if 'value' not in doc:
-                    raise NodeAlreadyExistsError(f'Tag "{tag[0]}" is not a leaf')
-                elif field is None:
-                    self._collection.update_one({'parent': parent, 'tag': tag[0]},
-                                                {'$set': {'value': data}})
-                else:
-                    self._collection.update_one({'parent': parent,
-                                                 'tag': tag[0]},
-                                                {'$set': {'value.' +
-                                                          str(field): data}})
-            elif field is None:
-                self._collection.insert_one({'parent': parent, 'tag': tag[0], 'value': data})
-            else:
-                raise NoDataAtKeyError(f'Tag "{tag[0]}" does not exist')
-        else:
-            doc = self._collection.find_one({'parent': parent, 'tag': tag[0]})
-            if doc is None:
-                if field is None:
-                    parent = self._collection.insert_one({'parent': parent, 'tag': tag[0]}).inserted_id
-                else:
-                    raise NoDataAtKeyError(f'Tag "{tag[0]}" does not exist')
+        self._store_values_by_path([(tag, data)])
+
+    def _store_values_by_path(self, items: Sequence[Tuple[TagType, Any]], overwrite: bool = True) -> None:
+        """ Store values at the given tags in the materialized path layout with a single ordered bulk write
+
+        Args:
+            items: Pairs of tag and encoded data to store
+            overwrite: If False, the values of existing leaves are left untouched
+
+        Raises:
+              NodeAlreadyExistsError: If a tag in Tag List is an unexpected node/leaf
+        """
+        requests, request_tags = self._path_write_requests(items, overwrite)
+        if not requests:
+            return
+        try:
+            self._collection.bulk_write(requests, ordered=True)
+        except BulkWriteError as e:
+            raise self._path_write_error(e, request_tags) from e
+
+    @staticmethod
+    def _path_write_requests(items: Sequence[Tuple[TagType, Any]],
+                             overwrite: bool = True) -> Tuple[List[UpdateOne], List[Tuple[TagType, bool]]]:
+        """ Create the upserts that store values at the given tags in the materialized path layout
+
+        An upsert that matches neither a node (for the ancestors) nor a leaf (for the tag itself) collides on the
+        unique path index when the requests are written with an ordered bulk write.
+
+        Args:
+            items: Pairs of tag and encoded data to store
+            overwrite: If False, the values of existing leaves are left untouched
+
+        Returns:
+            The upserts and for every upsert the tag it writes and whether that tag is a leaf
+        """
+        requests: List[UpdateOne] = []
+        request_tags: List[Tuple[TagType, bool]] = []
+        node_paths = set()
+        for tag, data in items:
+            for index in range(1, len(tag)):
+                path = StorageMongoDb._tag_to_path(tag[:index])
+                if path not in node_paths:
+                    node_paths.add(path)
+                    requests.append(UpdateOne({'path': path, 'value': {'$exists': False}},
+                                              {'$setOnInsert': StorageMongoDb._path_document(tag[:index],
+                                                                                             include_path=False)},
+                                              upsert=True))
+                    request_tags.append((tag[:index], False))
+            leaf_document = StorageMongoDb._path_document(tag, include_path=False)
+            if overwrite:
+                update = {'$set': {'value': data}, '$setOnInsert': leaf_document, '$inc': {'version': 1}}
             else:
-                if 'value' in doc:
-                    raise NodeAlreadyExistsError(f'Tag "{tag[0]}" is a leaf')
-                else:
-                    parent = doc['_id']
+                update = {'$setOnInsert': dict(leaf_document, value=data, version=1)}
+            requests.append(UpdateOne({'path': StorageMongoDb._tag_to_path(tag), 'value': {'$exists': True}}, update,
+                                      upsert=True))
+            request_tags.append((tag, True))
+        return requests, request_tags
+
+    @staticmethod
+    def _path_write_error(error: BulkWriteError, request_tags: List[Tuple[TagType, bool]]) -> Exception:
+        """ Convert the failure of a bulk write created by `_path_write_requests` to a storage error
+
+        Args:
+            error: The error raised by the bulk write
+            request_tags: The tags of the upserts, as returned by `_path_write_requests`
+
+        Returns:
+            The error that describes the offending tag
+        """
+        tag, is_leaf = request_tags[error.details['writeErrors'][0]['index']]
+        if is_leaf:
+            return NodeAlreadyExistsError(f'Tag "{tag[-1]}" is not a leaf')
+        return NodeAlreadyExistsError(f'Tag "{tag[-1]}" is a leaf')
 
-            self._store_value_by_tag(tag[1:], data, parent, field)
+    def _raise_path_error(self, tag: TagType) -> None:
+        """ Find out why a tag in the materialized path layout is not an existing leaf and raise the matching error
+
+        Args:
+            tag: The tag
+
+        Raises:
+              NodeAlreadyExistsError: If a tag in Tag List is an unexpected node/leaf
+              NoDataAtKeyError:  If a tag in Tag List does not exist
+        """
+        paths = [self._tag_to_path(tag[:index + 1]) for index in range(len(tag))]
+        existing = {doc['path'] for doc in self._collection.find({'path': {'$in': paths}}, {'path': 1})}
+        leaves = {doc['path'] for doc in self._collection.find({'path': {'$in': paths}, 'value': {'$exists': True}},
+                                                                {'path': 1})}
+        raise self._path_error(tag, existing, leaves)
+
+    @staticmethod
+    def _path_error(tag: TagType, existing: Set[str], leaves: Set[str]) -> Exception:
+        """ Create the error for a tag in the materialized path layout that is not an existing leaf
+
+        Args:
+            tag: The tag
+            existing: The paths of the tag and its ancestors that are in storage
+            leaves: The paths of the tag and its ancestors that are leaves
+
+        Returns:
+            The error that describes the first offending tag component
+        """
+        for index in range(len(tag)):
+            path = StorageMongoDb._tag_to_path(tag[:index + 1])
+            if path not in existing:
+                return NoDataAtKeyError(f'Tag "{tag[index]}" does not exist')
+            if path in leaves and index < len(tag) - 1:
+                return NodeAlreadyExistsError(f'Tag "{tag[index]}" is a leaf')
+        return NodeAlreadyExistsError(f'Tag "{tag[-1]}" is not a leaf')
+
+    def migrate_to_materialized_path(self) -> int:
+        """ Convert the documents of the tree layout to the materialized path layout
+
+        The tree structure is read with a single query without the values and the path fields are written back
+        in batches. The parent references are kept, the unique index on (parent, tag) is dropped. After the migration
+        the storage uses the materialized path layout.
+
+        Returns:
+            The number of migrated documents
+        """
+        root = self._get_root()
+        children: Dict[ObjectId, List[Dict[str, Any]]] = {}
+        for doc in self._collection.find({'parent': {'$exists': True}}, {'tag': 1, 'parent': 1}):
+            children.setdefault(doc['parent'], []).append(doc)
+
+        requests: List[UpdateOne] = []
+        migrated = 0
+        pending: List[Any] = [(root, [])]
+        while pending:
+            parent, parent_tag = pending.pop()
+            for doc in children.get(parent, []):
+                tag = parent_tag + [doc['tag']]
+                requests.append(UpdateOne({'_id': doc['_id']}, {'$set': self._path_document(tag)}))
+                pending.append((doc['_id'], tag))
+            if len(requests) >= self.MIGRATION_BATCH_SIZE:
+                migrated += self._collection.bulk_write(requests, ordered=False).matched_count
+                requests = []
+        if requests:
+            migrated += self._collection.bulk_write(requests, ordered=False).matched_count
+
+        self._create_path_indexes()
+        self._materialized_path = True
+        return migrated
 
     def load_data(self, tag: TagType) -> Any:
         if not isinstance(tag, list):
@@ -245,18 +895,232 @@ class StorageMongoDb(StorageInterface):
         if len(tag) == 0:
             raise NoDataAtKeyError('Tag cannot be empty')
 
-        return self._unserialize(self._decode_data(self._retrieve_value_by_tag(tag, self._get_root())))
+        if self._materialized_path:
+            return self._unserialize_value(self._retrieve_value_by_path(tag))
+        return self._unserialize_value(self._retrieve_value_by_tag(tag))
 
     def save_data(self, data: Any, tag: TagType) -> None:
         self._validate_tag(tag)
-        self._store_value_by_tag(tag, self._encode_data(self._serialize(data)), self._get_root())
+        if self._materialized_path:
+            self._store_value_by_path(tag, self._serialize_value(data))
+        else:
+            self._store_value_by_tag(tag, self._serialize_value(data))
 
-    def load_individual_data(self, tag: TagType, field: Union[str, int]) -> Any:
+    def load_versioned_data(self, tag: TagType) -> Tuple[Any, int]:
+        """ Load the data and the version of a leaf, for a later `save_versioned_data`
+
+        Args:
+            tag: The tag of the leaf
+
+        Returns:
+            The data of the leaf and its version. Leaves that were written before versions were introduced have
+            version 0
+
+        Raises:
+            NoDataAtKeyError: If the tag is not a leaf
+        """
+        self._validate_tag(tag)
+        if len(tag) == 0:
+            raise NoDataAtKeyError('Tag cannot be empty')
+        if self._materialized_path:
+            doc = self._collection.find_one({'path': self._tag_to_path(tag)})
+        else:
+            parent, depth, cached = self._walk_to_node(tag[:-1])
+            doc = self._collection.find_one({'parent': parent, 'tag': tag[-1]})
+            if doc is None and self._evict_stale_node(tag[:depth], cached):
+                return self.load_versioned_data(tag)
+        if doc is None:
+            raise NoDataAtKeyError(f'Tag "{tag[-1]}" cannot be found')
+        if 'value' not in doc:
+            raise NoDataAtKeyError(f'Tag "{tag[-1]}" is not a leaf')
+        return self._unserialize_value(doc['value']), doc.get('version', 0)
+
+    def save_versioned_data(self, data: Any, tag: TagType, version: int) -> int:
+        """ Save data to a leaf if the leaf was not changed since it was loaded with `load_versioned_data`
+
+        The version is compared and incremented by a single atomic write, so of two writers that loaded the same
+        version only the first one succeeds. A new leaf is saved with version 0 and then has version 1. Without a
+        unique (parent, tag) index the tree layout checks whether the leaf exists before a new leaf is saved.
+
+        Args:
+            data: The data to store
+            tag: The tag of the leaf
+            version: The version of the leaf when it was loaded, 0 if the leaf is new
+
+        Returns:
+            The new version of the leaf
+
+        Raises:
+            VersionConflictError: If the leaf was written by another writer after the version was loaded
+            NodeAlreadyExistsError: If the tag or one of its ancestors is an unexpected node/leaf
+        """
+        self._validate_tag(tag)
+        encoded_data = self._serialize_value(data)
+        version_filter = {'$exists': False} if version == 0 else version
+        update = {'$set': {'value': encoded_data}, '$inc': {'version': 1}}
+        if self._materialized_path:
+            requests, request_tags = self._path_write_requests([(tag, encoded_data)])
+            requests[-1] = UpdateOne({'path': self._tag_to_path(tag), 'value': {'$exists': True},
+                                      'version': version_filter},
+                                     dict(update, **{'$setOnInsert': self._path_document(tag, include_path=False)}),
+                                     upsert=version == 0)
+            try:
+                result = self._collection.bulk_write(requests, ordered=True)
+            except BulkWriteError as e:
+                if e.details['writeErrors'][0]['index'] == len(requests) - 1 and self._collection.find_one(
+                        {'path': self._tag_to_path(tag), 'value': {'$exists': True}}, {'_id': 1}) is not None:
+                    raise VersionConflictError(f'Tag "{tag[-1]}" was changed by another writer') from e
+                raise self._path_write_error(e, request_tags) from e
+            updated = result.matched_count + result.upserted_count >= len(requests)
+        else:
+            parent, depth, cached = self._walk_to_node(tag[:-1], create=True, leaf_error=NodeAlreadyExistsError)
+            if version == 0 and not self._unique_siblings:
+                sibling = self._collection.find_one({'parent': parent, 'tag': tag[-1]}, {'value': 1, 'version': 1})
+                if sibling is not None and 'value' not in sibling:
+                    raise NodeAlreadyExistsError(f'Tag "{tag[-1]}" is not a leaf')
+                if sibling is not None and 'version' in sibling:
+                    raise VersionConflictError(f'Tag "{tag[-1]}" was changed by another writer')
+            try:
+                result = self._collection.update_one(
+                    {'parent': parent, 'tag': tag[-1], 'value': {'$exists': True}, 'version': version_filter}, update,
+                    upsert=version == 0)
+            except DuplicateKeyError as e:
+                if self._collection.find_one({'parent': parent, 'tag': tag[-1], 'value': {'$exists': True}},
+                                             {'_id': 1}) is None:
+                    raise NodeAlreadyExistsError(f'Tag "{tag[-1]}" is not a leaf') from e
+                raise VersionConflictError(f'Tag "{tag[-1]}" was changed by another writer') from e
+            if result.upserted_id is not None and self._evict_stale_node(tag[:depth], cached):
+                return self.save_versioned_data(data, tag, version)
+            updated = result.matched_count > 0 or result.upserted_id is not None
+        if not updated:
+            raise VersionConflictError(f'Tag "{tag[-1]}" was changed by another writer')
+        return version + 1
+
+    def save_many(self, items: Sequence[Tuple[TagType, Any]], overwrite: bool = True) -> None:
+        """ Save multiple results with a bulk write
+
+        In the tree layout the parent nodes are resolved through the node cache and the existing tags are checked
+        with a single query. In the materialized path layout all nodes and leaves are written with one ordered bulk
+        write.
+
+        Args:
+            items: Pairs of reference tag and data to store
+            overwrite: If False, items of which the tag is already in storage are skipped
+
+        Raises:
+              NodeAlreadyExistsError: If a tag in one of the tag lists is an unexpected node/leaf
+        """
+        for tag, _ in items:
+            self._validate_tag(tag)
+        encoded_items = [(tag, self._serialize_value(data)) for tag, data in items]
+
+        if self._materialized_path:
+            if not overwrite:
+                paths = [self._tag_to_path(tag) for tag, _ in encoded_items]
+                existing = {doc['path'] for doc in self._collection.find({'path': {'$in': paths}}, {'path': 1})}
+                encoded_items = [(tag, data) for tag, data in encoded_items if self._tag_to_path(tag) not in existing]
+            self._store_values_by_path(encoded_items, overwrite)
+            return
+
+        walks = [self._walk_to_node(tag[:-1], create=True, leaf_error=NodeAlreadyExistsError)
+                 for tag, _ in encoded_items]
+        parents = [parent for parent, _, _ in walks]
+        query = self._children_query(parents, [tag[-1] for tag, _ in encoded_items])
+        if query is None:
+            return
+        if overwrite:
+            node = self._collection.find_one({'$and': [query, {'value': {'$exists': False}}]}, {'tag': 1})
+            if node is not None:
+                raise NodeAlreadyExistsError(f'Tag "{node["tag"]}" is not a leaf')
+            existing = set()
+        else:
+            existing = {(doc['parent'], doc['tag']) for doc in self._collection.find(query, {'tag': 1, 'parent': 1})}
+
+        requests = []
+        for parent, (tag, data) in zip(parents, encoded_items):
+            if (parent, tag[-1]) in existing:
+                continue
+            update = {'$set': {'value': data}, '$inc': {'version': 1}} if overwrite else \
+                {'$setOnInsert': {'value': data, 'version': 1}}
+            requests.append(UpdateOne({'parent': parent, 'tag': tag[-1], 'value': {'$exists': True}}, update,
+                                      upsert=True))
+        if requests:
+            try:
+                result = self._collection.bulk_write(requests, ordered=True)
+            except BulkWriteError as e:
+                raise NodeAlreadyExistsError('Failed to store a leaf, the tag is not a leaf') from e
+            if result.upserted_count > 0:
+                stale: Dict[ObjectId, bool] = {}
+                for (_, depth, cached), (tag, _) in zip(walks, encoded_items):
+                    if cached is not None and cached not in stale:
+                        stale[cached] = self._evict_stale_node(tag[:depth], cached)
+                retry = [item for (_, _, cached), item in zip(walks, items) if cached is not None and stale[cached]]
+                if retry:
+                    self.save_many(retry, overwrite)
+
+    def load_many(self, tags: Sequence[TagType]) -> List[Any]:
+        """ Load multiple results with a single query
+
+        Args:
+            tags: tags for results to load
+
+        Returns:
+            Data found at the nodes identified by the tags, in the order of the tags.
+
+        Raises:
+            NoDataAtKeyError: if there is no data for one of the tags.
+        """
+        for tag in tags:
+            self._validate_tag(tag)
+            if len(tag) == 0:
+                raise NoDataAtKeyError('Tag cannot be empty')
+
+        if self._materialized_path:
+            keys: List[Any] = [self._tag_to_path(tag) for tag in tags]
+            documents = {doc['path']: doc for doc in self._collection.find({'path': {'$in': keys}})} if keys else {}
+        else:
+            parents = [self._get_node(tag[:-1]) for tag in tags]
+            keys = list(zip(parents, [tag[-1] for tag in tags]))
+            query = self._children_query(parents, [tag[-1] for tag in tags])
+            documents = {} if query is None else {(doc['parent'], doc['tag']): doc
+                                                   for doc in self._collection.find(query)}
+
+        results = []
+        for key, tag in zip(keys, tags):
+            document = documents.get(key)
+            if document is None:
+                raise NoDataAtKeyError(f'Tag "{tag[-1]}" cannot be found')
+            if 'value' not in document:
+                raise NoDataAtKeyError(f'Tag "{tag[-1]}" is not a leaf')
+            results.append(self._unserialize_value(document['value']))
+        return results
+
+    @staticmethod
+    def _children_query(parents: Sequence[ObjectId], names: Sequence[str]) -> Optional[Dict[str, Any]]:
+        """ Create a query that matches the children with the given names of the given parents
+
+        Args:
+            parents: The ObjectIDs of the parents
+            names: The tags of the children, one for each parent
+
+        Returns:
+            The query, or None if there are no children to match
+        """
+        names_by_parent: Dict[ObjectId, List[str]] = {}
+        for parent, name in zip(parents, names):
+            names_by_parent.setdefault(parent, []).append(name)
+        clauses = [{'parent': parent, 'tag': {'$in': parent_names}} for parent, parent_names in names_by_parent.items()]
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {'$or': clauses}
+
+    def load_individual_data(self, tag: TagType, field: FieldType) -> Any:
         """ Retrieve an individual field value at a given tag
 
             Args:
                 tag: The tag
-                field: Name of the individual field to be retrieved
+                field: Name of the individual field to be retrieved, or the list of keys of a nested field. Only
+                    the field is read from the server with a projection
 
             Raises:
                 NoDataAtKeyError if the tag is empty
@@ -271,24 +1135,30 @@ class StorageMongoDb(StorageInterface):
         if len(tag) == 0:
             raise NoDataAtKeyError('Tag cannot be empty')
 
-        return self._unserialize(self._decode_data(
-            self._retrieve_value_by_tag(tag, self._get_root(), self._encode_field(self._serialize(field)))))
+        encoded_field = self._encode_field(self._serialize(field))
+        if self._materialized_path:
+            return self._unserialize_value(self._retrieve_value_by_path(tag, encoded_field))
+        return self._unserialize_value(self._retrieve_value_by_tag(tag, encoded_field))
 
-    def update_individual_data(self, data: Any, tag: TagType, field: Union[str, int]) -> None:
+    def update_individual_data(self, data: Any, tag: TagType, field: FieldType) -> None:
         """ Update an individual field at a given tag with the given data.
         If the field does not exist, it will be created.
 
             Args:
                 data: Data to update
                 tag: The tag
-                field: Name of the individual field to updated
+                field: Name of the individual field to updated, or the list of keys of a nested field. The field
+                    is updated with a single $set
 
         """
 
         self._validate_tag(tag)
         self._validate_field(field)
-        self._store_value_by_tag(tag, self._encode_data(self._serialize(data)), self._get_root(),
-                                 self._encode_field(self._serialize(field)))
+        encoded_field = self._encode_field(self._serialize(field))
+        if self._materialized_path:
+            self._store_value_by_path(tag, self._serialize_value(data), encoded_field)
+        else:
+            self._store_value_by_tag(tag, self._serialize_value(data), encoded_field)
 
     def get_latest_subtag(self, tag: TagType) -> Optional[TagType]:
         """ Get the latest subtag
@@ -304,49 +1174,250 @@ class StorageMongoDb(StorageInterface):
 
         return tag + [child_tags[0]]
 
-    def list_data_subtags(self, tag: TagType, limit: int = 0) -> TagType:
+    def list_data_subtags(self, tag: TagType, limit: int = 0, start: Optional[str] = None, end: Optional[str] = None,
+                          after: Optional[str] = None) -> TagType:
         """ List subtags for the given tag. The number of subtags listed is based on the limit parameter (0 for
-        listing all subtags)
+        listing all subtags). The range of subtags is selected with an indexed range query on the tag
 
         Args:
             tag: Tag to search from
             limit: Maximum number of subtags to return. If set to zero there is no limit
+            start: If set only the subtags that are greater than or equal to start are listed
+            end: If set only the subtags that are less than end are listed
+            after: If set only the subtags that are less than after are listed, see `StorageInterface.list_data_subtags`
         Returns:
             List of subtags found, sorted in descending order
         """
+        lower, upper = self._subtag_bounds(start, end, after)
+        if self._materialized_path:
+            return self._retrieve_nodes_by_path(tag, limit, lower, upper)
         try:
-            tags = self._retrieve_nodes_by_tag(tag, self._get_root(), limit)
+            tags = self._retrieve_nodes_by_tag(tag, limit, lower, upper)
         except NoDataAtKeyError:
             tags = []
 
         return tags
 
-    def search(self, query: str) -> Any:
-        raise NotImplementedError()
+    def export_subtree(self, tag: TagType, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """ Export the leaves in a subtree as a stream of records, see `StorageInterface.export_subtree`
 
-    def tag_in_storage(self, tag: TagType) -> bool:
-        parent = self._get_root()
-        for tag_part in tag:
-            doc = self._collection.find_one({'parent': parent, 'tag': tag_part}, {'value': 0})
-            if doc is None:
-                return False
+        The materialized path layout reads the subtree with a single cursor on the path index. The tree layout
+        descends level by level, reading the children of a batch of nodes of a level with one cursor. The cursors
+        fetch `batch_size` documents per round trip.
+
+        Args:
+            tag: The tag of the subtree. If the tag is a leaf a single record is exported
+            batch_size: Number of documents that are read at once
+
+        Yields:
+            A record with the tag of the leaf relative to the subtree and the data of the leaf
+        """
+        self._validate_tag(tag)
+        if self._materialized_path:
+            query = dict(self._subtree_filter(self._tag_to_path(tag)), value={'$exists': True})
+            for doc in self._collection.find(query, {'tags': 1, 'value': 1}, batch_size=batch_size):
+                yield {'tag': doc['tags'][len(tag):], 'data': self._unserialize_value(doc['value'])}
+            return
+
+        try:
+            parents: Dict[ObjectId, TagType] = {self._get_node(tag): []}
+        except NoDataAtKeyError:
+            try:
+                data = self.load_data(tag)
+            except NoDataAtKeyError:
+                return
+            yield {'tag': [], 'data': data}
+            return
+        while parents:
+            nodes: Dict[ObjectId, TagType] = {}
+            parent_ids = list(parents)
+            for start in range(0, len(parent_ids), batch_size):
+                query = {'parent': {'$in': parent_ids[start:start + batch_size]}}
+                for doc in self._collection.find(query, batch_size=batch_size):
+                    child = parents[doc['parent']] + [doc['tag']]
+                    if 'value' in doc:
+                        yield {'tag': child, 'data': self._unserialize_value(doc['value'])}
+                    else:
+                        nodes[doc['_id']] = child
+            parents = nodes
+
+    @staticmethod
+    def _subtree_filter(path: str) -> Dict[str, Any]:
+        """ Create the filter that matches a document and its descendants in the materialized path layout
+
+        Args:
+            path: The path of the document
+
+        Returns:
+            The filter, which is served by the path index
+        """
+        return {'$or': [{'path': path}, {'path': {'$regex': '^' + re.escape(path + '/')}}]}
+
+    def delete(self, tag: TagType, recursive: bool = True) -> None:
+        """ Delete a leaf or a node, the documents of a subtree are removed with bulk deletes, see `delete_many`
+
+        Args:
+            tag: The tag of the leaf or node
+            recursive: If True the children of a node are deleted with the node
+        """
+        self._validate_tag(tag)
+        if len(tag) == 0:
+            raise NoDataAtKeyError('Tag cannot be empty')
+        if not self.tag_in_storage(tag):
+            raise NoDataAtKeyError(f'Tag "{tag[-1]}" cannot be found')
+        self.delete_many([tag], recursive)
+
+    def delete_many(self, tags: Sequence[TagType], recursive: bool = True) -> None:
+        """ Delete multiple leaves or nodes with bulk deletes
+
+        The materialized path layout deletes the subtrees of a batch of tags with a single delete_many on the path
+        index. The tree layout collects the ObjectIDs of the subtrees level by level, reading the children of a
+        batch of nodes with one query, and deletes the collected documents with a delete_many per batch. The
+        deleted nodes are removed from the node cache.
+
+        Args:
+            tags: The tags of the leaves and nodes. Tags that are not in storage are skipped
+            recursive: If True the children of the nodes are deleted with the nodes
+
+        Raises:
+            NodeNotEmptyError: If one of the tags is a node that has children and recursive is False. Nothing is
+                deleted in that case
+        """
+        for tag in tags:
+            self._validate_tag(tag)
+            if len(tag) == 0:
+                raise NoDataAtKeyError('Tag cannot be empty')
+        batch_size = self.DELETE_BATCH_SIZE
+
+        if self._materialized_path:
+            paths = [self._tag_to_path(tag) for tag in tags]
+            if not recursive:
+                for start in range(0, len(paths), batch_size):
+                    child = self._collection.find_one({'parent_path': {'$in': paths[start:start + batch_size]}},
+                                                      {'tags': 1})
+                    if child is not None:
+                        raise NodeNotEmptyError(f'Tag "{child["tags"][-2]}" has children')
+            for start in range(0, len(paths), batch_size):
+                clauses = [clause for path in paths[start:start + batch_size]
+                           for clause in self._subtree_filter(path)['$or']]
+                self._collection.delete_many({'$or': clauses})
+        else:
+            parents: List[ObjectId] = []
+            names: List[str] = []
+            for tag in tags:
+                try:
+                    parents.append(self._get_node(tag[:-1]))
+                except NoDataAtKeyError:
+                    continue
+                names.append(tag[-1])
+            query = self._children_query(parents, names)
+            level: Dict[ObjectId, str] = {} if query is None else {
+                doc['_id']: doc['tag'] for doc in self._collection.find(query, {'tag': 1})}
+            if not recursive:
+                node_ids = list(level)
+                for start in range(0, len(node_ids), batch_size):
+                    child = self._collection.find_one({'parent': {'$in': node_ids[start:start + batch_size]}},
+                                                      {'parent': 1})
+                    if child is not None:
+                        raise NodeNotEmptyError(f'Tag "{level[child["parent"]]}" has children')
+
+            self._delete_subtrees(list(level))
+
+        for tag in tags:
+            self._node_cache.invalidate(tag)
+
+    def search(self, query: str) -> List[TagType]:
+        """ Find the leaves that satisfy a query, see `StorageInterface.search` for the query language
+
+        The conditions are compiled to server-side filters and only the tags of the matching leaves are returned.
+        The materialized path layout answers a query with a single find. The tree layout descends level by level,
+        filtering the children of all nodes of a level on the tag component with one query per level.
+
+        Args:
+            query: The query
+
+        Returns:
+            The tags of the matching leaves, sorted in descending order
+        """
+        conditions = parse_query(query)
+        value_conditions = [condition for condition in conditions if not condition.is_tag_condition]
+        tag_conditions = [condition for condition in conditions if condition.is_tag_condition]
+
+        if self._materialized_path:
+            leaf_filter = self._compile_conditions(conditions, lambda index: f'tags.{index}')
+            leaf_filter['value'] = {'$exists': True}
+            return sort_search_results([doc['tags'] for doc in self._collection.find(leaf_filter, {'tags': 1})])
+
+        deepest_tag_index = max((cast(int, condition.tag_index) for condition in tag_conditions), default=-1)
+        results: List[TagType] = []
+        parents: Dict[ObjectId, TagType] = {self._get_root(): []}
+        depth = 0
+        while parents:
+            level_conditions = [condition for condition in tag_conditions if condition.tag_index == depth]
+            if depth >= deepest_tag_index:
+                leaf_filter = self._compile_conditions(level_conditions + value_conditions, lambda index: 'tag')
+                leaf_filter.update({'parent': {'$in': list(parents)}, 'value': {'$exists': True}})
+                for doc in self._collection.find(leaf_filter, {'tag': 1, 'parent': 1}):
+                    results.append(parents[doc['parent']] + [doc['tag']])
+            level_filter = self._compile_conditions(level_conditions, lambda index: 'tag')
+            level_filter.update({'parent': {'$in': list(parents)}, 'value': {'$exists': False}})
+            parents = {doc['_id']: parents[doc['parent']] + [doc['tag']]
+                       for doc in self._collection.find(level_filter, {'tag': 1, 'parent': 1})}
+            depth += 1
+        return sort_search_results(results)
+
+    @staticmethod
+    def _compile_conditions(conditions: List[QueryCondition], tag_field: Callable[[int], str]) -> Dict[str, Any]:
+        """ Compile query conditions to a MongoDB filter
+
+        Args:
+            conditions: The conditions, as returned by `parse_query`
+            tag_field: Returns the document field that holds the tag component with the given index
+
+        Returns:
+            A filter that matches the documents that satisfy all conditions
+        """
+        clauses = []
+        for condition in conditions:
+            if condition.tag_index is not None:
+                field = tag_field(condition.tag_index)
             else:
-                parent = doc['_id']
-        return True
+                field = '.'.join(['value'] + [StorageMongoDb._encode_str(key) for key in condition.field_path])
+            operator = StorageMongoDb.QUERY_OPERATORS[condition.operator]
+            if condition.operator in ('==', '!=') or isinstance(condition.value, (str, int, float)) \
+                    and not isinstance(condition.value, bool):
+                clauses.append({field: {'$exists': True, operator: condition.value}})
+            else:
+                # range comparisons on true, false and null never match
+                clauses.append({field: {'$in': []}})
+        return {'$and': clauses} if clauses else {}
+
+    def tag_in_storage(self, tag: TagType) -> bool:
+        if self._materialized_path:
+            return len(tag) == 0 or self._collection.find_one({'path': self._tag_to_path(tag)}, {'_id': 1}) is not None
+        if len(tag) == 0:
+            return True
+        try:
+            parent = self._get_node(tag[:-1])
+        except NoDataAtKeyError:
+            return False
+        return self._collection.find_one({'parent': parent, 'tag': tag[-1]}, {'value': 0}) is not None
 
     @staticmethod
-    def _encode_field(field: Union[int, str]) -> str:
+    def _encode_field(field: FieldType) -> str:
         """Encodes a field value. A field can be an individual key in a structure like dict which is to be
-        read or updated
+        read or updated, or the list of keys of a nested field
 
         Args:
-            field: An integer or a string
+            field: An integer or a string, or a list of them
 
         Returns:
-            Encoded value for the field in string format
+            Encoded value for the field in string format. The encoded keys of a nested field are separated by dots,
+            so the field can be used in projections and updates
 
         """
-
+        if isinstance(field, list):
+            return '.'.join(StorageMongoDb._encode_field(key) for key in field)
         return StorageMongoDb._encode_int(field) if isinstance(field, int) \
             else StorageMongoDb._encode_str(field)
 
@@ -421,47 +1492,55 @@ class StorageMongoDb(StorageInterface):
 
         return value.replace('\\u002e', '.')
 
+    @staticmethod
+    def _encode_key(key: Union[int, str]) -> str:
+        """Apply dot replacement and integer encoding on a key
+
+        Args:
+            key: The key
+        Returns:
+            The encoded key
+        """
+
+        return StorageMongoDb._encode_str(StorageMongoDb._encode_int(key) if isinstance(key, int) else key)
+
+    @staticmethod
+    def _decode_key(key: str) -> Union[int, str]:
+        """Apply dot replacement and integer decoding on a key
+
+        Args:
+            key: The encoded key
+        Returns:
+            The decoded key
+        """
+
+        return StorageMongoDb._decode_int(StorageMongoDb._decode_str(key)) if StorageMongoDb._is_encoded_int(key) \
+            else StorageMongoDb._decode_str(key)
+
     @staticmethod
     def _encode_data(data: Any) -> Any:
         """Recursively encode the data and apply dot replacement and integer encoding on the keys
 
+        Storing serialized data uses `_serialize_value` instead, which encodes the keys while serializing.
+
         Args:
             data: The data
         Returns:
             The transformed data
         """
 
-        if isinstance(data, dict):
-            return {
-                StorageMongoDb._encode_str(StorageMongoDb._encode_int(key) if isinstance(key, int) else key)
-                : StorageMongoDb._encode_data(value)
-                for key, value in data.items()
-            }
-
-        elif isinstance(data, list):
-            return [StorageMongoDb._encode_data(item) for item in data]
-
-        return data
+        return Serializer._transform_keys(data, StorageMongoDb._encode_key)
 
     @staticmethod
     def _decode_data(data: Any) -> Any:
         """Recursively decode the data and apply dot replacement and integer decoding on the keys
 
+        Loading serialized data uses `_unserialize_value` instead, which decodes the keys while unserializing.
+
         Args:
             data: The data
         Returns:
             The transformed data
         """
 
-        if isinstance(data, dict):
-            return {
-                StorageMongoDb._decode_int(StorageMongoDb._decode_str(key))
-                if StorageMongoDb._is_encoded_int(key) else StorageMongoDb._decode_str(key)
-                : StorageMongoDb._decode_data(value)
-                for key, value in data.items()
-            }
-
-        elif isinstance(data, list):
-            return [StorageMongoDb._decode_data(item) for item in data]
-
-        return data
+        return Serializer._transform_keys(data, StorageMongoDb._decode_key)
@@ -0,0 +1,135 @@
+"""Quantum Inspire library
+
+Copyright 2022 QuTech Delft
+
+qilib is available under the [MIT open-source license](https://opensource.org/licenses/MIT):
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+
+from qilib.utils.type_aliases import TagType
+
+
+class NodeCache:
+    """ Bounded LRU cache that maps tag prefixes to the identifiers of the nodes in a storage tree.
+
+    Only nodes are cached, the identifiers of leaves are never stored. Entries of a subtree are dropped with
+    `invalidate`, e.g. when the subtree is removed from the storage.
+    """
+
+    def __init__(self, max_size: int = 1024) -> None:
+        """ Creates a node cache
+
+        Args:
+            max_size: Maximum number of cached nodes. If zero the cache is disabled.
+        """
+        self._max_size = max_size
+        self._nodes: 'OrderedDict[Tuple[str, ...], Any]' = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    @property
+    def max_size(self) -> int:
+        """ Maximum number of cached nodes """
+        return self._max_size
+
+    def get(self, tag: TagType) -> Optional[Any]:
+        """ Look up the identifier of the node at a tag and count the hit or miss
+
+        Args:
+            tag: The tag of the node
+
+        Returns:
+            The identifier of the node or None if the node is not cached
+        """
+        key = tuple(tag)
+        with self._lock:
+            node = self._nodes.get(key)
+            if node is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._nodes.move_to_end(key)
+            return node
+
+    def longest_prefix(self, tag: TagType) -> Tuple[int, Optional[Any]]:
+        """ Find the deepest cached node on the path of a tag
+
+        Args:
+            tag: The tag
+
+        Returns:
+            The length of the longest cached prefix of the tag and the identifier of that node. If no prefix is
+            cached (0, None) is returned.
+        """
+        with self._lock:
+            for depth in range(len(tag), -1, -1):
+                key = tuple(tag[:depth])
+                node = self._nodes.get(key)
+                if node is not None:
+                    self.hits += 1
+                    self._nodes.move_to_end(key)
+                    return depth, node
+            self.misses += 1
+            return 0, None
+
+    def put(self, tag: TagType, node: Any) -> None:
+        """ Store the identifier of the node at a tag, evicting the least recently used node if the cache is full
+
+        Args:
+            tag: The tag of the node
+            node: The identifier of the node
+        """
+        if self._max_size <= 0:
+            return
+        key = tuple(tag)
+        with self._lock:
+            self._nodes[key] = node
+            self._nodes.move_to_end(key)
+            while len(self._nodes) > self._max_size:
+                self._nodes.popitem(last=False)
+
+    def invalidate(self, tag: TagType) -> None:
+        """ Remove the node at a tag and all its descendants from the cache
+
+        Args:
+            tag: The tag of the subtree
+        """
+        prefix = tuple(tag)
+        with self._lock:
+            for key in [key for key in self._nodes if key[:len(prefix)] == prefix]:
+                del self._nodes[key]
+
+    def clear(self) -> None:
+        """ Remove all nodes from the cache and reset the statistics """
+        with self._lock:
+            self._nodes.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def statistics(self) -> Dict[str, int]:
+        """ The cache statistics
+
+        Returns:
+            The number of hits, misses and cached nodes
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._nodes)}
@@ -0,0 +1,298 @@
+"""Quantum Inspire library
+
+Copyright 2022 QuTech Delft
+
+qilib is available under the [MIT open-source license](https://opensource.org/licenses/MIT):
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import re
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from qilib.utils.storage.interface import InvalidQueryError
+from qilib.utils.type_aliases import TagType
+
+
+class QueryCondition:
+    """ A single comparison of a query, on either a tag component or a field of the leaf value """
+
+    OPERATORS = ('==', '!=', '<', '<=', '>', '>=')
+
+    def __init__(self, operator: str, value: Any, tag_index: Optional[int] = None,
+                 field_path: Tuple[str, ...] = ()) -> None:
+        """ Creates a query condition
+
+        Args:
+            operator: One of the comparison operators in OPERATORS
+            value: The literal to compare with
+            tag_index: Index of the tag component to compare, None to compare a field of the leaf value
+            field_path: Keys of the (nested) field of the leaf value to compare
+        """
+        if operator not in self.OPERATORS:
+            raise InvalidQueryError(f'Unknown operator {operator!r}')
+        self.operator = operator
+        self.value = value
+        self.tag_index = tag_index
+        self.field_path = field_path
+
+    def __repr__(self) -> str:
+        operand = f'tag[{self.tag_index}]' if self.tag_index is not None else '.'.join(self.field_path)
+        return f'{self.__class__.__name__}({operand} {self.operator} {self.value!r})'
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, QueryCondition) and (self.operator, self.value, self.tag_index, self.field_path) \
+            == (other.operator, other.value, other.tag_index, other.field_path)
+
+    @property
+    def is_tag_condition(self) -> bool:
+        """ True if the condition compares a tag component """
+        return self.tag_index is not None
+
+
+_TOKEN_PATTERN = re.compile(r'''\s*(?:
+    (?P<tag>tag\[(?P<tag_index>\d+)\])
+    |(?P<operator>==|!=|<=|>=|<|>)
+    |(?P<string>'[^']*'|"[^"]*")
+    |(?P<number>-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)
+    |(?P<name>[A-Za-z_]\w*(?:\.\w+)*)
+    )''', re.VERBOSE)
+
+_KEYWORDS = {'true': True, 'false': False, 'null': None}
+
+
+def _tokenize(query: str) -> Iterator['re.Match[str]']:
+    position = 0
+    query = query.rstrip()
+    while position < len(query):
+        match = _TOKEN_PATTERN.match(query, position)
+        if match is None or match.end() == position:
+            raise InvalidQueryError(f'Invalid query {query!r} at position {position}')
+        position = match.end()
+        yield match
+
+
+def parse_query(query: str) -> List[QueryCondition]:
+    """ Parse a query into a list of conditions that all have to hold
+
+    A query is a list of comparisons joined by `and`. The left hand side of a comparison is either a tag component,
+    written as `tag[index]`, or a (nested) field of the leaf value written as dotted keys. The right hand side is a
+    quoted string, a number, `true`, `false` or `null`. For example:
+
+        tag[0] == 'configuration' and adapter_class_name == 'M4iInstrumentAdapter' and tag[2] >= '2019-02-18'
+
+    Args:
+        query: The query
+
+    Returns:
+        The conditions of the query
+
+    Raises:
+        InvalidQueryError: If the query can not be parsed
+    """
+    tokens = list(_tokenize(query))
+    if len(tokens) == 0:
+        raise InvalidQueryError('Query cannot be empty')
+
+    conditions = []
+    for index in range(0, len(tokens), 4):
+        clause = tokens[index:index + 4]
+        if len(clause) < 3:
+            raise InvalidQueryError(f'Incomplete condition in query {query!r}')
+        operand, operator, literal = clause[:3]
+        if len(clause) == 4 and (clause[3].group('name') != 'and' or index + 4 == len(tokens)):
+            raise InvalidQueryError(f'Expected a condition after "and" in query {query!r}')
+        if operator.group('operator') is None:
+            raise InvalidQueryError(f'Expected an operator instead of {operator.group().strip()!r}')
+
+        if literal.group('string') is not None:
+            value: Any = literal.group('string')[1:-1]
+        elif literal.group('number') is not None:
+            number = literal.group('number')
+            value = int(number) if re.fullmatch(r'-?\d+', number) else float(number)
+        elif literal.group('name') in _KEYWORDS:
+            value = _KEYWORDS[literal.group('name')]
+        else:
+            raise InvalidQueryError(f'Expected a literal instead of {literal.group().strip()!r}')
+
+        if operand.group('tag') is not None:
+            conditions.append(QueryCondition(operator.group('operator'), value,
+                                             tag_index=int(operand.group('tag_index'))))
+        elif operand.group('name') is not None and operand.group('name') not in _KEYWORDS:
+            conditions.append(QueryCondition(operator.group('operator'), value,
+                                             field_path=tuple(operand.group('name').split('.'))))
+        else:
+            raise InvalidQueryError(f'Expected a tag component or field instead of {operand.group().strip()!r}')
+    return conditions
+
+
+def _type_class(value: Any) -> str:
+    """ Classify a value for comparisons, numbers compare with numbers and strings with strings """
+    if value is None:
+        return 'none'
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, (int, float)):
+        return 'number'
+    if isinstance(value, str):
+        return 'str'
+    return 'other'
+
+
+def sort_search_results(tags: List[TagType]) -> List[TagType]:
+    """ Sort the tags found by a search in descending order, so the most recent datetags come first """
+    return sorted(tags, reverse=True)
+
+
+IndexKey = Tuple[Any, ...]
+
+
+class SearchIndex:
+    """ Secondary index over the tag components and scalar leaf fields of an in-memory storage.
+
+    For every tag component position and every (nested) field path the index maps the values to the tags of the
+    leaves holding them. Each indexed key also keeps its distinct values sorted per type class, so range conditions
+    are answered with a bisect instead of a scan over the leaves.
+    """
+
+    def __init__(self) -> None:
+        self._postings: Dict[IndexKey, Dict[Tuple[str, Any], Set[Tuple[str, ...]]]] = {}
+        self._sorted_values: Dict[Tuple[IndexKey, str], List[Any]] = {}
+        self._entries: Dict[Tuple[str, ...], List[Tuple[IndexKey, Any]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _flatten(data: Any, path: Tuple[Any, ...] = ()) -> Iterator[Tuple[Tuple[Any, ...], Any]]:
+        if isinstance(data, dict):
+            for key, value in data.items():
+                yield from SearchIndex._flatten(value, path + (key,))
+        elif path and _type_class(data) != 'other':
+            yield path, data
+
+    def add(self, tag: TagType, data: Any) -> None:
+        """ Index a leaf, replacing the entries of a leaf that was stored at the same tag before
+
+        Args:
+            tag: The tag of the leaf
+            data: The value of the leaf
+        """
+        leaf = tuple(tag)
+        self.remove(tag)
+        entries: List[Tuple[IndexKey, Any]] = [(('tag', index), part) for index, part in enumerate(tag)]
+        entries.extend((('value',) + path, value) for path, value in self._flatten(data))
+        self._add_entries(leaf, entries)
+        self._entries[leaf] = entries
+
+    def update_field(self, tag: TagType, path: Sequence[Any], data: Any) -> None:
+        """ Re-index a single field of an indexed leaf after the field was updated
+
+        Only the entries of the field, of the fields nested in it and of a scalar it replaced on its path are
+        replaced, the other entries of the leaf are kept.
+
+        Args:
+            tag: The tag of the leaf
+            path: The keys of the updated field
+            data: The value of the leaf after the update
+        """
+        leaf = tuple(tag)
+        container = data
+        for key in path[:-1]:
+            container = container[key] if isinstance(container, dict) else None
+        if leaf not in self._entries or not isinstance(container, dict):
+            # fields in lists are not indexed, a path through a list can replace indexed fields of the leaf
+            self.add(tag, data)
+            return
+
+        field_key: IndexKey = ('value',) + tuple(path)
+        kept: List[Tuple[IndexKey, Any]] = []
+        removed: List[Tuple[IndexKey, Any]] = []
+        for key, value in self._entries[leaf]:
+            replaced = key[:len(field_key)] == field_key or field_key[:len(key)] == key
+            (removed if replaced else kept).append((key, value))
+        added = [(('value',) + field, value) for field, value in self._flatten(container[path[-1]], tuple(path))]
+        self._remove_entries(leaf, removed)
+        self._add_entries(leaf, added)
+        self._entries[leaf] = kept + added
+
+    def _add_entries(self, leaf: Tuple[str, ...], entries: List[Tuple[IndexKey, Any]]) -> None:
+        for key, value in entries:
+            values = self._postings.setdefault(key, {})
+            item = (_type_class(value), value)
+            if item not in values:
+                values[item] = set()
+                insort(self._sorted_values.setdefault((key, item[0]), []), value)
+            values[item].add(leaf)
+
+    def remove(self, tag: TagType) -> None:
+        """ Remove a leaf from the index
+
+        Args:
+            tag: The tag of the leaf
+        """
+        leaf = tuple(tag)
+        self._remove_entries(leaf, self._entries.pop(leaf, []))
+
+    def _remove_entries(self, leaf: Tuple[str, ...], entries: List[Tuple[IndexKey, Any]]) -> None:
+        for key, value in entries:
+            values = self._postings[key]
+            item = (_type_class(value), value)
+            values[item].discard(leaf)
+            if not values[item]:
+                del values[item]
+                sorted_values = self._sorted_values[(key, item[0])]
+                del sorted_values[bisect_left(sorted_values, value)]
+            if not values:
+                del self._postings[key]
+
+    def _lookup(self, condition: QueryCondition) -> Set[Tuple[str, ...]]:
+        key: IndexKey = ('tag', condition.tag_index) if condition.is_tag_condition else \
+            ('value',) + condition.field_path
+        values = self._postings.get(key, {})
+        type_class = _type_class(condition.value)
+        if condition.operator == '==':
+            return set(values.get((type_class, condition.value), set()))
+        if condition.operator == '!=':
+            return {leaf for item, leaves in values.items() if item != (type_class, condition.value) for leaf in leaves}
+        if type_class not in ('number', 'str'):
+            # range comparisons on true, false and null never match
+            return set()
+
+        sorted_values = self._sorted_values.get((key, type_class), [])
+        if condition.operator == '<':
+            selected = sorted_values[:bisect_left(sorted_values, condition.value)]
+        elif condition.operator == '<=':
+            selected = sorted_values[:bisect_right(sorted_values, condition.value)]
+        elif condition.operator == '>':
+            selected = sorted_values[bisect_right(sorted_values, condition.value):]
+        else:
+            selected = sorted_values[bisect_left(sorted_values, condition.value):]
+        return {leaf for value in selected for leaf in values[(type_class, value)]}
+
+    def search(self, conditions: List[QueryCondition]) -> List[TagType]:
+        """ Find the leaves that satisfy all conditions
+
+        Args:
+            conditions: The conditions, as returned by `parse_query`
+
+        Returns:
+            The tags of the matching leaves in descending order
+        """
+        leaves: Optional[Set[Tuple[str, ...]]] = None
+        for candidates in sorted((self._lookup(condition) for condition in conditions), key=len):
+            leaves = candidates if leaves is None else leaves & candidates
+            if not leaves:
+                break
+        return sort_search_results([list(leaf) for leaf in leaves or set()])
@@ -0,0 +1,62 @@
+"""Quantum Inspire library
+
+Copyright 2022 QuTech Delft
+
+qilib is available under the [MIT open-source license](https://opensource.org/licenses/MIT):
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+from typing import Any, Dict, IO, Iterable, Iterator, Optional
+
+from qilib.utils.serialization import Serializer, serializer as _serializer
+
+
+def dump_records(records: Iterable[Dict[str, Any]], stream: IO[str], serializer: Optional[Serializer] = None) -> int:
+    """ Write records, e.g. created by `StorageInterface.export_subtree`, as newline-delimited JSON
+
+    The records are written one by one, so a stream of records is never held in memory.
+
+    Args:
+        records: The records
+        stream: Text stream to write to
+        serializer: Serializer for the records. If None the default serializer is used
+
+    Returns:
+        The number of written records
+    """
+    if serializer is None:
+        serializer = _serializer
+    count = 0
+    for record in records:
+        stream.write(serializer.serialize(record))
+        stream.write('\n')
+        count += 1
+    return count
+
+
+def load_records(stream: IO[str], serializer: Optional[Serializer] = None) -> Iterator[Dict[str, Any]]:
+    """ Read newline-delimited JSON records written by `dump_records`
+
+    Args:
+        stream: Text stream to read from
+        serializer: Serializer for the records. If None the default serializer is used
+
+    Yields:
+        The records, e.g. to import with `StorageInterface.import_subtree`
+    """
+    if serializer is None:
+        serializer = _serializer
+    for line in stream:
+        if line.strip():
+            yield serializer.unserialize(line)
@@ -0,0 +1,67 @@
+"""Quantum Inspire library
+
+Copyright 2022 QuTech Delft
+
+qilib is available under the [MIT open-source license](https://opensource.org/licenses/MIT):
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+from datetime import datetime, timedelta
+from typing import Optional, Union
+
+
+class RetentionPolicy:
+    """ Rules that select the results of a node that are removed by `StorageInterface.prune`
+
+    The results are the children of the node, tagged with `StorageInterface.datetag_part`, so the most recent
+    results have the greatest subtags. A result is kept if it is one of the `keep_last` most recent results or if it
+    is newer than `newer_than`. A policy without rules keeps all results.
+    """
+
+    def __init__(self, keep_last: Optional[int] = None,
+                 newer_than: Union[None, str, datetime, timedelta] = None) -> None:
+        """ Creates a retention policy
+
+        Args:
+            keep_last: Number of most recent results that are kept. If None the results are not kept by count
+            newer_than: The results of which the subtag is greater than or equal to this datetag are kept. A
+                datetime is converted with `datetag_part` and a timedelta is taken relative to the time the policy
+                is applied, e.g. timedelta(days=30) keeps the results of the last 30 days. If None the results are
+                not kept by date
+
+        Raises:
+            ValueError: If keep_last is negative
+        """
+        if keep_last is not None and keep_last < 0:
+            raise ValueError(f'keep_last should not be negative, got {keep_last}')
+        self.keep_last = keep_last
+        self.newer_than = newer_than
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(keep_last={self.keep_last!r}, newer_than={self.newer_than!r})'
+
+    def cutoff(self, now: Optional[datetime] = None) -> Optional[str]:
+        """ The datetag below which results are not kept by date
+
+        Args:
+            now: The time the policy is applied at, if None the current time is used
+
+        Returns:
+            The datetag, or None if the results are not kept by date
+        """
+        if self.newer_than is None or isinstance(self.newer_than, str):
+            return self.newer_than
+        if isinstance(self.newer_than, timedelta):
+            return ((datetime.now() if now is None else now) - self.newer_than).isoformat()
+        return self.newer_than.isoformat()
@@ -0,0 +1,528 @@
+"""Quantum Inspire library
+
+Copyright 2022 QuTech Delft
+
+qilib is available under the [MIT open-source license](https://opensource.org/licenses/MIT):
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from qilib.utils.serialization import Serializer, serializer as _serializer
+from qilib.utils.storage.file import StorageFile
+from qilib.utils.storage.interface import (NoDataAtKeyError, NodeAlreadyExistsError, NodeDoesNotExistsError,
+                                           NodeNotEmptyError, StorageInterface)
+from qilib.utils.storage.query import QueryCondition, SearchIndex, _type_class, parse_query, sort_search_results
+from qilib.utils.type_aliases import FieldType, TagType
+
+
+class StorageSQLite(StorageInterface):
+    """ Implementation of StorageInterface with an embedded SQLite database
+
+    Every node and leaf is a row of the nodes table, keyed by its path. The children of a node are found through the
+    index on (parent path, name), which also serves the descending order of `list_data_subtags`. The value of a leaf
+    is a blob with the JSON encoding of the `Serializer`. The tag components and the scalar fields of the leaves are
+    kept in the search_terms table, of which the index on (key, type class, value) serves `search`.
+
+    The database uses write-ahead logging, so readers in other threads and processes are not blocked by a writer.
+    Every thread uses its own connection, `close` closes the connections of all threads. Writes are transactions.
+    """
+
+    MAX_VARIABLES = 500
+    _SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS nodes (path TEXT PRIMARY KEY, parent_path TEXT NOT NULL, name TEXT NOT NULL, '
+        'is_leaf INTEGER NOT NULL, value BLOB) WITHOUT ROWID',
+        'CREATE INDEX IF NOT EXISTS nodes_parent_path_name ON nodes (parent_path, name)',
+        'CREATE TABLE IF NOT EXISTS search_terms (path TEXT NOT NULL, key TEXT NOT NULL, type_class TEXT NOT NULL, '
+        'value)',
+        'CREATE INDEX IF NOT EXISTS search_terms_key_value ON search_terms (key, type_class, value)',
+        'CREATE INDEX IF NOT EXISTS search_terms_path ON search_terms (path)',
+    )
+    _COMPARISONS = {'==': 'value IS ?', '<': 'value < ?', '<=': 'value <= ?', '>': 'value > ?', '>=': 'value >= ?'}
+
+    def __init__(self, name: str, database: str, serializer: Optional[Serializer] = None,
+                 timeout: float = 30) -> None:
+        """ SQLite implementation of storage class
+
+        See also: `StorageInterface`
+
+        Args:
+            name: Symbolic name for the storage instance.
+            database: Path of the database file, it is created if it does not exist
+            serializer: The serializer for the leaves, if None the default serializer is used
+            timeout: How long to wait for a lock held by another connection before raising an error in seconds
+        """
+        super().__init__(name)
+        self._database = database
+        self._timeout = timeout
+        self._serializer = _serializer if serializer is None else serializer
+        self._connections_lock = threading.Lock()
+        self._connections: Dict[threading.Thread, sqlite3.Connection] = {}
+
+        connection = self._connection
+        connection.execute('PRAGMA journal_mode=WAL')
+        with self._transaction() as cursor:
+            for statement in self._SCHEMA:
+                cursor.execute(statement)
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} at 0x{id(self):x}: name {self.name}, database {self._database}>'
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        """ The connection of the current thread, which is opened on first use and again after `close` """
+        thread = threading.current_thread()
+        connection = self._connections.get(thread)
+        if connection is None:
+            # the connection is only used by this thread, but it is closed by the thread that calls close
+            connection = sqlite3.connect(self._database, timeout=self._timeout, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            with self._connections_lock:
+                # the connections of the threads that finished are closed
+                for finished in [other for other in self._connections if not other.is_alive()]:
+                    self._connections.pop(finished).close()
+                self._connections[thread] = connection
+        return connection
+
+    def close(self) -> None:
+        """ Close the connections of all threads, a thread that uses the storage again opens a new connection """
+        with self._connections_lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for connection in connections:
+            connection.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Cursor]:
+        """ Run a write transaction, which is committed when the context exits and rolled back on an error """
+        cursor = self._connection.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            yield cursor
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+        else:
+            cursor.execute('COMMIT')
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _tag_to_path(tag: TagType) -> str:
+        return json.dumps(tag)
+
+    def _encode_value(self, data: Any) -> bytes:
+        encoded = self._serializer.encode_data(data, encode_key=StorageFile._encode_key)
+        return json.dumps(encoded).encode('utf-8')
+
+    def _decode_value(self, value: bytes) -> Any:
+        return self._serializer.decode_data(json.loads(value), decode_key=StorageFile._decode_key)
+
+    @staticmethod
+    def _search_terms(tag: TagType, data: Any) -> Iterator[Tuple[str, str, str, Any]]:
+        """ Create the rows of the search_terms table for a leaf
+
+        Args:
+            tag: The tag of the leaf
+            data: The value of the leaf
+
+        Returns:
+            Iterator over the path of the leaf, the key, the type class and the value of the search terms
+        """
+        path = StorageSQLite._tag_to_path(tag)
+        for index, part in enumerate(tag):
+            yield path, json.dumps(['tag', index]), 'str', part
+        for field_path, value in SearchIndex._flatten(data):
+            if isinstance(value, int) and not isinstance(value, bool) and not -2 ** 63 <= value < 2 ** 63:
+                value = float(value)
+            yield path, json.dumps(['value', *field_path]), _type_class(value), value
+
+    def _write_leaves(self, cursor: sqlite3.Cursor, items: Sequence[Tuple[TagType, Any]],
+                      overwrite: bool = True) -> None:
+        """ Write leaves and their missing ancestors in the current transaction
+
+        Args:
+            cursor: The cursor of the transaction
+            items: Pairs of tag and data to store
+            overwrite: If False, existing leaves are left untouched
+
+        Raises:
+            NodeAlreadyExistsError: If a tag or one of its ancestors is an unexpected node/leaf
+        """
+        paths = {self._tag_to_path(tag[:index]) for tag, _ in items for index in range(1, len(tag) + 1)}
+        is_leaf = dict(self._select(cursor, 'SELECT path, is_leaf FROM nodes WHERE path IN ({})', sorted(paths)))
+
+        for tag, data in items:
+            for index in range(1, len(tag)):
+                path = self._tag_to_path(tag[:index])
+                if is_leaf.get(path):
+                    raise NodeAlreadyExistsError(f'Tag "{tag[index - 1]}" is a leaf')
+                if path not in is_leaf:
+                    cursor.execute('INSERT INTO nodes (path, parent_path, name, is_leaf) VALUES (?, ?, ?, 0)',
+                                   (path, self._tag_to_path(tag[:index - 1]), tag[index - 1]))
+                    is_leaf[path] = False
+
+            path = self._tag_to_path(tag)
+            if path in is_leaf and not is_leaf[path]:
+                raise NodeAlreadyExistsError(f'Tag "{tag[-1]}" is not a leaf')
+            if path in is_leaf and not overwrite:
+                continue
+            cursor.execute('INSERT OR REPLACE INTO nodes (path, parent_path, name, is_leaf, value) '
+                           'VALUES (?, ?, ?, 1, ?)', (path, self._tag_to_path(tag[:-1]), tag[-1],
+                                                      self._encode_value(data)))
+            cursor.execute('DELETE FROM search_terms WHERE path = ?', (path,))
+            cursor.executemany('INSERT INTO search_terms (path, key, type_class, value) VALUES (?, ?, ?, ?)',
+                               self._search_terms(tag, data))
+            is_leaf[path] = True
+
+    def _select(self, cursor: Union[sqlite3.Connection, sqlite3.Cursor], query: str,
+                values: Sequence[Any]) -> List[Any]:
+        """ Run a query with an IN clause in batches that stay below the limit on the number of variables
+
+        Args:
+            cursor: The connection or cursor to run the query on
+            query: The query, with {} in place of the list of variables of the IN clause
+            values: The values of the IN clause
+
+        Returns:
+            The rows of all batches
+        """
+        rows: List[Any] = []
+        for start in range(0, len(values), self.MAX_VARIABLES):
+            batch = values[start:start + self.MAX_VARIABLES]
+            rows.extend(cursor.execute(query.format(', '.join('?' * len(batch))), batch).fetchall())
+        return rows
+
+    def _read_leaf(self, tag: TagType) -> Any:
+        """ Read the value of a leaf
+
+        Raises:
+            NoDataAtKeyError: If the tag is not a leaf
+        """
+        row = self._connection.execute('SELECT is_leaf, value FROM nodes WHERE path = ?',
+                                       (self._tag_to_path(tag),)).fetchone()
+        if row is None:
+            raise NoDataAtKeyError(f'Tag "{tag[-1]}" cannot be found')
+        if not row[0]:
+            raise NoDataAtKeyError(f'Tag "{tag[-1]}" is not a leaf')
+        return self._decode_value(row[1])
+
+    def load_data(self, tag: TagType) -> Any:
+        if not isinstance(tag, list):
+            raise TypeError('Tag should be a list of strings')
+        if len(tag) == 0:
+            raise NoDataAtKeyError('Tag cannot be empty')
+
+        return self._read_leaf(tag)
+
+    def save_data(self, data: Any, tag: TagType) -> None:
+        """ Save data to storage
+
+        Args:
+            data: data to store
+            tag: reference tag to store the data
+
+        Raises:
+            NodeAlreadyExistsError: If the tag or one of its ancestors is an unexpected node/leaf
+        """
+        self._validate_tag(tag)
+        if len(tag) == 0:
+            raise NodeAlreadyExistsError('Tag cannot be empty')
+        with self._transaction() as cursor:
+            self._write_leaves(cursor, [(tag, data)])
+
+    def save_many(self, items: Sequence[Tuple[TagType, Any]], overwrite: bool = True) -> None:
+        """ Save multiple results in a single transaction
+
+        Args:
+            items: Pairs of reference tag and data to store
+            overwrite: If False, items of which the tag is already in storage are skipped
+
+        Raises:
+              NodeAlreadyExistsError: If a tag in one of the tag lists is an unexpected node/leaf
+        """
+        for tag, _ in items:
+            self._validate_tag(tag)
+            if len(tag) == 0:
+                raise NodeAlreadyExistsError('Tag cannot be empty')
+        with self._transaction() as cursor:
+            self._write_leaves(cursor, items, overwrite)
+
+    def load_many(self, tags: Sequence[TagType]) -> List[Any]:
+        """ Load multiple results with a single query
+
+        Args:
+            tags: tags for results to load
+
+        Returns:
+            Data found at the nodes identified by the tags, in the order of the tags.
+
+        Raises:
+            NoDataAtKeyError: if there is no data for one of the tags.
+        """
+        for tag in tags:
+            self._validate_tag(tag)
+            if len(tag) == 0:
+                raise NoDataAtKeyError('Tag cannot be empty')
+        paths = [self._tag_to_path(tag) for tag in tags]
+        rows = {path: (is_leaf, value) for path, is_leaf, value in
+                self._select(self._connection, 'SELECT path, is_leaf, value FROM nodes WHERE path IN ({})',
+                             sorted(set(paths)))}
+
+        results = []
+        for path, tag in zip(paths, tags):
+            if path not in rows:
+                raise NoDataAtKeyError(f'Tag "{tag[-1]}" cannot be found')
+            is_leaf, value = rows[path]
+            if not is_leaf:
+                raise NoDataAtKeyError(f'Tag "{tag[-1]}" is not a leaf')
+            results.append(self._decode_value(value))
+        return results
+
+    def load_individual_data(self, tag: TagType, field: FieldType) -> Any:
+        """ Retrieve an individual field value at a given tag
+
+        Args:
+            tag: The tag
+            field: Name of the individual field to be retrieved, or the list of keys of a nested field
+
+        Raises:
+            NoDataAtKeyError: If the tag is not a leaf or the field does not exist
+
+        Returns:
+            Value of the field
+        """
+        self._validate_tag(tag)
+        self._validate_field(field)
+        if len(tag) == 0:
+            raise NoDataAtKeyError('Tag cannot be empty')
+
+        data = self._read_leaf(tag)
+        if not isinstance(data, dict):
+            raise NoDataAtKeyError(f'The field "{field}" does not exists')
+        return self._get_field(data, self._field_path(field))
+
+    def update_individual_data(self, data: Any, tag: TagType, field: FieldType) -> None:
+        """ Update an individual field at a given tag with the given data in a single transaction.
+        If the field does not exist, it will be created.
+
+        Args:
+            data: Data to update
+            tag: The tag
+            field: Name of the individual field to updated, or the list of keys of a nested field
+
+        Raises:
+            NodeDoesNotExistsError: If the tag does not exist
+            NodeAlreadyExistsError: If the tag or one of its ancestors is an unexpected node/leaf
+        """
+        self._validate_tag(tag)
+        self._validate_field(field)
+        if len(tag) == 0:
+            raise NodeDoesNotExistsError('Tag cannot be empty')
+        with self._transaction() as cursor:
+            paths = [self._tag_to_path(tag[:index + 1]) for index in range(len(tag))]
+            rows = dict(self._select(cursor, 'SELECT path, is_leaf FROM nodes WHERE path IN ({})', paths))
+            for index, path in enumerate(paths[:-1]):
+                if rows.get(path):
+                    raise NodeAlreadyExistsError(f'Tag "{tag[index]}" is a leaf')
+            if paths[-1] not in rows:
+                raise NodeDoesNotExistsError(f'Tag "{tag[-1]}" does not exist')
+            if not rows[paths[-1]]:
+                raise NodeAlreadyExistsError(f'Tag "{tag[-1]}" is not a leaf')
+
+            leaf_data = self._read_leaf(tag)
+            leaf_data = self._set_field(leaf_data, field, data)
+            self._write_leaves(cursor, [(tag, leaf_data)])
+
+    def get_latest_subtag(self, tag: TagType) -> Optional[TagType]:
+        """ Get the latest subtag
+
+        Args:
+            tag: Tag to search from
+        Returns:
+            Latest subtag found among subtags or None if there are no subtags
+        """
+        child_tags = self.list_data_subtags(tag, limit=1)
+        if len(child_tags) == 0:
+            return None
+
+        return tag + [child_tags[0]]
+
+    def list_data_subtags(self, tag: TagType, limit: int = 0, start: Optional[str] = None, end: Optional[str] = None,
+                          after: Optional[str] = None) -> TagType:
+        """ List subtags for the given tag with an indexed query. The number of subtags listed is based on the limit
+        parameter (0 for listing all subtags). The range of subtags is a range scan of the (parent_path, name) index
+
+        Args:
+            tag: Tag to search from
+            limit: Maximum number of subtags to return. If set to zero there is no limit
+            start: If set only the subtags that are greater than or equal to start are listed
+            end: If set only the subtags that are less than end are listed
+            after: If set only the subtags that are less than after are listed, see `StorageInterface.list_data_subtags`
+        Returns:
+            List of subtags found, sorted in descending order
+        """
+        query = 'SELECT name FROM nodes WHERE parent_path = ?'
+        parameters: List[Any] = [self._tag_to_path(tag)]
+        lower, upper = self._subtag_bounds(start, end, after)
+        if lower is not None:
+            query += ' AND name >= ?'
+            parameters.append(lower)
+        if upper is not None:
+            query += ' AND name < ?'
+            parameters.append(upper)
+        parameters.append(limit if limit > 0 else -1)
+        rows = self._connection.execute(query + ' ORDER BY name DESC LIMIT ?', parameters)
+        return [name for name, in rows]
+
+    @staticmethod
+    def _subtree_range(tag: TagType) -> Tuple[str, str, str]:
+        """ The range of the primary key that holds a subtree
+
+        Returns:
+            The path of the tag and the inclusive lower and exclusive upper bound of the paths of its descendants
+        """
+        path = StorageSQLite._tag_to_path(tag)
+        # the paths are ASCII, the paths of the descendants of ["a"] are in the range ['["a", "', '["a", #')
+        prefix = path[:-1] + (', "' if tag else '"')
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return path, prefix, upper
+
+    def _delete_subtree(self, cursor: sqlite3.Cursor, tag: TagType, recursive: bool) -> bool:
+        """ Delete a leaf or node with its descendants and their search terms in the current transaction
+
+        Args:
+            cursor: The cursor of the transaction
+            tag: The tag of the leaf or node
+            recursive: If False a node with children is not deleted
+
+        Returns:
+            False if the tag is not in storage
+
+        Raises:
+            NodeNotEmptyError: If the tag is a node that has children and recursive is False
+        """
+        path, prefix, upper = self._subtree_range(tag)
+        if cursor.execute('SELECT 1 FROM nodes WHERE path = ?', (path,)).fetchone() is None:
+            return False
+        if not recursive and cursor.execute('SELECT 1 FROM nodes WHERE parent_path = ? LIMIT 1',
+                                            (path,)).fetchone() is not None:
+            raise NodeNotEmptyError(f'Tag "{tag[-1]}" has children')
+        for table in ('nodes', 'search_terms'):
+            cursor.execute(f'DELETE FROM {table} WHERE path = ? OR path >= ? AND path < ?', (path, prefix, upper))
+        return True
+
+    def delete(self, tag: TagType, recursive: bool = True) -> None:
+        """ Delete a leaf or a node with a range delete on the primary key
+
+        Args:
+            tag: The tag of the leaf or node
+            recursive: If True the children of a node are deleted with the node
+        """
+        self._validate_tag(tag)
+        if len(tag) == 0:
+            raise NoDataAtKeyError('Tag cannot be empty')
+        with self._transaction() as cursor:
+            if not self._delete_subtree(cursor, tag, recursive):
+                raise NoDataAtKeyError(f'Tag "{tag[-1]}" cannot be found')
+
+    def delete_many(self, tags: Sequence[TagType], recursive: bool = True) -> None:
+        """ Delete multiple leaves or nodes in a single transaction
+
+        Args:
+            tags: The tags of the leaves and nodes. Tags that are not in storage are skipped
+            recursive: If True the children of the nodes are deleted with the nodes
+        """
+        for tag in tags:
+            self._validate_tag(tag)
+            if len(tag) == 0:
+                raise NoDataAtKeyError('Tag cannot be empty')
+        with self._transaction() as cursor:
+            for tag in tags:
+                self._delete_subtree(cursor, tag, recursive)
+
+    def export_subtree(self, tag: TagType, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """ Export the leaves in a subtree as a stream of records, see `StorageInterface.export_subtree`
+
+        The subtree is read with a single range query on the primary key, because the paths of the descendants
+        of a tag share the path of the tag as prefix. The rows are fetched `batch_size` at a time.
+
+        Args:
+            tag: The tag of the subtree. If the tag is a leaf a single record is exported
+            batch_size: Number of leaves that are read at once
+
+        Yields:
+            A record with the tag of the leaf relative to the subtree and the data of the leaf
+        """
+        self._validate_tag(tag)
+        path, prefix, upper = self._subtree_range(tag)
+        cursor = self._connection.execute('SELECT path, value FROM nodes WHERE is_leaf = 1 AND '
+                                          '(path = ? OR path >= ? AND path < ?)', (path, prefix, upper))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row_path, value in rows:
+                yield {'tag': json.loads(row_path)[len(tag):], 'data': self._decode_value(value)}
+
+    def _compile_condition(self, condition: QueryCondition) -> Optional[Tuple[str, List[Any]]]:
+        """ Compile a query condition to a query on the search_terms table
+
+        Args:
+            condition: The condition
+
+        Returns:
+            The query that selects the paths of the matching leaves and its parameters, or None if the condition
+            never matches
+        """
+        key = json.dumps(['tag', condition.tag_index] if condition.is_tag_condition
+                         else ['value', *condition.field_path])
+        type_class = _type_class(condition.value)
+        query = 'SELECT path FROM search_terms WHERE key = ? AND '
+        if condition.operator == '!=':
+            return query + 'NOT (type_class = ? AND value IS ?)', [key, type_class, condition.value]
+        if condition.operator != '==' and type_class not in ('number', 'str'):
+            # range comparisons on true, false and null never match
+            return None
+        return query + 'type_class = ? AND ' + self._COMPARISONS[condition.operator], \
+            [key, type_class, condition.value]
+
+    def search(self, query: str) -> List[TagType]:
+        """ Find the leaves that satisfy a query, see `StorageInterface.search` for the query language
+
+        Every condition is an indexed query on the search_terms table, the results are intersected by the database.
+
+        Args:
+            query: The query
+
+        Returns:
+            The tags of the matching leaves, sorted in descending order
+        """
+        compiled = [self._compile_condition(condition) for condition in parse_query(query)]
+        if any(condition is None for condition in compiled):
+            return []
+        sql = ' INTERSECT '.join(condition[0] for condition in compiled if condition is not None)
+        parameters = [parameter for condition in compiled if condition is not None for parameter in condition[1]]
+        return sort_search_results([json.loads(path) for path, in self._connection.execute(sql, parameters)])
+
+    def tag_in_storage(self, tag: TagType) -> bool:
+        if len(tag) == 0:
+            return True
+        return self._connection.execute('SELECT 1 FROM nodes WHERE path = ?',
+                                        (self._tag_to_path(tag),)).fetchone() is not None
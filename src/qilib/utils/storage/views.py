@@ -0,0 +1,259 @@
+"""Quantum Inspire library
+
+Copyright 2022 QuTech Delft
+
+qilib is available under the [MIT open-source license](https://opensource.org/licenses/MIT):
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+from typing import Any, Dict, Iterator, List, Set, Tuple, Union
+
+import numpy as np
+
+
+def read_only_view(value: Any) -> Any:
+    """ Create a view of a value that protects the value against modification without copying it
+
+    Dictionaries and lists are wrapped in copy-on-write views, numpy arrays are returned as non-writeable views and
+    the items of tuples are wrapped recursively. Other values are returned as is.
+
+    Args:
+        value: The value
+
+    Returns:
+        The view of the value
+    """
+    if isinstance(value, (CopyOnWriteDict, CopyOnWriteList)):
+        return value
+    if isinstance(value, dict):
+        return CopyOnWriteDict(value)
+    if isinstance(value, list):
+        return CopyOnWriteList(value)
+    if isinstance(value, np.ndarray):
+        view = value.view()
+        view.flags.writeable = False
+        return view
+    if isinstance(value, tuple) and type(value) is tuple:
+        return tuple(read_only_view(item) for item in value)
+    return value
+
+
+class CopyOnWriteDict(Dict[Any, Any]):
+    """ Dictionary that holds the items of another dictionary without copying the nested values
+
+    The view is a shallow copy of the wrapped dictionary, so it can be used wherever a dictionary is expected, e.g.
+    by the Serializer or PythonJsonStructure. A nested value is replaced by its `read_only_view` when it is first
+    accessed, so the wrapped data is never changed. Copies of the view are plain dictionaries.
+    """
+
+    def __init__(self, data: Dict[Any, Any]) -> None:
+        """
+        Args:
+            data: The dictionary to read from
+        """
+        super().__init__(data)
+        self._viewed: Set[Any] = set()
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({super().__repr__()})'
+
+    def __reduce_ex__(self, protocol: Any) -> Tuple[Any, ...]:
+        return dict, (self.copy(),)
+
+    def _view(self, key: Any) -> Any:
+        value = super().__getitem__(key)
+        if key in self._viewed:
+            return value
+        self._viewed.add(key)
+        view = read_only_view(value)
+        if view is not value:
+            super().__setitem__(key, view)
+        return view
+
+    def _view_all(self) -> None:
+        if len(self._viewed) < len(self):
+            for key in list(super().__iter__()):
+                self._view(key)
+
+    def __getitem__(self, key: Any) -> Any:
+        return self._view(key)
+
+    def __iter__(self) -> Iterator[Any]:
+        # overriding __iter__ makes dict(view) and {**view} read the items through __getitem__
+        return super().__iter__()
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        self._viewed.add(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key: Any) -> None:
+        super().__delitem__(key)
+        self._viewed.discard(key)
+
+    def __or__(self, other: Any) -> Any:
+        self._view_all()
+        return super().__or__(other)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        return self._view(key) if key in self else default
+
+    def items(self) -> Any:
+        self._view_all()
+        return super().items()
+
+    def values(self) -> Any:
+        self._view_all()
+        return super().values()
+
+    def pop(self, key: Any, *default: Any) -> Any:
+        if key not in self:
+            return super().pop(key, *default)
+        value = self._view(key)
+        del self[key]
+        return value
+
+    def popitem(self) -> Tuple[Any, Any]:
+        self._view_all()
+        key, value = super().popitem()
+        self._viewed.discard(key)
+        return key, value
+
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        if key in self:
+            return self._view(key)
+        self[key] = default
+        return default
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def copy(self) -> Dict[Any, Any]:
+        """ Return a shallow copy as a dictionary, the nested values are views """
+        return dict(self.items())
+
+
+class CopyOnWriteList(List[Any]):
+    """ List that holds the items of another list without copying the nested values
+
+    The view is a shallow copy of the wrapped list, so it can be used wherever a list is expected. A nested value
+    is replaced by its `read_only_view` when it is first accessed, so the wrapped data is never changed. Copies and
+    slices of the view are plain lists.
+    """
+
+    def __init__(self, data: List[Any]) -> None:
+        """
+        Args:
+            data: The list to read from
+        """
+        super().__init__(data)
+        self._viewed: Set[int] = set()
+        self._all_viewed = False
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({super().__repr__()})'
+
+    def __reduce_ex__(self, protocol: Any) -> Tuple[Any, ...]:
+        return list, (self.copy(),)
+
+    def _view(self, index: int) -> Any:
+        value = super().__getitem__(index)
+        if self._all_viewed:
+            return value
+        index %= len(self)
+        if index in self._viewed:
+            return value
+        self._viewed.add(index)
+        view = read_only_view(value)
+        if view is not value:
+            super().__setitem__(index, view)
+        return view
+
+    def _view_all(self) -> None:
+        """ Replace all items by their views, which is done before the first modification as it moves the items """
+        if not self._all_viewed:
+            for index in range(len(self)):
+                self._view(index)
+            self._all_viewed = True
+            self._viewed = set()
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:  # type: ignore
+        if isinstance(index, slice):
+            return [self._view(i) for i in range(*index.indices(len(self)))]
+        return self._view(index)
+
+    def __iter__(self) -> Iterator[Any]:
+        self._view_all()
+        return super().__iter__()
+
+    def __reversed__(self) -> Iterator[Any]:
+        self._view_all()
+        return super().__reversed__()
+
+    def __add__(self, other: Any) -> Any:
+        self._view_all()
+        return super().__add__(other)
+
+    def __mul__(self, other: Any) -> Any:
+        self._view_all()
+        return super().__mul__(other)
+
+    def __setitem__(self, index: Any, value: Any) -> None:
+        self._view_all()
+        super().__setitem__(index, value)
+
+    def __delitem__(self, index: Any) -> None:
+        self._view_all()
+        super().__delitem__(index)
+
+    def __iadd__(self, other: Any) -> Any:
+        self._view_all()
+        return super().__iadd__(other)
+
+    def __imul__(self, other: Any) -> Any:
+        self._view_all()
+        return super().__imul__(other)
+
+    def append(self, value: Any) -> None:
+        self._view_all()
+        super().append(value)
+
+    def extend(self, values: Any) -> None:
+        self._view_all()
+        super().extend(values)
+
+    def insert(self, index: Any, value: Any) -> None:
+        self._view_all()
+        super().insert(index, value)
+
+    def pop(self, index: Any = -1) -> Any:
+        self._view_all()
+        return super().pop(index)
+
+    def remove(self, value: Any) -> None:
+        self._view_all()
+        super().remove(value)
+
+    def reverse(self) -> None:
+        self._view_all()
+        super().reverse()
+
+    def sort(self, *args: Any, **kwargs: Any) -> None:
+        self._view_all()
+        super().sort(*args, **kwargs)
+
+    def copy(self) -> List[Any]:
+        """ Return a shallow copy as a list, the nested values are views """
+        self._view_all()
+        return list(super().__iter__())
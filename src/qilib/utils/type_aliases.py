@@ -24,6 +24,7 @@ PJSValueTypes = Union[None, bool, int, float, complex, str, bytes]
 PJSContainers = Sequence[PJSValueTypes]
 PJSValues = Union[PJSContainers, PJSValueTypes]
 TagType = List[str]
+FieldType = Union[str, int, List[Union[str, int]]]
 EncodedNumpyArray = Dict[str, Union[str, Dict[str, Union[str, List[Any], bytes]]]]
 # type alias for numpy.ndarray
 NumpyNdarrayType = npt.NDArray[Any]
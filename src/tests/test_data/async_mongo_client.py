@@ -0,0 +1,82 @@
+from typing import Any, Dict, List, Optional
+
+from mongomock import MongoClient
+
+
+class AsyncCursor:
+
+    def __init__(self, cursor: Any) -> None:
+        """ Stand-in for an asynchronous cursor, wraps a mongomock cursor."""
+        self._cursor = cursor
+
+    async def to_list(self, length: Optional[int]) -> List[Dict[str, Any]]:
+        documents = list(self._cursor)
+        return documents if length is None else documents[:length]
+
+
+class AsyncCollection:
+
+    def __init__(self, collection: Any) -> None:
+        """ Stand-in for an asynchronous collection, wraps a mongomock collection."""
+        self._collection = collection
+        self.calls: List[str] = []
+
+    @property
+    def name(self) -> str:
+        return str(self._collection.name)
+
+    def find(self, *args: Any, **kwargs: Any) -> AsyncCursor:
+        self.calls.append('find')
+        return AsyncCursor(self._collection.find(*args, **kwargs))
+
+    async def find_one(self, *args: Any, **kwargs: Any) -> Any:
+        self.calls.append('find_one')
+        return self._collection.find_one(*args, **kwargs)
+
+    async def update_one(self, *args: Any, **kwargs: Any) -> Any:
+        self.calls.append('update_one')
+        return self._collection.update_one(*args, **kwargs)
+
+    async def bulk_write(self, *args: Any, **kwargs: Any) -> Any:
+        self.calls.append('bulk_write')
+        return self._collection.bulk_write(*args, **kwargs)
+
+    async def create_index(self, *args: Any, **kwargs: Any) -> Any:
+        return self._collection.create_index(*args, **kwargs)
+
+    async def index_information(self) -> Any:
+        return self._collection.index_information()
+
+    async def drop(self) -> None:
+        self._collection.drop()
+
+
+class AsyncDatabase:
+
+    def __init__(self, database: Any) -> None:
+        """ Stand-in for an asynchronous database, wraps a mongomock database."""
+        self._database = database
+
+    @property
+    def name(self) -> str:
+        return str(self._database.name)
+
+    def get_collection(self, name: str) -> AsyncCollection:
+        return AsyncCollection(self._database.get_collection(name))
+
+
+class AsyncMongoClient:
+
+    def __init__(self, client: Optional[MongoClient] = None) -> None:
+        """ Local stand-in for an asynchronous MongoDB client, wraps a mongomock client.
+
+        Args:
+            client: The mongomock client to wrap, share a client to access the same data synchronously
+        """
+        self.client = MongoClient() if client is None else client
+
+    async def server_info(self) -> Dict[str, Any]:
+        return dict(self.client.server_info())
+
+    def get_database(self, name: str, **kwargs: Any) -> AsyncDatabase:
+        return AsyncDatabase(self.client.get_database(name, **kwargs))
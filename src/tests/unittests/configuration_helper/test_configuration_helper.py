@@ -20,10 +20,12 @@ class TestConfigurationHelper(unittest.TestCase):
         storage = Mock()
         configuration_tags = [['some_tag']]
         configuration = {'adapter_class_name': 'Dummy', 'address': 'fake', 'configuration': {'param': 'value'}}
-        storage.load_data.side_effect = [configuration_tags, configuration]
+        storage.load_data.return_value = configuration_tags
+        storage.load_many.return_value = [configuration]
         with patch('qilib.configuration_helper.instrument_configuration.InstrumentAdapterFactory'):
             configuration_helper = ConfigurationHelper(storage)
             configuration_helper.retrieve_inactive_configuration_from_storage(tag)
+        storage.load_many.assert_called_once_with(configuration_tags)
         inactive_configuration = configuration_helper._inactive_configuration
         self.assertListEqual(inactive_configuration.tag, tag)
         self.assertListEqual(inactive_configuration.instrument_configurations[0].tag, ['some_tag'])
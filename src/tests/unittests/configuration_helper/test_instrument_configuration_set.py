@@ -70,6 +70,23 @@ class TestInstrumentConfigurationSet(TestCase):
             self.assertTrue(self._storage.tag_in_storage(instrument_1.tag))
             self.assertTrue(self._storage.tag_in_storage(instrument_2.tag))
 
+    def test_store_saves_in_bulk(self):
+        storage = Mock()
+        storage.tag_in_storage.return_value = False
+        with patch('qilib.configuration_helper.instrument_configuration.InstrumentAdapterFactory'):
+            instrument_1 = InstrumentConfiguration('DummyClass', 'fake-address-1', storage, tag=['instrument_1'])
+            instrument_2 = InstrumentConfiguration('DummyClass', 'fake-address-2', storage, tag=['instrument_2'])
+            instrument_configuration_set = InstrumentConfigurationSet(storage, tag=['set'],
+                                                                      instrument_configurations=[instrument_1,
+                                                                                                 instrument_2])
+            instrument_configuration_set.store()
+
+        storage.save_data.assert_not_called()
+        storage.save_many.assert_called_once_with([(['instrument_1'], instrument_1.to_document()),
+                                                   (['instrument_2'], instrument_2.to_document()),
+                                                   (['set'], [['instrument_1'], ['instrument_2']])],
+                                                  overwrite=False)
+
     def test_store_raises_error(self):
         instrument_configuration_set = InstrumentConfigurationSet(self._storage)
         instrument_configuration_set.store()
@@ -11,10 +11,16 @@ from qilib.data_set.mongo_data_set_io import DocumentNotFoundError, FieldNotUniq
 
 
 class TestMongoDataSetIO(unittest.TestCase):
+    @staticmethod
+    def _mongo_client(collection):
+        client = MagicMock()
+        client.__getitem__.return_value.__getitem__.return_value = collection
+        return client
+
     def test_constructor_only_name(self):
         mock_mongo_client = MagicMock()
         with patch('qilib.data_set.mongo_data_set_io.MongoClient',
-                   return_value={'qilib': {'data_sets': mock_mongo_client}}) as mongo_client:
+                   return_value=self._mongo_client(mock_mongo_client)) as mongo_client:
             mock_mongo_client.find_one.return_value = {'_id': ObjectId('5c9a3457e3306c41f7ae1f3e'),
                                                        'name': 'test_data_set'}
             mock_mongo_client.insert_one.return_value.inserted_id = ObjectId('5c9a3457e3306c41f7ae1f3e')
@@ -29,7 +35,7 @@ class TestMongoDataSetIO(unittest.TestCase):
     def test_set_unique_field_fails(self):
         mock_mongo_client = MagicMock()
         with patch('qilib.data_set.mongo_data_set_io.MongoClient',
-                   return_value={'qilib': {'data_sets': mock_mongo_client}}):
+                   return_value=self._mongo_client(mock_mongo_client)):
             mock_mongo_client.index_information.return_value = {'name_1': {'unique': False}}
             error = FieldNotUniqueError, "Field 'name' is not unique in database."
             self.assertRaisesRegex(*error, MongoDataSetIO, name='test_data_set')
@@ -41,7 +47,7 @@ class TestMongoDataSetIO(unittest.TestCase):
     def test_constructor_name_not_found(self):
         mock_mongo_client = MagicMock()
         with patch('qilib.data_set.mongo_data_set_io.MongoClient',
-                   return_value={'qilib': {'data_sets': mock_mongo_client}}) as mongo_client:
+                   return_value=self._mongo_client(mock_mongo_client)) as mongo_client:
             insert_one = namedtuple('insert_one', 'inserted_id')
             insert_one.inserted_id = ObjectId('5c9a3457e3306c41f7ae1f3e')
             mock_mongo_client.find_one.return_value = None
@@ -57,7 +63,7 @@ class TestMongoDataSetIO(unittest.TestCase):
     def test_constructor_name_not_found_raises_error(self):
         mock_mongo_client = MagicMock()
         with patch('qilib.data_set.mongo_data_set_io.MongoClient',
-                   return_value={'qilib': {'data_sets': mock_mongo_client}}):
+                   return_value=self._mongo_client(mock_mongo_client)):
             mock_mongo_client.find_one.return_value = None
 
             error = DocumentNotFoundError, "Document not found in database."
@@ -67,7 +73,7 @@ class TestMongoDataSetIO(unittest.TestCase):
     def test_constructor_only_id(self):
         mock_mongo_client = MagicMock()
         with patch('qilib.data_set.mongo_data_set_io.MongoClient',
-                   return_value={'qilib': {'data_sets': mock_mongo_client}}) as mongo_client:
+                   return_value=self._mongo_client(mock_mongo_client)) as mongo_client:
             mock_mongo_client.find_one.return_value = {'_id': ObjectId('5c9a3457e3306c41f7ae1f3e'),
                                                        'name': 'test_data_set'}
             mongo_data_set_io = MongoDataSetIO(document_id='5c9a3457e3306c41f7ae1f3e')
@@ -80,7 +86,7 @@ class TestMongoDataSetIO(unittest.TestCase):
     def test_constructor_id_not_found(self):
         mock_mongo_client = MagicMock()
         with patch('qilib.data_set.mongo_data_set_io.MongoClient',
-                   return_value={'qilib': {'data_sets': mock_mongo_client}}):
+                   return_value=self._mongo_client(mock_mongo_client)):
             mock_mongo_client.find_one.return_value = None
 
             error = DocumentNotFoundError, "Document not found in database."
@@ -90,7 +96,7 @@ class TestMongoDataSetIO(unittest.TestCase):
     def test_constructor_name_and_id(self):
         mock_mongo_client = MagicMock()
         with patch('qilib.data_set.mongo_data_set_io.MongoClient',
-                   return_value={'qilib': {'data_sets': mock_mongo_client}}) as mongo_client:
+                   return_value=self._mongo_client(mock_mongo_client)) as mongo_client:
             mock_mongo_client.find_one.return_value = {'_id': ObjectId('5c9a3457e3306c41f7ae1f3e'),
                                                        'name': 'test_data_set'}
             mock_mongo_client.insert_one.return_value.inserted_id = ObjectId('5c9a3457e3306c41f7ae1f3e')
@@ -106,7 +112,7 @@ class TestMongoDataSetIO(unittest.TestCase):
     def test_constructor_name_and_id_not_found(self):
         mock_mongo_client = MagicMock()
         with patch('qilib.data_set.mongo_data_set_io.MongoClient',
-                   return_value={'qilib': {'data_sets': mock_mongo_client}}):
+                   return_value=self._mongo_client(mock_mongo_client)):
             mock_mongo_client.find_one.return_value = None
 
             error = DocumentNotFoundError, "Document not found in database."
@@ -121,7 +127,7 @@ class TestMongoDataSetIO(unittest.TestCase):
     def test_watch(self):
         mock_mongo_client = MagicMock()
         with patch('qilib.data_set.mongo_data_set_io.MongoClient',
-                   return_value={'qilib': {'data_sets': mock_mongo_client}}):
+                   return_value=self._mongo_client(mock_mongo_client)):
             mock_mongo_client.find_one.return_value = {'_id': ObjectId('5c9a3457e3306c41f7ae1f3e'),
                                                        'name': 'test_data_set'}
             mock_mongo_client.watch.return_value = 'Watching'
@@ -134,7 +140,7 @@ class TestMongoDataSetIO(unittest.TestCase):
     def test_get_document(self):
         mock_mongo_client = MagicMock()
         with patch('qilib.data_set.mongo_data_set_io.MongoClient',
-                   return_value={'qilib': {'data_sets': mock_mongo_client}}):
+                   return_value=self._mongo_client(mock_mongo_client)):
             db_document = {'_id': ObjectId('5c9a3457e3306c41f7ae1f3e'),
                            'name': 'test_data_set'}
             mock_mongo_client.find_one.return_value = db_document
@@ -151,7 +157,7 @@ class TestMongoDataSetIO(unittest.TestCase):
     def test_append_to_document(self):
         mock_mongo_client = MagicMock()
         with patch('qilib.data_set.mongo_data_set_io.MongoClient',
-                   return_value={'qilib': {'data_sets': mock_mongo_client}}):
+                   return_value=self._mongo_client(mock_mongo_client)):
             mongo_data_set_io = MongoDataSetIO(name='test_data_set')
             mongo_data_set_io.append_to_document({'metadata.label': 'test_data'})
             mock_mongo_client.update_one.called_once_with({'name': 'test_data_set'},
@@ -161,7 +167,7 @@ class TestMongoDataSetIO(unittest.TestCase):
     def test_update_document(self):
         mock_mongo_client = MagicMock()
         with patch('qilib.data_set.mongo_data_set_io.MongoClient',
-                   return_value={'qilib': {'data_sets': mock_mongo_client}}):
+                   return_value=self._mongo_client(mock_mongo_client)):
             mongo_data_set_io = MongoDataSetIO(name='test_data_set')
             mongo_data_set_io.update_document({'array_updates': ('(2,2)', {'test': 5})})
             mock_mongo_client.update_one.called_once_with({'name': 'test_data_set'},
@@ -182,3 +188,8 @@ class TestMongoDataSetIO(unittest.TestCase):
         self.assertIsInstance(decoded_array, np.ndarray)
         self.assertTupleEqual(shape, decoded_array.shape)
         self.assertTrue(np.issubdtype(decoded_array.dtype, d_type))
+        self.assertTrue(decoded_array.flags.writeable)
+
+        decoded_array = MongoDataSetIO.decode_numpy_array(encoded_array, read_only=True)
+        np.testing.assert_array_equal(array, decoded_array)
+        self.assertFalse(decoded_array.flags.writeable)
@@ -151,6 +151,14 @@ class TestMongoDataSetIOReader(unittest.TestCase):
                                             database='qilib')
             self.assertIsInstance(data_set.storage, MongoDataSetIOReader)
 
+    def test_delete_releases_client(self):
+        mock_mongo_data_set_io = MagicMock()
+        with patch('qilib.data_set.mongo_data_set_io_reader.MongoDataSetIO', return_value=mock_mongo_data_set_io), \
+                patch('qilib.data_set.mongo_data_set_io_reader.Thread'):
+            reader = MongoDataSetIOReader(name='test')
+            del reader
+            mock_mongo_data_set_io.finalize.assert_called_once_with()
+
     def test_thread_and_queue(self):
         mock_queue_instance = MagicMock()
         with patch('qilib.data_set.mongo_data_set_io_reader.MongoDataSetIO'), patch(
@@ -0,0 +1,167 @@
+import sys
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+from mongomock import MongoClient
+
+import qilib.utils.storage
+from qilib.utils.storage import AsyncStorageMongoDb, StorageMongoDb
+from qilib.utils.storage.interface import (NoDataAtKeyError, NodeAlreadyExistsError, ConnectionTimeoutError,
+                                           InvalidQueryError)
+from tests.test_data.async_mongo_client import AsyncMongoClient
+
+
+class TestAsyncStorageMongo(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.client = MongoClient()
+        with patch('qilib.utils.storage.async_mongo.AsyncIOMotorClient', return_value=AsyncMongoClient(self.client)):
+            self.storage = AsyncStorageMongoDb('test')
+
+    def tearDown(self) -> None:
+        self.client.drop_database('test')
+
+    def test_repr(self):
+        self.assertTrue(str(self.storage).startswith('<AsyncStorageMongoDb'))
+        self.assertIn(f'{id(self.storage):x}', repr(self.storage))
+        self.assertIn(self.storage.name, repr(self.storage))
+
+    def test_motor_is_optional(self):
+        with patch.dict(sys.modules, {'motor': None, 'motor.motor_asyncio': None}):
+            del sys.modules['qilib.utils.storage.async_mongo']
+            self.assertIs(qilib.utils.storage.StorageMongoDb, StorageMongoDb)
+            with self.assertRaisesRegex(ImportError, r'pip install qilib\[async\]$'):
+                _ = qilib.utils.storage.AsyncStorageMongoDb
+        self.assertIs(qilib.utils.storage.AsyncStorageMongoDb, AsyncStorageMongoDb)
+
+    async def test_server_timeout(self):
+        storage = AsyncStorageMongoDb('test', port=-1, connection_timeout=0.01)
+        error_msg = 'Failed to connect to Mongo database within 0.01 milliseconds$'
+        with self.assertRaisesRegex(ConnectionTimeoutError, error_msg):
+            await storage.load_data(['a'])
+
+    async def test_save_load(self):
+        test_data = [10, 3.14, 'string', {'a': 1, 'b': 2}, [1, [2, 3]], {'tuple': (1, 2, 3)},
+                     (1, 2, {'he.llo': 'world'}), {1: 'integer key', 'dict': {-2: 'negative'}}]
+        for index, value in enumerate(test_data):
+            await self.storage.save_data(value, ['data', str(index)])
+        for index, value in enumerate(test_data):
+            self.assertEqual(value, await self.storage.load_data(['data', str(index)]))
+
+        await self.storage.save_data('overwritten', ['data', '0'])
+        self.assertEqual('overwritten', await self.storage.load_data(['data', '0']))
+
+    async def test_save_load_numpy_array(self):
+        await self.storage.save_data({'array': np.array([[1, 2], [3, 4]])}, ['array'])
+        data = await self.storage.load_data(['array'])
+        np.testing.assert_array_equal(np.array([[1, 2], [3, 4]]), data['array'])
+
+    async def test_load_errors(self):
+        with self.assertRaises(TypeError):
+            await self.storage.load_data('a')
+        with self.assertRaises(NoDataAtKeyError):
+            await self.storage.load_data([])
+        with self.assertRaises(NoDataAtKeyError):
+            await self.storage.load_data(['a'])
+        await self.storage.save_data(1, ['a', 'b'])
+        with self.assertRaisesRegex(NoDataAtKeyError, 'Tag "a" is not a leaf'):
+            await self.storage.load_data(['a'])
+
+    async def test_save_errors(self):
+        with self.assertRaises(TypeError):
+            await self.storage.save_data(1, ['a', 1])
+        await self.storage.save_data(1, ['a', 'b'])
+        with self.assertRaisesRegex(NodeAlreadyExistsError, 'Tag "a" is not a leaf'):
+            await self.storage.save_data(2, ['a'])
+        with self.assertRaisesRegex(NodeAlreadyExistsError, 'Tag "b" is a leaf'):
+            await self.storage.save_data(2, ['a', 'b', 'c'])
+
+    async def test_save_data_single_bulk_write(self):
+        await self.storage.save_data(1, ['a', 'b', 'c'])
+        self.assertEqual(['bulk_write'], self.storage._collection.calls)
+
+    async def test_individual_data(self):
+        await self.storage.save_data({'a': 1, 2: {'b.c': 3}}, ['data'])
+        self.assertEqual(1, await self.storage.load_individual_data(['data'], 'a'))
+        self.assertEqual({'b.c': 3}, await self.storage.load_individual_data(['data'], 2))
+
+        await self.storage.update_individual_data([4, 5], ['data'], 'a')
+        await self.storage.update_individual_data('new', ['data'], 'new.key')
+        self.assertEqual({'a': [4, 5], 2: {'b.c': 3}, 'new.key': 'new'}, await self.storage.load_data(['data']))
+
+        with self.assertRaisesRegex(NoDataAtKeyError, 'The field "missing" does not exists'):
+            await self.storage.load_individual_data(['data'], 'missing')
+        with self.assertRaises(NoDataAtKeyError):
+            await self.storage.load_individual_data([], 'a')
+        with self.assertRaises(TypeError):
+            await self.storage.load_individual_data(['data'], 1.5)
+
+    async def test_nested_individual_data(self):
+        await self.storage.save_data({'dac1': {'value': 1.5, 'unit': 'V'}, 2: {'b.c': 3}}, ['data'])
+        self.assertEqual(1.5, await self.storage.load_individual_data(['data'], ['dac1', 'value']))
+        self.assertEqual(3, await self.storage.load_individual_data(['data'], [2, 'b.c']))
+
+        self.storage._collection.calls.clear()
+        await self.storage.update_individual_data(2.5, ['data'], ['dac1', 'value'])
+        self.assertEqual(['update_one'], self.storage._collection.calls)
+        self.assertEqual({'dac1': {'value': 2.5, 'unit': 'V'}, 2: {'b.c': 3}}, await self.storage.load_data(['data']))
+        with self.assertRaises(NoDataAtKeyError):
+            await self.storage.load_individual_data(['data'], ['dac1', 'missing'])
+
+    async def test_update_individual_data_errors(self):
+        await self.storage.save_data(1, ['a', 'b'])
+        with self.assertRaisesRegex(NoDataAtKeyError, 'Tag "c" does not exist'):
+            await self.storage.update_individual_data(1, ['a', 'c'], 'field')
+        with self.assertRaisesRegex(NodeAlreadyExistsError, 'Tag "a" is not a leaf'):
+            await self.storage.update_individual_data(1, ['a'], 'field')
+        with self.assertRaisesRegex(NodeAlreadyExistsError, 'Tag "b" is a leaf'):
+            await self.storage.update_individual_data(1, ['a', 'b', 'c'], 'field')
+
+    async def test_list_subtags(self):
+        self.assertEqual([], await self.storage.list_data_subtags(['a']))
+        self.assertIsNone(await self.storage.get_latest_subtag(['a']))
+        for subtag in ['2019-01-02', '2019-01-03', '2019-01-01']:
+            await self.storage.save_data(subtag, ['a', subtag])
+
+        self.assertEqual(['2019-01-03', '2019-01-02', '2019-01-01'], await self.storage.list_data_subtags(['a']))
+        self.assertEqual(['2019-01-03', '2019-01-02'], await self.storage.list_data_subtags(['a'], limit=2))
+        self.assertEqual(['a'], await self.storage.list_data_subtags([]))
+        self.assertEqual(['a', '2019-01-03'], await self.storage.get_latest_subtag(['a']))
+
+    async def test_list_subtags_range(self):
+        for subtag in ['2019-01-02', '2019-01-03', '2019-01-01', '2019-01-04']:
+            await self.storage.save_data(subtag, ['a', subtag])
+        self.assertEqual(['2019-01-03', '2019-01-02'],
+                         await self.storage.list_data_subtags(['a'], start='2019-01-02', end='2019-01-04'))
+        self.assertEqual(['2019-01-02'], await self.storage.list_data_subtags(['a'], limit=1, after='2019-01-03'))
+
+    async def test_tag_in_storage(self):
+        await self.storage.save_data(1, ['a', 'b'])
+        self.assertTrue(await self.storage.tag_in_storage([]))
+        self.assertTrue(await self.storage.tag_in_storage(['a']))
+        self.assertTrue(await self.storage.tag_in_storage(['a', 'b']))
+        self.assertFalse(await self.storage.tag_in_storage(['b']))
+
+    async def test_search(self):
+        await self.storage.save_data({'name': 'x', 'value': 1}, ['a', '2019-01-01'])
+        await self.storage.save_data({'name': 'y', 'value': 2}, ['a', '2019-01-02'])
+        await self.storage.save_data({'name': 'y', 'value': 3}, ['b', '2019-01-03'])
+
+        self.assertEqual([['b', '2019-01-03'], ['a', '2019-01-02']], await self.storage.search("name == 'y'"))
+        self.assertEqual([['a', '2019-01-02']], await self.storage.search("name == 'y' and tag[0] == 'a'"))
+        with self.assertRaises(InvalidQueryError):
+            await self.storage.search('name ==')
+
+    async def test_create_indexes(self):
+        await self.storage.tag_in_storage(['a'])
+        self.assertIn('path_1', await self.storage._collection.index_information())
+
+    async def test_shared_collection_with_storage_mongo(self):
+        with patch('qilib.utils.storage.mongo.MongoClient', return_value=self.client):
+            storage = StorageMongoDb('test', materialized_path=True)
+        await self.storage.save_data({'a': 1}, ['async', 'data'])
+        storage.save_data({'b': 2}, ['sync', 'data'])
+
+        self.assertEqual({'a': 1}, storage.load_data(['async', 'data']))
+        self.assertEqual({'b': 2}, await self.storage.load_data(['sync', 'data']))
+        self.assertEqual(['sync', 'async'], await self.storage.list_data_subtags([]))
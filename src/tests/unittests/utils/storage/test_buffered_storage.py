@@ -0,0 +1,260 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from qilib.utils.storage import BufferedStorage, StorageMemory
+from qilib.utils.storage.buffered import FlushError
+from qilib.utils.storage.interface import (NodeAlreadyExistsError, NodeDoesNotExistsError, NoDataAtKeyError,
+                                           NodeNotEmptyError)
+from tests.unittests.utils.storage import test_storage_memory
+
+
+class TestBufferedStorageMemory(test_storage_memory.TestStorageMemory):
+    """ Runs the tests of the memory storage through the buffered storage
+
+    Errors of the wrapped storage are raised by a FlushError when the writes are flushed. The failed writes are
+    discarded by deleting their tags.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.storage = BufferedStorage(StorageMemory('test'), flush_interval=None)
+
+    def tearDown(self):
+        self.storage.close()
+
+    def test_node_overwrite(self):
+        self.storage.save_data((1, 2), ['aap', 'noot'])
+        self.storage.save_data('mies', ['aap'])
+        with self.assertRaises(FlushError) as context:
+            self.storage.flush()
+        self.assertIsInstance(context.exception.errors[('aap',)], NodeAlreadyExistsError)
+        self.assertEqual((1, 2), self.storage.storage.load_data(['aap', 'noot']))
+        self.storage.delete(['aap'])
+
+    def test_list_subtags_sorted(self):
+        for subtag in ['2019-01-02', '2019-01-04', '2019-01-01', '2019-01-03', '2019-01-02']:
+            self.storage.save_data(subtag, ['a', subtag])
+        self.assertEqual(['2019-01-04', '2019-01-03', '2019-01-02', '2019-01-01'],
+                         self.storage.list_data_subtags(['a']))
+        self.assertEqual(['a', '2019-01-04'], self.storage.get_latest_subtag(['a']))
+        self.assertEqual(['a'], self.storage.list_data_subtags([]))
+        self.storage.flush()
+        self.assertEqual(['2019-01-04', '2019-01-03', '2019-01-02', '2019-01-01'],
+                         self.storage.list_data_subtags(['a']))
+
+        self.storage.save_data('x', ['aapjes', 'noot'])
+        self.storage.save_data('x2', ['aapjes', 'mies'])
+        self.assertEqual(['noot', 'mies'], self.storage.list_data_subtags(['aapjes']))
+        self.assertEqual(['noot'], self.storage.list_data_subtags(['aapjes'], limit=1))
+
+    def test_update_individual_data(self):
+        for index, value in enumerate(self.testdata):
+            self.storage.save_data(value, ['data', str(index)])
+        self.storage.flush()
+
+        self.storage.update_individual_data(42, ['data', str(3)], 'a')
+        self.storage.update_individual_data(43, ['data', str(3)], 'NEW KEY')
+        self.assertEqual(42, self.storage.load_individual_data(['data', str(3)], 'a'))
+        self.assertEqual(43, self.storage.load_individual_data(['data', str(3)], 'NEW KEY'))
+        self.assertEqual(self.testdata[3]['b'], self.storage.load_individual_data(['data', str(3)], 'b'))
+        self.storage.flush()
+        self.assertEqual(43, self.storage.storage.load_individual_data(['data', str(3)], 'NEW KEY'))
+
+        self.assertRaises(TypeError, self.storage.update_individual_data, 42, ['data', str(3)], {'dict_as_field': 1})
+        self.storage.update_individual_data(42, ['data', str(3000)], 'a')
+        with self.assertRaises(FlushError) as context:
+            self.storage.flush()
+        self.assertIsInstance(context.exception.errors[('data', '3000')], NodeDoesNotExistsError)
+        self.storage.delete(['data', str(3000)])
+
+
+class TestBufferedStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = StorageMemory('backend')
+        self.storage = BufferedStorage(self.backend, max_pending=3, flush_interval=None)
+
+    def tearDown(self):
+        self.storage.close()
+
+    def test_writes_are_buffered(self):
+        self.storage.save_data({'a': 1}, ['x'])
+        self.assertFalse(self.backend.tag_in_storage(['x']))
+        self.assertTrue(self.storage.tag_in_storage(['x']))
+        self.assertEqual({'a': 1}, self.storage.load_data(['x']))
+        self.assertEqual(1, self.storage.queue_depth)
+
+        self.storage.flush()
+        self.assertEqual({'a': 1}, self.backend.load_data(['x']))
+        self.assertEqual(0, self.storage.queue_depth)
+
+    def test_coalescing(self):
+        self.storage.save_data({'a': 1}, ['x'])
+        self.storage.update_individual_data(2, ['x'], 'a')
+        self.storage.update_individual_data(3, ['x'], 'a')
+        self.storage.update_individual_data(4, ['x'], 'b')
+        self.assertEqual({'a': 3, 'b': 4}, self.storage.load_data(['x']))
+        self.assertEqual(3, self.storage.load_individual_data(['x'], 'a'))
+        self.assertRaises(NoDataAtKeyError, self.storage.load_individual_data, ['x'], 'c')
+
+        with patch.object(self.backend, 'save_many', wraps=self.backend.save_many) as save_many, \
+                patch.object(self.backend, 'update_individual_data') as update_individual_data:
+            self.storage.flush()
+        save_many.assert_called_once_with([(['x'], {'a': 3, 'b': 4})])
+        update_individual_data.assert_not_called()
+        statistics = self.storage.statistics()
+        self.assertEqual(4, statistics['writes'])
+        self.assertEqual(3, statistics['coalesced_writes'])
+        self.assertEqual(1, statistics['flushed_writes'])
+
+    def test_field_updates_overlay_storage(self):
+        self.backend.save_data({'a': 1, 'b': 2}, ['x'])
+        self.storage.update_individual_data(3, ['x'], 'a')
+        self.assertEqual({'a': 3, 'b': 2}, self.storage.load_data(['x']))
+        self.assertEqual([{'a': 3, 'b': 2}, {'a': 1, 'b': 2}], [self.storage.load_many([['x']])[0],
+                                                                self.backend.load_data(['x'])])
+        self.storage.flush()
+        self.assertEqual({'a': 3, 'b': 2}, self.backend.load_data(['x']))
+
+    def test_nested_field_updates(self):
+        self.backend.save_data({'dac1': {'value': 1, 'unit': 'V'}, 'dac2': {'value': 2}}, ['x'])
+        self.storage.update_individual_data(3, ['x'], ['dac1', 'value'])
+        self.storage.update_individual_data(4, ['x'], ['dac2', 'value'])
+        self.storage.update_individual_data({'value': 5}, ['x'], 'dac2')
+        self.storage.update_individual_data(6, ['x'], ['dac2', 'value'])
+        self.assertEqual(3, self.storage.load_individual_data(['x'], ['dac1', 'value']))
+        self.assertEqual({'value': 3, 'unit': 'V'}, self.storage.load_individual_data(['x'], 'dac1'))
+        self.assertEqual(6, self.storage.load_individual_data(['x'], ['dac2', 'value']))
+        self.assertEqual({'dac1': {'value': 3, 'unit': 'V'}, 'dac2': {'value': 6}}, self.storage.load_data(['x']))
+        self.assertEqual({'dac1': {'value': 1, 'unit': 'V'}, 'dac2': {'value': 2}}, self.backend.load_data(['x']))
+
+        with patch.object(self.backend, 'update_individual_data',
+                          wraps=self.backend.update_individual_data) as update_individual_data:
+            self.storage.flush()
+        self.assertEqual(3, update_individual_data.call_count)
+        self.assertEqual({'dac1': {'value': 3, 'unit': 'V'}, 'dac2': {'value': 6}}, self.backend.load_data(['x']))
+
+    def test_save_replaces_pending_updates(self):
+        self.storage.update_individual_data(3, ['x'], 'a')
+        self.storage.save_data({'b': 1}, ['x'])
+        self.assertEqual({'b': 1}, self.storage.load_data(['x']))
+
+    def test_delete_drops_pending_writes(self):
+        self.backend.save_data(1, ['a', 'x'])
+        self.storage.save_data(2, ['a', 'y'])
+        self.storage.save_data(3, ['b'])
+        self.storage.save_data(4, ['c', 'x'])
+        with patch.object(self.backend, 'save_many', wraps=self.backend.save_many) as save_many:
+            self.storage.delete_many([['a'], ['c']])
+        save_many.assert_called_once_with([(['b'], 3)])
+        self.assertListEqual(['b'], self.backend.list_data_subtags([]))
+
+        self.storage.save_data(4, ['c', 'x'])
+        self.storage.delete(['c'])
+        self.assertFalse(self.storage.tag_in_storage(['c']))
+        self.assertRaises(NoDataAtKeyError, self.storage.delete, ['c'])
+
+        self.storage.save_data(5, ['d', 'x'])
+        self.assertRaises(NodeNotEmptyError, self.storage.delete, ['d'], recursive=False)
+        self.assertEqual(5, self.backend.load_data(['d', 'x']))
+        self.storage.save_data(6, ['d', 'y'])
+        self.storage.delete_many([['d'], ['b']])
+        self.assertListEqual([], self.backend.list_data_subtags([]))
+        self.assertEqual(0, self.storage.queue_depth)
+
+    def test_flush_on_size(self):
+        flushed = threading.Event()
+        with patch.object(self.backend, 'save_many', side_effect=lambda items: flushed.set()):
+            for index in range(3):
+                self.storage.save_data(index, [str(index)])
+            self.assertTrue(flushed.wait(5))
+
+    def test_flush_on_interval(self):
+        storage = BufferedStorage(self.backend, flush_interval=0.01)
+        storage.save_data(1, ['x'])
+        deadline = time.monotonic() + 5
+        while storage.statistics()['flushes'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(1, self.backend.load_data(['x']))
+        self.assertEqual(1, storage.statistics()['flushes'])
+        storage.close()
+
+    def test_search_flushes(self):
+        self.storage.save_data({'a': 1}, ['x'])
+        self.assertEqual([['x']], self.storage.search('a == 1'))
+
+    def test_close_flushes(self):
+        self.storage.save_data(1, ['x'])
+        self.storage.close()
+        self.assertEqual(1, self.backend.load_data(['x']))
+        self.assertFalse(self.storage._thread.is_alive())
+
+    def test_background_error_is_raised(self):
+        with patch.object(self.backend, 'save_many', side_effect=ValueError('failed')), \
+                patch.object(self.backend, 'save_data', side_effect=ValueError('failed')):
+            for index in range(3):
+                self.storage.save_data(index, [str(index)])
+            deadline = time.monotonic() + 5
+            while self.storage.statistics()['flushes'] == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        with self.assertRaisesRegex(FlushError, 'Failed to write 3 buffered tags') as context:
+            self.storage.save_data(1, ['x'])
+        self.assertIsInstance(context.exception.__cause__, ValueError)
+        self.storage.save_data(1, ['x'])
+        self.storage.flush()
+        self.assertEqual([0, 1, 2], self.backend.load_many([['0'], ['1'], ['2']]))
+
+    def test_failed_writes_are_kept(self):
+        self.backend.save_data(1, ['a'])
+        self.storage.save_data(2, ['b'])
+        self.storage.save_data(3, ['a', 'c'])
+        self.storage.update_individual_data(4, ['d'], 'x')
+        with self.assertRaises(FlushError) as context:
+            self.storage.flush()
+        self.assertEqual([('a', 'c'), ('d',)], sorted(context.exception.errors))
+        self.assertEqual(2, self.backend.load_data(['b']))
+        self.assertEqual(2, self.storage.queue_depth)
+        self.assertEqual(1, self.storage.statistics()['flushed_writes'])
+
+        self.backend.delete(['a'])
+        self.backend.save_data({'x': 0, 'y': 0}, ['d'])
+        self.storage.update_individual_data(5, ['d'], 'y')
+        self.storage.flush()
+        self.assertEqual(3, self.backend.load_data(['a', 'c']))
+        self.assertEqual({'x': 4, 'y': 5}, self.backend.load_data(['d']))
+        self.assertEqual(0, self.storage.queue_depth)
+
+    def test_failed_write_replaced_by_save(self):
+        with patch.object(self.backend, 'save_data', side_effect=ValueError('failed')), \
+                patch.object(self.backend, 'save_many', side_effect=ValueError('failed')):
+            self.storage.save_data(1, ['x'])
+            self.assertRaises(FlushError, self.storage.flush)
+        self.storage.save_data(2, ['x'])
+        self.assertEqual(1, self.storage.queue_depth)
+        self.storage.flush()
+        self.assertEqual(2, self.backend.load_data(['x']))
+
+    def test_write_after_close(self):
+        self.storage.close()
+        self.assertRaisesRegex(ValueError, 'closed', self.storage.save_data, 1, ['x'])
+        self.assertRaisesRegex(ValueError, 'closed', self.storage.update_individual_data, 1, ['x'], 'y')
+        self.assertRaisesRegex(ValueError, 'closed', self.storage.save_many, [(['x'], 1)])
+
+    def test_reads_use_snapshots_of_the_writes(self):
+        self.storage.save_data({'a': 1}, ['x'])
+        writes = self.storage._writes(['x'])
+        self.storage.update_individual_data(2, ['x'], 'b')
+        self.storage.save_data({'a': 3}, ['x'])
+        self.assertEqual({'a': 1}, writes[0].apply(None))
+        self.assertEqual({'a': 3}, self.storage.load_data(['x']))
+
+    def test_statistics(self):
+        self.storage.save_data(1, ['x'])
+        self.storage.flush()
+        statistics = self.storage.statistics()
+        self.assertEqual(0, statistics['queue_depth'])
+        self.assertEqual(1, statistics['flushes'])
+        self.assertGreaterEqual(statistics['max_flush_latency'], statistics['last_flush_latency'])
+        self.assertEqual(statistics['last_flush_latency'], statistics['mean_flush_latency'])
@@ -0,0 +1,195 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+from qilib.configuration_helper import InstrumentConfiguration
+from qilib.utils.serialization import serialize, unserialize
+from qilib.utils.storage import CachedStorage, StorageMemory, StorageMongoDb
+from qilib.utils.storage.interface import NoDataAtKeyError
+from tests.unittests.utils.storage import test_storage_memory
+
+
+class TestCachedStorageMemory(test_storage_memory.TestStorageMemory):
+    """ Runs the tests of the memory storage through the cached storage """
+
+    def setUp(self):
+        super().setUp()
+        self.storage = CachedStorage(StorageMemory('test'))
+
+
+class TestCachedStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = StorageMemory('backend')
+        self.backend.save_data({'a': 1, 'b': [1, 2]}, ['labels', 'online'])
+        self.storage = CachedStorage(self.backend, max_size=3)
+
+    def test_load_data_is_cached(self):
+        with patch.object(self.backend, 'load_data', wraps=self.backend.load_data) as load_data:
+            self.assertEqual({'a': 1, 'b': [1, 2]}, self.storage.load_data(['labels', 'online']))
+            self.assertEqual({'a': 1, 'b': [1, 2]}, self.storage.load_data(['labels', 'online']))
+        load_data.assert_called_once_with(['labels', 'online'])
+        self.assertEqual({'hits': 1, 'misses': 1, 'evictions': 0, 'invalidations': 0, 'size': 1},
+                         self.storage.statistics())
+
+    def test_cached_data_is_read_only(self):
+        self.backend.save_data({'array': np.arange(3)}, ['x'])
+        data = self.storage.load_data(['x'])
+        data['b'] = 2
+        self.assertFalse(data['array'].flags.writeable)
+        self.assertNotIn('b', self.storage.load_data(['x']))
+
+    def test_instrument_configuration_round_trip(self):
+        document = {'adapter_class_name': 'Dummy', 'address': 'dev42', 'instrument_name': 'name',
+                    'configuration': {'power': 'MAX', 'gates': {'P1': [0.1, 0.2]}, 'trace': np.arange(3)}}
+        self.backend.save_data(document, ['configuration', 'Dummy', '1'])
+        with patch('qilib.configuration_helper.instrument_configuration.InstrumentAdapterFactory'):
+            configuration = InstrumentConfiguration.load(['configuration', 'Dummy', '1'], self.storage)
+            self.assertIsInstance(configuration.configuration, dict)
+            configuration.configuration['gates']['P1'].append(0.3)
+            stored = InstrumentConfiguration('Dummy', 'dev42', self.storage, ['configuration', 'Dummy', '2'],
+                                             configuration.configuration, 'name')
+            stored.store()
+
+        self.assertEqual({'P1': [0.1, 0.2]}, self.storage.load_data(['configuration', 'Dummy', '1'])['configuration']
+                         ['gates'])
+        loaded = self.backend.load_data(['configuration', 'Dummy', '2'])['configuration']
+        self.assertEqual({'P1': [0.1, 0.2, 0.3]}, loaded['gates'])
+        np.testing.assert_array_equal(np.arange(3), loaded['trace'])
+        self.assertEqual({'P1': [0.1, 0.2, 0.3]}, unserialize(serialize(loaded))['gates'])
+
+    def test_load_individual_data_is_cached_per_field(self):
+        with patch.object(self.backend, 'load_individual_data',
+                          wraps=self.backend.load_individual_data) as load_individual_data:
+            self.assertEqual(1, self.storage.load_individual_data(['labels', 'online'], 'a'))
+            self.assertEqual(1, self.storage.load_individual_data(['labels', 'online'], 'a'))
+            self.assertEqual([1, 2], self.storage.load_individual_data(['labels', 'online'], 'b'))
+        self.assertEqual(2, load_individual_data.call_count)
+
+    def test_update_invalidates_field(self):
+        self.storage.load_data(['labels', 'online'])
+        self.storage.load_individual_data(['labels', 'online'], 'a')
+        self.storage.load_individual_data(['labels', 'online'], 'b')
+        self.storage.update_individual_data(2, ['labels', 'online'], 'a')
+        self.assertEqual(1, len(self.storage))
+        self.assertEqual(2, self.storage.load_individual_data(['labels', 'online'], 'a'))
+        self.assertEqual({'a': 2, 'b': [1, 2]}, self.storage.load_data(['labels', 'online']))
+
+    def test_update_invalidates_nested_fields(self):
+        self.backend.save_data({'dac1': {'value': 1, 'unit': 'V'}, 'dac2': {'value': 2}}, ['x'])
+        self.storage.load_individual_data(['x'], 'dac1')
+        self.storage.load_individual_data(['x'], ['dac1', 'unit'])
+        self.storage.load_individual_data(['x'], ['dac2', 'value'])
+        self.storage.update_individual_data(3, ['x'], ['dac1', 'value'])
+        self.assertEqual(2, len(self.storage))
+        self.assertEqual({'value': 3, 'unit': 'V'}, self.storage.load_individual_data(['x'], 'dac1'))
+        self.storage.update_individual_data({'value': 4}, ['x'], 'dac2')
+        self.assertEqual(4, self.storage.load_individual_data(['x'], ['dac2', 'value']))
+
+    def test_save_invalidates_leaf(self):
+        self.storage.load_data(['labels', 'online'])
+        self.storage.load_individual_data(['labels', 'online'], 'a')
+        self.storage.save_data({'a': 3}, ['labels', 'online'])
+        self.assertEqual(0, len(self.storage))
+        self.assertEqual(3, self.storage.load_individual_data(['labels', 'online'], 'a'))
+        self.storage.save_many([(['labels', 'online'], {'a': 4})])
+        self.assertEqual(4, self.storage.load_individual_data(['labels', 'online'], 'a'))
+
+    def test_delete_invalidates_subtree(self):
+        self.backend.save_data({'a': 2}, ['labels', 'offline'])
+        self.backend.save_data({'a': 3}, ['other'])
+        self.storage.load_data(['labels', 'online'])
+        self.storage.load_individual_data(['labels', 'offline'], 'a')
+        self.storage.load_data(['other'])
+        self.storage.delete(['labels'])
+        self.assertEqual(1, len(self.storage))
+        self.assertRaises(NoDataAtKeyError, self.storage.load_data, ['labels', 'online'])
+        self.assertRaises(NoDataAtKeyError, self.storage.load_individual_data, ['labels', 'offline'], 'a')
+        self.storage.delete_many([['other']])
+        self.assertEqual(0, len(self.storage))
+        self.assertFalse(self.backend.tag_in_storage(['other']))
+
+    def test_load_many(self):
+        self.backend.save_data(2, ['x'])
+        self.storage.load_data(['x'])
+        with patch.object(self.backend, 'load_many', wraps=self.backend.load_many) as load_many:
+            self.assertEqual([2, {'a': 1, 'b': [1, 2]}], self.storage.load_many([['x'], ['labels', 'online']]))
+        load_many.assert_called_once_with([['labels', 'online']])
+        self.assertRaises(NoDataAtKeyError, self.storage.load_many, [['y']])
+
+    def test_lru_eviction(self):
+        for index in range(4):
+            self.backend.save_data(index, [str(index)])
+            self.storage.load_data([str(index)])
+        self.storage.load_data(['1'])
+        self.storage.load_data(['0'])
+        self.assertEqual(3, len(self.storage))
+        self.assertEqual(2, self.storage.statistics()['evictions'])
+        self.assertEqual(1, self.storage.statistics()['hits'])
+
+    def test_ttl(self):
+        storage = CachedStorage(self.backend, ttl=0.01)
+        storage.load_data(['labels', 'online'])
+        self.backend.save_data('changed', ['labels', 'online'])
+        self.assertEqual({'a': 1, 'b': [1, 2]}, storage.load_data(['labels', 'online']))
+        time.sleep(0.02)
+        self.assertEqual('changed', storage.load_data(['labels', 'online']))
+
+    def test_disabled(self):
+        storage = CachedStorage(self.backend, max_size=0)
+        storage.load_data(['labels', 'online'])
+        self.assertEqual(0, len(storage))
+
+    def test_invalidate_during_load(self):
+        def load_data(tag):
+            self.storage.invalidate(tag)
+            return 'outdated'
+
+        with patch.object(self.backend, 'load_data', side_effect=load_data):
+            self.assertEqual('outdated', self.storage.load_data(['labels', 'online']))
+        self.assertEqual(0, len(self.storage))
+
+    def test_invalidate_all(self):
+        self.storage.load_data(['labels', 'online'])
+        self.storage.load_individual_data(['labels', 'online'], 'a')
+        self.storage.invalidate()
+        self.assertEqual(0, len(self.storage))
+        self.assertEqual(2, self.storage.statistics()['invalidations'])
+
+    def test_watch_changes_requires_mongo(self):
+        self.assertRaises(TypeError, CachedStorage, self.backend, watch_changes=True)
+
+    def test_watch_changes(self):
+        changes = threading.Event()
+        backend = MagicMock(spec=StorageMongoDb)
+        backend.name = 'mongo'
+        backend.load_data.return_value = 1
+
+        def watch_changes(stop):
+            changes.wait()
+            yield ['a']
+            yield None
+            stop.wait()
+
+        backend.watch_changes.side_effect = watch_changes
+        storage = CachedStorage(backend, watch_changes=True)
+        storage.load_data(['a'])
+        storage.load_data(['b'])
+        changes.set()
+        deadline = time.monotonic() + 5
+        while len(storage) > 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(2, storage.statistics()['invalidations'])
+        storage.close()
+        self.assertFalse(storage._watcher.is_alive())
+
+    def test_watch_changes_of_any_storage(self):
+        backend = MagicMock(spec=['name', 'watch_changes'])
+        backend.name = 'watched'
+        backend.watch_changes.return_value = iter([])
+        storage = CachedStorage(backend, watch_changes=True)
+        storage.close()
+        backend.watch_changes.assert_called_once_with(storage._stop)
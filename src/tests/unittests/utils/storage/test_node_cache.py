@@ -0,0 +1,54 @@
+import unittest
+
+from qilib.utils.storage.node_cache import NodeCache
+
+
+class TestNodeCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = NodeCache(max_size=3)
+
+    def test_get_counts_hits_and_misses(self):
+        self.assertIsNone(self.cache.get(['a']))
+        self.cache.put(['a'], 1)
+        self.assertEqual(self.cache.get(['a']), 1)
+        self.assertEqual(self.cache.statistics(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_longest_prefix(self):
+        self.cache.put([], 0)
+        self.cache.put(['a'], 1)
+        self.cache.put(['a', 'b'], 2)
+        self.assertEqual(self.cache.longest_prefix(['a', 'b', 'c']), (2, 2))
+        self.assertEqual(self.cache.longest_prefix(['a', 'x']), (1, 1))
+        self.assertEqual(self.cache.longest_prefix(['x']), (0, 0))
+        self.assertEqual(NodeCache().longest_prefix(['x']), (0, None))
+
+    def test_lru_eviction(self):
+        self.cache.put(['a'], 1)
+        self.cache.put(['b'], 2)
+        self.cache.put(['c'], 3)
+        self.cache.get(['a'])
+        self.cache.put(['d'], 4)
+        self.assertEqual(len(self.cache), 3)
+        self.assertIsNone(self.cache.get(['b']))
+        self.assertEqual(self.cache.get(['a']), 1)
+
+    def test_invalidate_subtree(self):
+        self.cache.put(['a'], 1)
+        self.cache.put(['a', 'b'], 2)
+        self.cache.put(['ab'], 3)
+        self.cache.invalidate(['a'])
+        self.assertIsNone(self.cache.get(['a']))
+        self.assertIsNone(self.cache.get(['a', 'b']))
+        self.assertEqual(self.cache.get(['ab']), 3)
+
+    def test_disabled(self):
+        cache = NodeCache(max_size=0)
+        cache.put(['a'], 1)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.max_size, 0)
+
+    def test_clear(self):
+        self.cache.put(['a'], 1)
+        self.cache.get(['a'])
+        self.cache.clear()
+        self.assertEqual(self.cache.statistics(), {'hits': 0, 'misses': 0, 'size': 0})
@@ -0,0 +1,94 @@
+import unittest
+from unittest.mock import patch
+
+from qilib.utils.storage.interface import InvalidQueryError
+from qilib.utils.storage.query import QueryCondition, SearchIndex, parse_query
+
+
+class TestParseQuery(unittest.TestCase):
+    def test_parse_query(self):
+        conditions = parse_query("tag[2] >= '2019-02-18' and configuration.dac1.value != -1.5 and "
+                                 "adapter_class_name == \"M4iInstrumentAdapter\" and enabled == true and x < 3")
+        self.assertListEqual(conditions, [QueryCondition('>=', '2019-02-18', tag_index=2),
+                                          QueryCondition('!=', -1.5, field_path=('configuration', 'dac1', 'value')),
+                                          QueryCondition('==', 'M4iInstrumentAdapter',
+                                                         field_path=('adapter_class_name',)),
+                                          QueryCondition('==', True, field_path=('enabled',)),
+                                          QueryCondition('<', 3, field_path=('x',))])
+        self.assertEqual(repr(conditions[0]), "QueryCondition(tag[2] >= '2019-02-18')")
+
+    def test_parse_query_invalid(self):
+        for query in ['', 'x ==', 'x == 1 and', 'x == 1 or y == 2', 'x 1 2', '1 == 1', 'x == y', 'x == 1 y', '$ == 1',
+                      'null == 1']:
+            with self.subTest(query=query):
+                self.assertRaises(InvalidQueryError, parse_query, query)
+
+    def test_unknown_operator(self):
+        self.assertRaises(InvalidQueryError, QueryCondition, '=~', 1, tag_index=0)
+
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.add(['configuration', 'M4i', '2019-02-18T10:00'], {'adapter': 'M4i', 'settings': {'gain': 2}})
+        self.index.add(['configuration', 'M4i', '2019-02-18T12:00'], {'adapter': 'M4i', 'settings': {'gain': 4}})
+        self.index.add(['configuration', 'D5a', '2019-02-18T11:00'], {'adapter': 'D5a', 'on': True, 'x': None})
+        self.index.add(['labels', 'online'], [1, 2])
+
+    def search(self, query):
+        return self.index.search(parse_query(query))
+
+    def test_equality(self):
+        self.assertListEqual(self.search("adapter == 'M4i'"), [['configuration', 'M4i', '2019-02-18T12:00'],
+                                                               ['configuration', 'M4i', '2019-02-18T10:00']])
+        self.assertListEqual(self.search("tag[1] == 'online'"), [['labels', 'online']])
+        self.assertListEqual(self.search('on == true'), [['configuration', 'D5a', '2019-02-18T11:00']])
+        self.assertListEqual(self.search('on == 1'), [])
+        self.assertListEqual(self.search('x == null'), [['configuration', 'D5a', '2019-02-18T11:00']])
+
+    def test_range(self):
+        self.assertListEqual(self.search("tag[2] >= '2019-02-18T11:00' and tag[2] < '2019-02-18T12:00'"),
+                             [['configuration', 'D5a', '2019-02-18T11:00']])
+        self.assertListEqual(self.search('settings.gain > 2'), [['configuration', 'M4i', '2019-02-18T12:00']])
+        self.assertListEqual(self.search('settings.gain <= 4 and settings.gain >= 2.0'),
+                             [['configuration', 'M4i', '2019-02-18T12:00'],
+                              ['configuration', 'M4i', '2019-02-18T10:00']])
+        self.assertListEqual(self.search("settings.gain > '1'"), [])
+        self.assertListEqual(self.search('on < true'), [])
+
+    def test_not_equal(self):
+        self.assertListEqual(self.search("adapter != 'M4i'"), [['configuration', 'D5a', '2019-02-18T11:00']])
+        self.assertListEqual(self.search("tag[2] != 'x' and tag[0] == 'labels'"), [])
+
+    def test_replace_and_remove(self):
+        self.index.add(['configuration', 'M4i', '2019-02-18T12:00'], {'adapter': 'M4a'})
+        self.assertEqual(len(self.search("adapter == 'M4i'")), 1)
+        self.assertEqual(len(self.search('settings.gain >= 4')), 0)
+        self.index.remove(['configuration', 'M4i', '2019-02-18T10:00'])
+        self.assertListEqual(self.search("adapter == 'M4i'"), [])
+        self.assertEqual(len(self.index), 3)
+
+    def test_update_field(self):
+        tag = ['configuration', 'M4i', '2019-02-18T10:00']
+        data = {'adapter': 'M4i', 'settings': {'gain': 8, 'offset': {'x': 1}}}
+        with patch.object(self.index, 'add') as add:
+            self.index.update_field(tag, ['settings', 'gain'], data)
+            self.index.update_field(tag, ['settings', 'offset'], data)
+        add.assert_not_called()
+        self.assertListEqual(self.search('settings.gain == 8'), [tag])
+        self.assertListEqual(self.search('settings.gain == 2'), [])
+        self.assertListEqual(self.search('settings.offset.x == 1'), [tag])
+        self.assertListEqual(self.search("adapter == 'M4i' and tag[2] < '2019-02-18T11:00'"), [tag])
+
+        self.index.update_field(tag, ['settings'], {'adapter': 'M4i', 'settings': 3})
+        self.assertListEqual(self.search('settings.offset.x == 1'), [])
+        self.assertListEqual(self.search('settings == 3'), [tag])
+        self.index.update_field(tag, ['settings', 'gain'], {'adapter': 'M4i', 'settings': {'gain': 5}})
+        self.assertListEqual(self.search('settings == 3'), [])
+        self.assertListEqual(self.search('settings.gain == 5'), [tag])
+
+    def test_update_field_in_list(self):
+        tag = ['labels', 'online']
+        self.index.update_field(tag, [0], [{'a': 1}, 2])
+        self.assertListEqual(self.search('a == 1'), [])
+        self.assertListEqual(self.search("tag[1] == 'online'"), [tag])
@@ -0,0 +1,36 @@
+import io
+import unittest
+
+import numpy as np
+
+from qilib.utils.storage import StorageMemory, dump_records, load_records
+
+
+class TestRecords(unittest.TestCase):
+
+    def test_dump_load_records(self):
+        records = [{'tag': ['a', '1'], 'data': {'array': np.arange(3), 'text': 'line\nbreak'}},
+                   {'tag': ['b'], 'data': (1, 2)}]
+        stream = io.StringIO()
+        self.assertEqual(2, dump_records(iter(records), stream))
+        self.assertEqual(2, stream.getvalue().count('\n'))
+
+        stream.seek(0)
+        loaded = list(load_records(stream))
+        self.assertEqual(['a', '1'], loaded[0]['tag'])
+        np.testing.assert_array_equal(np.arange(3), loaded[0]['data']['array'])
+        self.assertEqual('line\nbreak', loaded[0]['data']['text'])
+        self.assertEqual({'tag': ['b'], 'data': (1, 2)}, loaded[1])
+
+    def test_round_trip_storage(self):
+        source = StorageMemory('source')
+        for index in range(10):
+            source.save_data({'index': index}, ['calibration', f'{index:02d}'])
+        stream = io.StringIO()
+        dump_records(source.export_subtree(['calibration']), stream)
+
+        stream.seek(0)
+        target = StorageMemory('target')
+        self.assertEqual(10, target.import_subtree(load_records(stream), ['imported']))
+        self.assertEqual({'index': 3}, target.load_data(['imported', '03']))
+        self.assertEqual(10, len(target.list_data_subtags(['imported'])))
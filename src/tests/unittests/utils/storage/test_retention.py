@@ -0,0 +1,21 @@
+import unittest
+from datetime import datetime, timedelta
+
+from qilib.utils.storage import RetentionPolicy
+
+
+class TestRetentionPolicy(unittest.TestCase):
+
+    def test_cutoff(self):
+        now = datetime(2019, 2, 18, 12)
+        self.assertIsNone(RetentionPolicy(keep_last=3).cutoff(now))
+        self.assertEqual('2019-02-18', RetentionPolicy(newer_than='2019-02-18').cutoff(now))
+        self.assertEqual('2019-02-17T09:00:00', RetentionPolicy(newer_than=datetime(2019, 2, 17, 9)).cutoff(now))
+        self.assertEqual('2019-02-11T12:00:00', RetentionPolicy(newer_than=timedelta(days=7)).cutoff(now))
+        self.assertLess(RetentionPolicy(newer_than=timedelta(days=7)).cutoff(), datetime.now().isoformat())
+
+    def test_invalid_keep_last(self):
+        self.assertRaises(ValueError, RetentionPolicy, keep_last=-1)
+
+    def test_repr(self):
+        self.assertEqual("RetentionPolicy(keep_last=2, newer_than='2019')", repr(RetentionPolicy(2, '2019')))
@@ -0,0 +1,129 @@
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+import numpy as np
+
+from qilib.utils.storage import StorageFile
+from qilib.utils.storage.interface import NoDataAtKeyError, NodeAlreadyExistsError
+from tests.unittests.utils.storage import test_storage_memory
+
+
+class TestStorageFile(test_storage_memory.TestStorageMemory):
+    """ Runs the tests of the memory storage against the file storage """
+
+    def setUp(self):
+        super().setUp()
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.storage = StorageFile('test', self.temporary_directory.name, memmap_threshold=64)
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_load_data_from_subtag(self):
+        for ii in range(4):
+            self.storage.save_data(ii, ['s', f's{ii}'])
+        self.assertEqual(list(self.storage.load_data_from_subtag(['s'])), [3, 2, 1, 0])
+
+    def test_copy_on_write(self):
+        array = np.arange(100)
+        self.storage.save_data({'array': array, 'small': np.arange(3)}, ['data'])
+
+        data = self.storage.load_data(['data'])
+        self.assertIsInstance(data['array'], np.memmap)
+        self.assertFalse(data['array'].flags.writeable)
+        np.testing.assert_array_equal(array, data['array'])
+        self.assertNotIsInstance(data['small'], np.memmap)
+        np.testing.assert_array_equal(np.arange(3), data['small'])
+
+    def test_save_loaded_memmap(self):
+        self.storage.save_data({'array': np.arange(100), 'offset': 0}, ['data'])
+        data = self.storage.load_data(['data'])
+        self.assertIsInstance(data['array'], np.memmap)
+
+        data['offset'] = 1
+        data['slice'] = data['array'][:3]
+        self.storage.save_data(data, ['data'])
+        self.storage.update_individual_data(2, ['data'], 'offset')
+        self.storage.update_individual_data(self.storage.load_data(['data'])['array'][1:4], ['data'], 'small')
+
+        loaded = self.storage.load_data(['data'])
+        np.testing.assert_array_equal(np.arange(100), loaded['array'])
+        np.testing.assert_array_equal(np.arange(3), loaded['slice'])
+        np.testing.assert_array_equal(np.arange(1, 4), loaded['small'])
+        self.assertEqual(2, loaded['offset'])
+
+    def test_persistence(self):
+        self.storage.save_data({1: 'integer key', 'a.b': (1, np.arange(20)), 'nested': {'c': [None, True]}},
+                               ['a', '2019-01-01T10:00:00.000'])
+        storage = StorageFile('other', self.temporary_directory.name)
+        data = storage.load_data(['a', '2019-01-01T10:00:00.000'])
+        self.assertEqual('integer key', data[1])
+        np.testing.assert_array_equal(np.arange(20), data['a.b'][1])
+        self.assertEqual({'c': [None, True]}, data['nested'])
+        self.assertEqual(['a', '2019-01-01T10:00:00.000'], storage.get_latest_subtag(['a']))
+
+    def test_tag_names(self):
+        tags = [['', 'a'], ['.', '..'], ['x/y', 'p%q'], ['a.json', 'b'], ['a', 'b.0.npy']]
+        for index, tag in enumerate(tags):
+            self.storage.save_data(index, tag)
+        for index, tag in enumerate(tags):
+            self.assertEqual(index, self.storage.load_data(tag))
+        self.assertEqual(['x/y', 'a.json', 'a', '.', ''], self.storage.list_data_subtags([]))
+        self.assertEqual(sorted(os.listdir(self.temporary_directory.name)), ['%', '%2E', 'a', 'a%2Ejson', 'x%2Fy'])
+
+    def test_overwrite_removes_arrays(self):
+        self.storage.save_data([np.arange(20), np.arange(30)], ['data'])
+        old_files = self.storage._array_files(['data'])
+        self.storage.save_data([np.arange(40)], ['data'])
+        np.testing.assert_array_equal(np.arange(40), self.storage.load_data(['data'])[0])
+        new_files = self.storage._array_files(['data'])
+        self.assertEqual((2, 1), (len(old_files), len(new_files)))
+        self.assertEqual(sorted(new_files + ['data.json']), sorted(os.listdir(self.temporary_directory.name)))
+        self.storage.delete(['data'])
+        self.assertEqual([], os.listdir(self.temporary_directory.name))
+
+    def test_arrays_of_old_leaf_are_kept_until_replaced(self):
+        self.storage.save_data([np.arange(20)], ['data'])
+        old_leaf = self.storage._read_leaf(['data'], insert_arrays=False)
+        self.storage.save_data([np.arange(30)], ['data'])
+        new_leaf = self.storage._read_leaf(['data'], insert_arrays=False)
+        self.assertNotEqual(old_leaf, new_leaf)
+        np.testing.assert_array_equal(np.arange(30), self.storage._insert_arrays(new_leaf, ['data'])[0])
+        self.assertRaises(FileNotFoundError, self.storage._insert_arrays, old_leaf, ['data'])
+
+    def test_load_retries_replaced_arrays(self):
+        self.storage.save_data([np.arange(20)], ['data'])
+        load = json.load
+        rewritten = []
+
+        def load_then_rewrite(file):
+            encoded = load(file)
+            if not rewritten:
+                rewritten.append(True)
+                self.storage.save_data([np.arange(30)], ['data'])
+            return encoded
+
+        with patch('json.load', side_effect=load_then_rewrite):
+            np.testing.assert_array_equal(np.arange(30), self.storage.load_data(['data'])[0])
+
+    def test_index_references(self):
+        np.save(os.path.join(self.temporary_directory.name, 'data.0.npy'), np.arange(20))
+        with open(os.path.join(self.temporary_directory.name, 'data.json'), 'w') as file:
+            file.write('[{"__npy_file__": 0}]')
+        np.testing.assert_array_equal(np.arange(20), self.storage.load_data(['data'])[0])
+        self.storage.save_data([np.arange(30)], ['data'])
+        self.assertNotIn('data.0.npy', os.listdir(self.temporary_directory.name))
+
+    def test_errors(self):
+        self.storage.save_data(1, ['a', 'b'])
+        self.assertRaisesRegex(NodeAlreadyExistsError, 'Tag "b" is a leaf', self.storage.save_data, 2,
+                               ['a', 'b', 'c'])
+        self.assertRaisesRegex(NodeAlreadyExistsError, 'Tag "a" is not a leaf', self.storage.save_data, 2, ['a'])
+        self.assertRaisesRegex(NodeAlreadyExistsError, 'Tag "a" is not a leaf',
+                               self.storage.update_individual_data, 2, ['a'], 'field')
+        self.assertRaisesRegex(NoDataAtKeyError, 'Tag "a" is not a leaf', self.storage.load_data, ['a'])
+        self.assertRaisesRegex(NoDataAtKeyError, 'The field "c" does not exists',
+                               self.storage.load_individual_data, ['a', 'b'], 'c')
+        self.assertRaises(NodeAlreadyExistsError, self.storage.save_data, 1, [])
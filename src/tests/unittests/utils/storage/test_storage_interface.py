@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, call, patch
 
 from qilib.utils.storage.interface import StorageInterface, _LazySequence
 
@@ -31,7 +31,32 @@ class TestStorage(unittest.TestCase):
             storage_interface.list_data_subtags(None)
             storage_interface.load_individual_data(None, None)
             storage_interface.update_individual_data(None, None, None)
-            self.assertRaises(NotImplementedError, storage_interface.search, None)
+            storage_interface.search(None)
+
+    def test_delete_default(self):
+        self.assertNotIn('delete', StorageInterface.__abstractmethods__)
+        with patch.multiple(StorageInterface, __abstractmethods__=set()):
+            storage_interface = StorageInterface('test_abc')
+            self.assertRaisesRegex(NotImplementedError, 'StorageInterface does not support deletes',
+                                   storage_interface.delete, ['a'])
+
+    def test_save_many_load_many_defaults(self):
+        with patch.multiple(StorageInterface, __abstractmethods__=set()):
+            storage_interface = StorageInterface('test_abc')
+            with patch.object(storage_interface, 'save_data') as save_data, \
+                    patch.object(storage_interface, 'tag_in_storage', side_effect=[True, False]):
+                storage_interface.save_many([(['a'], 1), (['b'], 2)], overwrite=False)
+            save_data.assert_called_once_with(2, ['b'])
+            with patch.object(storage_interface, 'load_data', side_effect=lambda tag: tag[0]):
+                self.assertListEqual(storage_interface.load_many([['a'], ['b']]), ['a', 'b'])
+
+    def test_delete_many_default(self):
+        with patch.multiple(StorageInterface, __abstractmethods__=set()):
+            storage_interface = StorageInterface('test_abc')
+            with patch.object(storage_interface, 'delete') as delete, \
+                    patch.object(storage_interface, 'tag_in_storage', side_effect=[False, True]):
+                storage_interface.delete_many([['a'], ['b']], recursive=False)
+            delete.assert_called_once_with(['b'], False)
 
     def test_LazySequence(self):
         getter = lambda i: i
@@ -39,3 +64,26 @@ class TestStorage(unittest.TestCase):
         self.assertEqual(lazy_list[2], 2)
         self.assertEqual(list(lazy_list[6:]), [6,7,8,9])
         self.assertIn('length 10', repr(lazy_list) )
+
+    def test_LazySequence_pages(self):
+        getter = MagicMock(side_effect=lambda i: i)
+        page_getter = MagicMock(side_effect=lambda start, stop: list(range(start, stop)))
+        lazy_list = _LazySequence(10, getter, page_getter, page_size=4)
+        self.assertEqual(lazy_list[2], 2)
+        page_getter.assert_called_once_with(2, 6)
+        self.assertEqual(lazy_list[-1], 9)
+        self.assertEqual(list(lazy_list), list(range(10)))
+        self.assertListEqual(page_getter.call_args_list, [call(2, 6), call(9, 10), call(0, 2), call(6, 9)])
+        getter.assert_not_called()
+        self.assertRaises(IndexError, lazy_list.__getitem__, 10)
+        self.assertRaises(IndexError, lazy_list.__getitem__, -11)
+
+    def test_load_data_from_subtag(self):
+        with patch.multiple(StorageInterface, __abstractmethods__=set()):
+            storage_interface = StorageInterface('test_abc')
+            with patch.object(storage_interface, 'list_data_subtags', return_value=['c', 'b', 'a']), \
+                    patch.object(storage_interface, 'load_many', side_effect=lambda tags: tags) as load_many:
+                results = storage_interface.load_data_from_subtag(['x'], page_size=2)
+                self.assertListEqual(list(results[1:]), [['x', 'b'], ['x', 'a']])
+                self.assertListEqual(list(results), [['x', 'c'], ['x', 'b'], ['x', 'a']])
+            self.assertListEqual(load_many.call_args_list, [call([['x', 'b'], ['x', 'a']]), call([['x', 'c']])])
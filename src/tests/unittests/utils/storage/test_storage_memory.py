@@ -2,8 +2,13 @@ import datetime
 import unittest
 import numpy as np
 
-from qilib.utils.storage.interface import NoDataAtKeyError, NodeAlreadyExistsError, NodeDoesNotExistsError
+from qilib.utils import PythonJsonStructure
+from qilib.utils.metrics import StorageMetrics
+from qilib.utils.serialization import serialize, unserialize
+from qilib.utils.storage.interface import (InvalidQueryError, NoDataAtKeyError, NodeAlreadyExistsError,
+                                           NodeDoesNotExistsError, NodeNotEmptyError)
 from qilib.utils.storage.memory import StorageMemory
+from qilib.utils.storage.retention import RetentionPolicy
 
 
 class TestStorageMemory(unittest.TestCase):
@@ -28,7 +33,31 @@ class TestStorageMemory(unittest.TestCase):
         self.assertRaises(TypeError, self.storage.load_data, '/str/tag/')
 
     def test_search(self):
-        self.assertRaises(NotImplementedError, self.storage.search, None)
+        self.storage.save_data({'adapter': 'M4i', 'gain': 2}, ['configuration', 'M4i', '2019-02-18T10:00'])
+        self.storage.save_data({'adapter': 'M4i', 'gain': 4}, ['configuration', 'M4i', '2019-02-18T12:00'])
+        self.storage.save_many([(['configuration', 'D5a', '2019-02-18T11:00'], {'adapter': 'D5a'})])
+        results = self.storage.search("adapter == 'M4i' and tag[2] >= '2019-02-18T11:00'")
+        self.assertListEqual(results, [['configuration', 'M4i', '2019-02-18T12:00']])
+
+        self.storage.update_individual_data(5, ['configuration', 'M4i', '2019-02-18T10:00'], 'gain')
+        results = self.storage.search('gain > 3')
+        self.assertListEqual(results, [['configuration', 'M4i', '2019-02-18T12:00'],
+                                       ['configuration', 'M4i', '2019-02-18T10:00']])
+        self.assertRaises(InvalidQueryError, self.storage.search, 'gain >')
+
+    def test_search_index_is_built_on_first_search(self):
+        storage = StorageMemory('lazy_index')
+        storage.save_data({'gain': 2}, ['a', '1'])
+        storage.save_many([(['a', '2'], {'gain': 4})])
+        storage.update_individual_data(6, ['a', '1'], 'gain')
+        storage.save_data({'gain': 8}, ['b'])
+        storage.delete(['b'])
+        self.assertIsNone(storage._search_index)
+        self.assertListEqual([['a', '2'], ['a', '1']], storage.search('gain > 3'))
+
+        storage.save_data({'gain': 1}, ['a', '2'])
+        storage.save_data({'gain': 5}, ['c'])
+        self.assertListEqual([['c'], ['a', '1']], storage.search('gain > 3'))
 
     def test_datetag_implicit(self):
         t = self.storage.datetag_part()
@@ -68,12 +97,24 @@ class TestStorageMemory(unittest.TestCase):
     def test_list_subtags_limit(self):
         self.storage.save_data('1', ['a', '1'])
         self.storage.save_data('1', ['a', '2'])
+        self.storage.save_data('1', ['a', '0'])
         tags = self.storage.list_data_subtags(['a'], limit=0)
-        self.assertEqual(tags, ['1', '2'])
+        self.assertEqual(tags, ['2', '1', '0'])
         tags = self.storage.list_data_subtags(['a'], limit=1)
-        self.assertEqual(tags, ['1'])
+        self.assertEqual(tags, ['2'])
+        tags = self.storage.list_data_subtags(['a'], limit=2)
+        self.assertEqual(tags, ['2', '1'])
+        tags = self.storage.list_data_subtags(['a'], limit=5)
+        self.assertEqual(tags, ['2', '1', '0'])
+
+    def test_list_subtags_sorted(self):
+        for subtag in ['2019-01-02', '2019-01-04', '2019-01-01', '2019-01-03', '2019-01-02']:
+            self.storage.save_data(subtag, ['a', subtag])
+        self.assertEqual(['2019-01-04', '2019-01-03', '2019-01-02', '2019-01-01'],
+                         self.storage.list_data_subtags(['a']))
+        self.assertEqual(['a', '2019-01-04'], self.storage.get_latest_subtag(['a']))
+        self.assertEqual(['a'], self.storage.list_data_subtags([]))
 
-    def test_save_load(self):
         storage = self.storage
         storage.save_data((1, 2), ['aap'])
         self.assertRaises(NodeAlreadyExistsError, storage.save_data, 'x', ['aap', 'noot'])
@@ -163,5 +204,192 @@ class TestStorageMemory(unittest.TestCase):
         storage_interface = StorageMemory('test')
         for ii in range(4):
             storage_interface.save_data(ii, ['s', f's{ii}'])        
-        self.assertEqual(list(storage_interface.load_data_from_subtag(['s'])), [0,1,2,3])
-        
\ No newline at end of file
+        self.assertEqual(list(storage_interface.load_data_from_subtag(['s'])), [3, 2, 1, 0])
+        
+
+    def test_save_many_load_many(self):
+        self.storage.save_many([(['a', '1'], 1), (['a', '2'], {'b': 2}), (['c'], 'c')])
+        self.assertListEqual(self.storage.load_many([['c'], ['a', '2'], ['a', '1']]), ['c', {'b': 2}, 1])
+        self.assertRaises(NoDataAtKeyError, self.storage.load_many, [['c'], ['d']])
+
+    def test_save_many_overwrite(self):
+        self.storage.save_data(1, ['a'])
+        self.storage.save_many([(['a'], 2), (['b'], 2)], overwrite=False)
+        self.assertListEqual(self.storage.load_many([['a'], ['b']]), [1, 2])
+        self.storage.save_many([(['a'], 3)])
+        self.assertEqual(self.storage.load_data(['a']), 3)
+
+    def test_copy_on_write(self):
+        storage = StorageMemory('test', copy_on_write=True)
+        storage.save_data({'array': np.arange(3), 'nested': {'a': 1}}, ['data'])
+
+        data = storage.load_data(['data'])
+        data['nested']['a'] = 2
+        self.assertFalse(data['array'].flags.writeable)
+        self.assertEqual(1, storage.load_individual_data(['data'], 'nested')['a'])
+        self.assertEqual({'a': 1}, storage.load_many([['data']])[0]['nested'])
+
+        loaded = storage.load_data(['data'])
+        storage.update_individual_data(3, ['data'], 'b')
+        storage.update_individual_data(4, ['data'], ['nested', 'a'])
+        self.assertNotIn('b', data)
+        self.assertEqual(1, loaded['nested']['a'])
+        self.assertEqual(4, storage.load_individual_data(['data'], ['nested', 'a']))
+        self.assertEqual(3, storage.load_data(['data'])['b'])
+        self.assertEqual([['data']], storage.search('b == 3'))
+
+        loaded = storage.load_data(['data'])
+        self.assertIsInstance(loaded, dict)
+        self.assertEqual({'a': 4}, unserialize(serialize(loaded))['nested'])
+        self.assertEqual({'a': 4}, PythonJsonStructure(loaded=loaded)['loaded']['nested'])
+
+    def test_export_import_subtree(self):
+        self.storage.save_many([(['calibration', 'qubit', '1'], {'f': 1.5}), (['calibration', 'qubit', '2'], [1, 2]),
+                                (['calibration', 'resonator', 'r'], 'r'), (['calibration', 'leaf'], 3),
+                                (['other'], 4)])
+        records = list(self.storage.export_subtree(['calibration'], batch_size=2))
+        self.assertCountEqual([(['qubit', '1'], {'f': 1.5}), (['qubit', '2'], [1, 2]), (['resonator', 'r'], 'r'),
+                               (['leaf'], 3)], [(record['tag'], record['data']) for record in records])
+        self.assertListEqual([{'tag': [], 'data': 3}], list(self.storage.export_subtree(['calibration', 'leaf'])))
+        self.assertListEqual([], list(self.storage.export_subtree(['nosuchtag'])))
+        self.assertEqual(5, len(list(self.storage.export_subtree([]))))
+
+        self.assertEqual(4, self.storage.import_subtree(records, ['copy'], batch_size=3))
+        self.assertListEqual(['resonator', 'qubit', 'leaf'], self.storage.list_data_subtags(['copy']))
+        self.assertEqual({'f': 1.5}, self.storage.load_data(['copy', 'qubit', '1']))
+        self.assertEqual('r', self.storage.load_data(['copy', 'resonator', 'r']))
+
+        self.storage.import_subtree([{'tag': ['copy', 'leaf'], 'data': 5}, {'tag': ['new'], 'data': 6}],
+                                    overwrite=False)
+        self.assertEqual(3, self.storage.load_data(['copy', 'leaf']))
+        self.assertEqual(6, self.storage.load_data(['new']))
+
+    def test_list_subtags_range(self):
+        subtags = [f'2019-02-18T{hour:02d}:00:00' for hour in range(6, 15)]
+        for subtag in subtags:
+            self.storage.save_data(subtag, ['calibration', subtag])
+        self.assertListEqual(['2019-02-18T11:00:00', '2019-02-18T10:00:00', '2019-02-18T09:00:00'],
+                             self.storage.list_data_subtags(['calibration'], start='2019-02-18T09:00',
+                                                            end='2019-02-18T12:00'))
+        self.assertListEqual(['2019-02-18T14:00:00'], self.storage.list_data_subtags(['calibration'], limit=1,
+                                                                                     start='2019-02-18T09:00'))
+        self.assertListEqual(['2019-02-18T07:00:00', '2019-02-18T06:00:00'],
+                             self.storage.list_data_subtags(['calibration'], end='2019-02-18T08:00'))
+        self.assertListEqual([], self.storage.list_data_subtags(['calibration'], start='2019-02-19'))
+        self.assertListEqual([], self.storage.list_data_subtags(['nosuchtag'], start='2019'))
+
+    def test_list_subtags_pages(self):
+        subtags = [f'2019-02-18T{hour:02d}:00:00' for hour in range(6, 15)]
+        for subtag in subtags:
+            self.storage.save_data(subtag, ['calibration', subtag])
+        pages = []
+        after = None
+        while True:
+            page = self.storage.list_data_subtags(['calibration'], limit=4, after=after)
+            if not page:
+                break
+            pages.append(page)
+            after = page[-1]
+        self.assertListEqual([4, 4, 1], [len(page) for page in pages])
+        self.assertListEqual(subtags[::-1], [subtag for page in pages for subtag in page])
+
+        self.assertListEqual(['2019-02-18T09:00:00'],
+                             self.storage.list_data_subtags(['calibration'], start='2019-02-18T09:00',
+                                                            end='2019-02-18T12:00', after='2019-02-18T10:00:00'))
+        self.assertListEqual(['2019-02-18T09:00:00'],
+                             self.storage.list_data_subtags(['calibration'], start='2019-02-18T09:00',
+                                                            end='2019-02-18T10:00', after='2019-02-18T12:00:00'))
+
+    def test_nested_individual_data(self):
+        configuration = {'dac1': {'value': 1.5, 'unit': 'V'}, 'a.b': {2: 'integer key'}, 'c': 3}
+        self.storage.save_data(configuration, ['configuration'])
+        self.assertEqual(1.5, self.storage.load_individual_data(['configuration'], ['dac1', 'value']))
+        self.assertEqual('integer key', self.storage.load_individual_data(['configuration'], ['a.b', 2]))
+        self.assertEqual(3, self.storage.load_individual_data(['configuration'], ['c']))
+        self.assertRaises(NoDataAtKeyError, self.storage.load_individual_data, ['configuration'], ['dac1', 'x'])
+        self.assertRaises(NoDataAtKeyError, self.storage.load_individual_data, ['configuration'], ['c', 'x'])
+        self.assertRaises(NoDataAtKeyError, self.storage.load_individual_data, ['configuration'], 'dac1.value')
+        self.assertRaises(TypeError, self.storage.load_individual_data, ['configuration'], [])
+        self.assertRaises(TypeError, self.storage.load_individual_data, ['configuration'], ['dac1', None])
+
+        self.storage.update_individual_data(2.5, ['configuration'], ['dac1', 'value'])
+        self.storage.update_individual_data('new', ['configuration'], ['dac2', 'settings', 'mode'])
+        self.assertEqual({'dac1': {'value': 2.5, 'unit': 'V'}, 'a.b': {2: 'integer key'}, 'c': 3,
+                          'dac2': {'settings': {'mode': 'new'}}}, self.storage.load_data(['configuration']))
+        self.assertEqual(2.5, self.storage.load_individual_data(['configuration'], ['dac1', 'value']))
+        self.assertEqual({'mode': 'new'}, self.storage.load_individual_data(['configuration'], ['dac2', 'settings']))
+        self.assertRaises(TypeError, self.storage.update_individual_data, 1, ['configuration'], [])
+
+    def test_delete(self):
+        self.storage.save_many([(['calibration', 'qubit', '1'], {'f': 1.5}), (['calibration', 'qubit', '2'], 2),
+                                (['calibration', 'leaf'], 3), (['other'], 4)])
+        self.storage.delete(['calibration', 'qubit', '1'])
+        self.assertListEqual(['2'], self.storage.list_data_subtags(['calibration', 'qubit']))
+        self.assertRaises(NoDataAtKeyError, self.storage.load_data, ['calibration', 'qubit', '1'])
+        self.assertListEqual([], self.storage.search('f == 1.5'))
+
+        self.assertRaises(NodeNotEmptyError, self.storage.delete, ['calibration'], recursive=False)
+        self.assertEqual(3, self.storage.load_data(['calibration', 'leaf']))
+        self.storage.delete(['calibration'])
+        self.assertFalse(self.storage.tag_in_storage(['calibration']))
+        self.assertListEqual(['other'], self.storage.list_data_subtags([]))
+        self.assertListEqual([['other']], self.storage.search("tag[0] != ''"))
+
+        self.assertRaises(NoDataAtKeyError, self.storage.delete, ['calibration'])
+        self.assertRaises(NoDataAtKeyError, self.storage.delete, ['other', 'leaf'])
+        self.assertRaises(NoDataAtKeyError, self.storage.delete, [])
+        self.assertRaises(TypeError, self.storage.delete, 'other')
+
+        self.storage.save_data(5, ['calibration', 'leaf'])
+        self.assertEqual(5, self.storage.load_data(['calibration', 'leaf']))
+
+    def test_delete_many(self):
+        self.storage.save_many([(['a', '1'], 1), (['a', '2'], 2), (['b', '1'], 3), (['c'], 4)])
+        self.assertRaises(NodeNotEmptyError, self.storage.delete_many, [['c'], ['b']], recursive=False)
+        self.storage.delete_many([['a', '1'], ['b'], ['c'], ['nosuchtag']])
+        self.assertListEqual(['a'], self.storage.list_data_subtags([]))
+        self.assertListEqual(['2'], self.storage.list_data_subtags(['a']))
+
+    def test_metrics(self):
+        metrics = StorageMetrics()
+        self.storage.set_metrics(metrics)
+        self.assertIs(metrics, self.storage.metrics)
+        self.storage.save_data(1, ['a', '1'])
+        self.storage.save_many([(['a', '2'], 2), (['a', '3'], 3)])
+        self.assertListEqual([1, 2], self.storage.load_many([['a', '1'], ['a', '2']]))
+        self.assertEqual(3, self.storage.load_data(['a', '3']))
+
+        statistics = metrics.statistics()[self.storage.name]
+        self.assertCountEqual(['save_data', 'save_many', 'load_many', 'load_data'], statistics)
+        self.assertEqual(1, statistics['load_data']['count'])
+        self.assertEqual(1, statistics['load_many']['count'])
+
+        self.storage.set_metrics(None)
+        self.assertIsNone(self.storage.metrics)
+        self.assertNotIn('load_data', vars(self.storage))
+        self.storage.load_data(['a', '1'])
+        self.assertEqual(1, metrics.statistics()[self.storage.name]['load_data']['count'])
+
+    def test_prune(self):
+        subtags = [f'2019-02-18T{hour:02d}:00:00' for hour in range(6, 15)]
+        for adapter in ('M4i', 'D5a'):
+            for subtag in subtags:
+                self.storage.save_data({'adapter': adapter}, ['configuration', adapter, subtag])
+        self.storage.save_data({'adapter': 'S5i'}, ['configuration', 'S5i', subtags[0]])
+
+        policy = RetentionPolicy(keep_last=3, newer_than='2019-02-18T10:00')
+        expired = self.storage.prune(['configuration'], policy, depth=1, dry_run=True)
+        self.assertCountEqual([['configuration', adapter, subtag] for adapter in ('M4i', 'D5a')
+                               for subtag in subtags[:4]], expired)
+        self.assertEqual(len(subtags), len(self.storage.list_data_subtags(['configuration', 'M4i'])))
+
+        self.assertCountEqual(expired, self.storage.prune(['configuration'], policy, depth=1, batch_size=3))
+        self.assertListEqual(subtags[:3:-1], self.storage.list_data_subtags(['configuration', 'M4i']))
+        self.assertListEqual(subtags[:3:-1], self.storage.list_data_subtags(['configuration', 'D5a']))
+        self.assertListEqual([subtags[0]], self.storage.list_data_subtags(['configuration', 'S5i']))
+
+        expired = self.storage.prune(['configuration', 'M4i'], RetentionPolicy(keep_last=2))
+        self.assertListEqual([['configuration', 'M4i', subtag] for subtag in subtags[-3:3:-1]], expired)
+        self.assertListEqual(subtags[:-3:-1], self.storage.list_data_subtags(['configuration', 'M4i']))
+        self.assertListEqual([], self.storage.prune(['configuration'], RetentionPolicy(), depth=1))
+        self.assertListEqual([], self.storage.prune(['nosuchtag'], RetentionPolicy(keep_last=0), depth=1))
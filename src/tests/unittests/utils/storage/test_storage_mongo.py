@@ -1,6 +1,7 @@
 import datetime
+import threading
 import unittest
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 
 import numpy as np
 from bson import BSON
@@ -8,9 +9,16 @@ from bson.codec_options import TypeRegistry, CodecOptions
 from mongomock import MongoClient
 
 from qilib.utils.storage import StorageMongoDb
-from qilib.utils.storage.interface import NoDataAtKeyError, NodeAlreadyExistsError, ConnectionTimeoutError
+from pymongo.errors import DuplicateKeyError
+
+from qilib.utils.metrics import StorageMetrics
+from qilib.utils.mongo_client_registry import command_metrics_listener
+from qilib.utils.storage.interface import (NoDataAtKeyError, NodeAlreadyExistsError, ConnectionTimeoutError,
+                                           InvalidQueryError, NodeNotEmptyError, VersionConflictError)
 from qilib.utils.storage.mongo import NumpyArrayCodec
+from qilib.utils.storage.retention import RetentionPolicy
 from tests.test_data.dummy_storage import DummyStorage
+from tests.test_data.m4i_snapshot import snapshot
 
 
 class TestStorageMongo(unittest.TestCase):
@@ -81,13 +89,46 @@ class TestStorageMongo(unittest.TestCase):
         self.assertIsInstance(decoded, type(data))
         self.assertIn('array', decoded)
         np.testing.assert_array_equal(data['array'], decoded['array'])
+        self.assertTrue(decoded['array'].flags.writeable)
+
+        codec_options = CodecOptions(type_registry=TypeRegistry([NumpyArrayCodec(read_only=True)]))
+        decoded = BSON.decode(encoded, codec_options=codec_options)
+        np.testing.assert_array_equal(data['array'], decoded['array'])
+        self.assertFalse(decoded['array'].flags.writeable)
 
     def test_tag_type(self):
         self.assertRaises(TypeError, self.storage.load_data, 3)
         self.assertRaises(TypeError, self.storage.load_data, '/str/tag/')
 
     def test_search(self):
-        self.assertRaises(NotImplementedError, self.storage.search, None)
+        self.storage.save_data({'adapter': 'M4i', 'gain': 2}, ['configuration', 'M4i', '2019-02-18T10:00'])
+        self.storage.save_data({'adapter': 'M4i', 'gain': 4}, ['configuration', 'M4i', '2019-02-18T12:00'])
+        self.storage.save_data({'adapter': 'D5a', 'on': True, 'x.y': {'1': 'a'}},
+                               ['configuration', 'D5a', '2019-02-18T11:00'])
+        self.storage.save_data({'adapter': 'M4i'}, ['labels', 'online'])
+        self.storage.save_data(3, ['scalar'])
+
+        results = self.storage.search("adapter == 'M4i' and tag[2] >= '2019-02-18T11:00'")
+        self.assertListEqual(results, [['configuration', 'M4i', '2019-02-18T12:00']])
+        results = self.storage.search("adapter == 'M4i'")
+        self.assertListEqual(results, [['labels', 'online'], ['configuration', 'M4i', '2019-02-18T12:00'],
+                                       ['configuration', 'M4i', '2019-02-18T10:00']])
+        self.assertListEqual(self.storage.search("tag[0] == 'labels'"), [['labels', 'online']])
+        self.assertListEqual(self.storage.search('gain > 2 and gain <= 4.0'),
+                             [['configuration', 'M4i', '2019-02-18T12:00']])
+        self.assertListEqual(self.storage.search("adapter != 'M4i'"), [['configuration', 'D5a', '2019-02-18T11:00']])
+        self.assertListEqual(self.storage.search('on == true'), [['configuration', 'D5a', '2019-02-18T11:00']])
+        self.assertListEqual(self.storage.search('on < true'), [])
+        self.assertListEqual(self.storage.search('gain == null'), [])
+        self.assertListEqual(self.storage.search("tag[3] != 'x'"), [])
+        self.assertRaises(InvalidQueryError, self.storage.search, 'gain >')
+
+    def test_search_projection(self):
+        self.storage.save_data({'adapter': 'M4i'}, ['a', 'b'])
+        with patch.object(self.storage._collection, 'find', wraps=self.storage._collection.find) as find:
+            self.assertListEqual(self.storage.search("adapter == 'M4i'"), [['a', 'b']])
+        for call in find.call_args_list:
+            self.assertNotIn('value', call.args[1])
 
     def test_datetag_implicit(self):
         t = self.storage.datetag_part()
@@ -445,3 +486,555 @@ class TestStorageMongo(unittest.TestCase):
         self.assertNotIn('\\u002e', data[0])
         self.assertIn('.', data[0])
         self.assertListEqual(data, list_of_strings_with_dots)
+
+    def test_serialize_value_single_pass(self):
+        for data in [snapshot, self.test_individual_data] + self.test_data:
+            encoded = self.storage._serialize_value(data)
+            self.assertEqual(self.storage._encode_data(self.storage._serialize(data)), encoded)
+            self.assertEqual(self.storage._unserialize(self.storage._decode_data(encoded)),
+                             self.storage._unserialize_value(encoded))
+
+    def test_create_indexes(self):
+        index_information = self.storage._collection.index_information()
+        self.assertTrue(index_information['parent_1_tag_1']['unique'])
+
+    def test_create_indexes_opt_out(self):
+        with patch('qilib.utils.storage.mongo.MongoClient', return_value=MongoClient()):
+            storage = StorageMongoDb('test_no_indexes', create_indexes=False)
+        self.assertNotIn('parent_1_tag_1', storage._collection.index_information())
+        self.assertFalse(storage._unique_siblings)
+
+        storage.save_data(1, ['a', 'b'])
+        self.assertRaises(NodeAlreadyExistsError, storage.save_data, 2, ['a'])
+        storage.save_data(3, ['c'])
+        self.assertRaises(NodeAlreadyExistsError, storage.save_data, 4, ['c', 'd'])
+        self.assertEqual(1, storage._collection.count_documents({'tag': 'a'}))
+        self.assertEqual(1, storage._collection.count_documents({'tag': 'c'}))
+        self.assertEqual(1, storage.load_data(['a', 'b']))
+        self.assertEqual(3, storage.load_data(['c']))
+
+        storage._collection.create_index([('parent', 1), ('tag', 1)], unique=True)
+        with patch('qilib.utils.storage.mongo.MongoClient', return_value=storage._client):
+            provisioned = StorageMongoDb('test_no_indexes', create_indexes=False)
+        self.assertTrue(provisioned._unique_siblings)
+        storage._collection.drop()
+
+    def test_create_indexes_with_duplicate_siblings(self):
+        with patch('qilib.utils.storage.mongo.MongoClient', return_value=MongoClient()):
+            storage = StorageMongoDb('test_duplicates', create_indexes=False)
+        storage._collection.insert_many([{'parent': 1, 'tag': 'a'}, {'parent': 1, 'tag': 'a'}])
+        with self.assertLogs(storage.logger, 'WARNING'):
+            storage._create_indexes()
+        self.assertNotIn('unique', storage._collection.index_information()['parent_1_tag_1'])
+        storage._collection.drop()
+
+    def test_find_unindexed_queries(self):
+        index_scan = {'queryPlanner': {'winningPlan': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN'}}}}
+        collection_scan = {'queryPlanner': {'winningPlan': {'stage': 'SORT', 'inputStage': {'stage': 'COLLSCAN'}}}}
+        cursor = MagicMock()
+        cursor.sort.return_value = cursor
+        cursor.explain.side_effect = [index_scan, index_scan, collection_scan]
+        with patch.object(self.storage._collection, 'find', return_value=cursor), \
+                self.assertLogs(self.storage.logger, 'WARNING'):
+            unindexed = self.storage.find_unindexed_queries()
+        self.assertListEqual(unindexed, ['list children by parent'])
+
+    def test_save_many_load_many(self):
+        items = [(['a', '1'], 1), (['a', '2'], {'b.c': 2}), (['c'], (1, 2)), (['d', 'e', 'f'], np.int64(3))]
+        self.storage.save_many(items)
+        tags = [tag for tag, _ in items]
+        self.assertListEqual(self.storage.load_many(tags), [data for _, data in items])
+        self.assertListEqual(self.storage.load_many([]), [])
+        self.assertRaises(NoDataAtKeyError, self.storage.load_many, [['c'], ['x']])
+        self.assertRaises(NoDataAtKeyError, self.storage.load_many, [['a']])
+        self.assertRaises(NoDataAtKeyError, self.storage.load_many, [[]])
+
+    def test_save_many_overwrite(self):
+        self.storage.save_data(1, ['a', 'b'])
+        self.storage.save_data(1, ['a', 'c', 'd'])
+        self.storage.save_many([(['a', 'b'], 2), (['a', 'c'], 2), (['a', 'e'], 2)], overwrite=False)
+        self.assertListEqual(self.storage.load_many([['a', 'b'], ['a', 'c', 'd'], ['a', 'e']]), [1, 1, 2])
+        self.storage.save_many([(['a', 'b'], 3)])
+        self.assertEqual(self.storage.load_data(['a', 'b']), 3)
+
+    def test_save_many_raises_error(self):
+        self.storage.save_data(1, ['a', 'b'])
+        self.assertRaises(NodeAlreadyExistsError, self.storage.save_many, [(['x'], 1), (['a'], 1)])
+        self.assertRaises(NodeAlreadyExistsError, self.storage.save_many, [(['a', 'b', 'c'], 1)])
+        self.assertRaises(TypeError, self.storage.save_many, [('a/b', 1)])
+
+    def test_save_many_single_bulk_write(self):
+        items = [(['configuration', f'adapter_{index % 5}', str(index)], index) for index in range(50)]
+        self.storage.save_many(items)
+        with patch.object(self.storage._collection, 'bulk_write',
+                          wraps=self.storage._collection.bulk_write) as bulk_write, \
+                patch.object(self.storage._collection, 'find', wraps=self.storage._collection.find) as find:
+            self.storage.save_many([(tag, 0) for tag, _ in items])
+            self.assertListEqual(self.storage.load_many([tag for tag, _ in items]), [0] * 50)
+        bulk_write.assert_called_once()
+        # at most one check for existing nodes and one query for the loads, mongomock implements find_one with find
+        self.assertLessEqual(find.call_count, 2)
+
+    def test_load_data_from_subtag_in_pages(self):
+        self.storage.save_many([(['results', f'{index:03d}'], index) for index in range(25)])
+        results = self.storage.load_data_from_subtag(['results'], page_size=10)
+        with patch.object(self.storage, 'load_many', wraps=self.storage.load_many) as load_many:
+            self.assertListEqual(list(results), list(range(24, -1, -1)))
+            self.assertListEqual(list(results[:5]), [24, 23, 22, 21, 20])
+        self.assertEqual(load_many.call_count, 3)
+
+    def test_nested_individual_data(self):
+        self.storage.save_data({'dac1': {'value': 1.5, 'unit': 'V'}, 2: {'b.c': 3}, 'c': 4}, ['a', 'configuration'])
+        with patch.object(self.storage._collection, 'find_one', wraps=self.storage._collection.find_one) as find_one:
+            self.assertEqual(1.5, self.storage.load_individual_data(['a', 'configuration'], ['dac1', 'value']))
+        self.assertIn('value.dac1.value', find_one.call_args[0][1])
+        self.assertEqual(3, self.storage.load_individual_data(['a', 'configuration'], [2, 'b.c']))
+        self.assertRaises(NoDataAtKeyError, self.storage.load_individual_data, ['a', 'configuration'], ['c', 'x'])
+        self.assertRaises(NoDataAtKeyError, self.storage.load_individual_data, ['a', 'configuration'], 'dac1.value')
+
+        with patch.object(self.storage._collection, 'update_one',
+                          wraps=self.storage._collection.update_one) as update_one:
+            self.storage.update_individual_data(2.5, ['a', 'configuration'], ['dac1', 'value'])
+            self.storage.update_individual_data('new', ['a', 'configuration'], ['dac2', 'mode'])
+        self.assertEqual({'$set': {'value.dac1.value': 2.5}, '$inc': {'version': 1}},
+                         update_one.call_args_list[0][0][1])
+        self.assertEqual({'dac1': {'value': 2.5, 'unit': 'V'}, 2: {'b.c': 3}, 'c': 4, 'dac2': {'mode': 'new'}},
+                         self.storage.load_data(['a', 'configuration']))
+
+    def test_list_subtags_range(self):
+        for subtag in ['2019-01-02', '2019-01-04', '2019-01-01', '2019-01-03']:
+            self.storage.save_data(subtag, ['a', subtag])
+        self.assertListEqual(['2019-01-03', '2019-01-02'],
+                             self.storage.list_data_subtags(['a'], start='2019-01-02', end='2019-01-04'))
+        with patch.object(self.storage._collection, 'find', wraps=self.storage._collection.find) as find:
+            self.assertListEqual(['2019-01-02', '2019-01-01'],
+                                 self.storage.list_data_subtags(['a'], limit=2, end='2019-01-04', after='2019-01-03'))
+        self.assertEqual({'$exists': True, '$lt': '2019-01-03'}, find.call_args[0][0]['tag'])
+        self.assertEqual(2, find.call_args[1]['limit'])
+        self.assertListEqual([], self.storage.list_data_subtags(['nosuchtag'], start='2019'))
+
+    def test_export_import_subtree(self):
+        self.storage.save_many([(['calibration', 'qubit', '1'], {'f': 1.5, 'a.b': np.arange(2)}),
+                                (['calibration', 'qubit', '2'], [1, 2]), (['calibration', 'leaf'], 3),
+                                (['other'], 4)])
+        with patch.object(self.storage._collection, 'find', wraps=self.storage._collection.find) as find:
+            records = list(self.storage.export_subtree(['calibration'], batch_size=2))
+        self.assertTrue(all(call[1]['batch_size'] == 2 for call in find.call_args_list))
+        self.assertCountEqual([['qubit', '1'], ['qubit', '2'], ['leaf']], [record['tag'] for record in records])
+        exported = {tuple(record['tag']): record['data'] for record in records}
+        np.testing.assert_array_equal(np.arange(2), exported[('qubit', '1')]['a.b'])
+        self.assertListEqual([{'tag': [], 'data': 3}], list(self.storage.export_subtree(['calibration', 'leaf'])))
+        self.assertListEqual([], list(self.storage.export_subtree(['nosuchtag'])))
+        self.assertEqual(4, len(list(self.storage.export_subtree([]))))
+
+        self.assertEqual(3, self.storage.import_subtree(records, ['copy']))
+        self.assertEqual(1.5, self.storage.load_individual_data(['copy', 'qubit', '1'], 'f'))
+        self.assertListEqual(['qubit', 'leaf'], self.storage.list_data_subtags(['copy']))
+
+    def _watch_changes(self, changes):
+        stop = threading.Event()
+        stream = MagicMock()
+        stream.__enter__.return_value = stream
+        stream.try_next.side_effect = lambda: changes.pop(0) if changes else stop.set()
+        with patch.object(self.storage._collection, 'watch', return_value=stream) as watch:
+            tags = list(self.storage.watch_changes(stop, max_await_time=0.5))
+        watch.assert_called_once_with(full_document='updateLookup', max_await_time_ms=500)
+        return tags
+
+    def test_watch_changes(self):
+        changes = [None, {'operationType': 'update', 'fullDocument': {'tag': 'b', 'parent': 1, 'value': 1}},
+                   {'operationType': 'delete'}]
+        self.assertListEqual(self._watch_changes(changes), [None, None])
+
+    def test_binary_compressed_arrays(self):
+        trace = np.linspace(0, 1, 4096)
+        data = {'trace': trace, 'small': np.arange(3), 'tuple': (np.arange(2),)}
+        self.storage.save_data(data, ['base64'])
+        with patch('qilib.utils.storage.mongo.MongoClient', return_value=self.storage._client):
+            storage = StorageMongoDb(self.storage._db.name, materialized_path=self.storage.materialized_path,
+                                     binary_arrays=True, compression='zlib', compression_threshold=1024)
+        storage.save_data(data, ['binary'])
+        storage.update_individual_data(trace, ['binary'], 'field')
+
+        document = self.storage._collection.find_one({'tag': 'binary'})
+        content = document['value']['trace']['__content__']
+        self.assertIsInstance(content['__ndarray__'], bytes)
+        self.assertEqual('zlib', content['__compression__'])
+        self.assertLess(len(content['__ndarray__']), trace.nbytes)
+        self.assertNotIn('__compression__', document['value']['small']['__content__'])
+        self.assertEqual('zlib', document['value']['field']['__content__']['__compression__'])
+
+        for tag in (['base64'], ['binary']):
+            for reader in (self.storage, storage):
+                loaded = reader.load_data(tag)
+                np.testing.assert_array_equal(trace, loaded['trace'])
+                np.testing.assert_array_equal(np.arange(3), loaded['small'])
+                np.testing.assert_array_equal(np.arange(2), loaded['tuple'][0])
+        np.testing.assert_array_equal(trace, self.storage.load_individual_data(['binary'], 'field'))
+
+        with patch('qilib.utils.storage.mongo.MongoClient', return_value=MongoClient()):
+            self.assertRaises(ValueError, StorageMongoDb, 'test_compression', compression='rar')
+
+    def test_read_only_arrays(self):
+        data = {'trace': np.linspace(0, 1, 100), 'tuple': (np.arange(2),)}
+        self.storage.save_data(data, ['trace'])
+        with patch('qilib.utils.storage.mongo.MongoClient', return_value=self.storage._client):
+            storage = StorageMongoDb(self.storage._db.name, materialized_path=self.storage.materialized_path,
+                                     read_only_arrays=True)
+
+        loaded = storage.load_data(['trace'])
+        np.testing.assert_array_equal(data['trace'], loaded['trace'])
+        self.assertFalse(loaded['trace'].flags.writeable)
+        self.assertFalse(loaded['tuple'][0].flags.writeable)
+        self.assertRaises(ValueError, loaded['trace'].__setitem__, 0, 1.)
+        self.assertTrue(self.storage.load_data(['trace'])['trace'].flags.writeable)
+
+    def test_versioned_data(self):
+        self.assertEqual(1, self.storage.save_versioned_data({'a': 1}, ['calibration', 'qubit'], 0))
+        data, version = self.storage.load_versioned_data(['calibration', 'qubit'])
+        self.assertEqual(({'a': 1}, 1), (data, version))
+
+        self.assertEqual(2, self.storage.save_versioned_data({'a': 2}, ['calibration', 'qubit'], version))
+        self.assertRaises(VersionConflictError, self.storage.save_versioned_data, {'a': 3}, ['calibration', 'qubit'],
+                          version)
+        self.assertRaises(VersionConflictError, self.storage.save_versioned_data, {'a': 3}, ['calibration', 'qubit'],
+                          0)
+        self.storage.update_individual_data(4, ['calibration', 'qubit'], 'a')
+        self.assertEqual(({'a': 4}, 3), self.storage.load_versioned_data(['calibration', 'qubit']))
+        self.storage.save_data({'a': 5}, ['calibration', 'qubit'])
+        self.assertEqual(({'a': 5}, 4), self.storage.load_versioned_data(['calibration', 'qubit']))
+
+        self.assertRaises(NodeAlreadyExistsError, self.storage.save_versioned_data, 1, ['calibration'], 0)
+        self.assertRaises(NodeAlreadyExistsError, self.storage.save_versioned_data, 1,
+                          ['calibration', 'qubit', 'x'], 0)
+        self.assertRaises(NoDataAtKeyError, self.storage.load_versioned_data, ['calibration'])
+        self.assertRaises(NoDataAtKeyError, self.storage.load_versioned_data, ['calibration', 'other'])
+
+    def test_versioned_data_without_version_field(self):
+        self.storage.save_data(1, ['legacy'])
+        self.storage._collection.update_many({}, {'$unset': {'version': ''}})
+        self.assertEqual((1, 0), self.storage.load_versioned_data(['legacy']))
+        self.assertEqual(1, self.storage.save_versioned_data(2, ['legacy'], 0))
+        self.assertEqual((2, 1), self.storage.load_versioned_data(['legacy']))
+
+    def test_versioned_data_without_unique_siblings(self):
+        with patch('qilib.utils.storage.mongo.MongoClient', return_value=MongoClient()):
+            storage = StorageMongoDb('test_no_indexes', create_indexes=False)
+        self.assertEqual(1, storage.save_versioned_data(1, ['calibration', 'qubit'], 0))
+        self.assertRaises(VersionConflictError, storage.save_versioned_data, 2, ['calibration', 'qubit'], 0)
+        self.assertRaises(NodeAlreadyExistsError, storage.save_versioned_data, 2, ['calibration'], 0)
+        self.assertEqual(1, storage._collection.count_documents({'tag': 'qubit'}))
+        self.assertEqual((1, 1), storage.load_versioned_data(['calibration', 'qubit']))
+
+        storage.save_data(3, ['legacy'])
+        storage._collection.update_many({'tag': 'legacy'}, {'$unset': {'version': ''}})
+        self.assertEqual(1, storage.save_versioned_data(4, ['legacy'], 0))
+        self.assertEqual(1, storage._collection.count_documents({'tag': 'legacy'}))
+        storage._collection.drop()
+
+    def test_delete(self):
+        self.storage.save_many([(['calibration', 'qubit', '1'], {'f': 1.5}), (['calibration', 'qubit', '2'], 2),
+                                (['calibration', 'leaf'], 3), (['other'], 4)])
+        self.storage.delete(['calibration', 'qubit', '1'])
+        self.assertListEqual(['2'], self.storage.list_data_subtags(['calibration', 'qubit']))
+        self.assertRaises(NoDataAtKeyError, self.storage.load_data, ['calibration', 'qubit', '1'])
+
+        self.assertRaises(NodeNotEmptyError, self.storage.delete, ['calibration'], recursive=False)
+        self.assertEqual(3, self.storage.load_data(['calibration', 'leaf']))
+        self.storage.delete(['calibration'])
+        self.assertFalse(self.storage.tag_in_storage(['calibration']))
+        self.assertListEqual(['other'], self.storage.list_data_subtags([]))
+        self.assertEqual(0, self.storage._collection.count_documents({'tag': {'$in': ['calibration', 'qubit',
+                                                                                         '2', 'leaf']}}))
+
+        self.assertRaises(NoDataAtKeyError, self.storage.delete, ['calibration'])
+        self.assertRaises(NoDataAtKeyError, self.storage.delete, ['other', 'leaf'])
+        self.assertRaises(NoDataAtKeyError, self.storage.delete, [])
+        self.storage.save_data(5, ['calibration', 'leaf'])
+        self.assertEqual(5, self.storage.load_data(['calibration', 'leaf']))
+
+    def test_prune_bulk_delete(self):
+        subtags = [f'2019-02-18T{hour:02d}:00:00' for hour in range(6, 15)]
+        self.storage.save_many([(['configuration', adapter, subtag, 'settings'], {'adapter': adapter})
+                                for adapter in ('M4i', 'D5a') for subtag in subtags])
+        self.storage.DELETE_BATCH_SIZE = 8
+        with patch.object(self.storage._collection, 'delete_many',
+                          wraps=self.storage._collection.delete_many) as delete_many:
+            expired = self.storage.prune(['configuration'], RetentionPolicy(keep_last=1), depth=1)
+        self.assertEqual(16, len(expired))
+        # the tree layout deletes the 16 results and their 16 leaves, the path layout the subtrees of 16 paths
+        self.assertEqual(2 if self.storage.materialized_path else 4, delete_many.call_count)
+        self.assertListEqual([subtags[-1]], self.storage.list_data_subtags(['configuration', 'M4i']))
+        self.assertListEqual([subtags[-1]], self.storage.list_data_subtags(['configuration', 'D5a']))
+        self.assertEqual(0, self.storage._collection.count_documents({'tag': {'$in': subtags[:-1]}}))
+        self.assertEqual(2, self.storage._collection.count_documents({'tag': 'settings'}))
+
+    @staticmethod
+    def _replay_command(request_id, name):
+        # mongomock does not publish command events, so the events that pymongo publishes are replayed
+        command_metrics_listener.started(MagicMock(request_id=request_id, command_name=name,
+                                                   command={name: 'storage', 'filter': {'tag': 'a'}}))
+        command_metrics_listener.succeeded(MagicMock(request_id=request_id, command_name=name,
+                                                     duration_micros=1000, reply={'ok': 1.0}))
+
+    def test_metrics_round_trips(self):
+        tag = ['system', 'device', 'instrument', 'settings']
+        self.storage.save_data({'gain': 2}, tag)
+        self.storage.node_cache.clear()
+        metrics = StorageMetrics()
+        self.storage.set_metrics(metrics)
+
+        collection_find = self.storage._collection.find
+
+        def find(*args, **kwargs):
+            self._replay_command(0, 'find')
+            return collection_find(*args, **kwargs)
+
+        with patch.object(self.storage._collection, 'find', side_effect=find):
+            self.assertEqual({'gain': 2}, self.storage.load_data(tag))
+            self.assertEqual(['settings'], self.storage.list_data_subtags(tag[:-1]))
+            self.storage._collection.find_one({'tag': 'settings'})
+        statistics = metrics.statistics()[self.storage.name]
+        # the tree layout resolves the root and the three nodes before it reads the leaf
+        self.assertEqual({'find': 1 if self.storage.materialized_path else 5},
+                         statistics['load_data']['round_trips'])
+        self.assertEqual({'find': 1}, statistics['list_data_subtags']['round_trips'])
+        self.assertGreater(statistics['load_data']['bytes'], 0)
+        self.assertNotIn('', statistics)
+        self.assertEqual({}, command_metrics_listener._command_sizes)
+
+        self.storage.set_metrics(None)
+        self.assertEqual({'gain': 2}, self.storage.load_data(tag))
+        self.assertEqual(1, metrics.statistics()[self.storage.name]['load_data']['count'])
+
+    def test_metrics_cursor_batches(self):
+        def list_data_subtags():
+            self._replay_command(1, 'find')
+            self._replay_command(2, 'getMore')
+            command_metrics_listener.failed(MagicMock(request_id=3, command_name='getMore', duration_micros=500))
+
+        metrics = StorageMetrics()
+        metrics.scope('storage').instrument('list_data_subtags', list_data_subtags)()
+        self.assertEqual({'find': 1, 'getMore': 2}, metrics.statistics()['storage']['list_data_subtags']['round_trips'])
+
+    def test_metrics_listener_installed(self):
+        with patch('qilib.utils.storage.mongo.MongoClient') as client_class:
+            storage = StorageMongoDb('test_listener')
+        self.assertEqual([command_metrics_listener], client_class.call_args.kwargs['event_listeners'])
+        storage.close()
+
+
+class TestStorageMongoMaterializedPath(TestStorageMongo):
+    def setUp(self) -> None:
+        super().setUp()
+        with patch('qilib.utils.storage.mongo.MongoClient', return_value=MongoClient()):
+            self.storage = StorageMongoDb('test_path', materialized_path=True)
+
+    def test_materialized_path(self):
+        self.assertTrue(self.storage.materialized_path)
+
+    def test_create_indexes(self):
+        index_information = self.storage._collection.index_information()
+        self.assertTrue(index_information['path_1']['unique'])
+        self.assertIn('parent_path_1_tag_1', index_information)
+
+    def test_find_unindexed_queries(self):
+        index_scan = {'queryPlanner': {'winningPlan': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN'}}}}
+        cursor = MagicMock()
+        cursor.sort.return_value = cursor
+        cursor.explain.return_value = index_scan
+        with patch.object(self.storage._collection, 'find', return_value=cursor):
+            self.assertListEqual(self.storage.find_unindexed_queries(), [])
+        self.assertEqual(cursor.explain.call_count, 2)
+
+    def test_tag_to_path(self):
+        self.assertEqual(StorageMongoDb._tag_to_path([]), '')
+        self.assertEqual(StorageMongoDb._tag_to_path(['a', 'b']), '/a/b')
+        self.assertNotEqual(StorageMongoDb._tag_to_path(['a/b']), StorageMongoDb._tag_to_path(['a', 'b']))
+        self.assertEqual(StorageMongoDb._tag_to_path(['a/b%']), '/a%2Fb%25')
+
+    def test_document_layout(self):
+        self.storage.save_data(42, ['a', 'b', 'c'])
+        document = self.storage._collection.find_one({'tag': 'c'})
+        self.assertEqual(document['path'], '/a/b/c')
+        self.assertEqual(document['parent_path'], '/a/b')
+        self.assertEqual(document['ancestors'], ['', '/a', '/a/b'])
+        self.assertEqual(document['value'], 42)
+
+    def test_load_data_single_query(self):
+        self.storage.save_data(42, ['a', 'b', 'c', 'd'])
+        with patch.object(self.storage._collection, 'find_one', wraps=self.storage._collection.find_one) as find_one:
+            self.assertEqual(self.storage.load_data(['a', 'b', 'c', 'd']), 42)
+            self.assertTrue(self.storage.tag_in_storage(['a', 'b']))
+        self.assertEqual(find_one.call_count, 2)
+
+    def test_save_data_single_bulk_write(self):
+        with patch.object(self.storage._collection, 'bulk_write',
+                          wraps=self.storage._collection.bulk_write) as bulk_write:
+            self.storage.save_data(42, ['a', 'b', 'c', 'd'])
+        bulk_write.assert_called_once()
+        self.assertListEqual(self.storage.list_data_subtags(['a', 'b']), ['c'])
+
+    def test_watch_changes(self):
+        changes = [{'operationType': 'insert', 'fullDocument': {'tags': ['a', 'b'], 'path': '/a/b', 'value': 1}},
+                   None, {'operationType': 'delete'}]
+        self.assertListEqual(self._watch_changes(changes), [['a', 'b'], None])
+
+    def test_migrate_to_materialized_path(self):
+        with patch('qilib.utils.storage.mongo.MongoClient', return_value=MongoClient()):
+            storage = StorageMongoDb('test_migration')
+        storage.save_data(1, ['a', 'b'])
+        storage.save_data({'x.y': 2}, ['a', 'c', 'd'])
+        storage.save_data(3, ['e'])
+
+        migrated = storage.migrate_to_materialized_path()
+
+        self.assertEqual(migrated, 5)
+        self.assertTrue(storage.materialized_path)
+        self.assertEqual(storage.load_data(['a', 'b']), 1)
+        self.assertEqual(storage.load_data(['a', 'c', 'd']), {'x.y': 2})
+        self.assertListEqual(storage.list_data_subtags([]), ['e', 'a'])
+        storage.save_data(4, ['a', 'c', 'f'])
+        self.assertListEqual(storage.list_data_subtags(['a', 'c']), ['f', 'd'])
+        storage._collection.drop()
+
+    def test_save_after_migration(self):
+        with patch('qilib.utils.storage.mongo.MongoClient', return_value=MongoClient()):
+            storage = StorageMongoDb('test_migration')
+        storage.save_data(1, ['a', 'b'])
+        self.assertTrue(storage._has_unique_sibling_index())
+
+        storage.migrate_to_materialized_path()
+
+        self.assertFalse(storage._has_unique_sibling_index())
+        storage.save_data(2, ['c', 'b'])
+        storage.save_data(3, ['d', 'b'])
+        self.assertEqual(storage.load_data(['c', 'b']), 2)
+        self.assertEqual(storage.load_data(['d', 'b']), 3)
+        storage._collection.drop()
+
+
+class TestStorageMongoAtomicWrites(unittest.TestCase):
+    def setUp(self) -> None:
+        with patch('qilib.utils.storage.mongo.MongoClient', return_value=MongoClient()):
+            self.storage = StorageMongoDb('test_atomic_writes')
+
+    def tearDown(self) -> None:
+        self.storage._collection.drop()
+
+    def test_save_is_a_single_upsert(self):
+        self.storage.save_data(1, ['calibration', 'qubit', '2019-02-18T09:00:00'])
+        with patch.object(self.storage._collection, 'find_one', wraps=self.storage._collection.find_one) as find_one, \
+                patch.object(self.storage._collection, 'update_one',
+                             wraps=self.storage._collection.update_one) as update_one:
+            self.storage.save_data(2, ['calibration', 'qubit', '2019-02-18T10:00:00'])
+            self.storage.save_data(3, ['calibration', 'qubit', '2019-02-18T10:00:00'])
+        find_one.assert_called_once_with({'_id': self.storage.node_cache.get(['calibration', 'qubit'])}, {'_id': 1})
+        self.assertEqual(2, update_one.call_count)
+        self.assertEqual(3, self.storage.load_data(['calibration', 'qubit', '2019-02-18T10:00:00']))
+
+    def test_node_deleted_by_other_writer(self):
+        with patch('qilib.utils.storage.mongo.MongoClient', return_value=self.storage._client):
+            other_storage = StorageMongoDb('test_atomic_writes')
+        self.storage.save_data(1, ['a', 'b', 'c'])
+        self.storage.save_data(2, ['d', 'e'])
+        other_storage.delete(['a'])
+        other_storage.save_data(3, ['a', 'b', 'f'])
+        other_storage.delete(['d'])
+
+        self.storage.save_data(4, ['a', 'b', 'c'])
+        self.storage.save_data(5, ['d', 'x', 'y'])
+
+        self.assertEqual(4, other_storage.load_data(['a', 'b', 'c']))
+        self.assertEqual(5, other_storage.load_data(['d', 'x', 'y']))
+        self.assertListEqual(['f', 'c'], self.storage.list_data_subtags(['a', 'b']))
+        root = self.storage._get_root()
+        nodes = {doc['_id'] for doc in self.storage._collection.find({}, {'_id': 1})}
+        parents = {doc['parent'] for doc in self.storage._collection.find({'parent': {'$exists': True}})}
+        self.assertLessEqual(parents, nodes)
+        self.assertIn(root, parents)
+
+    def test_stale_node_on_load(self):
+        with patch('qilib.utils.storage.mongo.MongoClient', return_value=self.storage._client):
+            other_storage = StorageMongoDb('test_atomic_writes')
+        self.storage.save_data(1, ['a', 'b'])
+        other_storage.delete(['a'])
+        other_storage.save_data(2, ['a', 'b'])
+
+        self.assertEqual(2, self.storage.load_data(['a', 'b']))
+        self.assertListEqual(['b'], self.storage.list_data_subtags(['a']))
+        other_storage.delete(['a'])
+        self.assertRaises(NoDataAtKeyError, self.storage.load_data, ['a', 'b'])
+
+    def test_node_created_by_other_writer(self):
+        self.storage.save_data(1, ['a', 'b'])
+        other_node = self.storage._collection.insert_one({'parent': self.storage._get_root(), 'tag': 'c'}).inserted_id
+        with patch.object(self.storage._collection, 'find_one_and_update', side_effect=DuplicateKeyError('')):
+            self.storage.save_data(2, ['c', 'd'])
+        self.assertEqual(other_node, self.storage.node_cache.get(['c']))
+        self.assertEqual(1, self.storage._collection.count_documents({'tag': 'c'}))
+        self.assertEqual(2, self.storage.load_data(['c', 'd']))
+
+    def test_node_and_leaf_collisions(self):
+        self.storage.save_data(1, ['a', 'b'])
+        self.storage.node_cache.clear()
+        self.assertRaises(NodeAlreadyExistsError, self.storage.save_data, 2, ['a', 'b', 'c'])
+        self.assertRaises(NodeAlreadyExistsError, self.storage.save_data, 2, ['a'])
+        self.assertRaises(NodeAlreadyExistsError, self.storage.update_individual_data, 2, ['a'], 'x')
+        self.assertRaises(NoDataAtKeyError, self.storage.update_individual_data, 2, ['a', 'c'], 'x')
+        self.assertEqual(1, self.storage._collection.count_documents({'tag': 'b'}))
+
+    def test_non_unique_siblings(self):
+        self.storage._unique_siblings = False
+        self.storage.save_data(1, ['a', 'b'])
+        self.assertRaises(NodeAlreadyExistsError, self.storage.save_data, 2, ['a'])
+        self.assertRaises(NodeAlreadyExistsError, self.storage.save_data, 2, ['a', 'b', 'c'])
+        self.assertEqual(1, self.storage.load_data(['a', 'b']))
+
+
+class TestStorageMongoNodeCache(unittest.TestCase):
+    def setUp(self) -> None:
+        with patch('qilib.utils.storage.mongo.MongoClient', return_value=MongoClient()):
+            self.storage = StorageMongoDb('test_node_cache')
+
+    def tearDown(self) -> None:
+        self.storage._collection.drop()
+
+    def test_node_cache(self):
+        self.storage.save_data(42, ['a', 'b', 'c', 'd'])
+        self.storage.node_cache.clear()
+
+        with patch.object(self.storage._collection, 'find_one', wraps=self.storage._collection.find_one) as find_one:
+            self.assertEqual(self.storage.load_data(['a', 'b', 'c', 'd']), 42)
+            self.assertEqual(find_one.call_count, 5)
+            find_one.reset_mock()
+            self.assertEqual(self.storage.load_data(['a', 'b', 'c', 'd']), 42)
+            self.assertEqual(find_one.call_count, 1)
+        self.assertEqual(self.storage.node_cache.hits, 1)
+        self.assertListEqual(self.storage.list_data_subtags(['a', 'b']), ['c'])
+        self.assertEqual(self.storage.node_cache.hits, 2)
+
+    def test_node_cache_invalidate(self):
+        self.storage.save_data(42, ['a', 'b', 'c'])
+        self.storage.node_cache.invalidate(['a'])
+        self.assertIsNone(self.storage.node_cache.get(['a', 'b']))
+        self.assertEqual(self.storage.load_data(['a', 'b', 'c']), 42)
+        self.assertIsNotNone(self.storage.node_cache.get(['a', 'b']))
+
+    def test_delete_invalidates_node_cache(self):
+        self.storage.save_data(42, ['a', 'b', 'c'])
+        self.assertIsNotNone(self.storage.node_cache.get(['a', 'b']))
+        self.storage.delete(['a'])
+        self.assertIsNone(self.storage.node_cache.get(['a']))
+        self.assertIsNone(self.storage.node_cache.get(['a', 'b']))
+        self.storage.save_data(43, ['a', 'b', 'c'])
+        self.assertEqual(self.storage.load_data(['a', 'b', 'c']), 43)
+
+    def test_node_cache_disabled(self):
+        with patch('qilib.utils.storage.mongo.MongoClient', return_value=MongoClient()):
+            storage = StorageMongoDb('test_no_cache', node_cache_size=0)
+        storage.save_data(42, ['a', 'b', 'c'])
+        self.assertEqual(storage.load_data(['a', 'b', 'c']), 42)
+        self.assertEqual(len(storage.node_cache), 0)
+        storage._collection.drop()
+
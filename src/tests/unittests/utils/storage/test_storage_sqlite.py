@@ -0,0 +1,135 @@
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from qilib.utils.storage import StorageSQLite
+from qilib.utils.storage.interface import NoDataAtKeyError, NodeAlreadyExistsError, NodeDoesNotExistsError
+from qilib.utils.storage.query import parse_query
+from tests.unittests.utils.storage import test_storage_memory
+
+
+class TestStorageSQLite(test_storage_memory.TestStorageMemory):
+    """ Runs the tests of the memory storage against the SQLite storage """
+
+    def setUp(self):
+        super().setUp()
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.temporary_directory.name, 'storage.db')
+        self.storage = StorageSQLite('test', self.database)
+
+    def tearDown(self):
+        self.storage.close()
+        self.temporary_directory.cleanup()
+
+    def test_load_data_from_subtag(self):
+        for ii in range(4):
+            self.storage.save_data(ii, ['s', f's{ii}'])
+        self.assertEqual(list(self.storage.load_data_from_subtag(['s'])), [3, 2, 1, 0])
+
+    def test_copy_on_write(self):
+        data = {'array': np.arange(3), 'nested': {'a': 1}}
+        self.storage.save_data(data, ['data'])
+        self.storage.load_data(['data'])['nested']['a'] = 2
+        self.assertEqual({'a': 1}, self.storage.load_data(['data'])['nested'])
+
+    def test_wal_mode(self):
+        self.assertEqual('wal', self.storage._connection.execute('PRAGMA journal_mode').fetchone()[0])
+
+    def test_persistence(self):
+        self.storage.save_data({1: 'integer key', 'tuple': (1, 2), 'nested': {'c': [None, True]}}, ['a', 'b'])
+        storage = StorageSQLite('other', self.database)
+        self.assertEqual({1: 'integer key', 'tuple': (1, 2), 'nested': {'c': [None, True]}},
+                         storage.load_data(['a', 'b']))
+        storage.close()
+
+    def test_concurrent_reader(self):
+        self.storage.save_data(1, ['a', '1'])
+        results = []
+
+        def reader():
+            results.append(self.storage.load_data(['a', '1']))
+            results.append(self.storage.list_data_subtags(['a']))
+
+        with self.storage._transaction() as cursor:
+            self.storage._write_leaves(cursor, [(['a', '2'], 2)])
+            thread = threading.Thread(target=reader)
+            thread.start()
+            thread.join()
+        self.assertEqual([1, ['1']], results)
+        self.assertEqual(['2', '1'], self.storage.list_data_subtags(['a']))
+
+    def test_close_closes_all_connections(self):
+        self.storage.save_data(1, ['a'])
+        loaded = threading.Event()
+        closed = threading.Event()
+        results = []
+
+        def load():
+            results.append(self.storage.load_data(['a']))
+            loaded.set()
+            closed.wait()
+            results.append(self.storage.load_data(['a']))
+
+        thread = threading.Thread(target=load, daemon=True)
+        thread.start()
+        loaded.wait()
+        try:
+            self.assertTrue(os.path.exists(self.database + '-wal'))
+            self.storage.close()
+            self.assertFalse(os.path.exists(self.database + '-wal'))
+        finally:
+            closed.set()
+            thread.join()
+        self.assertEqual([1, 1], results)
+        self.assertEqual(1, self.storage.load_data(['a']))
+
+    def test_connections_of_finished_threads_are_closed(self):
+        for _ in range(3):
+            thread = threading.Thread(target=self.storage.list_data_subtags, args=([],))
+            thread.start()
+            thread.join()
+        self.assertEqual(2, len(self.storage._connections))
+
+    def test_indexed_queries(self):
+        queries = {
+            'list': ('SELECT name FROM nodes WHERE parent_path = ? ORDER BY name DESC LIMIT ?', ('[]', 1)),
+            'search': self.storage._compile_condition(parse_query("tag[0] >= 'a'")[0]),
+            'search not equal': self.storage._compile_condition(parse_query("value != 1")[0]),
+        }
+        for name, (query, parameters) in queries.items():
+            plan = ' '.join(row[-1] for row in self.storage._connection.execute('EXPLAIN QUERY PLAN ' + query,
+                                                                               parameters))
+            self.assertIn('INDEX', plan, name)
+            self.assertNotIn('TEMP B-TREE', plan, name)
+
+    def test_search_types(self):
+        self.storage.save_data({'value': 1, 'flag': True, 'none': None, 'big': 2 ** 70}, ['a'])
+        self.storage.save_data({'value': 1.5, 'flag': False, 'none': 'x'}, ['b'])
+        self.assertEqual([['a']], self.storage.search('flag == true'))
+        self.assertEqual([['b']], self.storage.search('flag != true'))
+        self.assertEqual([['a']], self.storage.search('none == null'))
+        self.assertEqual([['b'], ['a']], self.storage.search('value >= 1'))
+        self.assertEqual([], self.storage.search('flag > false'))
+        self.assertEqual([['a']], self.storage.search('big > 1'))
+
+    def test_save_many_transaction(self):
+        self.storage.save_data(1, ['a', 'b'])
+        self.assertRaises(NodeAlreadyExistsError, self.storage.save_many, [(['c'], 1), (['a'], 2)])
+        self.assertFalse(self.storage.tag_in_storage(['c']))
+        self.storage.save_many([(['a', 'b'], 2), (['c'], 3)], overwrite=False)
+        self.assertEqual([1, 3], self.storage.load_many([['a', 'b'], ['c']]))
+
+    def test_errors(self):
+        self.storage.save_data(1, ['a', 'b'])
+        self.assertRaisesRegex(NodeAlreadyExistsError, 'Tag "b" is a leaf', self.storage.save_data, 2,
+                               ['a', 'b', 'c'])
+        self.assertRaisesRegex(NodeAlreadyExistsError, 'Tag "a" is not a leaf', self.storage.save_data, 2, ['a'])
+        self.assertRaisesRegex(NodeAlreadyExistsError, 'Tag "b" is a leaf',
+                               self.storage.update_individual_data, 2, ['a', 'b', 'c'], 'field')
+        self.assertRaisesRegex(NodeAlreadyExistsError, 'Tag "a" is not a leaf',
+                               self.storage.update_individual_data, 2, ['a'], 'field')
+        self.assertRaises(NodeDoesNotExistsError, self.storage.update_individual_data, 2, [], 'field')
+        self.assertRaisesRegex(NoDataAtKeyError, 'Tag "a" is not a leaf', self.storage.load_data, ['a'])
+        self.assertRaisesRegex(NoDataAtKeyError, 'Tag "a" is not a leaf', self.storage.load_many, [['a']])
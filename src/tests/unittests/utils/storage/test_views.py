@@ -0,0 +1,114 @@
+import copy
+import json
+import pickle
+import unittest
+
+import numpy as np
+
+from qilib.utils import PythonJsonStructure
+from qilib.utils.serialization import serialize, unserialize
+from qilib.utils.storage.views import CopyOnWriteDict, CopyOnWriteList, read_only_view
+
+
+class TestReadOnlyView(unittest.TestCase):
+    def setUp(self) -> None:
+        self.data = {'a': 1, 'nested': {'b': [1, {'c': 2}]}, 'array': np.arange(4), 'tuple': (1, {'d': 3})}
+
+    def test_read_only_view(self):
+        view = read_only_view(self.data)
+        self.assertIsInstance(view, CopyOnWriteDict)
+        self.assertIsInstance(view['nested'], CopyOnWriteDict)
+        self.assertIsInstance(view['nested']['b'], CopyOnWriteList)
+        self.assertIsInstance(view['tuple'][1], CopyOnWriteDict)
+        self.assertIs(view['nested'], view['nested'])
+        self.assertEqual(1, read_only_view(1))
+        self.assertEqual('string', read_only_view('string'))
+
+    def test_equality(self):
+        view = read_only_view(self.data)
+        self.assertEqual({'b': [1, {'c': 2}]}, view['nested'])
+        self.assertEqual(view['nested'], {'b': [1, {'c': 2}]})
+        self.assertEqual([1, {'c': 2}], view['nested']['b'])
+        self.assertNotEqual([1], view['nested']['b'])
+        self.assertEqual({'a': 1}, read_only_view({'a': 1}).copy())
+        self.assertEqual([1, 2], read_only_view([1, 2]).copy())
+        self.assertIn('CopyOnWriteDict', repr(view))
+        self.assertIn('CopyOnWriteList', repr(view['nested']['b']))
+
+    def test_array_is_not_writeable(self):
+        view = read_only_view(self.data)
+        self.assertFalse(view['array'].flags.writeable)
+        self.assertTrue(np.shares_memory(view['array'], self.data['array']))
+        with self.assertRaises(ValueError):
+            view['array'][0] = 10
+        self.assertTrue(self.data['array'].flags.writeable)
+
+    def test_copy_on_write_dict(self):
+        view = read_only_view(self.data)
+        view['a'] = 2
+        view['new'] = [1]
+        del view['tuple']
+        view['nested']['b'][1]['c'] = 5
+        view['nested']['b'].append(3)
+
+        self.assertEqual(2, view['a'])
+        self.assertEqual([1], view['new'])
+        self.assertNotIn('tuple', view)
+        self.assertEqual({'b': [1, {'c': 5}, 3]}, view['nested'])
+        self.assertEqual({'a': 1, 'nested': {'b': [1, {'c': 2}]}}, {key: self.data[key] for key in ['a', 'nested']})
+        self.assertIn('tuple', self.data)
+
+    def test_copy_on_write_list(self):
+        data = [1, [2, 3], {'a': 4}]
+        view = read_only_view(data)
+        self.assertEqual(3, len(view))
+        self.assertEqual({'a': 4}, view[-1])
+        self.assertEqual([[2, 3], {'a': 4}], view[1:])
+        with self.assertRaises(IndexError):
+            view[3]
+
+        view[-1]['a'] = 5
+        view[1].insert(0, 1)
+        view[0] = 0
+        del view[1]
+        view.insert(0, -1)
+        self.assertEqual([-1, 0, {'a': 5}], view)
+        self.assertEqual([1, [2, 3], {'a': 4}], data)
+
+    def test_deepcopy(self):
+        view = read_only_view(self.data)
+        view_copy = copy.deepcopy(view)
+        view_copy['nested']['b'][1]['c'] = 5
+        self.assertEqual(2, self.data['nested']['b'][1]['c'])
+
+    def test_real_containers(self):
+        view = read_only_view(self.data)
+        self.assertIsInstance(view, dict)
+        self.assertIsInstance(view['nested']['b'], list)
+        self.assertIsInstance(dict(view)['nested'], CopyOnWriteDict)
+        self.assertIsInstance({**view}['nested'], CopyOnWriteDict)
+        self.assertIsInstance(list(view['nested']['b'])[1], CopyOnWriteDict)
+        self.assertIsInstance(dict(view.items())['nested'], CopyOnWriteDict)
+        self.assertIsInstance((view['nested']['b'] + [])[1], CopyOnWriteDict)
+
+        dict(view)['nested']['b'].append(5)
+        for item in view['nested']['b']:
+            if isinstance(item, dict):
+                item['c'] = 5
+        self.assertEqual({'b': [1, {'c': 2}]}, self.data['nested'])
+
+    def test_serialize(self):
+        view = read_only_view(self.data)
+        unserialized = unserialize(serialize(view))
+        self.assertEqual({'b': [1, {'c': 2}]}, unserialized['nested'])
+        np.testing.assert_array_equal(self.data['array'], unserialized['array'])
+        self.assertEqual('{"b": [1, {"c": 2}]}', json.dumps(read_only_view(self.data['nested'])))
+        self.assertEqual({'b': [1, {'c': 2}]}, PythonJsonStructure(configuration=view['nested'])['configuration'])
+
+    def test_pickle(self):
+        view = read_only_view(self.data)
+        view['a'] = 2
+        unpickled = pickle.loads(pickle.dumps(view))
+        self.assertIs(dict, type(unpickled))
+        self.assertEqual(2, unpickled['a'])
+        self.assertIs(list, type(unpickled['nested']['b']))
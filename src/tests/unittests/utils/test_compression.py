@@ -0,0 +1,52 @@
+import importlib.util
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from qilib.utils.compression import check_compression_method, compress, compression_methods, decompress
+
+
+def _installed(module):
+    return importlib.util.find_spec(module) is not None
+
+
+class TestCompression(unittest.TestCase):
+
+    def test_zlib(self):
+        data = b'0123456789' * 100
+        compressed = compress(data, 'zlib')
+        self.assertLess(len(compressed), len(data))
+        self.assertEqual(data, decompress(compressed, 'zlib'))
+
+    @unittest.skipUnless(_installed('zstandard'), 'zstandard is not installed')
+    def test_zstd(self):
+        data = b'0123456789' * 100
+        self.assertEqual(data, decompress(compress(data, 'zstd'), 'zstd'))
+
+    def test_zstd_context_per_thread(self):
+        zstandard = MagicMock()
+        with patch('qilib.utils.compression._loaded_methods', {}), \
+                patch('importlib.import_module', return_value=zstandard):
+            compress(b'data', 'zstd')
+            compress(b'data', 'zstd')
+            decompress(b'data', 'zstd')
+            thread = threading.Thread(target=compress, args=(b'data', 'zstd'))
+            thread.start()
+            thread.join()
+        self.assertEqual(2, zstandard.ZstdCompressor.call_count)
+        self.assertEqual(1, zstandard.ZstdDecompressor.call_count)
+
+    @unittest.skipUnless(_installed('lz4'), 'lz4 is not installed')
+    def test_lz4(self):
+        data = b'0123456789' * 100
+        self.assertEqual(data, decompress(compress(data, 'lz4'), 'lz4'))
+
+    def test_compression_methods(self):
+        self.assertEqual(('zlib', 'zstd', 'lz4'), compression_methods())
+        check_compression_method('zlib')
+        self.assertRaisesRegex(ValueError, 'Unknown compression method', check_compression_method, 'rar')
+
+    def test_missing_package(self):
+        with patch('qilib.utils.compression._loaded_methods', {}), \
+                patch('importlib.import_module', side_effect=ImportError('No module named lz4')):
+            self.assertRaisesRegex(ImportError, 'requires the lz4 package', compress, b'data', 'lz4')
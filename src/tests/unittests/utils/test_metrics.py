@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import MagicMock
+
+from qilib.utils.metrics import MetricsScope
+from qilib.utils.storage import MetricsEvent, StorageMetrics
+
+
+class TestStorageMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.callback = MagicMock()
+        self.metrics = StorageMetrics(self.callback, buckets=(0.01, 0.1))
+
+    def test_statistics(self):
+        self.metrics.observe('storage', 'load_data', 0.005, 100)
+        self.metrics.observe('storage', 'load_data', 0.05, 20)
+        self.metrics.count_round_trip('storage', 'load_data', 'find_one', 0.001, 10)
+        self.metrics.count_round_trip('storage', 'load_data', 'find_one')
+        self.metrics.count_round_trip('storage', '', 'create_index')
+
+        statistics = self.metrics.statistics()
+        self.assertEqual({'count': 2, 'seconds': 0.055, 'bytes': 120, 'round_trips': {'find_one': 2}},
+                         statistics['storage']['load_data'])
+        self.assertEqual({'count': 0, 'seconds': 0.0, 'bytes': 0, 'round_trips': {'create_index': 1}},
+                         statistics['storage'][''])
+        self.callback.assert_any_call(MetricsEvent('operation', 'storage', 'load_data', '', 0.05, 20))
+        self.callback.assert_any_call(MetricsEvent('round_trip', 'storage', 'load_data', 'find_one', 0.001, 10))
+        self.assertEqual(5, self.callback.call_count)
+
+        self.metrics.clear()
+        self.assertEqual({}, self.metrics.statistics())
+
+    def test_export_prometheus(self):
+        self.metrics.observe('storage', 'load_data', 0.005, 100)
+        self.metrics.observe('storage', 'load_data', 0.05)
+        self.metrics.observe('storage', 'load_data', 1.0)
+        self.metrics.count_round_trip('my "storage"', 'save_data', 'update_one')
+
+        lines = self.metrics.export_prometheus().splitlines()
+        self.assertIn('# TYPE qilib_storage_operation_seconds histogram', lines)
+        self.assertIn('qilib_storage_operation_seconds_bucket{storage="storage",operation="load_data",le="0.01"} 1',
+                      lines)
+        self.assertIn('qilib_storage_operation_seconds_bucket{storage="storage",operation="load_data",le="0.1"} 2',
+                      lines)
+        self.assertIn('qilib_storage_operation_seconds_bucket{storage="storage",operation="load_data",le="+Inf"} 3',
+                      lines)
+        self.assertIn('qilib_storage_operation_seconds_count{storage="storage",operation="load_data"} 3', lines)
+        self.assertIn('qilib_storage_operation_bytes_total{storage="storage",operation="load_data"} 100', lines)
+        self.assertIn('qilib_storage_round_trips_total{storage="my \\"storage\\"",operation="save_data",'
+                      'call="update_one"} 1', lines)
+
+    def test_scope(self):
+        scope = self.metrics.scope('storage')
+
+        def load_many(tags):
+            scope.round_trip('find', nbytes=30)
+            return [load_data(tag) for tag in tags]
+
+        def load_data(tag):
+            self.assertIs(scope, MetricsScope.active())
+            scope.round_trip('find_one', nbytes=10)
+            return tag
+
+        load_data = scope.instrument('load_data', load_data)
+        load_many = scope.instrument('load_many', load_many)
+        self.assertEqual(['a', 'b'], load_many(['a', 'b']))
+        self.assertEqual('c', load_data('c'))
+        self.assertIsNone(MetricsScope.active())
+        scope.round_trip('create_index')
+
+        statistics = self.metrics.statistics()['storage']
+        self.assertEqual(1, statistics['load_many']['count'])
+        self.assertEqual(50, statistics['load_many']['bytes'])
+        self.assertEqual({'find': 1, 'find_one': 2}, statistics['load_many']['round_trips'])
+        self.assertEqual(1, statistics['load_data']['count'])
+        self.assertEqual({'find_one': 1}, statistics['load_data']['round_trips'])
+        self.assertEqual({'create_index': 1}, statistics['']['round_trips'])
+
+    def test_scope_error(self):
+        scope = self.metrics.scope('storage')
+        failing = scope.instrument('load_data', MagicMock(side_effect=KeyError))
+        self.assertRaises(KeyError, failing, ['a'])
+        self.assertRaises(KeyError, failing, ['a'])
+        self.assertEqual(2, self.metrics.statistics()['storage']['load_data']['count'])
@@ -0,0 +1,108 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from mongomock import MongoClient
+
+from qilib.data_set import MongoDataSetIO
+from qilib.utils.mongo_client_registry import MongoClientRegistry, command_metrics_listener
+from qilib.utils.storage import StorageMongoDb
+
+
+class TestMongoClientRegistry(unittest.TestCase):
+    def setUp(self) -> None:
+        self.registry = MongoClientRegistry(max_pool_size=10, min_pool_size=1)
+        self.client_class = MagicMock(side_effect=lambda *args, **kwargs: MagicMock())
+
+    def test_acquire_shares_client(self):
+        client = self.registry.acquire('localhost', 27017, client_class=self.client_class)
+        self.assertIs(client, self.registry.acquire('localhost', 27017, client_class=self.client_class))
+        self.client_class.assert_called_once_with('localhost', 27017, maxPoolSize=10, minPoolSize=1,
+                                                  event_listeners=[command_metrics_listener])
+        self.assertEqual(1, len(self.registry))
+
+    def test_acquire_different_parameters(self):
+        client = self.registry.acquire('localhost', 27017, client_class=self.client_class)
+        self.assertIsNot(client, self.registry.acquire('localhost', 27018, client_class=self.client_class))
+        self.assertIsNot(client, self.registry.acquire('localhost', 27017, client_class=self.client_class,
+                                                       max_pool_size=5))
+        self.assertEqual(3, len(self.registry))
+
+    def test_options_do_not_split_clients(self):
+        client = self.registry.acquire('localhost', 27017, client_class=self.client_class)
+        self.assertIs(client, self.registry.acquire('localhost', 27017, client_class=self.client_class,
+                                                    serverSelectionTimeoutMS=10))
+        self.client_class.assert_called_once_with('localhost', 27017, maxPoolSize=10, minPoolSize=1,
+                                                  event_listeners=[command_metrics_listener])
+
+    def test_pool_size_defaults(self):
+        self.registry.max_pool_size = 20
+        self.registry.acquire(client_class=self.client_class, min_pool_size=2)
+        self.client_class.assert_called_once_with('localhost', 27017, maxPoolSize=20, minPoolSize=2,
+                                                  event_listeners=[command_metrics_listener])
+
+    def test_release_closes_last_reference(self):
+        client = self.registry.acquire(client_class=self.client_class)
+        self.registry.acquire(client_class=self.client_class)
+
+        self.registry.release(client)
+        client.close.assert_not_called()
+        self.registry.release(client)
+        client.close.assert_called_once()
+        self.assertEqual(0, len(self.registry))
+
+        self.registry.release(client)
+        client.close.assert_called_once()
+        self.assertIsNot(client, self.registry.acquire(client_class=self.client_class))
+
+    def test_metrics_listener_installed(self):
+        listener = MagicMock()
+        self.registry.acquire(client_class=self.client_class, event_listeners=[listener])
+        self.assertEqual([command_metrics_listener, listener], self.client_class.call_args.kwargs['event_listeners'])
+
+    def test_clear(self):
+        client = self.registry.acquire(client_class=self.client_class)
+        self.registry.clear()
+        client.close.assert_called_once()
+        self.assertEqual(0, len(self.registry))
+
+    def test_shared_by_storage_and_data_set_io(self):
+        registry = MongoClientRegistry()
+        client_class = MagicMock(side_effect=lambda *args, **kwargs: MongoClient())
+        with patch('qilib.utils.storage.mongo.mongo_client_registry', registry), \
+                patch('qilib.data_set.mongo_data_set_io.mongo_client_registry', registry), \
+                patch('qilib.utils.storage.mongo.MongoClient', client_class), \
+                patch('qilib.data_set.mongo_data_set_io.MongoClient', client_class):
+            storage = StorageMongoDb('test')
+            other_storage = StorageMongoDb('other')
+            data_set_io = MongoDataSetIO(name='test_data_set')
+            pooled_data_set_io = MongoDataSetIO(name='test_data_set', max_pool_size=5)
+
+            self.assertIs(storage._client, other_storage._client)
+            self.assertIs(storage._client, data_set_io._client)
+            self.assertIsNot(storage._client, pooled_data_set_io._client)
+            self.assertEqual(2, len(registry))
+            client_class.assert_any_call('localhost', 27017, maxPoolSize=5, minPoolSize=0,
+                                          event_listeners=[command_metrics_listener])
+            pooled_data_set_io.finalize()
+            data_set_io.finalize()
+            storage.close()
+            self.assertEqual(1, len(registry))
+            other_storage.close()
+            self.assertEqual(0, len(registry))
+
+    def test_release_once_per_holder(self):
+        registry = MongoClientRegistry()
+        client_class = MagicMock(side_effect=lambda *args, **kwargs: MongoClient())
+        with patch('qilib.utils.storage.mongo.mongo_client_registry', registry), \
+                patch('qilib.data_set.mongo_data_set_io.mongo_client_registry', registry), \
+                patch('qilib.utils.storage.mongo.MongoClient', client_class), \
+                patch('qilib.data_set.mongo_data_set_io.MongoClient', client_class):
+            storage = StorageMongoDb('test')
+            other_storage = StorageMongoDb('other')
+            data_set_io = MongoDataSetIO(name='test_data_set')
+            storage.close()
+            storage.close()
+            data_set_io.finalize()
+            data_set_io.finalize()
+            self.assertEqual(1, len(registry))
+            self.assertIs(other_storage._client, registry.acquire(client_class=client_class))
@@ -18,14 +18,18 @@ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER I
 OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
+import importlib.util
+import unittest
 from dataclasses import dataclass
 from unittest import TestCase
+from unittest.mock import patch
 
 import numpy as np
 from dataclasses_json import dataclass_json
 
 from qilib.utils import PythonJsonStructure
-from qilib.utils.serialization import (Decoder, Encoder, serialize, serializer, unserialize, NumpyArrayEncDec)
+from qilib.utils.serialization import (Decoder, Encoder, Serializer, serialize, serializer, unserialize,
+                                       NumpyArrayEncDec, serialize_binary, unserialize_binary)
 
 
 @dataclass_json
@@ -159,4 +163,86 @@ class TestSerialization(TestCase):
             array = NumpyArrayEncDec.decode(encoded)
             self.assertListEqual(x.tolist(), array.tolist())
 
+    def test_np_encoding_decoding_compressed(self):
+        x = np.arange(1000, dtype=np.float64)
+        for encode in (NumpyArrayEncDec.encode, NumpyArrayEncDec.encode_to_bytes):
+            encoded = encode(x, compression='zlib', compression_threshold=x.nbytes)
+            self.assertEqual('zlib', encoded['__content__']['__compression__'])
+            self.assertLess(len(encoded['__content__']['__ndarray__']), x.nbytes / 2)
+            np.testing.assert_array_equal(x, NumpyArrayEncDec.decode(encoded))
 
+            encoded = encode(x, compression='zlib', compression_threshold=x.nbytes + 1)
+            self.assertNotIn('__compression__', encoded['__content__'])
+            np.testing.assert_array_equal(x, NumpyArrayEncDec.decode(encoded))
+        self.assertEqual(NumpyArrayEncDec.encode(x), NumpyArrayEncDec.encode(x, compression_threshold=0))
+
+    def test_np_decoding_read_only(self):
+        for x in self.testdata_arrays:
+            for encoded in (NumpyArrayEncDec.encode(x), NumpyArrayEncDec.encode_to_bytes(x, 'zlib')):
+                array = NumpyArrayEncDec.decode(encoded, read_only=True)
+                np.testing.assert_array_equal(x, array)
+                self.assertFalse(array.flags.writeable)
+                self.assertIsNotNone(array.base)
+                self.assertTrue(NumpyArrayEncDec.decode(encoded).flags.writeable)
+
+        read_only_serializer = Serializer(read_only_arrays=True)
+        array = read_only_serializer.unserialize(read_only_serializer.serialize({'array': np.arange(3)}))['array']
+        np.testing.assert_array_equal(np.arange(3), array)
+        self.assertFalse(array.flags.writeable)
+        self.assertTrue(unserialize(serialize(np.arange(3))).flags.writeable)
+
+    def test_np_encoding_decoding_buffer(self):
+        for x in self.testdata_arrays + [np.zeros((0, 3), dtype='<i2'), np.array(1.5), np.arange(6).reshape(2, 3).T]:
+            buffer = NumpyArrayEncDec.encode_to_buffer(x)
+            array = NumpyArrayEncDec.decode_from_buffer(buffer)
+            np.testing.assert_array_equal(x, array)
+            self.assertEqual(x.dtype, array.dtype)
+            self.assertEqual(x.shape, array.shape)
+            self.assertEqual(0, (len(buffer) - x.nbytes) % 16)
+            self.assertFalse(array.flags.writeable)
+
+    @unittest.skipUnless(importlib.util.find_spec('msgpack'), 'msgpack is not installed')
+    def test_serialize_binary(self):
+        for data in self.testdata:
+            unserialized = unserialize_binary(serialize_binary(data))
+            self.assertEqual(data, unserialized)
+            self.assertIs(type(data), type(unserialized))
+        for x in self.testdata_arrays:
+            array = unserialize_binary(serialize_binary(x))
+            np.testing.assert_array_equal(x, array)
+            self.assertFalse(array.flags.writeable)
+
+        data = {'array': np.arange(1000.), 'tuple': (1, np.arange(3), np.float32(2.5)), 1: b'bytes',
+                'custom': CustomDataClass(1.0, 'a')}
+        serializer.register_dataclass(CustomDataClass)
+        serialized = serialize_binary(data)
+        self.assertLess(len(serialized), len(serialize(data)) * 3 / 4)
+        unserialized = unserialize_binary(serialized)
+        np.testing.assert_array_equal(data['array'], unserialized['array'])
+        self.assertEqual((1, [0, 1, 2], 2.5), (unserialized['tuple'][0], unserialized['tuple'][1].tolist(),
+                                               unserialized['tuple'][2]))
+        self.assertEqual(b'bytes', unserialized[1])
+        self.assertEqual(CustomDataClass(1.0, 'a'), unserialized['custom'])
+
+    @unittest.skipUnless(importlib.util.find_spec('msgpack'), 'msgpack is not installed')
+    def test_serialize_binary_unknown_type(self):
+        self.assertRaises(TypeError, serialize_binary, CustomType(1, 2))
+        self.assertRaises(ValueError, unserialize_binary, serialize_binary({'__object__': 'unknown'}))
+
+    def test_serialize_binary_without_msgpack(self):
+        with patch('importlib.import_module', side_effect=ImportError('No module named msgpack')):
+            self.assertRaisesRegex(ImportError, r'pip install qilib\[msgpack\]', serialize_binary, {})
+
+    def test_encode_decode_data_with_keys(self):
+        data = {'a.b': 1, 'tuple': (1, {'c.d': 2}), 'list': [{'e.f': (3, 4)}, b'bytes'],
+                'array': np.array([1, 2]), 'number': np.int64(5)}
+
+        encode_key = lambda key: key.replace('.', '%')
+        encoded = serializer.encode_data(data, encode_key=encode_key)
+        expected = serializer._transform_keys(serializer.encode_data(data), encode_key)
+        self.assertEqual(serialize(expected), serialize(encoded))
+        self.assertNotIn('.', serialize(encoded).decode())
+
+        decoded = serializer.decode_data(encoded, decode_key=lambda key: key.replace('%', '.'))
+        self.assertEqual(serialize(data), serialize(decoded))
+        self.assertEqual((1, {'c.d': 2}), decoded['tuple'])